@@ -390,6 +390,328 @@ try:
 except ValueError:
     REDIS_SENTINEL_MAX_RETRY_COUNT = 2
 
+####################################
+# WISP
+####################################
+
+# Cookies that identify a JumpServer login; their values key the user cache
+WISP_USER_CACHE_COOKIES = [
+    name.strip()
+    for name in os.environ.get("WISP_USER_CACHE_COOKIES", "jms_sessionid").split(",")
+    if name.strip()
+]
+
+try:
+    WISP_USER_CACHE_TTL = int(os.environ.get("WISP_USER_CACHE_TTL", "60"))
+except ValueError:
+    WISP_USER_CACHE_TTL = 60
+
+try:
+    WISP_USER_CACHE_NEGATIVE_TTL = int(
+        os.environ.get("WISP_USER_CACHE_NEGATIVE_TTL", "5")
+    )
+except ValueError:
+    WISP_USER_CACHE_NEGATIVE_TTL = 5
+
+try:
+    WISP_USER_CACHE_MAXSIZE = int(os.environ.get("WISP_USER_CACHE_MAXSIZE", "10000"))
+except ValueError:
+    WISP_USER_CACHE_MAXSIZE = 10000
+
+# Share wisp caches across workers through REDIS_URL
+ENABLE_WISP_REDIS_CACHE = (
+        os.environ.get("ENABLE_WISP_REDIS_CACHE", "False").lower() == "true"
+)
+
+# Max seconds a buffered message/status patch may wait before it is written to
+# wisp; 0 writes every patch immediately
+try:
+    WISP_CHAT_WRITE_BEHIND_INTERVAL = float(
+        os.environ.get("WISP_CHAT_WRITE_BEHIND_INTERVAL", "1")
+    )
+except ValueError:
+    WISP_CHAT_WRITE_BEHIND_INTERVAL = 1.0
+
+try:
+    WISP_CHAT_WRITE_BEHIND_RETRIES = int(
+        os.environ.get("WISP_CHAT_WRITE_BEHIND_RETRIES", "3")
+    )
+except ValueError:
+    WISP_CHAT_WRITE_BEHIND_RETRIES = 3
+
+# Send message-level JSON-Patch ops instead of the whole chat document
+ENABLE_WISP_CHAT_PATCH = (
+        os.environ.get("ENABLE_WISP_CHAT_PATCH", "True").lower() == "true"
+)
+
+# Seconds to fall back to full updates after the server rejected a patch
+try:
+    WISP_CHAT_PATCH_RETRY_INTERVAL = int(
+        os.environ.get("WISP_CHAT_PATCH_RETRY_INTERVAL", "600")
+    )
+except ValueError:
+    WISP_CHAT_PATCH_RETRY_INTERVAL = 600
+
+# Send multi-chat retrieve/update/delete ops in one call to the batch endpoint
+ENABLE_WISP_CHAT_BATCH = (
+        os.environ.get("ENABLE_WISP_CHAT_BATCH", "True").lower() == "true"
+)
+
+# Seconds to run ops one by one after the server rejected a batch
+try:
+    WISP_CHAT_BATCH_RETRY_INTERVAL = int(
+        os.environ.get("WISP_CHAT_BATCH_RETRY_INTERVAL", "600")
+    )
+except ValueError:
+    WISP_CHAT_BATCH_RETRY_INTERVAL = 600
+
+# Chat documents are JSON, or "protobuf" to ask wisp for ChatDocument messages:
+# about half the bytes on the wire, but more CPU in Python than orjson
+WISP_CHAT_CODEC = os.environ.get("WISP_CHAT_CODEC", "json").lower()
+
+# Seconds a retrieved chat document may be served from cache; writes from this
+# process invalidate it immediately, 0 disables the cache
+try:
+    WISP_CHAT_CACHE_TTL = int(os.environ.get("WISP_CHAT_CACHE_TTL", "10"))
+except ValueError:
+    WISP_CHAT_CACHE_TTL = 10
+
+try:
+    WISP_CHAT_CACHE_MAXSIZE = int(os.environ.get("WISP_CHAT_CACHE_MAXSIZE", "1000"))
+except ValueError:
+    WISP_CHAT_CACHE_MAXSIZE = 1000
+
+# Page size of chat lists streamed from wisp (exports, /chats/all)
+try:
+    WISP_CHAT_LIST_PAGE_SIZE = int(os.environ.get("WISP_CHAT_LIST_PAGE_SIZE", "100"))
+except ValueError:
+    WISP_CHAT_LIST_PAGE_SIZE = 100
+
+# Local chat search index: users kept in memory, and how often an index is
+# compared with wisp for changes made by other workers
+try:
+    WISP_CHAT_SEARCH_MAX_USERS = int(os.environ.get("WISP_CHAT_SEARCH_MAX_USERS", "200"))
+except ValueError:
+    WISP_CHAT_SEARCH_MAX_USERS = 200
+
+try:
+    WISP_CHAT_SEARCH_SYNC_INTERVAL = float(
+        os.environ.get("WISP_CHAT_SEARCH_SYNC_INTERVAL", "30")
+    )
+except ValueError:
+    WISP_CHAT_SEARCH_SYNC_INTERVAL = 30.0
+
+# GetAccountChat payload, the same for every new chat; reloaded in the
+# background once older than REFRESH_AHEAD * TTL
+try:
+    WISP_ACCOUNT_CACHE_TTL = int(os.environ.get("WISP_ACCOUNT_CACHE_TTL", "300"))
+except ValueError:
+    WISP_ACCOUNT_CACHE_TTL = 300
+
+try:
+    WISP_ACCOUNT_CACHE_REFRESH_AHEAD = float(
+        os.environ.get("WISP_ACCOUNT_CACHE_REFRESH_AHEAD", "0.8")
+    )
+except ValueError:
+    WISP_ACCOUNT_CACHE_REFRESH_AHEAD = 0.8
+
+# Command audit records waiting for upload; overflow goes to the on-disk journal
+try:
+    WISP_COMMAND_QUEUE_SIZE = int(os.environ.get("WISP_COMMAND_QUEUE_SIZE", "1000"))
+except ValueError:
+    WISP_COMMAND_QUEUE_SIZE = 1000
+
+try:
+    WISP_COMMAND_BATCH_SIZE = int(os.environ.get("WISP_COMMAND_BATCH_SIZE", "20"))
+except ValueError:
+    WISP_COMMAND_BATCH_SIZE = 20
+
+try:
+    WISP_COMMAND_RETRIES = int(os.environ.get("WISP_COMMAND_RETRIES", "5"))
+except ValueError:
+    WISP_COMMAND_RETRIES = 5
+
+# JMS sessions closed at the same time after socket disconnects
+try:
+    WISP_SESSION_CLOSE_CONCURRENCY = int(
+        os.environ.get("WISP_SESSION_CLOSE_CONCURRENCY", "8")
+    )
+except ValueError:
+    WISP_SESSION_CLOSE_CONCURRENCY = 8
+
+# Seconds to collect a burst of wisp tasks (e.g. kill sessions) into one batch
+try:
+    WISP_DISPATCH_BATCH_WINDOW = float(
+        os.environ.get("WISP_DISPATCH_BATCH_WINDOW", "0.05")
+    )
+except ValueError:
+    WISP_DISPATCH_BATCH_WINDOW = 0.05
+
+# Upper bound of the backoff between reconnects of the wisp task stream
+try:
+    WISP_DISPATCH_RECONNECT_MAX_DELAY = float(
+        os.environ.get("WISP_DISPATCH_RECONNECT_MAX_DELAY", "30")
+    )
+except ValueError:
+    WISP_DISPATCH_RECONNECT_MAX_DELAY = 30.0
+
+# Seconds shutdown waits for session closes and queued command/replay uploads
+try:
+    WISP_SHUTDOWN_TIMEOUT = float(
+        os.environ.get("WISP_SHUTDOWN_TIMEOUT", "5")
+    )
+except ValueError:
+    WISP_SHUTDOWN_TIMEOUT = 5.0
+
+# Upload session replays as .cast.gz
+ENABLE_WISP_REPLAY_GZIP = (
+        os.environ.get("ENABLE_WISP_REPLAY_GZIP", "False").lower() == "true"
+)
+
+# Replay files kept open between rows; older sessions are reopened on demand
+try:
+    WISP_REPLAY_MAX_OPEN_FILES = int(
+        os.environ.get("WISP_REPLAY_MAX_OPEN_FILES", "256")
+    )
+except ValueError:
+    WISP_REPLAY_MAX_OPEN_FILES = 256
+
+try:
+    WISP_REPLAY_UPLOAD_WORKERS = int(os.environ.get("WISP_REPLAY_UPLOAD_WORKERS", "2"))
+except ValueError:
+    WISP_REPLAY_UPLOAD_WORKERS = 2
+
+try:
+    WISP_REPLAY_UPLOAD_RETRIES = int(os.environ.get("WISP_REPLAY_UPLOAD_RETRIES", "3"))
+except ValueError:
+    WISP_REPLAY_UPLOAD_RETRIES = 3
+
+# Deadline in seconds of wisp RPCs; WISP_RPC_TIMEOUTS sets it per method, e.g.
+# "CallAPI=30,UploadReplayFile=600"
+try:
+    WISP_RPC_TIMEOUT = float(os.environ.get("WISP_RPC_TIMEOUT", "10"))
+except ValueError:
+    WISP_RPC_TIMEOUT = 10.0
+
+
+def parse_wisp_rpc_timeouts(value: str) -> dict:
+    timeouts = {}
+    for item in value.split(","):
+        method, _, timeout = item.partition("=")
+        try:
+            timeouts[method.strip()] = float(timeout)
+        except ValueError:
+            continue
+    return timeouts
+
+
+WISP_RPC_TIMEOUTS = parse_wisp_rpc_timeouts(os.environ.get("WISP_RPC_TIMEOUTS", ""))
+
+# Retries of idempotent wisp RPCs (CallAPI GET, CheckUserByCookies,
+# GetAccountChat) when the sidecar is unavailable
+try:
+    WISP_RPC_RETRIES = int(os.environ.get("WISP_RPC_RETRIES", "2"))
+except ValueError:
+    WISP_RPC_RETRIES = 2
+
+# Base of the jittered exponential backoff between retries, in seconds
+try:
+    WISP_RPC_RETRY_BACKOFF = float(os.environ.get("WISP_RPC_RETRY_BACKOFF", "0.1"))
+except ValueError:
+    WISP_RPC_RETRY_BACKOFF = 0.1
+
+# Consecutive unavailable/timed out RPCs after which calls fail fast, and
+# seconds until a probe call is let through again
+try:
+    WISP_RPC_BREAKER_FAILURES = int(os.environ.get("WISP_RPC_BREAKER_FAILURES", "5"))
+except ValueError:
+    WISP_RPC_BREAKER_FAILURES = 5
+
+try:
+    WISP_RPC_BREAKER_RESET_TIMEOUT = float(
+        os.environ.get("WISP_RPC_BREAKER_RESET_TIMEOUT", "10")
+    )
+except ValueError:
+    WISP_RPC_BREAKER_RESET_TIMEOUT = 10.0
+
+# Wait for the wisp channel to connect (until the deadline) instead of failing
+# at once while it is down
+WISP_GRPC_WAIT_FOR_READY = (
+        os.environ.get("WISP_GRPC_WAIT_FOR_READY", "False").lower() == "true"
+)
+
+# HTTP/2 keepalive pings of the wisp channels, in seconds, 0 disables them.
+# Go gRPC servers reject pings more frequent than every 5 minutes by default.
+try:
+    WISP_GRPC_KEEPALIVE_TIME = int(os.environ.get("WISP_GRPC_KEEPALIVE_TIME", "300"))
+except ValueError:
+    WISP_GRPC_KEEPALIVE_TIME = 300
+
+try:
+    WISP_GRPC_KEEPALIVE_TIMEOUT = int(os.environ.get("WISP_GRPC_KEEPALIVE_TIMEOUT", "20"))
+except ValueError:
+    WISP_GRPC_KEEPALIVE_TIMEOUT = 20
+
+
+def parse_wisp_addresses(value: str) -> list:
+    """
+    gRPC targets of comma separated wisp addresses: host:port, or a unix
+    socket as unix:/path, unix:///path or a bare absolute path.
+    """
+    addresses = []
+    for address in value.split(","):
+        address = address.strip()
+        if address.startswith("/"):
+            address = f"unix:{address}"
+        if address:
+            addresses.append(address)
+    return addresses or ["localhost:9090"]
+
+
+# Wisp gRPC addresses; a unix socket saves the TCP loopback overhead when
+# wisp runs on the same host
+WISP_ADDRESSES = parse_wisp_addresses(os.environ.get("WISP_ADDRESS", "localhost:9090"))
+
+# Largest wisp message sent or received, in MB; gRPC receives 4 MB by default,
+# less than big chat documents
+try:
+    WISP_GRPC_MAX_MESSAGE_SIZE = int(os.environ.get("WISP_GRPC_MAX_MESSAGE_SIZE", "64"))
+except ValueError:
+    WISP_GRPC_MAX_MESSAGE_SIZE = 64
+
+# Serve wisp from an in-memory fake in each worker process instead of the
+# sidecar, for load tests; see jms/wisp/fake.py
+WISP_FAKE_SERVER = os.environ.get("WISP_FAKE_SERVER", "False").lower() == "true"
+
+# Channels (each with its own connection) unary wisp calls are spread over,
+# "least_outstanding" or "round_robin"; streams get a channel of their own
+try:
+    WISP_GRPC_CHANNELS = int(os.environ.get("WISP_GRPC_CHANNELS", "2"))
+except ValueError:
+    WISP_GRPC_CHANNELS = 2
+
+WISP_GRPC_LB_POLICY = os.environ.get("WISP_GRPC_LB_POLICY", "least_outstanding").lower()
+
+# gRPC health checking of the wisp connections (grpc.health.v1); servers
+# without the health service are taken as healthy
+WISP_GRPC_HEALTH_CHECK = (
+        os.environ.get("WISP_GRPC_HEALTH_CHECK", "False").lower() == "true"
+)
+
+# Minutes of wisp calls kept for the slow calls debug endpoint, and the
+# slowest calls kept of each minute
+try:
+    WISP_RPC_SLOW_CALLS_WINDOW = int(os.environ.get("WISP_RPC_SLOW_CALLS_WINDOW", "60"))
+except ValueError:
+    WISP_RPC_SLOW_CALLS_WINDOW = 60
+
+try:
+    WISP_RPC_SLOW_CALLS_PER_MINUTE = int(
+        os.environ.get("WISP_RPC_SLOW_CALLS_PER_MINUTE", "50")
+    )
+except ValueError:
+    WISP_RPC_SLOW_CALLS_PER_MINUTE = 50
+
 ####################################
 # UVICORN WORKERS
 ####################################
@@ -589,6 +911,63 @@ except ValueError:
 WEBSOCKET_SENTINEL_HOSTS = os.environ.get("WEBSOCKET_SENTINEL_HOSTS", "")
 WEBSOCKET_SENTINEL_PORT = os.environ.get("WEBSOCKET_SENTINEL_PORT", "26379")
 
+# Seconds chat:completion deltas of a message are coalesced into one frame
+# per session; 0 emits every event as it comes
+try:
+    WEBSOCKET_EVENT_COALESCE_INTERVAL = float(
+        os.environ.get("WEBSOCKET_EVENT_COALESCE_INTERVAL", "0.05")
+    )
+except ValueError:
+    WEBSOCKET_EVENT_COALESCE_INTERVAL = 0.05
+
+# Events a frame holds at most before it is sent
+try:
+    WEBSOCKET_EVENT_COALESCE_MAX_EVENTS = int(
+        os.environ.get("WEBSOCKET_EVENT_COALESCE_MAX_EVENTS", "64")
+    )
+except ValueError:
+    WEBSOCKET_EVENT_COALESCE_MAX_EVENTS = 64
+
+# Packets queued on a client's socket above which its frames are held back
+try:
+    WEBSOCKET_EVENT_MAX_BACKLOG = int(
+        os.environ.get("WEBSOCKET_EVENT_MAX_BACKLOG", "32")
+    )
+except ValueError:
+    WEBSOCKET_EVENT_MAX_BACKLOG = 32
+
+# Seconds a worker caches what it read from the Redis session pools
+try:
+    WEBSOCKET_SESSION_CACHE_TTL = float(
+        os.environ.get("WEBSOCKET_SESSION_CACHE_TTL", "2")
+    )
+except ValueError:
+    WEBSOCKET_SESSION_CACHE_TTL = 2.0
+
+# Seconds a session stays in the Redis session pools after its worker last refreshed it
+try:
+    WEBSOCKET_SESSION_POOL_TTL = int(
+        os.environ.get("WEBSOCKET_SESSION_POOL_TTL", "60")
+    )
+except ValueError:
+    WEBSOCKET_SESSION_POOL_TTL = 60
+
+# Updates a collaborative document's log holds before it is folded into a snapshot
+try:
+    WEBSOCKET_YDOC_COMPACT_UPDATES = int(
+        os.environ.get("WEBSOCKET_YDOC_COMPACT_UPDATES", "100")
+    )
+except ValueError:
+    WEBSOCKET_YDOC_COMPACT_UPDATES = 100
+
+# Seconds between sweeps of the collaborative documents left without users
+try:
+    WEBSOCKET_YDOC_SWEEP_INTERVAL = float(
+        os.environ.get("WEBSOCKET_YDOC_SWEEP_INTERVAL", "30")
+    )
+except ValueError:
+    WEBSOCKET_YDOC_SWEEP_INTERVAL = 30.0
+
 AIOHTTP_CLIENT_TIMEOUT = os.environ.get("AIOHTTP_CLIENT_TIMEOUT", "")
 
 if AIOHTTP_CLIENT_TIMEOUT == "":
@@ -634,6 +1013,33 @@ AIOHTTP_CLIENT_SESSION_TOOL_SERVER_SSL = (
         os.environ.get("AIOHTTP_CLIENT_SESSION_TOOL_SERVER_SSL", "True").lower() == "true"
 )
 
+# Connection pools shared by the OpenAI and Ollama routers, one per upstream
+try:
+    AIOHTTP_CLIENT_POOL_LIMIT = int(os.environ.get("AIOHTTP_CLIENT_POOL_LIMIT", "200"))
+except ValueError:
+    AIOHTTP_CLIENT_POOL_LIMIT = 200
+
+try:
+    AIOHTTP_CLIENT_POOL_LIMIT_PER_HOST = int(
+        os.environ.get("AIOHTTP_CLIENT_POOL_LIMIT_PER_HOST", "100")
+    )
+except ValueError:
+    AIOHTTP_CLIENT_POOL_LIMIT_PER_HOST = 100
+
+try:
+    AIOHTTP_CLIENT_POOL_KEEPALIVE_TIMEOUT = float(
+        os.environ.get("AIOHTTP_CLIENT_POOL_KEEPALIVE_TIMEOUT", "60")
+    )
+except ValueError:
+    AIOHTTP_CLIENT_POOL_KEEPALIVE_TIMEOUT = 60.0
+
+try:
+    AIOHTTP_CLIENT_POOL_DNS_TTL = int(
+        os.environ.get("AIOHTTP_CLIENT_POOL_DNS_TTL", "300")
+    )
+except ValueError:
+    AIOHTTP_CLIENT_POOL_DNS_TTL = 300
+
 ####################################
 # SENTENCE TRANSFORMERS
 ####################################
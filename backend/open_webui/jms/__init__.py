@@ -4,3 +4,4 @@ from .session import *
 from .poll import *
 from .account import *
 from .chat import *
+from .chat_buffer import chat_write_buffer
@@ -1,20 +1,72 @@
+import asyncio
 import logging
 from typing import Any
 
 from open_webui.jms.wisp.exceptions import WispError
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    WISP_ACCOUNT_CACHE_TTL,
+    WISP_ACCOUNT_CACHE_REFRESH_AHEAD,
+)
 from open_webui.jms.wisp.protobuf import service_pb2
 
 from .base import BaseWisp
+from .cache import TTLCache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["WISP"])
 
+# The account and asset new chats run as; one entry, local to each worker
+account_cache = TTLCache(
+    "wisp.account_cache",
+    maxsize=1,
+    ttl=WISP_ACCOUNT_CACHE_TTL,
+    refresh_ahead=WISP_ACCOUNT_CACHE_REFRESH_AHEAD,
+)
+
+
+def _log_prefetch_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Account prefetch failed: {task.exception()}")
+
 
 class AccountChatHandler(BaseWisp):
+    CACHE_KEY = "account"
 
     def get_account(self) -> dict[Any, Any] | dict[str, Any] | dict[str, str] | dict[bytes, bytes]:
+        return dict(account_cache.get_or_load(self.CACHE_KEY, self._get_account))
+
+    async def aget_account(self) -> dict[str, Any]:
+        return dict(await account_cache.aget_or_load(self.CACHE_KEY, self._aget_account))
+
+    async def aprefetch(self) -> None:
+        """Warm the cache so the first new chat does not wait for GetAccountChat."""
+        try:
+            await self.aget_account()
+        except Exception as e:
+            logger.warning(f"Failed to prefetch account info: {e}")
+
+    @classmethod
+    def start_prefetch(cls) -> asyncio.Task:
+        """Run `aprefetch` in the background; keep the task to cancel it on shutdown."""
+        task = asyncio.create_task(cls().aprefetch())
+        task.add_done_callback(_log_prefetch_failure)
+        return task
+
+    @classmethod
+    def invalidate(cls) -> None:
+        account_cache.invalidate(cls.CACHE_KEY)
+
+    def _get_account(self) -> dict[str, Any]:
         resp = self.stub.GetAccountChat(service_pb2.Empty())
+        return self._check_response(resp)
+
+    async def _aget_account(self) -> dict[str, Any]:
+        resp = await self.aio_stub.GetAccountChat(service_pb2.Empty())
+        return self._check_response(resp)
+
+    @staticmethod
+    def _check_response(resp) -> dict[str, Any]:
         if not resp.status.ok:
             error_message = f'Failed to get account info: {resp.status.err}'
             logger.error(error_message)
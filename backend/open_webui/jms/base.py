@@ -1,8 +1,36 @@
-from open_webui.jms.wisp import grpc_channel
+from open_webui.jms import wisp
+from open_webui.jms.wisp import get_aio_channel
+from open_webui.jms.wisp.policy import PolicyStub
 from open_webui.jms.wisp.protobuf import service_pb2_grpc
 
 
 class BaseWisp:
 
-    def __init__(self):
-        self.stub = service_pb2_grpc.ServiceStub(grpc_channel)
+    @property
+    def stub(self) -> service_pb2_grpc.ServiceStub:
+        """
+        Stub bound to the sync channel pool, followed when setup_protobuf
+        opens a new one.
+        """
+        channel = wisp.grpc_channel
+        stub = getattr(self, '_stub', None)
+        if stub is None or self._stub_channel is not channel:
+            stub = PolicyStub(service_pb2_grpc.ServiceStub(channel))
+            self._stub = stub
+            self._stub_channel = channel
+        return stub
+
+    @property
+    def aio_stub(self) -> service_pb2_grpc.ServiceStub:
+        """
+        Stub bound to the grpc.aio channel of the running event loop.
+        Only usable from coroutines. Both stubs apply the RPC policies, see
+        PolicyStub.
+        """
+        channel = get_aio_channel()
+        stub = getattr(self, '_aio_stub', None)
+        if stub is None or self._aio_stub_channel is not channel:
+            stub = PolicyStub(service_pb2_grpc.ServiceStub(channel), aio=True)
+            self._aio_stub = stub
+            self._aio_stub_channel = channel
+        return stub
@@ -0,0 +1,386 @@
+import time
+import asyncio
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, Type
+
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    REDIS_URL,
+    REDIS_CLUSTER,
+    REDIS_SENTINEL_HOSTS,
+    REDIS_SENTINEL_PORT,
+    ENABLE_WISP_REDIS_CACHE,
+)
+from open_webui.utils.redis import get_redis_connection, get_sentinels_from_env
+
+logger = logging.getLogger(__name__)
+logger.setLevel(SRC_LOG_LEVELS["WISP"])
+
+_MISSING = object()
+
+
+def get_cache_redis():
+    """Async redis client for the shared cache tier, or None when it is disabled."""
+    if not (ENABLE_WISP_REDIS_CACHE and REDIS_URL):
+        return None
+    return get_redis_connection(
+        redis_url=REDIS_URL,
+        redis_sentinels=get_sentinels_from_env(
+            REDIS_SENTINEL_HOSTS, REDIS_SENTINEL_PORT
+        ),
+        redis_cluster=REDIS_CLUSTER,
+        async_mode=True,
+    )
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with a per-entry TTL, used to avoid repeating identical
+    wisp round-trips.
+
+    * Failures listed in ``negative_exceptions`` are remembered for
+      ``negative_ttl`` seconds; a hit raises a new exception of the same type
+      and arguments.
+    * Concurrent ``aget_or_load`` calls for the same key share one load.
+    * With ``refresh_ahead`` (a fraction of ``ttl``), ``aget_or_load`` hits on
+      entries older than ``refresh_ahead * ttl`` reload them in the background
+      and return the current value meanwhile.
+    * If a redis client is given, positive entries are also written to a
+      shared tier so other workers can reuse them; ``dumps``/``loads`` must
+      turn values into/from ``str``. Invalidations are then published so the
+      other workers drop their local copies too.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            maxsize: int = 1024,
+            ttl: float = 60,
+            negative_ttl: float = 0,
+            negative_exceptions: Tuple[Type[BaseException], ...] = (),
+            refresh_ahead: float = 0,
+            redis=None,
+            redis_key_prefix: Optional[str] = None,
+            dumps: Optional[Callable[[Any], str]] = None,
+            loads: Optional[Callable[[str], Any]] = None,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_exceptions = negative_exceptions
+        self.refresh_ahead = refresh_ahead
+
+        self._redis = redis if (dumps and loads) else None
+        self._redis_key_prefix = redis_key_prefix or name
+        self._dumps = dumps
+        self._loads = loads
+        self._channel = f"{self._redis_key_prefix}:invalidate"
+        # Tags the invalidations this instance publishes, it has applied them already
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+        # key -> (expires_at, value, is_negative)
+        self._data: "OrderedDict[str, Tuple[float, Any, bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "redis_hits": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "refreshes": 0,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "size": len(self._data)}
+
+    def _incr(self, name: str, value: int = 1):
+        self._stats[name] += value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Local lookup only; negative entries are re-raised."""
+        value = self._get_local(key)
+        return default if value is _MISSING else value
+
+    def peek(self, key: str, default: Any = None) -> Any:
+        """
+        Local lookup that leaves the stats and the LRU order alone; negative
+        entries read as missing.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[2] or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def _get_local(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value, is_negative = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+
+        if is_negative:
+            self._incr("negative_hits")
+            exc_type, args = value
+            # A new instance, raising the cached one would grow its traceback
+            raise exc_type(*args)
+        self._incr("hits")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._set_local(key, value, self.ttl if ttl is None else ttl, False)
+
+    def set_negative(self, key: str, exc: BaseException):
+        if self.negative_ttl > 0:
+            self._set_local(key, (type(exc), exc.args), self.negative_ttl, True)
+
+    def _set_local(self, key: str, value: Any, ttl: float, is_negative: bool):
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value, is_negative)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._incr("evictions")
+
+    def invalidate(self, key: str):
+        """
+        Drop a key. The shared tier entry is deleted, and the other workers
+        told, in the background when called on the event loop thread; use
+        ``ainvalidate`` to wait for it.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+        self._in_background(self._redis_delete(key))
+
+    def clear(self):
+        """Drop every local entry, on the other workers too."""
+        with self._lock:
+            self._data.clear()
+        self._in_background(self._publish("*"))
+
+    def _in_background(self, coro: Awaitable):
+        if self._redis is None:
+            coro.close()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            coro.close()
+            return
+        task = loop.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self._redis_key_prefix}:{key}"
+
+    async def _redis_get(self, key: str) -> Any:
+        if self._redis is None:
+            return _MISSING
+        try:
+            raw = await self._redis.get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"{self.name}: redis get failed: {e}")
+            return _MISSING
+        if raw is None:
+            return _MISSING
+        try:
+            return self._loads(raw)
+        except Exception as e:
+            logger.warning(f"{self.name}: failed to decode redis entry: {e}")
+            return _MISSING
+
+    async def _redis_set(self, key: str, value: Any):
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(self._redis_key(key), self._dumps(value), ex=max(int(self.ttl), 1))
+        except Exception as e:
+            logger.warning(f"{self.name}: redis set failed: {e}")
+
+    async def _redis_delete(self, key: str):
+        self._listen()
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.delete(self._redis_key(key))
+                pipe.publish(self._channel, f"{self._origin}:{key}")
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"{self.name}: redis delete failed: {e}")
+
+    async def _publish(self, key: str):
+        self._listen()
+        try:
+            await self._redis.publish(self._channel, f"{self._origin}:{key}")
+        except Exception as e:
+            logger.warning(f"{self.name}: redis publish failed: {e}")
+
+    def _listen(self):
+        """Apply the invalidations of other workers from now on."""
+        if self._redis is None or (self._listener is not None and not self._listener.done()):
+            return
+        self._listener = asyncio.get_running_loop().create_task(self._listen_forever())
+
+    async def _listen_forever(self):
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self._channel)
+                # Invalidations may have been missed while not subscribed
+                self.clear_local()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    origin, _, key = data.partition(":")
+                    if origin == self._origin:
+                        continue
+                    if key == "*":
+                        self.clear_local()
+                    else:
+                        with self._lock:
+                            self._data.pop(key, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name}: invalidation listener failed ({e}), resubscribing")
+                self.clear_local()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def clear_local(self):
+        with self._lock:
+            self._data.clear()
+
+    async def ainvalidate(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+        if self._redis is not None:
+            await self._redis_delete(key)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Synchronous variant for thread contexts; uses the local tier only."""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+
+        self._incr("misses")
+        self._incr("loads")
+        try:
+            value = loader()
+        except self.negative_exceptions as e:
+            self._incr("load_errors")
+            self.set_negative(key, e)
+            raise
+        self.set(key, value)
+        return value
+
+    def _refresh_due(self, key: str) -> bool:
+        if not 0 < self.refresh_ahead < 1 or key in self._inflight:
+            return False
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[2]:
+            return False
+        return entry[0] - time.monotonic() < self.ttl * (1 - self.refresh_ahead)
+
+    def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        async def run():
+            try:
+                self._incr("refreshes")
+                value = await loader()
+                self.set(key, value)
+                await self._redis_set(key, value)
+                future.set_result(value)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                # The entry keeps serving until it expires
+                logger.warning(f"{self.name}: background refresh failed: {e}")
+                future.cancel()
+            finally:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        self._listen()
+        value = self._get_local(key)
+        if value is not _MISSING:
+            if self._refresh_due(key):
+                self._refresh(key, loader)
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._incr("coalesced")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leading load was cancelled with its caller, load it ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._redis_get(key)
+            if value is not _MISSING:
+                self._incr("redis_hits")
+                self.set(key, value)
+            else:
+                self._incr("misses")
+                self._incr("loads")
+                value = await loader()
+                self.set(key, value)
+                await self._redis_set(key, value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if isinstance(e, self.negative_exceptions):
+                self._incr("load_errors")
+                self.set_negative(key, e)
+            future.set_exception(e)
+            # Mark retrieved so waiter-less failures are not logged as unhandled
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
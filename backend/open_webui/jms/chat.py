@@ -1,21 +1,150 @@
 import json
+import re
+import time
+import asyncio
+import base64
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence, Union
 
-from open_webui.jms.wisp.exceptions import WispError
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.jms.wisp.exceptions import WispAPIError, WispError
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    REDIS_KEY_PREFIX,
+    ENABLE_WISP_CHAT_PATCH,
+    WISP_CHAT_PATCH_RETRY_INTERVAL,
+    ENABLE_WISP_CHAT_BATCH,
+    WISP_CHAT_BATCH_RETRY_INTERVAL,
+    WISP_CHAT_CODEC,
+    WISP_CHAT_CACHE_TTL,
+    WISP_CHAT_CACHE_MAXSIZE,
+    WISP_CHAT_LIST_PAGE_SIZE,
+)
+
+from open_webui.utils.chat_search import chat_search_indexes
+
+from google.protobuf.message import DecodeError
 
 from .base import BaseWisp
+from .cache import TTLCache, get_cache_redis
+from .chat_codec import (
+    ACCEPT_PROTOBUF_HEADER,
+    PROTOBUF_BODY_HEADER,
+    decode_chat,
+    encode_chat,
+    is_protobuf_response,
+    json_dumps,
+    json_loads,
+)
 from .wisp.protobuf.service_pb2 import HTTPRequest
 
 logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["WISP"])
 
 CHAT_URL = "/api/v1/terminal/chats/"
+CHAT_BATCH_URL = f"{CHAT_URL}batch/"
 TERMINAL_CONFIG_URL = "/api/v1/terminal/terminals/config/"
+CHAT_PATCH_HEADER = {"Content-Type": "application/json-patch+json"}
+
+# Statuses of a server without the patch or batch endpoint; anything else is
+# a failure of the call itself and is raised as is
+UNSUPPORTED_STATUS_CODES = (404, 405, 415)
+# wisp's error text of a call answered with an error status, e.g. "405" or
+# "status code: 405 ..."
+_STATUS_CODE_RE = re.compile(r"(?:status[ _]code:?\s*)?([1-5]\d\d)\b", re.IGNORECASE)
+
+# Fields returned by `fields_size=mini`; a projection within them is served by it
+CHAT_MINI_FIELDS = ("id", "title", "updated_at", "created_at")
+
+
+def json_pointer(*tokens: str) -> str:
+    """RFC 6901 pointer, e.g. json_pointer("chat", "history", "messages", message_id)."""
+    return "".join("/" + str(t).replace("~", "~0").replace("/", "~1") for t in tokens)
+
+
+def set_op(*tokens: str, value: Any) -> dict:
+    # "add" on an object member replaces it, so it doubles as "set"
+    return {"op": "add", "path": json_pointer(*tokens), "value": value}
+
+
+def append_op(*tokens: str, value: Any) -> dict:
+    return {"op": "add", "path": json_pointer(*tokens, "-"), "value": value}
+
+
+def _many_op(op: str, ids: Sequence[str], user_id: Optional[str], **fields: Any) -> dict:
+    op = {"op": op, "ids": list(dict.fromkeys(chat_id for chat_id in ids if chat_id)), **fields}
+    if user_id:
+        op["user_id"] = user_id
+    return op
+
+
+def retrieve_many_op(ids: Sequence[str], user_id: Optional[str] = None) -> dict:
+    return _many_op("retrieve", ids, user_id)
+
+
+def update_many_op(ids: Sequence[str], data: Dict[str, Any], user_id: Optional[str] = None) -> dict:
+    return _many_op("update", ids, user_id, data=data)
+
+
+def delete_many_op(ids: Sequence[str], user_id: Optional[str] = None) -> dict:
+    return _many_op("delete", ids, user_id)
+
+
+def _dump_cache_entry(entry: tuple) -> str:
+    updated_at, body = entry
+    if isinstance(body, bytes):
+        # protobuf, the redis client only stores text
+        return json.dumps([updated_at, base64.b64encode(body).decode("ascii"), "protobuf"])
+    return json.dumps([updated_at, body])
+
+
+def _load_cache_entry(raw: str) -> tuple:
+    entry = json.loads(raw)
+    if len(entry) > 2:
+        return entry[0], base64.b64decode(entry[1])
+    return entry[0], entry[1]
+
+
+# chat_id -> (updated_at, raw response body: JSON text or protobuf bytes).
+# Bodies are decoded on every hit, so callers get their own copy to mutate.
+chat_cache = TTLCache(
+    "wisp.chat_cache",
+    maxsize=WISP_CHAT_CACHE_MAXSIZE,
+    ttl=WISP_CHAT_CACHE_TTL,
+    redis=get_cache_redis() if WISP_CHAT_CACHE_TTL > 0 else None,
+    redis_key_prefix=f"{REDIS_KEY_PREFIX}:wisp:chat_cache",
+    dumps=_dump_cache_entry,
+    loads=_load_cache_entry,
+)
+
+
+class ChatPage(NamedTuple):
+    results: List[dict]
+    # Pass back to get the following page, None on the last one
+    cursor: Optional[str]
+
+
+class ChatPatchResult(NamedTuple):
+    chat: Any
+    # Written as the full `fallback_data` rather than the ops
+    full_update: bool = False
+
+
+class ChatOpResult(NamedTuple):
+    ok: bool
+    # retrieve and update: the chats, delete: the deleted ids
+    result: Any = None
+    error: Optional[str] = None
 
 
 class ChatHandler(BaseWisp):
+    # Until this monotonic time, patches go straight to a full update because
+    # the server did not accept the patch endpoint
+    _patch_disabled_until: float = 0.0
+    # Same for the batch endpoint, ops then run one by one
+    _batch_disabled_until: float = 0.0
+    # Set once wisp answered with a ChatDocument, chats are then sent as one too
+    _protobuf_accepted: bool = False
+
     def get_providers(self):
         resp = self._request("GET", TERMINAL_CONFIG_URL, action="list providers")
         return self._loads(TERMINAL_CONFIG_URL, resp.body).get("CHAT_AI_PROVIDERS", [])
@@ -23,25 +152,101 @@ class ChatHandler(BaseWisp):
     def list(self, query: Optional[Dict[str, Any]] = None) -> List[dict]:
         query = self._normalize_query(query)
         resp = self._request("GET", CHAT_URL, query=query, action="list chats")
-        return self._loads(CHAT_URL, resp.body)
+        return self._validate_cached(self._loads(CHAT_URL, resp.body))
+
+    def list_page(
+            self,
+            query: Optional[Dict[str, Any]] = None,
+            *,
+            cursor: Optional[str] = None,
+            offset: int = 0,
+            limit: int = WISP_CHAT_LIST_PAGE_SIZE,
+            fields: Optional[Sequence[str]] = None,
+    ) -> ChatPage:
+        """
+        One page of chats ordered by (updated_at, id), newest first unless
+        `query` orders by 'date_updated'. Start at `offset` (page-numbered
+        callers) or at a `cursor` returned for the previous page; only the
+        `fields` given are kept in the results.
+        """
+        state = self._decode_cursor(cursor, offset)
+        query = self._page_query(query, state, limit, fields)
+        resp = self._request("GET", CHAT_URL, query=query, action="list chats")
+        return self._page(self._validate_cached(self._loads(CHAT_URL, resp.body)), query, state, limit, fields)
 
-    def retrieve(self, chat_id: str) -> dict:
+    def iter(
+            self,
+            query: Optional[Dict[str, Any]] = None,
+            *,
+            page_size: int = WISP_CHAT_LIST_PAGE_SIZE,
+            fields: Optional[Sequence[str]] = None,
+    ) -> Iterator[dict]:
+        """Every chat matching `query`, fetched page by page."""
+        cursor = None
+        while True:
+            page = self.list_page(query, cursor=cursor, limit=page_size, fields=fields)
+            yield from page.results
+            if page.cursor is None:
+                return
+            cursor = page.cursor
+
+    def retrieve(self, chat_id: str, fresh: bool = False) -> dict:
+        """
+        The chat, from the cache unless `fresh`: callers that write back what
+        they read must not start from a copy another worker has outdated.
+        """
         self._ensure_id(chat_id)
         path = f"{CHAT_URL}{chat_id}/"
-        resp = self._request("GET", path, action=f"retrieve chat {chat_id}")
-        return self._loads(path, resp.body)
+        if fresh:
+            entry = self._retrieve_entry(path, chat_id)
+            chat_cache.set(chat_id, entry)
+        else:
+            entry = chat_cache.get_or_load(chat_id, lambda: self._retrieve_entry(path, chat_id))
+        return self._loads(path, entry[1], isinstance(entry[1], bytes))
 
     def create(self, data: Dict[str, Any]) -> dict:
-        body = self._dumps(data)
-        resp = self._request("POST", CHAT_URL, body=body, action="create chat")
-        return self._loads(CHAT_URL, resp.body)
+        body, header = self._encode_chat(data)
+        resp = self._request("POST", CHAT_URL, body=body, header=header, action="create chat")
+        return self._index(self._loads_chat(CHAT_URL, resp.body)[0])
 
     def update(self, chat_id: Optional[str] = None, data: Dict[str, Any] = None, query: Dict[str, Any] = None) -> dict:
         self._ensure_id(chat_id)
         path = f"{CHAT_URL}{chat_id}/"
-        body = self._dumps(data)
-        resp = self._request("PATCH", path, query=query, body=body, action=f"update chat {chat_id}")
-        return self._loads(path, resp.body)
+        body, header = self._encode_chat(data, chat_id)
+        chat_cache.invalidate(chat_id)
+        resp = self._request(
+            "PATCH", path, query=query, body=body, header=header, action=f"update chat {chat_id}"
+        )
+        return self._remember(chat_id, path, resp.body)
+
+    def patch(self, chat_id: str, ops: List[dict], fallback_data: Dict[str, Any]) -> ChatPatchResult:
+        """
+        Apply JSON-Patch (RFC 6902) ops to a chat, e.g.
+        `set_op("chat", "history", "messages", message_id, value=message)`.
+
+        `fallback_data` is the equivalent full-update payload; it is only
+        serialized when the server does not support the patch endpoint, and
+        the result's `full_update` tells it was written.
+        """
+        self._ensure_id(chat_id)
+        if not self._patch_enabled():
+            return ChatPatchResult(self.update(chat_id, fallback_data), True)
+
+        path = f"{CHAT_URL}{chat_id}/patch/"
+        chat_cache.invalidate(chat_id)
+        try:
+            resp = self._request(
+                "PATCH", path, body=self._dumps(ops), header=self._accept(CHAT_PATCH_HEADER),
+                action=f"patch chat {chat_id}", expected_codes=UNSUPPORTED_STATUS_CODES,
+            )
+        except WispAPIError as e:
+            if e.status_code not in UNSUPPORTED_STATUS_CODES:
+                raise
+            # A missing chat fails the update too, and leaves patches enabled
+            result = self.update(chat_id, fallback_data)
+            self._disable_patch()
+            return ChatPatchResult(result, True)
+        return ChatPatchResult(self._remember(chat_id, path, resp.body))
 
     def destroy(self, chat_id: Optional[str] = None, query: Dict[str, Any] = None) -> None:
         """
@@ -55,8 +260,157 @@ class ChatHandler(BaseWisp):
         else:
             raise ValueError("Either chat_id or data must be provided")
 
+        self._forget(chat_id, query)
         self._request("DELETE", path, query=query, action=action)
 
+    def batch(self, ops: List[dict]) -> List[ChatOpResult]:
+        """
+        Run ops built with retrieve_many_op, update_many_op and
+        delete_many_op in one round trip, in order, with a result per op.
+        A failed op does not stop the following ones and ops are not atomic.
+        Ops given a user_id only touch that user's chats.
+
+        Ops run one by one only when the server has no batch endpoint; any
+        other failure of the call is raised, its ops may have been applied.
+        """
+        if not ops:
+            return []
+        self._before_batch(ops)
+        if not self._batch_enabled():
+            return [self._run_op(op) for op in ops]
+
+        try:
+            resp = self._request(
+                "POST", CHAT_BATCH_URL, body=self._dumps({"ops": ops}), action="run chat batch",
+                expected_codes=UNSUPPORTED_STATUS_CODES,
+            )
+        except WispAPIError as e:
+            if e.status_code not in UNSUPPORTED_STATUS_CODES:
+                raise
+            self._disable_batch()
+            return [self._run_op(op) for op in ops]
+        return self._batch_results(ops, resp.body)
+
+    async def aget_providers(self):
+        resp = await self._arequest("GET", TERMINAL_CONFIG_URL, action="list providers")
+        return self._loads(TERMINAL_CONFIG_URL, resp.body).get("CHAT_AI_PROVIDERS", [])
+
+    async def alist(self, query: Optional[Dict[str, Any]] = None) -> List[dict]:
+        query = self._normalize_query(query)
+        resp = await self._arequest("GET", CHAT_URL, query=query, action="list chats")
+        return self._validate_cached(self._loads(CHAT_URL, resp.body))
+
+    async def alist_page(
+            self,
+            query: Optional[Dict[str, Any]] = None,
+            *,
+            cursor: Optional[str] = None,
+            offset: int = 0,
+            limit: int = WISP_CHAT_LIST_PAGE_SIZE,
+            fields: Optional[Sequence[str]] = None,
+    ) -> ChatPage:
+        state = self._decode_cursor(cursor, offset)
+        query = self._page_query(query, state, limit, fields)
+        resp = await self._arequest("GET", CHAT_URL, query=query, action="list chats")
+        return self._page(self._validate_cached(self._loads(CHAT_URL, resp.body)), query, state, limit, fields)
+
+    async def aiter(
+            self,
+            query: Optional[Dict[str, Any]] = None,
+            *,
+            page_size: int = WISP_CHAT_LIST_PAGE_SIZE,
+            fields: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Every chat matching `query`, fetched page by page, so large results
+        (exports, /chats/all) are never held in memory whole.
+        """
+        cursor = None
+        while True:
+            page = await self.alist_page(query, cursor=cursor, limit=page_size, fields=fields)
+            for chat in page.results:
+                yield chat
+            if page.cursor is None:
+                return
+            cursor = page.cursor
+
+    async def aretrieve(self, chat_id: str, fresh: bool = False) -> dict:
+        self._ensure_id(chat_id)
+        path = f"{CHAT_URL}{chat_id}/"
+        if fresh:
+            entry = await self._aretrieve_entry(path, chat_id)
+            chat_cache.set(chat_id, entry)
+        else:
+            entry = await chat_cache.aget_or_load(chat_id, lambda: self._aretrieve_entry(path, chat_id))
+        return self._loads(path, entry[1], isinstance(entry[1], bytes))
+
+    async def acreate(self, data: Dict[str, Any]) -> dict:
+        body, header = self._encode_chat(data)
+        resp = await self._arequest("POST", CHAT_URL, body=body, header=header, action="create chat")
+        return self._index(self._loads_chat(CHAT_URL, resp.body)[0])
+
+    async def aupdate(
+            self, chat_id: Optional[str] = None, data: Dict[str, Any] = None, query: Dict[str, Any] = None
+    ) -> dict:
+        self._ensure_id(chat_id)
+        path = f"{CHAT_URL}{chat_id}/"
+        body, header = self._encode_chat(data, chat_id)
+        chat_cache.invalidate(chat_id)
+        resp = await self._arequest(
+            "PATCH", path, query=query, body=body, header=header, action=f"update chat {chat_id}"
+        )
+        return self._remember(chat_id, path, resp.body)
+
+    async def apatch(self, chat_id: str, ops: List[dict], fallback_data: Dict[str, Any]) -> ChatPatchResult:
+        self._ensure_id(chat_id)
+        if not self._patch_enabled():
+            return ChatPatchResult(await self.aupdate(chat_id, fallback_data), True)
+
+        path = f"{CHAT_URL}{chat_id}/patch/"
+        chat_cache.invalidate(chat_id)
+        try:
+            resp = await self._arequest(
+                "PATCH", path, body=self._dumps(ops), header=self._accept(CHAT_PATCH_HEADER),
+                action=f"patch chat {chat_id}", expected_codes=UNSUPPORTED_STATUS_CODES,
+            )
+        except WispAPIError as e:
+            if e.status_code not in UNSUPPORTED_STATUS_CODES:
+                raise
+            result = await self.aupdate(chat_id, fallback_data)
+            self._disable_patch()
+            return ChatPatchResult(result, True)
+        return ChatPatchResult(self._remember(chat_id, path, resp.body))
+
+    async def adestroy(self, chat_id: Optional[str] = None, query: Dict[str, Any] = None) -> None:
+        if chat_id:
+            path, action = f"{CHAT_URL}{chat_id}/", f"delete chat {chat_id}"
+        elif query is not None:
+            path, action = CHAT_URL, "bulk delete chats"
+        else:
+            raise ValueError("Either chat_id or data must be provided")
+
+        self._forget(chat_id, query)
+        await self._arequest("DELETE", path, query=query, action=action)
+
+    async def abatch(self, ops: List[dict]) -> List[ChatOpResult]:
+        if not ops:
+            return []
+        self._before_batch(ops)
+        if not self._batch_enabled():
+            return [await self._arun_op(op) for op in ops]
+
+        try:
+            resp = await self._arequest(
+                "POST", CHAT_BATCH_URL, body=self._dumps({"ops": ops}), action="run chat batch",
+                expected_codes=UNSUPPORTED_STATUS_CODES,
+            )
+        except WispAPIError as e:
+            if e.status_code not in UNSUPPORTED_STATUS_CODES:
+                raise
+            self._disable_batch()
+            return [await self._arun_op(op) for op in ops]
+        return self._batch_results(ops, resp.body)
+
     def _request(
             self,
             method: str,
@@ -64,23 +418,56 @@ class ChatHandler(BaseWisp):
             *,
             query: Optional[Dict[str, str]] = None,
             body: Optional[bytes] = None,
+            header: Optional[Dict[str, str]] = None,
             action: str = "call API",
+            expected_codes: Sequence[int] = (),
     ):
         """
-        Centralized request with optional retries and better error surfacing.
+        Centralized request with better error surfacing; deadlines and
+        retries of reads come from the RPC policy of the stub. Failures with
+        `expected_codes` are raised without being logged as errors.
         """
         req = HTTPRequest(
             method=method,
             path=path,
             query=query,
+            header=header,
             body=body
         )
 
         resp = self.stub.CallAPI(req)
+        return self._check_response(resp, action, expected_codes)
+
+    async def _arequest(
+            self,
+            method: str,
+            path: str,
+            *,
+            query: Optional[Dict[str, str]] = None,
+            body: Optional[bytes] = None,
+            header: Optional[Dict[str, str]] = None,
+            action: str = "call API",
+            expected_codes: Sequence[int] = (),
+    ):
+        """
+        Same as `_request`, but over the grpc.aio channel so the event loop is not blocked.
+        """
+        req = HTTPRequest(
+            method=method,
+            path=path,
+            query=query,
+            header=header,
+            body=body
+        )
+
+        resp = await self.aio_stub.CallAPI(req)
+        return self._check_response(resp, action, expected_codes)
+
+    def _check_response(self, resp, action: str, expected_codes: Sequence[int] = ()):
         if resp.status.ok:
             return resp
 
-        status_code = getattr(resp.status, "code", None)
+        status_code = self._status_code(resp.status)
 
         err_body = self._safe_decode(resp.body)
         err_msg = (
@@ -88,8 +475,295 @@ class ChatHandler(BaseWisp):
             f"status={status_code}, err={resp.status.err}, body={err_body!r}"
         )
 
-        logger.error(err_msg)
-        raise WispError(err_msg)
+        if status_code in expected_codes:
+            logger.debug(err_msg)
+        else:
+            logger.error(err_msg)
+        raise WispAPIError(err_msg, status_code)
+
+    @staticmethod
+    def _status_code(status) -> Optional[int]:
+        """
+        HTTP status of a failed call. wisp starts the error text with it;
+        other errors (connection, timeout) have none, whatever numbers they hold.
+        """
+        match = _STATUS_CODE_RE.match(status.err or "")
+        return int(match.group(1)) if match else None
+
+    def _retrieve_entry(self, path: str, chat_id: str) -> tuple:
+        resp = self._request("GET", path, header=self._accept(), action=f"retrieve chat {chat_id}")
+        return self._cache_entry(path, resp.body)
+
+    async def _aretrieve_entry(self, path: str, chat_id: str) -> tuple:
+        resp = await self._arequest("GET", path, header=self._accept(), action=f"retrieve chat {chat_id}")
+        return self._cache_entry(path, resp.body)
+
+    def _cache_entry(self, path: str, body: bytes) -> tuple:
+        chat, protobuf = self._loads_chat(path, body)
+        return (chat or {}).get("updated_at"), self._cache_body(body, protobuf)
+
+    @staticmethod
+    def _cache_body(body: bytes, protobuf: bool) -> Union[bytes, str]:
+        # Cached bodies keep their format in their type: protobuf stays bytes, JSON is text
+        return body if protobuf else body.decode("utf-8")
+
+    def _remember(self, chat_id: str, path: str, body: bytes) -> Any:
+        """
+        Parse a write response; if it is the full document, keep it as the
+        cached version (local tier only, other workers re-read it).
+        """
+        chat, protobuf = self._loads_chat(path, body)
+        if isinstance(chat, dict) and "chat" in chat and "updated_at" in chat:
+            chat_cache.set(chat_id, (chat["updated_at"], self._cache_body(body, protobuf)))
+            self._index(chat)
+        else:
+            # A retrieve that raced with the write may have cached the old version
+            chat_cache.invalidate(chat_id)
+        return chat
+
+    @staticmethod
+    def _index(chat: Any) -> Any:
+        if isinstance(chat, dict) and "id" in chat and "updated_at" in chat:
+            chat_search_indexes.upsert(chat)
+        return chat
+
+    @staticmethod
+    def _forget(chat_id: Optional[str], query: Optional[Dict[str, Any]] = None):
+        if chat_id:
+            chat_cache.invalidate(chat_id)
+            chat_search_indexes.remove(chat_id)
+        else:
+            # Bulk writes may touch any chat
+            chat_cache.clear()
+            chat_search_indexes.drop((query or {}).get("user_id"))
+
+    # Without the batch endpoint an op costs one list call (retrieve) or a
+    # call per chat (update, delete), the latter run concurrently on aio.
+
+    def _run_op(self, op: dict) -> ChatOpResult:
+        query = {"user_id": op["user_id"]} if op.get("user_id") else None
+        try:
+            if op["op"] == "retrieve":
+                chats, missing = self._cached_chats(op["ids"], query)
+                if missing:
+                    query = {**(query or {}), "ids": ",".join(missing)}
+                    chats.update((chat["id"], chat) for chat in self.iter(query))
+                return ChatOpResult(True, [chats[chat_id] for chat_id in op["ids"] if chat_id in chats])
+            if op["op"] == "update":
+                return self._op_result(op["ids"], [
+                    self._attempt(self.update, chat_id, op["data"], query) for chat_id in op["ids"]
+                ])
+            if op["op"] == "delete":
+                return self._op_result(op["ids"], [
+                    self._attempt(self.destroy, chat_id, query) for chat_id in op["ids"]
+                ], deleted=True)
+            raise ValueError(f"Unknown chat op {op['op']!r}")
+        except (WispError, ValueError) as e:
+            return ChatOpResult(False, error=str(e))
+
+    async def _arun_op(self, op: dict) -> ChatOpResult:
+        query = {"user_id": op["user_id"]} if op.get("user_id") else None
+        try:
+            if op["op"] == "retrieve":
+                chats, missing = self._cached_chats(op["ids"], query)
+                if missing:
+                    query = {**(query or {}), "ids": ",".join(missing)}
+                    chats.update([(chat["id"], chat) async for chat in self.aiter(query)])
+                return ChatOpResult(True, [chats[chat_id] for chat_id in op["ids"] if chat_id in chats])
+            if op["op"] == "update":
+                return self._op_result(op["ids"], await asyncio.gather(
+                    *(self.aupdate(chat_id, op["data"], query) for chat_id in op["ids"]), return_exceptions=True
+                ))
+            if op["op"] == "delete":
+                return self._op_result(op["ids"], await asyncio.gather(
+                    *(self.adestroy(chat_id, query) for chat_id in op["ids"]), return_exceptions=True
+                ), deleted=True)
+            raise ValueError(f"Unknown chat op {op['op']!r}")
+        except (WispError, ValueError) as e:
+            return ChatOpResult(False, error=str(e))
+
+    @staticmethod
+    def _attempt(func, *args) -> Any:
+        try:
+            return func(*args)
+        except (WispError, ValueError) as e:
+            return e
+
+    @staticmethod
+    def _op_result(ids: Sequence[str], outcomes: Sequence[Any], deleted: bool = False) -> ChatOpResult:
+        """
+        Result of an op run chat by chat: every chat is tried, the op is ok
+        only if all of them were and its error names the ids that failed.
+        """
+        done, failed = [], []
+        for chat_id, outcome in zip(ids, outcomes):
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, (WispError, ValueError)):
+                    raise outcome
+                failed.append(f"{chat_id}: {outcome}")
+            else:
+                done.append(chat_id if deleted else outcome)
+        return ChatOpResult(not failed, done, "; ".join(failed) or None)
+
+    @classmethod
+    def _cached_chats(cls, ids: Sequence[str], query: Optional[Dict[str, Any]]) -> tuple:
+        """Chats of `ids` held in the local cache, and the ids that are not."""
+        chats, missing = {}, []
+        for chat_id in ids:
+            try:
+                entry = chat_cache.get(chat_id)
+            except Exception:
+                entry = None
+            if entry is None:
+                missing.append(chat_id)
+                continue
+            chat = cls._loads(CHAT_URL, entry[1], isinstance(entry[1], bytes))
+            if isinstance(chat, dict) and (not query or chat.get("user_id") == query["user_id"]):
+                chats[chat_id] = chat
+        return chats, missing
+
+    @classmethod
+    def _before_batch(cls, ops: List[dict]):
+        for op in ops:
+            if op["op"] == "update":
+                for chat_id in op["ids"]:
+                    chat_cache.invalidate(chat_id)
+            elif op["op"] == "delete":
+                for chat_id in op["ids"]:
+                    cls._forget(chat_id)
+
+    @classmethod
+    def _batch_results(cls, ops: List[dict], body: bytes) -> List[ChatOpResult]:
+        resp = cls._loads(CHAT_BATCH_URL, body)
+        items = (resp.get("results") if isinstance(resp, dict) else resp) or []
+        if len(items) != len(ops):
+            # Not retried: the server may have applied every op
+            raise WispError(f"Chat batch returned {len(items)} results for {len(ops)} ops")
+
+        results = []
+        for op, item in zip(ops, items):
+            result = ChatOpResult(bool(item.get("ok")), item.get("result"), item.get("error"))
+            if result.ok and op["op"] == "retrieve":
+                cls._validate_cached(result.result)
+            elif op["op"] == "update":
+                # Only a whole document replaces the indexed one; chats updated
+                # in part or maybe not at all are dropped, the next search
+                # sync loads them again
+                indexed = set()
+                for chat in result.result or []:
+                    if isinstance(chat, dict) and "chat" in chat:
+                        indexed.add(cls._index(chat).get("id"))
+                for chat_id in op["ids"]:
+                    if chat_id not in indexed:
+                        chat_search_indexes.remove(chat_id)
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _validate_cached(resp: Any) -> Any:
+        """Drop cached documents that a list response shows to be outdated."""
+        results = resp.get("results", []) if isinstance(resp, dict) else resp
+        for item in results or []:
+            chat_id = item.get("id") if isinstance(item, dict) else None
+            if not chat_id or "updated_at" not in item:
+                continue
+            entry = chat_cache.peek(chat_id)
+            if entry is not None and entry[0] != item["updated_at"]:
+                chat_cache.invalidate(chat_id)
+        return resp
+
+    # The chat API pages by offset only. A cursor carries the offset of the
+    # next page plus the (updated_at, id) keyset of the last row returned, and
+    # rows at or before that key are dropped from the next page: chats created
+    # or bumped meanwhile shift the offsets but are not returned twice.
+
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str], offset: int) -> dict:
+        if not cursor:
+            return {"offset": max(offset or 0, 0), "updated_at": None, "ids": []}
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return {"offset": int(state["offset"]), "updated_at": state["updated_at"], "ids": list(state["ids"])}
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid chat list cursor: {cursor!r}") from e
+
+    @staticmethod
+    def _encode_cursor(state: dict) -> str:
+        raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @classmethod
+    def _page_query(
+            cls, query: Optional[Dict[str, Any]], state: dict, limit: int, fields: Optional[Sequence[str]]
+    ) -> Dict[str, str]:
+        query = dict(query or {})
+        query["offset"] = state["offset"]
+        query["limit"] = limit
+        # id breaks updated_at ties where the server allows ordering by it
+        query["ordering"] = "date_updated,id" if query.get("ordering") == "date_updated" else "-date_updated,-id"
+        if fields is not None and set(fields) <= set(CHAT_MINI_FIELDS):
+            query["fields_size"] = "mini"
+        return cls._normalize_query(query)
+
+    @classmethod
+    def _page(
+            cls, resp: Any, query: Dict[str, str], state: dict, limit: int, fields: Optional[Sequence[str]]
+    ) -> ChatPage:
+        rows = (resp.get("results") if isinstance(resp, dict) else resp) or []
+        ascending = not query["ordering"].startswith("-")
+
+        results = []
+        boundary, boundary_ids = state["updated_at"], set(state["ids"])
+        for row in rows:
+            updated_at = row.get("updated_at")
+            if boundary is not None and updated_at is not None:
+                passed = updated_at < boundary if ascending else updated_at > boundary
+                if passed or (updated_at == boundary and row.get("id") in boundary_ids):
+                    continue
+            results.append(row)
+
+        has_next = len(rows) >= limit
+        if isinstance(resp, dict) and "next" in resp:
+            has_next = bool(resp["next"])
+
+        cursor = None
+        if has_next:
+            next_state = {"offset": state["offset"] + len(rows), "updated_at": boundary, "ids": list(boundary_ids)}
+            if results and results[-1].get("updated_at") is not None:
+                last = results[-1]["updated_at"]
+                ids = [row.get("id") for row in results if row.get("updated_at") == last]
+                if last == boundary:
+                    ids = list(boundary_ids) + ids
+                next_state["updated_at"], next_state["ids"] = last, ids
+            cursor = cls._encode_cursor(next_state)
+
+        if fields is not None:
+            results = [{k: row[k] for k in fields if k in row} for row in results]
+        return ChatPage(results, cursor)
+
+    @classmethod
+    def _patch_enabled(cls) -> bool:
+        return ENABLE_WISP_CHAT_PATCH and time.monotonic() >= cls._patch_disabled_until
+
+    @classmethod
+    def _disable_patch(cls):
+        # The server answered it has no patch endpoint and the full update went through
+        logger.warning(
+            f"Chat patch endpoint unavailable, using full updates for {WISP_CHAT_PATCH_RETRY_INTERVAL}s"
+        )
+        cls._patch_disabled_until = time.monotonic() + WISP_CHAT_PATCH_RETRY_INTERVAL
+
+    @classmethod
+    def _batch_enabled(cls) -> bool:
+        return ENABLE_WISP_CHAT_BATCH and time.monotonic() >= cls._batch_disabled_until
+
+    @classmethod
+    def _disable_batch(cls):
+        # The server answered it has no batch endpoint, nothing was applied
+        logger.warning(
+            f"Chat batch endpoint unavailable, running ops one by one for {WISP_CHAT_BATCH_RETRY_INTERVAL}s"
+        )
+        cls._batch_disabled_until = time.monotonic() + WISP_CHAT_BATCH_RETRY_INTERVAL
 
     @staticmethod
     def _normalize_query(query: Optional[Dict[str, Any]]) -> Dict[str, str]:
@@ -97,18 +771,53 @@ class ChatHandler(BaseWisp):
             return {}
         return {str(k): ('' if v is None else str(v)) for k, v in query.items()}
 
+    # With WISP_CHAT_CODEC=protobuf, requests for a chat document accept a
+    # ChatDocument and servers without the schema keep answering JSON. Chats
+    # are sent as ChatDocument only after wisp answered with one.
+
+    @staticmethod
+    def _accept(header: Optional[Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+        if WISP_CHAT_CODEC != "protobuf":
+            return header
+        return {**(header or {}), **ACCEPT_PROTOBUF_HEADER}
+
+    @classmethod
+    def _encode_chat(cls, data: Dict[str, Any], chat_id: Optional[str] = None) -> tuple:
+        """Request body and header for a create or update with `data`."""
+        header = cls._accept()
+        if cls._protobuf_accepted and isinstance(data, dict) and "chat" in data:
+            body = encode_chat({**data, "id": chat_id} if chat_id else data)
+            if body is not None:
+                return body, {**(header or {}), **PROTOBUF_BODY_HEADER}
+        return cls._dumps(data), header
+
     @staticmethod
-    def _dumps(data: Dict[str, Any]) -> bytes:
+    def _dumps(data: Any) -> bytes:
         try:
-            return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            return json_dumps(data)
         except (TypeError, ValueError) as e:
             raise WispError(f"Failed to serialize request body: {e}") from e
 
-    @staticmethod
-    def _loads(path: str, b: bytes) -> Any:
+    @classmethod
+    def _loads_chat(cls, path: str, body: bytes) -> tuple:
+        """
+        Parse the answer to a request sent with `_accept()`, a chat document;
+        also tell whether it came as protobuf.
+        """
+        protobuf = is_protobuf_response(body, WISP_CHAT_CODEC == "protobuf")
+        return cls._loads(path, body, protobuf), protobuf
+
+    @classmethod
+    def _loads(cls, path: str, b: Union[bytes, str], protobuf: bool = False) -> Any:
+        if not b:
+            return None
         try:
-            return json.loads(b.decode("utf-8")) if b else None
-        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            if protobuf:
+                chat = decode_chat(b)
+                cls._protobuf_accepted = True
+                return chat
+            return json_loads(b)
+        except (UnicodeDecodeError, json.JSONDecodeError, DecodeError) as e:
             raise WispError(f"Failed to parse response body: {e} path {path}") from e
 
     @staticmethod
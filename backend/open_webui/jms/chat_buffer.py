@@ -0,0 +1,350 @@
+import asyncio
+import concurrent.futures
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    WISP_CHAT_WRITE_BEHIND_INTERVAL,
+    WISP_CHAT_WRITE_BEHIND_RETRIES,
+)
+
+from .chat import chat_manager, set_op
+
+logger = logging.getLogger(__name__)
+logger.setLevel(SRC_LOG_LEVELS["WISP"])
+
+
+def _join(older: Union[str, list], newer: Union[str, list], prepend: bool) -> Union[str, list]:
+    return newer + older if prepend else older + newer
+
+
+class _PendingChat:
+    __slots__ = ("messages", "statuses", "appends", "current_id")
+
+    def __init__(self):
+        self.messages: Dict[str, dict] = {}
+        self.statuses: Dict[str, List[dict]] = {}
+        # message id -> key -> (value to join with the stored one, prepend)
+        self.appends: Dict[str, Dict[str, Tuple[Union[str, list], bool]]] = {}
+        self.current_id: Optional[str] = None
+
+    def __bool__(self):
+        return bool(self.messages or self.statuses or self.appends)
+
+    def add_message(self, message_id: str, message: dict):
+        self.messages[message_id] = {**self.messages.get(message_id, {}), **message}
+        self.current_id = message_id
+        # Set values replace what was appended before
+        appends = self.appends.get(message_id)
+        if appends:
+            for key in message:
+                appends.pop(key, None)
+            if not appends:
+                del self.appends[message_id]
+
+    def add_append(self, message_id: str, key: str, value: Union[str, list], prepend: bool = False):
+        self.current_id = message_id
+        message = self.messages.get(message_id)
+        if message is not None and key in message:
+            message[key] = _join(message[key], value, prepend)
+            return
+        appends = self.appends.setdefault(message_id, {})
+        if key in appends:
+            value = _join(appends[key][0], value, prepend)
+        appends[key] = (value, prepend)
+
+    def add_status(self, message_id: str, status: dict):
+        self.statuses.setdefault(message_id, []).append(status)
+
+    def merge_older(self, older: "_PendingChat"):
+        """Fold patches that failed to flush back in, below the newer ones."""
+        for message_id, appends in older.appends.items():
+            newer = self.appends.setdefault(message_id, {})
+            for key, (value, prepend) in appends.items():
+                if key in self.messages.get(message_id, {}):
+                    continue
+                if key in newer:
+                    value = _join(value, newer[key][0], prepend)
+                newer[key] = (value, prepend)
+        for message_id, message in older.messages.items():
+            newer = self.appends.get(message_id, {})
+            for key in [key for key in newer if key in message]:
+                value, prepend = newer.pop(key)
+                message = {**message, key: _join(message[key], value, prepend)}
+            self.messages[message_id] = {**message, **self.messages.get(message_id, {})}
+        self.appends = {message_id: appends for message_id, appends in self.appends.items() if appends}
+        for message_id, statuses in older.statuses.items():
+            self.statuses[message_id] = statuses + self.statuses.get(message_id, [])
+        if self.current_id is None:
+            self.current_id = older.current_id
+
+    def apply(self, chat: dict) -> dict:
+        """Apply the patches to a chat document the same way ChatTable's upserts do."""
+        history = chat.setdefault("history", {})
+        messages = history.setdefault("messages", {})
+
+        for message_id, message in self.messages.items():
+            messages[message_id] = {**messages.get(message_id, {}), **message}
+
+        for message_id, appends in self.appends.items():
+            if message_id not in messages:
+                continue
+            message = messages[message_id]
+            for key, (value, prepend) in appends.items():
+                stored = message.get(key)
+                if stored is None:
+                    stored = value[:0]
+                message[key] = _join(stored, value, prepend)
+
+        for message_id, statuses in self.statuses.items():
+            if message_id in messages:
+                status_history = messages[message_id].get("statusHistory", [])
+                messages[message_id]["statusHistory"] = status_history + statuses
+
+        if self.current_id is not None:
+            history["currentId"] = self.current_id
+        return chat
+
+
+class ChatWriteBuffer:
+    """
+    Write-behind buffer for per-message chat patches.
+
+    Message upserts and status appends are coalesced in memory per chat and
+    written with one retrieve + update at most every `interval` seconds, or
+    earlier through `flush` (end of a stream, cancellation, shutdown).
+    Reads through ChatTable overlay the pending patches, so callers always
+    see their own writes.
+    """
+
+    def __init__(self, interval: float, retries: int = 3):
+        self.interval = interval
+        self.retries = retries
+        self._pending: Dict[str, _PendingChat] = {}
+        self._flushing: Dict[str, _PendingChat] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Flushes holding or waiting for each lock, it is dropped once none are left
+        self._lock_users: Dict[str, int] = {}
+        # Bumped by direct (unbuffered) writes so an in-flight flush re-reads the chat
+        self._versions: Dict[str, int] = {}
+        # Loop of the timers, the state is only changed on it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def enabled(self) -> bool:
+        if self.interval <= 0:
+            return False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    def has_pending(self, chat_id: str) -> bool:
+        return chat_id in self._pending or chat_id in self._flushing
+
+    def add_message(self, chat_id: str, message_id: str, message: dict):
+        if isinstance(message.get("content"), str):
+            message["content"] = message["content"].replace("\x00", "")
+        self._pending.setdefault(chat_id, _PendingChat()).add_message(message_id, message)
+        self._schedule(chat_id)
+
+    def add_append(self, chat_id: str, message_id: str, key: str, value: Union[str, list], prepend: bool = False):
+        """
+        Join `value` to the message's `key` when the chat is written, a string
+        (content deltas) or a list (embeds, files, sources), so appends need no
+        read of the chat.
+        """
+        if isinstance(value, str):
+            value = value.replace("\x00", "")
+        self._pending.setdefault(chat_id, _PendingChat()).add_append(message_id, key, value, prepend)
+        self._schedule(chat_id)
+
+    def add_status(self, chat_id: str, message_id: str, status: dict):
+        self._pending.setdefault(chat_id, _PendingChat()).add_status(message_id, status)
+        self._schedule(chat_id)
+
+    def overlay(self, chat_id: str, chat_dict: Optional[dict]) -> Optional[dict]:
+        if chat_dict is None or not self.has_pending(chat_id):
+            return chat_dict
+        chat = chat_dict.get("chat")
+        if not isinstance(chat, dict):
+            return chat_dict
+        for pending in (self._flushing.get(chat_id), self._pending.get(chat_id)):
+            if pending:
+                pending.apply(chat)
+        return chat_dict
+
+    def mark_written(self, chat_id: str):
+        """
+        Called after a direct full-document write that already contained the
+        overlay; the pending patches are now on the server.
+        """
+        self._call_on_loop(self._mark_written, chat_id)
+
+    def mark_message_written(self, chat_id: str, message_id: str):
+        """Like mark_written, for a direct write of a single message."""
+        self._call_on_loop(self._mark_message_written, chat_id, message_id)
+
+    def _mark_written(self, chat_id: str):
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+        self._pending.pop(chat_id, None)
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _mark_message_written(self, chat_id: str, message_id: str):
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            return
+        pending.messages.pop(message_id, None)
+        pending.statuses.pop(message_id, None)
+        pending.appends.pop(message_id, None)
+        if not pending:
+            self._mark_written(chat_id)
+
+    def _call_on_loop(self, callback, *args):
+        """
+        Run `callback` on the loop of the timers, and wait for it when called
+        from another thread (ChatTable's sync methods run in a threadpool).
+        """
+        loop = self._loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is None or running is loop or not loop.is_running():
+            callback(*args)
+            return
+
+        done = concurrent.futures.Future()
+
+        def run():
+            try:
+                done.set_result(callback(*args))
+            except BaseException as e:
+                done.set_exception(e)
+
+        loop.call_soon_threadsafe(run)
+        done.result()
+
+    def _schedule(self, chat_id: str):
+        if chat_id in self._timers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id))
+
+    async def _flush_later(self, chat_id: str):
+        await asyncio.sleep(self.interval)
+        self._timers.pop(chat_id, None)
+        try:
+            await self.flush(chat_id)
+        except Exception as e:
+            logger.error(f"Write-behind flush of chat {chat_id} failed: {e}")
+
+    async def flush(self, chat_id: str) -> None:
+        """Write all pending patches of a chat, retrying on failure."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._lock_users[chat_id] = self._lock_users.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                await self._flush_locked(chat_id)
+        finally:
+            self._lock_users[chat_id] -= 1
+            if not self._lock_users[chat_id]:
+                del self._lock_users[chat_id]
+                del self._locks[chat_id]
+
+    async def _flush_locked(self, chat_id: str):
+        pending = self._pending.pop(chat_id, None)
+        if not pending:
+            return
+        self._flushing[chat_id] = pending
+
+        version = ops = data = None
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    # Patches resolved before a direct write are applied on top of it
+                    if ops is None or self._versions.get(chat_id, 0) != version:
+                        version, pending, ops, data = await self._resolve(chat_id, pending)
+                        self._flushing[chat_id] = pending
+                    await chat_manager.apatch(chat_id, ops, data)
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if attempt >= self.retries:
+                        raise
+                    delay = min(0.2 * (2 ** attempt), 2.0)
+                    logger.warning(f"Flush of chat {chat_id} failed ({e}), retrying in {delay}s")
+                    await asyncio.sleep(delay)
+        except BaseException as e:
+            # Keep the patches so the next flush (or shutdown) still writes them
+            newer = self._pending.get(chat_id)
+            if newer:
+                newer.merge_older(pending)
+            else:
+                self._pending[chat_id] = pending
+            if isinstance(e, Exception):
+                # and try again later even if the chat gets no more writes
+                self._schedule(chat_id)
+            raise
+        finally:
+            self._flushing.pop(chat_id, None)
+
+    async def _resolve(self, chat_id: str, pending: _PendingChat) -> Tuple[int, _PendingChat, list, dict]:
+        """
+        Apply the patches to the chat as read now. They are returned as the
+        resulting messages, so writing them again (a retry of a write the
+        server applied before failing) or overlaying them on a read taken
+        after the write doesn't join the appends twice.
+        """
+        while True:
+            version = self._versions.get(chat_id, 0)
+            chat_dict = await chat_manager.aretrieve(chat_id, fresh=True)
+            if self._versions.get(chat_id, 0) == version:
+                break
+
+        chat = pending.apply(chat_dict.get("chat") or {})
+        messages = chat["history"]["messages"]
+
+        resolved = _PendingChat()
+        for message_id in {**pending.messages, **pending.statuses, **pending.appends}:
+            if message_id in messages:
+                resolved.messages[message_id] = messages[message_id]
+        resolved.current_id = pending.current_id
+
+        ops = [
+            set_op("chat", "history", "messages", message_id, value=message)
+            for message_id, message in resolved.messages.items()
+        ]
+        if resolved.current_id is not None:
+            ops.append(set_op("chat", "history", "currentId", value=resolved.current_id))
+
+        data = {
+            "chat": chat,
+            "title": chat["title"] if "title" in chat else "New Chat",
+        }
+        return version, resolved, ops, data
+
+    async def flush_all(self):
+        chat_ids = list(self._pending.keys())
+        results = await asyncio.gather(
+            *(self.flush(chat_id) for chat_id in chat_ids), return_exceptions=True
+        )
+        for chat_id, result in zip(chat_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to flush chat {chat_id}: {result}")
+
+
+chat_write_buffer = ChatWriteBuffer(
+    interval=WISP_CHAT_WRITE_BEHIND_INTERVAL,
+    retries=WISP_CHAT_WRITE_BEHIND_RETRIES,
+)
@@ -0,0 +1,195 @@
+import json
+import re
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .wisp.protobuf.chat_pb2 import ChatDocument, ChatMessage
+
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+JSON_CONTENT_TYPE = "application/json"
+# Sent by clients that read both; servers without the protobuf schema keep answering JSON
+ACCEPT_PROTOBUF_HEADER = {"Accept": f"{PROTOBUF_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.9"}
+PROTOBUF_BODY_HEADER = {"Content-Type": PROTOBUF_CONTENT_TYPE}
+
+# key in the chat document -> (ChatDocument field, value type)
+_DOC_FIELDS = {
+    "id": ("id", str),
+    "user_id": ("user_id", str),
+    "title": ("title", str),
+    "created_at": ("created_at", int),
+    "updated_at": ("updated_at", int),
+    "share_id": ("share_id", str),
+    "archived": ("archived", bool),
+    "pinned": ("pinned", bool),
+    "folder_id": ("folder_id", str),
+}
+# key in a history message -> (ChatMessage field, value type)
+_MESSAGE_FIELDS = {
+    "id": ("id", str),
+    "parentId": ("parent_id", str),
+    "childrenIds": ("children_ids", list),
+    "role": ("role", str),
+    "content": ("content", str),
+    "model": ("model", str),
+    "timestamp": ("timestamp", int),
+    "done": ("done", bool),
+}
+_MESSAGE_KEYS = {name: key for key, (name, _) in _MESSAGE_FIELDS.items()}
+
+
+def json_dumps(data: Any) -> bytes:
+    """Compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which json handles
+            pass
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# A JSON object or array, after the whitespace JSON allows before it
+_JSON_DOCUMENT_RE = re.compile(rb"[ \t\r\n]*[\[{]")
+
+
+def is_protobuf_response(body: Union[bytes, str, None], accepted: bool) -> bool:
+    """
+    Whether a chat API response is a ChatDocument. wisp's HTTPResponse has no
+    Content-Type, so the format follows from the request: only one sent with
+    ACCEPT_PROTOBUF_HEADER may be answered in protobuf, and a server without
+    the schema answers it with a JSON document instead.
+    """
+    return accepted and isinstance(body, bytes) and bool(body) and not _JSON_DOCUMENT_RE.match(body)
+
+
+def _typed(value: Any, kind: type) -> bool:
+    # bool is an int subclass, but True must not become the int 1
+    return type(value) is kind
+
+
+def _encode_message(message_id: str, message: dict) -> Optional[ChatMessage]:
+    if not message_id or not isinstance(message, dict) or message.get("id") != message_id:
+        return None
+    fields, extra = {}, {}
+    for key, value in message.items():
+        spec = _MESSAGE_FIELDS.get(key)
+        if spec is not None and _typed(value, spec[1]):
+            fields[spec[0]] = value
+        else:
+            extra[key] = value
+    # An empty list is not told apart from a missing one, nor other items from strings
+    children_ids = fields.get("children_ids")
+    if children_ids is not None and not (children_ids and all(type(i) is str for i in children_ids)):
+        extra["childrenIds"] = fields.pop("children_ids")
+    if extra:
+        fields["extra"] = json_dumps(extra)
+    return ChatMessage(**fields)
+
+
+def _decode_message(pb: ChatMessage) -> dict:
+    # ListFields returns only the fields that are set, in one call
+    message = {}
+    extra = None
+    for field, value in pb.ListFields():
+        if field.name == "extra":
+            extra = value
+        elif field.name == "children_ids":
+            message["childrenIds"] = list(value)
+        else:
+            message[_MESSAGE_KEYS[field.name]] = value
+    if extra:
+        message.update(json_loads(extra))
+    return message
+
+
+def _encode_history(pb: ChatDocument, chat: dict) -> bool:
+    """Type chat.history into `pb`, False if it does not fit the schema."""
+    history = chat.get("history")
+    if not isinstance(history, dict) or not set(history) <= {"messages", "currentId"}:
+        return False
+    messages = history.get("messages")
+    current_id = history.get("currentId")
+    if not isinstance(messages, dict) or not messages or not _typed(current_id, str):
+        return False
+
+    encoded = []
+    for message_id, message in messages.items():
+        message_pb = _encode_message(message_id, message)
+        if message_pb is None:
+            return False
+        encoded.append(message_pb)
+    pb.messages.extend(encoded)
+    pb.current_id = current_id
+    return True
+
+
+def encode_chat(doc: dict) -> Optional[bytes]:
+    """
+    Serialize a chat document, or a partial one for an update, as a
+    ChatDocument. Values that do not fit the schema travel as JSON in the
+    extra fields, so decode_chat(encode_chat(doc)) == doc. None when the
+    document has no string id.
+    """
+    if not _typed(doc.get("id"), str) or not doc["id"]:
+        return None
+
+    pb = ChatDocument()
+    extra = {}
+    for key, value in doc.items():
+        spec = _DOC_FIELDS.get(key)
+        if spec is not None and _typed(value, spec[1]):
+            setattr(pb, spec[0], value)
+        elif key == "meta" and isinstance(value, dict):
+            pb.meta = json_dumps(value)
+        elif key == "chat" and isinstance(value, dict):
+            chat_extra = dict(value)
+            if _encode_history(pb, value):
+                del chat_extra["history"]
+                branch = value.get("messages")
+                history = value["history"]["messages"]
+                # chat.messages repeats the current branch of the history
+                if isinstance(branch, list) and branch and all(
+                        isinstance(m, dict) and _typed(m.get("id"), str) and history.get(m["id"]) == m
+                        for m in branch
+                ):
+                    pb.branch_ids.extend(m["id"] for m in branch)
+                    del chat_extra["messages"]
+            pb.chat_extra = json_dumps(chat_extra)
+        else:
+            extra[key] = value
+    if extra:
+        pb.extra = json_dumps(extra)
+    return pb.SerializeToString()
+
+
+def decode_chat(body: bytes) -> dict:
+    pb = ChatDocument()
+    pb.ParseFromString(body)
+
+    doc = {"id": pb.id}
+    for key, (name, _) in _DOC_FIELDS.items():
+        if key != "id" and pb.HasField(name):
+            doc[key] = getattr(pb, name)
+    if pb.meta:
+        doc["meta"] = json_loads(pb.meta)
+    if pb.chat_extra:
+        chat = json_loads(pb.chat_extra)
+        if pb.messages:
+            messages = {message.id: _decode_message(message) for message in pb.messages}
+            chat["history"] = {"messages": messages, "currentId": pb.current_id}
+            if pb.branch_ids:
+                chat["messages"] = [dict(messages[message_id]) for message_id in pb.branch_ids]
+        doc["chat"] = chat
+    if pb.extra:
+        doc.update(json_loads(pb.extra))
+    return doc
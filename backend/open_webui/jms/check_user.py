@@ -1,50 +1,139 @@
+import base64
+import hashlib
 import logging
 from http.cookies import SimpleCookie
-from typing import Mapping
+from typing import Mapping, Optional
 
 from fastapi import Request
 from open_webui.jms.wisp.protobuf import service_pb2
 from open_webui.jms.wisp.exceptions import WispError
 from open_webui.jms.wisp.protobuf.common_pb2 import User
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    REDIS_KEY_PREFIX,
+    WISP_USER_CACHE_COOKIES,
+    WISP_USER_CACHE_TTL,
+    WISP_USER_CACHE_NEGATIVE_TTL,
+    WISP_USER_CACHE_MAXSIZE,
+)
 
 from .base import BaseWisp
+from .cache import TTLCache, get_cache_redis
 
 logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["WISP"])
 
 
+def _dump_user(user: User) -> str:
+    return base64.b64encode(user.SerializeToString()).decode("ascii")
+
+
+def _load_user(raw: str) -> User:
+    return User.FromString(base64.b64decode(raw))
+
+
+class UserCheckError(WispError):
+    """Wisp rejected the cookies; remembered for a while, unlike unavailability."""
+    pass
+
+
+user_cache = TTLCache(
+    "wisp.user_cache",
+    maxsize=WISP_USER_CACHE_MAXSIZE,
+    ttl=WISP_USER_CACHE_TTL,
+    negative_ttl=WISP_USER_CACHE_NEGATIVE_TTL,
+    negative_exceptions=(UserCheckError,),
+    redis=get_cache_redis(),
+    redis_key_prefix=f"{REDIS_KEY_PREFIX}:wisp:user_cache",
+    dumps=_dump_user,
+    loads=_load_user,
+)
+
+
 class CheckUserHandler(BaseWisp):
 
     def check_user_by_cookies(self, request: Request) -> User:
-        req = service_pb2.CookiesRequest()
-        for name, value in request.cookies.items():
-            c = req.cookies.add()
-            c.name = name
-            c.value = value
+        return self.check_user_by_cookie_map(request.cookies)
+
+    def check_user_by_cookie_map(self, cookies: Mapping[str, str]) -> User:
+        key = self._cache_key(cookies)
+        if key is None:
+            return self._check_user(cookies)
+        return self._copy(user_cache.get_or_load(key, lambda: self._check_user(cookies)))
+
+    def check_user_by_cookie_header(self, cookie_header: str) -> User:
+        return self.check_user_by_cookie_map(self._parse_cookie_header(cookie_header))
 
+    async def acheck_user_by_cookies(self, request: Request) -> User:
+        return await self.acheck_user_by_cookie_map(request.cookies)
+
+    async def acheck_user_by_cookie_map(self, cookies: Mapping[str, str]) -> User:
+        key = self._cache_key(cookies)
+        if key is None:
+            return await self._acheck_user(cookies)
+        user = await user_cache.aget_or_load(key, lambda: self._acheck_user(cookies))
+        return self._copy(user)
+
+    async def acheck_user_by_cookie_header(self, cookie_header: str) -> User:
+        return await self.acheck_user_by_cookie_map(self._parse_cookie_header(cookie_header))
+
+    @classmethod
+    async def ainvalidate(cls, cookies: Mapping[str, str]) -> None:
+        key = cls._cache_key(cookies)
+        if key is not None:
+            await user_cache.ainvalidate(key)
+
+    def _check_user(self, cookies: Mapping[str, str]) -> User:
+        req = self._build_request(cookies)
         user_resp = self.stub.CheckUserByCookies(req)
-        if not user_resp.status.ok:
-            error_message = f'Failed to check user: {user_resp.status.err}'
-            logger.error(error_message)
-            raise WispError(error_message)
-        return user_resp.data
+        return self._check_response(user_resp)
 
-    def check_user_by_cookie_map(self, cookies: Mapping[str, str]) -> User:
+    async def _acheck_user(self, cookies: Mapping[str, str]) -> User:
+        req = self._build_request(cookies)
+        user_resp = await self.aio_stub.CheckUserByCookies(req)
+        return self._check_response(user_resp)
+
+    @staticmethod
+    def _cache_key(cookies: Mapping[str, str]) -> Optional[str]:
+        """
+        Hash of the session cookies, None when the request carries none of them
+        (such lookups are never cached).
+        """
+        parts = [
+            f"{name}={cookies[name]}"
+            for name in sorted(WISP_USER_CACHE_COOKIES)
+            if cookies.get(name)
+        ]
+        if not parts:
+            return None
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _copy(user: User) -> User:
+        # Callers adjust fields such as `role`, keep the cached message pristine
+        copied = User()
+        copied.CopyFrom(user)
+        return copied
+
+    @staticmethod
+    def _build_request(cookies: Mapping[str, str]) -> service_pb2.CookiesRequest:
         req = service_pb2.CookiesRequest()
         for name, value in cookies.items():
             c = req.cookies.add()
             c.name = name
             c.value = value
-        user_resp = self.stub.CheckUserByCookies(req)
+        return req
+
+    @staticmethod
+    def _check_response(user_resp) -> User:
         if not user_resp.status.ok:
             error_message = f'Failed to check user: {user_resp.status.err}'
             logger.error(error_message)
-            raise WispError(error_message)
+            raise UserCheckError(error_message)
         return user_resp.data
 
-    def check_user_by_cookie_header(self, cookie_header: str) -> User:
+    @staticmethod
+    def _parse_cookie_header(cookie_header: str) -> dict:
         cookie = SimpleCookie()
         cookie.load(cookie_header or "")
-        cookies = {k: morsel.value for k, morsel in cookie.items()}
-        return self.check_user_by_cookie_map(cookies)
+        return {k: morsel.value for k, morsel in cookie.items()}
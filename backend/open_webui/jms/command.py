@@ -1,10 +1,23 @@
+import os
+import base64
+import asyncio
 import logging
-from typing import Optional
+from glob import glob
+from typing import Dict, List, Optional, Set
 from datetime import datetime
 
-from open_webui.env import SRC_LOG_LEVELS
+import grpc
+
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    WISP_COMMAND_QUEUE_SIZE,
+    WISP_COMMAND_BATCH_SIZE,
+    WISP_COMMAND_RETRIES,
+    WISP_SHUTDOWN_TIMEOUT,
+)
+from open_webui.jms.wisp import PROJECT_DIR
 from open_webui.jms.wisp.protobuf import service_pb2
-from open_webui.jms.wisp.exceptions import WispError
+from open_webui.jms.wisp.exceptions import WispError, WispUnavailableError
 from open_webui.jms.base import BaseWisp
 from open_webui.jms.schemas import CommandRecord
 
@@ -12,6 +25,235 @@ logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["WISP"])
 
 
+class CommandUploader(BaseWisp):
+    """
+    Background pipeline for command audit records.
+
+    `submit` only queues the record; a worker task sends queued records in
+    batches of concurrent UploadCommand calls (wisp has no batch RPC),
+    retrying transport failures with backoff. Records that still cannot be
+    delivered, or that do not fit in the queue, are appended to an on-disk
+    journal which `start` replays on the next startup.
+    """
+    JOURNAL_DIR = os.path.join(PROJECT_DIR, 'data/command')
+
+    def __init__(self, queue_size: int, batch_size: int, retries: int):
+        super().__init__()
+        self.queue_size = queue_size
+        self.batch_size = max(batch_size, 1)
+        self.retries = retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # id -> record of the batch being sent, until it was sent or given up on
+        self._inflight: Dict[int, service_pb2.CommandRequest] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    async def start(self):
+        self._ensure_worker()
+        self._spawn(self._replay_journal())
+
+    def submit(self, req: service_pb2.CommandRequest):
+        try:
+            self._ensure_worker()
+        except RuntimeError:
+            # No event loop in this thread, nothing would drain the queue
+            self._append_journal([req])
+            return
+
+        try:
+            self._queue.put_nowait(req)
+        except asyncio.QueueFull:
+            logger.warning(f"Command queue full, journaling command of session {req.sid}")
+            self._spawn(self._journal([req]))
+
+    async def aclose(self):
+        """Give queued records a chance to be sent, journal whatever is left."""
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), WISP_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out sending queued commands, journaling the rest")
+
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+        left = list(self._inflight.values())
+        while not self._queue.empty():
+            left.append(self._queue.get_nowait())
+        if left:
+            await self._journal(left)
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+        self._queue = None
+        self._worker = None
+        self._inflight = {}
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._worker.get_loop() is loop:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker = loop.create_task(self._run())
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            self._inflight = {id(req): req for req in batch}
+            try:
+                await self._send_batch(batch)
+            except Exception as e:
+                logger.error(f"Failed to send command batch: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            # Left as is when cancelled, aclose journals what was not sent
+            self._inflight = {}
+
+    async def _send(self, req: service_pb2.CommandRequest):
+        await self._upload(req)
+        # Sent, so not journaled again if the batch is cancelled by aclose
+        self._inflight.pop(id(req), None)
+
+    async def _send_batch(self, batch: List[service_pb2.CommandRequest]):
+        pending = batch
+        for attempt in range(self.retries + 1):
+            results = await asyncio.gather(
+                *(self._send(req) for req in pending), return_exceptions=True
+            )
+            failed = []
+            for req, result in zip(pending, results):
+                if isinstance(result, (grpc.aio.AioRpcError, WispUnavailableError)):
+                    failed.append(req)
+                elif isinstance(result, BaseException):
+                    # Rejected by wisp, sending it again would not help
+                    self._inflight.pop(id(req), None)
+                    logger.error(f"Dropping command of session {req.sid}: {result}")
+            pending = failed
+            if not pending:
+                return
+            if attempt < self.retries:
+                delay = min(0.5 * (2 ** attempt), 30.0)
+                logger.warning(f"Failed to upload {len(pending)} commands, retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+        logger.error(f"Wisp unavailable, journaling {len(pending)} commands")
+        for req in pending:
+            self._inflight.pop(id(req), None)
+        await self._journal(pending)
+
+    async def _upload(self, req: service_pb2.CommandRequest):
+        resp = await self.aio_stub.UploadCommand(req)
+        if not resp.status.ok:
+            error_message = f'Failed to upload command: {resp.status.err}'
+            logger.error(error_message)
+            raise WispError(error_message)
+
+    def _journal_path(self) -> str:
+        return os.path.join(self.JOURNAL_DIR, f"commands-{os.getpid()}.journal")
+
+    async def _journal(self, reqs: List[service_pb2.CommandRequest]):
+        await asyncio.to_thread(self._append_journal, reqs)
+
+    def _append_journal(self, reqs: List[service_pb2.CommandRequest]):
+        try:
+            os.makedirs(self.JOURNAL_DIR, exist_ok=True)
+            with open(self._journal_path(), "a", encoding="ascii") as f:
+                for req in reqs:
+                    f.write(base64.b64encode(req.SerializeToString()).decode("ascii") + "\n")
+        except OSError as e:
+            logger.error(f"Failed to journal {len(reqs)} commands, they are lost: {e}")
+
+    async def _replay_journal(self):
+        reqs = await asyncio.to_thread(self._claim_journal)
+        if not reqs:
+            return
+        logger.info(f"Replaying {len(reqs)} journaled commands")
+        for req in reqs:
+            await self._queue.put(req)
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        except (OverflowError, OSError):
+            return False
+        return True
+
+    def _claimable(self, path: str) -> bool:
+        """
+        Whether the journal at `path` was left behind: its writer (or, for a
+        claimed journal, its replayer) is not running. A journal named after
+        this process is from a previous one that had the same PID.
+        """
+        name = os.path.basename(path)
+        if name.endswith(".replaying"):
+            pid = name.rsplit(".", 2)[-2]
+        else:
+            pid = name[len("commands-"):-len(".journal")]
+        try:
+            pid = int(pid)
+        except ValueError:
+            return False
+        return pid == os.getpid() or not self._pid_alive(pid)
+
+    def _claim_journal(self) -> List[service_pb2.CommandRequest]:
+        reqs = []
+        paths = glob(os.path.join(self.JOURNAL_DIR, "commands-*.journal"))
+        paths += glob(os.path.join(self.JOURNAL_DIR, "commands-*.journal.*.replaying"))
+        for path in paths:
+            if not self._claimable(path):
+                # Still being written or replayed by a live worker
+                continue
+            journal = path.split(".journal", 1)[0] + ".journal"
+            claimed = f"{journal}.{os.getpid()}.replaying"
+            try:
+                # Atomic, so with several workers each journal is replayed once
+                os.rename(path, claimed)
+            except OSError:
+                continue
+
+            try:
+                with open(claimed, encoding="ascii") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            reqs.append(service_pb2.CommandRequest.FromString(base64.b64decode(line)))
+                        except Exception as e:
+                            logger.error(f"Skipping corrupt journal entry in {claimed}: {e}")
+                os.remove(claimed)
+            except OSError as e:
+                logger.error(f"Failed to replay command journal {claimed}: {e}")
+        return reqs
+
+
+command_uploader = CommandUploader(
+    queue_size=WISP_COMMAND_QUEUE_SIZE,
+    batch_size=WISP_COMMAND_BATCH_SIZE,
+    retries=WISP_COMMAND_RETRIES,
+)
+
+
 class CommandHandler(BaseWisp):
 
     def __init__(self, session_id: str, session_info: dict):
@@ -20,7 +262,8 @@ class CommandHandler(BaseWisp):
         self.session_info = session_info
         self.command_record: Optional[CommandRecord] = None
 
-    async def record_command(self):
+    def record_command(self):
+        """Queue the command for upload, see CommandUploader."""
         req = service_pb2.CommandRequest(
             sid=self.session_id,
             org_id=self.session_info['org_id'],
@@ -34,8 +277,4 @@ class CommandHandler(BaseWisp):
             cmd_acl_id='',
             cmd_group_id='',
         )
-        resp = self.stub.UploadCommand(req)
-        if not resp.status.ok:
-            error_message = f'Failed to upload command: {resp.status.err}'
-            logger.error(error_message)
-            raise WispError(error_message)
+        command_uploader.submit(req)
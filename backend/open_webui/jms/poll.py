@@ -1,25 +1,62 @@
 import os
-import queue
+import time
 import logging
 import asyncio
 import threading
+from typing import Dict, List, Optional
 
-from open_webui.env import SRC_LOG_LEVELS
-from open_webui.jms.wisp import PROJECT_DIR
+from opentelemetry import metrics
+
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    WISP_DISPATCH_BATCH_WINDOW,
+    WISP_DISPATCH_RECONNECT_MAX_DELAY,
+    WISP_RPC_TIMEOUT,
+)
+from open_webui.jms.wisp import PROJECT_DIR, get_aio_channel, shutdown_aio_protobuf
 from open_webui.jms.wisp.protobuf import service_pb2
-from open_webui.jms.wisp.exceptions import WispError
-from open_webui.jms.wisp.protobuf.common_pb2 import KillSession
+from open_webui.jms.wisp.exceptions import WispError, WispUnavailableError
+from open_webui.jms.wisp.protobuf.common_pb2 import KillSession, TaskAction, TerminalTask
 from .base import BaseWisp
-from .session import JMSSession
+from .account import AccountChatHandler
+from .session import session_closer
 
 logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["WISP"])
 
+meter = metrics.get_meter(__name__)
+task_duration_histogram = meter.create_histogram(
+    name="wisp.dispatch.task.duration",
+    description="Time from receiving a wisp task to acknowledging it",
+    unit="ms",
+)
+
 
 class PollJMSEvent(BaseWisp):
-    @staticmethod
-    async def close_session(target_session: JMSSession):
-        await target_session.close()
+    """
+    Receives wisp's DispatchTask stream on a dedicated thread running one
+    long-lived event loop, and reconnects with exponential backoff when the
+    stream breaks, over a new stream channel each time.
+
+    Kill tasks arriving in a burst are handled as one batch: one chat lookup
+    for all of them, generation tasks of the chats are stopped on the app
+    loop, then the sessions are closed concurrently.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.app_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.redis = None
+        self._stats = {
+            "received": 0,
+            "completed": 0,
+            "failed": 0,
+            "reconnects": 0,
+        }
+        self._backlog = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "backlog": self._backlog}
 
     def clear_zombie_session(self):
         replay_dir = os.path.join(PROJECT_DIR, 'data/replay')
@@ -32,31 +69,129 @@ class PollJMSEvent(BaseWisp):
         else:
             logger.info('Scan remain replay success')
 
-    def wait_for_kill_session_message(self):
+    async def run(self):
+        try:
+            await asyncio.to_thread(self.clear_zombie_session)
+        except Exception as e:
+            logger.error(f"Failed to scan remain replays: {e}")
+
+        delay = 1.0
+        while True:
+            connected_at = time.monotonic()
+            try:
+                await self.dispatch_tasks()
+                logger.warning("Wisp task stream closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Wisp task stream failed: {e}")
+
+            # Reconnect on a new connection, to the next address if there are
+            # several, instead of waiting out the channel's reconnect backoff
+            await get_aio_channel().reset_stream_channel()
+
+            # Wisp may have restarted with another account configured
+            AccountChatHandler.invalidate()
+            if time.monotonic() - connected_at > WISP_DISPATCH_RECONNECT_MAX_DELAY:
+                # The stream was healthy for a while, start backing off afresh
+                delay = 1.0
+            self._stats["reconnects"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WISP_DISPATCH_RECONNECT_MAX_DELAY)
+
+    async def dispatch_tasks(self):
+        acks: asyncio.Queue = asyncio.Queue()
+        received: asyncio.Queue = asyncio.Queue()
+
+        async def requests():
+            while True:
+                yield await acks.get()
+
+        channel = get_aio_channel()
+        if not await channel.stream_channel_ready(WISP_RPC_TIMEOUT):
+            raise WispUnavailableError(f"Wisp at {channel.stream_target} is not ready")
+
+        call = self.aio_stub.DispatchTask(requests())
+        worker = asyncio.create_task(self._handle_tasks(received, acks))
+        try:
+            async for resp in call:
+                self._stats["received"] += 1
+                self._backlog += 1
+                received.put_nowait((time.monotonic(), resp.task))
+        finally:
+            worker.cancel()
+            call.cancel()
+            # Unacknowledged tasks stay unfinished on the wisp side
+            self._backlog = 0
+
+    async def _handle_tasks(self, received: asyncio.Queue, acks: asyncio.Queue):
+        while True:
+            batch = [await received.get()]
+            await asyncio.sleep(WISP_DISPATCH_BATCH_WINDOW)
+            while not received.empty():
+                batch.append(received.get_nowait())
+
+            try:
+                await self.kill_sessions([task for _, task in batch if task.action == KillSession])
+                failed = False
+            except Exception as e:
+                logger.error(f"Failed to handle {len(batch)} wisp tasks: {e}")
+                failed = True
+
+            now = time.monotonic()
+            for received_at, task in batch:
+                acks.put_nowait(service_pb2.FinishedTaskRequest(task_id=task.id))
+                self._backlog -= 1
+                self._stats["failed" if failed else "completed"] += 1
+                task_duration_histogram.record(
+                    (now - received_at) * 1000, {"wisp.task.action": TaskAction.Name(task.action)}
+                )
+
+    async def kill_sessions(self, tasks: List[TerminalTask]):
+        session_ids = list(dict.fromkeys(task.session_id for task in tasks if task.session_id))
+        if not session_ids:
+            return
+
         from open_webui.jms import chat_manager
-        q = queue.Queue(maxsize=1000)
-        for resp in self.stub.DispatchTask(iter(q.get, None)):
-            task = resp.task
-            session_id = task.session_id
-            task_action = task.action
+        chats = await chat_manager.alist(query={'ids': ','.join(session_ids)})
 
-            if task_action == KillSession:
-                filtered = chat_manager.list(query={'ids': session_id})
-                for chat in filtered:
-                    asyncio.run(self.close_session(JMSSession(chat)))
+        await asyncio.gather(*(self.stop_generation(session_id) for session_id in session_ids))
+        results = await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in session_closer.close(chats)), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to close killed session: {result}")
 
-            req = service_pb2.FinishedTaskRequest(task_id=session_id)
-            self.stub.FinishSession(req)
+    async def stop_generation(self, session_id: str):
+        """Cancel the chat's running completions; they live on the app loop."""
+        if self.app_loop is None or self.app_loop.is_closed():
+            return
 
-    def start_session_killer(self):
-        self.wait_for_kill_session_message()
+        from open_webui.tasks import stop_item_tasks
+        future = asyncio.run_coroutine_threadsafe(stop_item_tasks(self.redis, session_id), self.app_loop)
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.error(f"Failed to stop tasks of killed session {session_id}: {e}")
 
     def start(self):
-        self.clear_zombie_session()
-        self.start_session_killer()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.run())
+        finally:
+            loop.run_until_complete(shutdown_aio_protobuf())
+            loop.close()
+
+
+jms_event = PollJMSEvent()
 
 
-def setup_poll_jms_event():
-    jms_event = PollJMSEvent()
-    thread = threading.Thread(target=jms_event.start)
+def setup_poll_jms_event(redis=None):
+    """Start the task dispatcher; call from the app loop so kills can stop its tasks."""
+    jms_event.app_loop = asyncio.get_running_loop()
+    session_closer.bind(jms_event.app_loop)
+    jms_event.redis = redis
+    thread = threading.Thread(target=jms_event.start, name="wisp-dispatch", daemon=True)
     thread.start()
@@ -1,122 +1,328 @@
 import os
+import json
+import time
+import gzip
+import shutil
+import hashlib
+import asyncio
 import textwrap
+import threading
 import logging
 from pathlib import Path
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 from open_webui.jms.wisp import PROJECT_DIR
 from open_webui.jms.wisp.protobuf import service_pb2
 from open_webui.jms.wisp.exceptions import WispError
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    ENABLE_WISP_REPLAY_GZIP,
+    WISP_REPLAY_MAX_OPEN_FILES,
+    WISP_REPLAY_UPLOAD_WORKERS,
+    WISP_REPLAY_UPLOAD_RETRIES,
+)
 from .asciinema import AsciinemaWriter
 from ..base import BaseWisp
 
 logger = logging.getLogger(__name__)
 logger.setLevel(SRC_LOG_LEVELS["WISP"])
 
+# All replay file I/O runs on this single thread: it keeps the event loop free
+# and keeps the rows of a session in submission order, whichever loop sent them.
+replay_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replay")
 
-class ReplayHandler(BaseWisp):
-    DEFAULT_ENCODING = "utf-8"
-    REPLAY_DIR = os.path.join(PROJECT_DIR, 'data/replay')
 
-    def __init__(self, session_id: str):
-        super().__init__()
-        self.session_id = session_id
-        self.replay_writer: AsciinemaWriter | None = None
-        self.file_writer = None
-        self.file: Path | None = None
+class ReplayWriter:
+    """
+    Block-buffered .cast writer of one session. The file handle stays open
+    between rows; methods must be called on `replay_executor`.
+    """
+    DEFAULT_ENCODING = "utf-8"
 
-    async def _prepare(self):
-        self.ensure_replay_dir()
-        path = self._replay_path()
+    def __init__(self, path: Path):
+        self.path = path
+        # Row timestamps are relative to the session, not to the last reopen
+        self.started_ns = None
+        self._file = None
+        self._asciinema: AsciinemaWriter | None = None
 
-        if self.file is None:
-            self.file = path
+    def _open(self):
+        if self._file is not None and not self._file.closed:
+            return
 
-        if not path.exists():
-            try:
-                path.touch()
-            except Exception as e:
-                logger.error(f"Failed to create replay file: {path.name} -> {e}")
-                raise
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._restore()
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        if self.started_ns is None and not is_new:
+            # A row after the session was uploaded gets a new writer, keep
+            # timing it from the start in the header
+            self.started_ns = self._header_started_ns()
+        try:
+            self._file = self.path.open(mode="a", encoding=self.DEFAULT_ENCODING)
+        except Exception as e:
+            logger.error(f"Failed to open replay file: {self.path.name} -> {e}")
+            raise
 
-            try:
-                self.file_writer = path.open(mode="w", encoding=self.DEFAULT_ENCODING, buffering=1)
-                self.replay_writer = AsciinemaWriter(self.file_writer)
-                self.replay_writer.write_header()
-            except Exception as e:
-                logger.error(f"Failed to init writer for new file {path.name}: {e}")
-                self.file_writer = None
-                self.replay_writer = None
-                raise
-            return
+        self._asciinema = AsciinemaWriter(self._file)
+        if self.started_ns is None:
+            self.started_ns = self._asciinema.timestampNano
+        self._asciinema.timestampNano = self.started_ns
+        if is_new:
+            self._asciinema.write_header()
 
-        if self.file_writer and not self.file_writer.closed and self.replay_writer is not None:
+    def _restore(self):
+        """Unpack a gzipped upload so rows written after it extend the same replay."""
+        gz_path = self.path.with_name(self.path.name + ".gz")
+        if self.path.exists() or not gz_path.exists():
             return
+        with gzip.open(gz_path, "rb") as src, self.path.open("wb") as dst:
+            shutil.copyfileobj(src, dst, ReplayUploader.CHUNK_SIZE)
+        gz_path.unlink()
 
+    def _header_started_ns(self) -> int | None:
         try:
-            self.file_writer = path.open(mode="a", encoding=self.DEFAULT_ENCODING, buffering=1)
-            self.replay_writer = AsciinemaWriter(self.file_writer)
+            with self.path.open(encoding=self.DEFAULT_ENCODING) as f:
+                return int(json.loads(f.readline())["timestamp"]) * 1_000_000_000
         except Exception as e:
-            logger.error(f"Failed to reopen writer for {path.name}: {e}")
-            self.file_writer = None
-            self.replay_writer = None
-
-    def ensure_replay_dir(self):
-        os.makedirs(self.REPLAY_DIR, exist_ok=True)
-
-    def _replay_path(self) -> Path:
-        return Path(os.path.join(self.REPLAY_DIR, f"{self.session_id}.cast"))
+            logger.warning(f"Failed to read replay header of {self.path.name}: {e}")
+            return None
 
-    def _write_row(self, row):
+    def _write_row(self, row: str):
         row = row.replace("\n", "\r\n")
         row = row.replace("\r\r\n", "\r\n")
         row = f"{row} \r\n"
 
         try:
-            self.replay_writer.write_row(row.encode(self.DEFAULT_ENCODING))
+            self._open()
+            self._asciinema.write_row(row)
         except Exception as e:
             logger.error(f"Failed to write replay row: {e}")
 
-    async def write_input(self, input_str):
-        await self._prepare()
-        current_time = datetime.now()
-        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
-        input_str = f"[{formatted_time}]#: {input_str}"
+    def write_input(self, input_str: str):
         self._write_row(input_str)
 
-    async def write_output(self, output_str):
-        await self._prepare()
-        wrapper = textwrap.TextWrapper(width=self.replay_writer.WIDTH)
+    def write_output(self, output_str: str):
+        wrapper = textwrap.TextWrapper(width=AsciinemaWriter.WIDTH)
         output_str = wrapper.fill(output_str)
-        output_str = f"\r\n {output_str} \r\n"
-        self._write_row(output_str)
+        self._write_row(f"\r\n {output_str} \r\n")
 
-    async def upload(self):
-        await self._prepare()
+    def close(self):
+        """Flush and release the handle; a later write reopens the file."""
+        if self._file is None or self._file.closed:
+            return
         try:
-            if self.file_writer and not self.file_writer.closed:
-                try:
-                    self.file_writer.flush()
-                except Exception:
-                    pass
-                self.file_writer.close()
+            self._file.close()
         except Exception as e:
-            logger.warning(f"Failed to flush/close before upload: {e}")
+            logger.warning(f"Failed to close replay file {self.path.name}: {e}")
+        finally:
+            self._file = None
+            self._asciinema = None
 
+    def finish(self) -> Path:
+        """Close for upload, creating the file (header only) if nothing was written."""
         try:
-            replay_request = service_pb2.ReplayRequest(
-                session_id=self.session_id,
-                replay_file_path=self.file.absolute().as_posix()
-            )
-            resp = self.stub.UploadReplayFile(replay_request)
-
-            if not resp.status.ok:
-                error_message = f'Failed to upload replay file: {self.file.name} {resp.status.err}'
-                logger.error(error_message)
-                raise WispError(error_message)
-        except Exception as e:
-            logger.error(f'Failed to upload replay file upload {e}')
+            self._open()
         finally:
-            self.replay_writer = None
-            self.file_writer = None
+            self.close()
+        return self.path
+
+
+class ReplayWriterRegistry:
+    """
+    One ReplayWriter per session, shared by every ReplayHandler of it until
+    the session is uploaded. Only the `max_open` most recently used writers
+    keep their file open; older ones are closed and reopen on their next row.
+    """
+
+    def __init__(self, replay_dir: str, max_open: int):
+        self.replay_dir = replay_dir
+        self.max_open = max(max_open, 1)
+        self._writers: dict[str, ReplayWriter] = {}
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ReplayWriter:
+        idle = []
+        with self._lock:
+            writer = self._writers.get(session_id)
+            if writer is None:
+                path = Path(os.path.join(self.replay_dir, f"{session_id}.cast"))
+                writer = self._writers[session_id] = ReplayWriter(path)
+            self._recent[session_id] = None
+            self._recent.move_to_end(session_id)
+            while len(self._recent) > self.max_open:
+                old_id, _ = self._recent.popitem(last=False)
+                idle.append(self._writers[old_id])
+
+        for old in idle:
+            replay_executor.submit(old.close)
+        return writer
+
+    def pop(self, session_id: str) -> ReplayWriter:
+        with self._lock:
+            writer = self._writers.pop(session_id, None)
+            self._recent.pop(session_id, None)
+        if writer is None:
+            path = Path(os.path.join(self.replay_dir, f"{session_id}.cast"))
+            writer = ReplayWriter(path)
+        return writer
+
+
+class ReplayUploader(BaseWisp):
+    """
+    Hands finished replays to wisp on background threads, so closing a
+    session (from the event loop or the poll thread) does not wait for it.
+
+    The file is read in bounded chunks to compress and checksum it. The
+    checksum is not sent (ReplayRequest only carries the path), it only lets
+    a recently uploaded replay that did not change be skipped. Failed uploads
+    retry with backoff, and files that still fail stay in the replay dir,
+    where the ScanRemainReplays call on the next startup resumes them.
+    """
+    CHUNK_SIZE = 1024 * 1024
+    # Sessions whose last upload checksum is remembered
+    UPLOADED_MAX = 1024
+
+    def __init__(self, workers: int, retries: int):
+        super().__init__()
+        self.retries = retries
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="replay-upload")
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        # session_id -> sha256 of the last replay uploaded for it, most recent last
+        self._uploaded: "OrderedDict[str, str]" = OrderedDict()
+
+    def submit(self, session_id: str, writer: ReplayWriter) -> Future:
+        with self._lock:
+            future = self._inflight.get(session_id)
+            if future is not None and not future.done():
+                return future
+            future = self._executor.submit(self._upload, session_id, writer)
+            self._inflight[session_id] = future
+        future.add_done_callback(lambda f: self._forget(session_id, f))
+        return future
+
+    def _forget(self, session_id: str, future: Future):
+        with self._lock:
+            if self._inflight.get(session_id) is future:
+                del self._inflight[session_id]
+
+    async def wait(self, timeout: float):
+        """Wait for in-flight uploads, e.g. on shutdown."""
+        with self._lock:
+            futures = list(self._inflight.values())
+        if futures:
+            await asyncio.to_thread(wait, futures, timeout)
+
+    def _upload(self, session_id: str, writer: ReplayWriter):
+        # Queued behind the rows already submitted for this session
+        path, digest = replay_executor.submit(self._finish, writer).result()
+        if digest is None:
+            digest = self._checksum(path)
+
+        with self._lock:
+            unchanged = self._uploaded.get(session_id) == digest
+        if unchanged:
+            logger.debug(f"Replay {path.name} unchanged since last upload, skipping")
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                self._send(session_id, path)
+                break
+            except Exception as e:
+                if attempt >= self.retries:
+                    logger.error(f"Failed to upload replay file {path.name}, left for the next startup scan: {e}")
+                    return
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"Failed to upload replay file {path.name} ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+        with self._lock:
+            self._uploaded[session_id] = digest
+            self._uploaded.move_to_end(session_id)
+            while len(self._uploaded) > self.UPLOADED_MAX:
+                self._uploaded.popitem(last=False)
+        logger.info(f"Uploaded replay {path.name} ({path.stat().st_size} bytes)")
+
+    def _finish(self, writer: ReplayWriter) -> tuple[Path, str | None]:
+        """
+        Close the replay for upload, on `replay_executor`. The .cast is
+        compressed and unlinked there too, so a row of the session written
+        meanwhile waits and goes to the restored .cast instead of being lost.
+        """
+        path = writer.finish()
+        if ENABLE_WISP_REPLAY_GZIP:
+            return self._compress(path)
+        return path, None
+
+    def _send(self, session_id: str, path: Path):
+        replay_request = service_pb2.ReplayRequest(
+            session_id=session_id,
+            replay_file_path=path.absolute().as_posix()
+        )
+        resp = self.stub.UploadReplayFile(replay_request)
+
+        if not resp.status.ok:
+            error_message = f'Failed to upload replay file: {path.name} {resp.status.err}'
+            logger.error(error_message)
+            raise WispError(error_message)
+
+    def _checksum(self, path: Path) -> str:
+        sha256 = hashlib.sha256()
+        with path.open("rb") as src:
+            while chunk := src.read(self.CHUNK_SIZE):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _compress(self, path: Path) -> tuple[Path, str]:
+        """
+        gzip the .cast into a .cast.gz that replaces it; the checksum covers
+        the uncompressed rows.
+        """
+        sha256 = hashlib.sha256()
+        gz_path = path.with_name(path.name + ".gz")
+        tmp_path = gz_path.with_name(gz_path.name + ".tmp")
+        with path.open("rb") as src, gzip.open(tmp_path, "wb") as dst:
+            while chunk := src.read(self.CHUNK_SIZE):
+                sha256.update(chunk)
+                dst.write(chunk)
+        os.replace(tmp_path, gz_path)
+        # Or ScanRemainReplays would upload both; a later row restores the
+        # .cast from the .gz, see ReplayWriter._restore
+        path.unlink()
+        return gz_path, sha256.hexdigest()
+
+
+class ReplayHandler(BaseWisp):
+    REPLAY_DIR = os.path.join(PROJECT_DIR, 'data/replay')
+
+    def __init__(self, session_id: str):
+        super().__init__()
+        self.session_id = session_id
+
+    # Rows are handed to the replay thread right away rather than from a
+    # scheduled task; `upload` then queues behind every row written before it,
+    # which is the flush barrier session teardown relies on.
+
+    def write_input(self, input_str) -> Future:
+        current_time = datetime.now()
+        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        input_str = f"[{formatted_time}]#: {input_str}"
+        return replay_executor.submit(replay_writers.get(self.session_id).write_input, input_str)
+
+    def write_output(self, output_str) -> Future:
+        return replay_executor.submit(replay_writers.get(self.session_id).write_output, output_str)
+
+    async def upload(self) -> Future:
+        """
+        Queue the session's replay for upload and return without waiting;
+        the returned future completes once it was handed to wisp.
+        """
+        return replay_uploader.submit(self.session_id, replay_writers.pop(self.session_id))
+
+
+replay_writers = ReplayWriterRegistry(ReplayHandler.REPLAY_DIR, WISP_REPLAY_MAX_OPEN_FILES)
+replay_uploader = ReplayUploader(WISP_REPLAY_UPLOAD_WORKERS, WISP_REPLAY_UPLOAD_RETRIES)
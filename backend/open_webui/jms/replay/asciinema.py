@@ -44,6 +44,8 @@ class AsciinemaWriter:
         self.write_stdout(ts, p)
 
     def write_stdout(self, ts, data):
-        row = [ts, "o", data.decode("utf-8")]
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        row = [ts, "o", data]
         json_data = json.dumps(row) + self.NEW_LINE
         self.writer.write(json_data)
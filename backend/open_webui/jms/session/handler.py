@@ -1,12 +1,14 @@
 import asyncio
 import logging
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Dict, List, Optional, Set
 
 from open_webui.jms.wisp.protobuf import service_pb2
 from open_webui.jms.wisp.exceptions import WispError
 from open_webui.jms.wisp.protobuf.common_pb2 import Session, User
 from open_webui.jms import CommandHandler, ReplayHandler
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.env import SRC_LOG_LEVELS, WISP_SESSION_CLOSE_CONCURRENCY
 from ..account import AccountChatHandler
 from ..base import BaseWisp
 
@@ -27,7 +29,7 @@ class JMSSession(BaseWisp):
             id=self.chat_id,
             date_end=int(datetime.now().timestamp())
         )
-        resp = self.stub.FinishSession(req)
+        resp = await self.aio_stub.FinishSession(req)
 
         if not resp.status.ok:
             error_message = f'Failed to close session: {resp.status.err}'
@@ -35,11 +37,100 @@ class JMSSession(BaseWisp):
             raise WispError(error_message)
 
     async def close(self) -> None:
-        await asyncio.sleep(1)
-        await self.replay_handler.upload()
+        # Queued behind the rows already written, see ReplayHandler; the
+        # session is finished only once wisp has the replay
+        upload = await self.replay_handler.upload()
+        try:
+            await asyncio.wrap_future(upload)
+        except Exception as e:
+            logger.error(f"Failed to upload replay of session {self.chat_id}: {e}")
         await self.close_session()
 
 
+class SessionCloser:
+    """
+    Closes JMS sessions in background tasks so socket disconnects return at
+    once. At most `concurrency` closes run at the same time, and a chat that
+    is already being closed is not closed twice.
+
+    Closes are requested from the app loop and from the dispatcher's loop, so
+    the tasks and their bookkeeping live on one loop, the bound one (see
+    `bind`); other loops hand work to it and get concurrent futures back.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = max(concurrency, 1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Only touched on self._loop
+        self._closing: Dict[str, asyncio.Task] = {}
+        self._lookups: Set[asyncio.Task] = set()
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Run closes on `loop`; by default the first loop that requests one."""
+        self._loop = loop
+
+    def _submit(self, coro) -> Future:
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.get_running_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close_socket_sessions(self, sid: str) -> Future:
+        """Close every session opened through the socket `sid`."""
+        return self._submit(self._close_socket_sessions(sid))
+
+    async def _close_socket_sessions(self, sid: str):
+        from open_webui.jms import chat_manager
+
+        task = asyncio.current_task()
+        self._lookups.add(task)
+        try:
+            chats = await chat_manager.alist(query={'socket_id': sid})
+            await asyncio.gather(*(self._close_once(chat) for chat in chats))
+        except Exception as e:
+            logger.error(f"Failed to close the sessions of socket {sid}: {e}")
+        finally:
+            self._lookups.discard(task)
+
+    def close(self, chats: List[dict]) -> List[Future]:
+        return [self._submit(self._close_once(chat)) for chat in chats]
+
+    async def _close_once(self, chat: dict):
+        task = self._closing.get(chat['id'])
+        if task is None:
+            task = self._closing[chat['id']] = asyncio.create_task(self._close(chat))
+        await asyncio.shield(task)
+
+    async def wait(self, timeout: float):
+        """Wait for closes in flight, e.g. on shutdown."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._wait(), self._loop)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting for sessions to close")
+
+    async def _wait(self):
+        # Lookups start closes of their own
+        while self._lookups or self._closing:
+            await asyncio.wait({*self._lookups, *self._closing.values()})
+
+    async def _close(self, chat: dict):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._semaphore:
+                await JMSSession(chat).close()
+        except Exception as e:
+            logger.error(f"Failed to close session {chat['id']}: {e}")
+        finally:
+            del self._closing[chat['id']]
+
+
+session_closer = SessionCloser(WISP_SESSION_CLOSE_CONCURRENCY)
+
+
 class SessionHandler(BaseWisp):
 
     def __init__(self, sid: str, ip: str, user: User):
@@ -52,6 +143,19 @@ class SessionHandler(BaseWisp):
         account_handler = AccountChatHandler()
         account_data = account_handler.get_account()
 
+        req = self._build_request(chat_model, account_data)
+        resp = self.stub.CreateSession(req)
+        return self._check_response(resp)
+
+    async def acreate_session(self, chat_model: str) -> Session:
+        account_handler = AccountChatHandler()
+        account_data = await account_handler.aget_account()
+
+        req = self._build_request(chat_model, account_data)
+        resp = await self.aio_stub.CreateSession(req)
+        return self._check_response(resp)
+
+    def _build_request(self, chat_model: str, account_data: dict) -> service_pb2.SessionCreateRequest:
         req_session = Session(
             user_id=self.user.id,
             user=f'{self.user.name}({self.user.username})',
@@ -65,10 +169,14 @@ class SessionHandler(BaseWisp):
             date_start=int(datetime.now().timestamp()),
             remote_addr=self.remote_address,
         )
-        req = service_pb2.SessionCreateRequest(data=req_session)
-        resp = self.stub.CreateSession(req)
+        return service_pb2.SessionCreateRequest(data=req_session)
+
+    @staticmethod
+    def _check_response(resp) -> Session:
         if not resp.status.ok:
             error_message = f'Failed to create session: {resp.status.err}'
             logger.error(error_message)
+            # The cached account may be what wisp rejected, reload it next time
+            AccountChatHandler.invalidate()
             raise WispError(error_message)
         return resp.data
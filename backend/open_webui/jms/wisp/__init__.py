@@ -1,21 +1,123 @@
 import os
 import sys
+import json
+import asyncio
+import tempfile
+import weakref
 import grpc
-from typing import Optional
+from typing import List, Optional
 
-grpc_channel: Optional[grpc.Channel] = None
+from open_webui.env import (
+    WISP_ADDRESSES,
+    WISP_GRPC_CHANNELS,
+    WISP_GRPC_LB_POLICY,
+    WISP_GRPC_HEALTH_CHECK,
+    WISP_GRPC_KEEPALIVE_TIME,
+    WISP_GRPC_KEEPALIVE_TIMEOUT,
+    WISP_GRPC_MAX_MESSAGE_SIZE,
+    WISP_FAKE_SERVER,
+)
+
+from .pool import AioChannelPool, ChannelPool
+from .telemetry import AioTelemetryInterceptor, TelemetryInterceptor
+
+grpc_channel: Optional[ChannelPool] = None
+# grpc.aio channels are bound to the event loop they were created on, so keep
+# one pool per loop (the FastAPI loop plus any loop spun up by worker threads).
+grpc_aio_channels: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AioChannelPool]" = (
+    weakref.WeakKeyDictionary()
+)
+# Addresses the channels are opened to, WISP_ADDRESSES unless set up otherwise
+wisp_addresses: List[str] = list(WISP_ADDRESSES)
+# The in-process FakeWisp server, with WISP_FAKE_SERVER
+fake_server: Optional[grpc.Server] = None
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.dirname(BASE_DIR)
 
 
-def setup_protobuf():
+def message_size_options() -> list:
+    size = WISP_GRPC_MAX_MESSAGE_SIZE * 1024 * 1024
+    return [
+        ("grpc.max_send_message_length", size),
+        ("grpc.max_receive_message_length", size),
+    ]
+
+
+def channel_options(target: str = "") -> list:
+    # Channels with equal arguments would otherwise share one connection
+    options = [("grpc.use_local_subchannel_pool", 1), *message_size_options()]
+    if target.startswith("unix:"):
+        # Instead of the socket path
+        options.append(("grpc.default_authority", "localhost"))
+    if WISP_GRPC_HEALTH_CHECK:
+        # Client health checking only runs under round_robin
+        options.append(("grpc.service_config", json.dumps({
+            "loadBalancingConfig": [{"round_robin": {}}],
+            "healthCheckConfig": {"serviceName": ""},
+        })))
+    if WISP_GRPC_KEEPALIVE_TIME > 0:
+        options += [
+            ("grpc.keepalive_time_ms", WISP_GRPC_KEEPALIVE_TIME * 1000),
+            ("grpc.keepalive_timeout_ms", WISP_GRPC_KEEPALIVE_TIMEOUT * 1000),
+            # Only ping while calls (the task stream) are open, as servers allow by default
+            ("grpc.keepalive_permit_without_calls", 0),
+            ("grpc.http2.max_pings_without_data", 0),
+        ]
+    return options
+
+
+def _new_channel(target: str) -> grpc.Channel:
+    return grpc.intercept_channel(
+        grpc.insecure_channel(target, options=channel_options(target)),
+        TelemetryInterceptor(),
+    )
+
+
+def _new_aio_channel(target: str) -> grpc.aio.Channel:
+    return grpc.aio.insecure_channel(
+        target,
+        options=channel_options(target),
+        interceptors=[AioTelemetryInterceptor()],
+    )
+
+
+def setup_protobuf(addresses: Optional[List[str]] = None):
+    """
+    Open the channels to `addresses`, WISP_ADDRESSES by default. Calling it
+    again points every wisp client at the new addresses, e.g. a FakeWisp
+    server in tests; the old channels are left to close on their own.
+    """
     global grpc_channel
     current_dir = os.path.dirname(os.path.abspath(__file__))
     protobuf_path = os.path.join(current_dir, 'protobuf')
     if protobuf_path not in sys.path:
         sys.path.insert(0, protobuf_path)
 
-    grpc_channel = grpc.insecure_channel('localhost:9090')
+    wisp_addresses[:] = addresses or WISP_ADDRESSES
+    grpc_channel = ChannelPool(wisp_addresses, WISP_GRPC_CHANNELS, WISP_GRPC_LB_POLICY, _new_channel)
+    grpc_aio_channels.clear()
+
+
+def setup_fake_server():
+    """Serve wisp from a FakeWisp in this process, on a unix socket of its own."""
+    global fake_server
+    from .fake import serve
+
+    path = os.path.join(tempfile.gettempdir(), f"kael-wisp-{os.getpid()}.sock")
+    if os.path.exists(path):
+        os.unlink(path)
+    address = f"unix:{path}"
+    _, fake_server = serve(address, options=message_size_options())
+    setup_protobuf([address])
+
+
+def get_aio_channel() -> AioChannelPool:
+    loop = asyncio.get_running_loop()
+    ch = grpc_aio_channels.get(loop)
+    if ch is None:
+        ch = AioChannelPool(wisp_addresses, WISP_GRPC_CHANNELS, WISP_GRPC_LB_POLICY, _new_aio_channel)
+        grpc_aio_channels[loop] = ch
+    return ch
 
 
 def shutdown_protobuf():
@@ -27,4 +129,14 @@ def shutdown_protobuf():
     grpc_channel = None
 
 
+async def shutdown_aio_protobuf():
+    loop = asyncio.get_running_loop()
+    ch = grpc_aio_channels.pop(loop, None)
+    if ch is None:
+        return
+    await ch.close()
+
+
 setup_protobuf()
+if WISP_FAKE_SERVER:
+    setup_fake_server()
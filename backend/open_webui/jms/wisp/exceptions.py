@@ -1,2 +1,18 @@
+from typing import Optional
+
+
 class WispError(Exception):
     pass
+
+
+class WispUnavailableError(WispError):
+    """The call was not sent: wisp was found unavailable, see CircuitBreaker."""
+    pass
+
+
+class WispAPIError(WispError):
+    """The API behind CallAPI answered with an error status."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
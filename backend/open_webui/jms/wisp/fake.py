@@ -0,0 +1,350 @@
+import copy
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent import futures
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import grpc
+
+from open_webui.jms.chat_codec import PROTOBUF_CONTENT_TYPE, decode_chat, encode_chat
+
+from .protobuf import common_pb2, service_pb2, service_pb2_grpc
+
+CHAT_URL = "/api/v1/terminal/chats/"
+TERMINAL_CONFIG_URL = "/api/v1/terminal/terminals/config/"
+
+DEFAULT_USER = {
+    "id": "00000000-0000-0000-0000-000000000001",
+    "name": "Fake User",
+    "username": "fake",
+    "role": "Admin",
+    "is_valid": True,
+    "is_active": True,
+}
+DEFAULT_ACCOUNT = {
+    "id": "00000000-0000-0000-0000-000000000002",
+    "name": "chat",
+    "username": "chat",
+    "org_id": "00000000-0000-0000-0000-000000000002",
+    "asset": {"id": "00000000-0000-0000-0000-000000000003", "name": "Chat AI"},
+}
+
+
+def _ok() -> service_pb2.Status:
+    return service_pb2.Status(ok=True)
+
+
+class _ApiError(Exception):
+    def __init__(self, code: Union[int, str], detail: str):
+        super().__init__(detail)
+        self.code = code
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ("true", "1")
+
+
+def _pointer_tokens(pointer: str) -> List[str]:
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer.split("/")[1:]]
+
+
+def _apply_patch(doc: dict, ops: List[dict]):
+    """The add, replace and remove ops of JSON Patch (RFC 6902)."""
+    for op in ops:
+        *parents, last = _pointer_tokens(op["path"])
+        target = doc
+        for token in parents:
+            target = target[int(token)] if isinstance(target, list) else target[token]
+        if op["op"] == "remove":
+            del target[int(last) if isinstance(target, list) else last]
+        elif isinstance(target, list):
+            if last == "-":
+                target.append(op["value"])
+            elif op["op"] == "add":
+                target.insert(int(last), op["value"])
+            else:
+                target[int(last)] = op["value"]
+        elif op["op"] in ("add", "replace"):
+            target[last] = op["value"]
+        else:
+            raise _ApiError(400, f"Unsupported patch op {op['op']}")
+
+
+class FakeWisp(service_pb2_grpc.ServiceServicer):
+    """
+    In-memory stand-in for the wisp sidecar, for load and unit tests that run
+    the full chat path: the chat API behind CallAPI (list, retrieve, create,
+    update, patch, delete and batch), users, the chat account, sessions,
+    commands, replays and the DispatchTask stream, fed with `dispatch()`.
+    `latency` seconds are added to every call.
+    """
+
+    def __init__(
+            self,
+            user: Optional[Dict[str, Any]] = None,
+            account: Optional[Dict[str, Any]] = None,
+            latency: float = 0.0,
+    ):
+        self.user = dict(user or DEFAULT_USER)
+        self.account = copy.deepcopy(account or DEFAULT_ACCOUNT)
+        self.latency = latency
+        self.chats: Dict[str, dict] = {}
+        self.sessions: Dict[str, common_pb2.Session] = {}
+        self.finished_sessions: List[str] = []
+        self.commands: List[service_pb2.CommandRequest] = []
+        self.finished_tasks: List[str] = []
+        self.calls: Counter = Counter()
+        # Chat endpoints ("patch", "batch") answered with 405, like servers without them
+        self.unsupported: Set[str] = set()
+        # Statuses (or error texts) the next chat API calls fail with, one per call
+        self.failures: List[Union[int, str]] = []
+        self._tasks: "queue.Queue[common_pb2.TerminalTask]" = queue.Queue()
+        # Bumped by end_streams(), DispatchTask streams of an older one end
+        self._stream_epoch = 0
+        self._lock = threading.RLock()
+
+    def _called(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def dispatch(self, task: common_pb2.TerminalTask):
+        """Send a task to the clients of the DispatchTask stream."""
+        self._tasks.put(task)
+
+    def end_streams(self):
+        """End the open DispatchTask streams, as a wisp restart does."""
+        with self._lock:
+            self._stream_epoch += 1
+
+    # Chat API
+
+    def CallAPI(self, request, context):
+        self._called("CallAPI")
+        header = {key.lower(): value for key, value in request.header.items()}
+        try:
+            with self._lock:
+                result = self._route(request.method, request.path, dict(request.query), request.body, header)
+        except _ApiError as e:
+            body = json.dumps({"detail": str(e)}).encode()
+            return service_pb2.HTTPResponse(status=service_pb2.Status(ok=False, err=f"{e.code}"), body=body)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            body = json.dumps({"detail": f"Bad request: {e}"}).encode()
+            return service_pb2.HTTPResponse(status=service_pb2.Status(ok=False, err="400"), body=body)
+
+        if result is None:
+            return service_pb2.HTTPResponse(status=_ok())
+        if isinstance(result, dict) and "chat" in result and PROTOBUF_CONTENT_TYPE in header.get("accept", ""):
+            body = encode_chat(result)
+            if body is not None:
+                return service_pb2.HTTPResponse(status=_ok(), body=body)
+        return service_pb2.HTTPResponse(status=_ok(), body=json.dumps(result).encode())
+
+    def _route(self, method: str, path: str, query: Dict[str, str], body: bytes, header: Dict[str, str]):
+        if self.failures:
+            raise _ApiError(self.failures.pop(0), "Injected failure")
+        if path == TERMINAL_CONFIG_URL and method == "GET":
+            return {"CHAT_AI_PROVIDERS": []}
+        if not path.startswith(CHAT_URL):
+            raise _ApiError(404, f"Not found: {path}")
+
+        parts = [part for part in path[len(CHAT_URL):].split("/") if part]
+        if not parts:
+            if method == "GET":
+                return self._list(query)
+            if method == "POST":
+                return self._create(self._load(body, header))
+            if method == "DELETE":
+                for chat in self._filter(query):
+                    del self.chats[chat["id"]]
+                return None
+        elif parts == ["batch"] and method == "POST" and "batch" not in self.unsupported:
+            return {"results": [self._run_op(op) for op in self._load(body, header)["ops"]]}
+        elif len(parts) == 1:
+            chat = self._get(parts[0], query)
+            if method == "GET":
+                return copy.deepcopy(chat)
+            if method == "PATCH":
+                data = self._load(body, header)
+                data.pop("id", None)
+                return self._update(chat, data)
+            if method == "DELETE":
+                del self.chats[chat["id"]]
+                return None
+        elif len(parts) == 2 and parts[1] == "patch" and method == "PATCH" and "patch" not in self.unsupported:
+            chat = self._get(parts[0], query)
+            updated = copy.deepcopy(chat)
+            _apply_patch(updated, self._load(body, header))
+            return self._update(chat, updated)
+        raise _ApiError(405, f"{method} {path} not allowed")
+
+    @staticmethod
+    def _load(body: bytes, header: Dict[str, str]) -> Any:
+        if header.get("content-type") == PROTOBUF_CONTENT_TYPE:
+            return decode_chat(body)
+        return json.loads(body)
+
+    def _get(self, chat_id: str, query: Dict[str, str]) -> dict:
+        chat = self.chats.get(chat_id)
+        if chat is None or (query.get("user_id") and chat["user_id"] != query["user_id"]):
+            raise _ApiError(404, "Not found.")
+        return chat
+
+    def _create(self, data: dict) -> dict:
+        now = int(time.time())
+        chat = {
+            "id": data.get("id") or str(uuid.uuid4()),
+            "user_id": self.user["id"],
+            "title": "New Chat",
+            "chat": {},
+            "meta": {},
+            "share_id": None,
+            "archived": False,
+            "pinned": False,
+            "folder_id": "",
+            **data,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.chats[chat["id"]] = chat
+        return copy.deepcopy(chat)
+
+    def _update(self, chat: dict, data: dict) -> dict:
+        chat.update(data)
+        # Strictly increasing, so an update within a second is a new version
+        chat["updated_at"] = max(int(time.time()), chat["updated_at"] + 1)
+        return copy.deepcopy(chat)
+
+    def _filter(self, query: Dict[str, str]) -> List[dict]:
+        chats = list(self.chats.values())
+        if query.get("ids"):
+            ids = set(query["ids"].split(","))
+            chats = [chat for chat in chats if chat["id"] in ids]
+        for key in ("user_id", "share_id"):
+            if query.get(key):
+                chats = [chat for chat in chats if chat.get(key) == query[key]]
+        if "folder_id" in query:
+            chats = [chat for chat in chats if (chat.get("folder_id") or "") == query["folder_id"]]
+        for key in ("archived", "pinned"):
+            if query.get(key):
+                chats = [chat for chat in chats if bool(chat.get(key)) == _parse_bool(query[key])]
+        if query.get("search"):
+            search = query["search"].lower()
+            chats = [chat for chat in chats if search in (chat.get("title") or "").lower()]
+        return chats
+
+    def _list(self, query: Dict[str, str]) -> Any:
+        chats = self._filter(query)
+        ordering = query.get("ordering", "-date_updated")
+        chats.sort(key=lambda chat: (chat["updated_at"], chat["id"]), reverse=ordering.startswith("-"))
+        if query.get("fields_size") == "mini":
+            chats = [{k: chat[k] for k in ("id", "title", "updated_at", "created_at")} for chat in chats]
+        else:
+            chats = copy.deepcopy(chats)
+        if "limit" not in query:
+            return chats
+
+        offset, limit = int(query.get("offset") or 0), int(query["limit"])
+        page = chats[offset:offset + limit]
+        has_next = offset + limit < len(chats)
+        return {"count": len(chats), "next": "next" if has_next else None, "previous": None, "results": page}
+
+    def _run_op(self, op: dict) -> dict:
+        query = {"user_id": op["user_id"]} if op.get("user_id") else {}
+        chats = [self.chats[chat_id] for chat_id in op["ids"] if chat_id in self.chats]
+        chats = [chat for chat in chats if not query or chat["user_id"] == query["user_id"]]
+        if op["op"] == "retrieve":
+            return {"ok": True, "result": copy.deepcopy(chats)}
+        if op["op"] == "update":
+            return {"ok": True, "result": [self._update(chat, op["data"]) for chat in chats]}
+        if op["op"] == "delete":
+            for chat in chats:
+                del self.chats[chat["id"]]
+            return {"ok": True, "result": [chat["id"] for chat in chats]}
+        return {"ok": False, "error": f"Unsupported op {op['op']}"}
+
+    # Users, account and sessions
+
+    def CheckUserByCookies(self, request, context):
+        self._called("CheckUserByCookies")
+        return service_pb2.UserResponse(status=_ok(), data=common_pb2.User(**self.user))
+
+    def GetAccountChat(self, request, context):
+        self._called("GetAccountChat")
+        response = service_pb2.AccountDetailResponse(status=_ok())
+        response.payload.update(self.account)
+        return response
+
+    def CreateSession(self, request, context):
+        self._called("CreateSession")
+        session = common_pb2.Session()
+        session.CopyFrom(request.data)
+        if not session.id:
+            session.id = str(uuid.uuid4())
+        with self._lock:
+            self.sessions[session.id] = session
+        return service_pb2.SessionCreateResponse(status=_ok(), data=session)
+
+    def FinishSession(self, request, context):
+        self._called("FinishSession")
+        with self._lock:
+            self.finished_sessions.append(request.id)
+        return service_pb2.SessionFinishResp(status=_ok())
+
+    def UploadCommand(self, request, context):
+        self._called("UploadCommand")
+        with self._lock:
+            self.commands.append(request)
+        return service_pb2.CommandResponse(status=_ok())
+
+    def UploadReplayFile(self, request, context):
+        self._called("UploadReplayFile")
+        return service_pb2.ReplayResponse(status=_ok())
+
+    def ScanRemainReplays(self, request, context):
+        self._called("ScanRemainReplays")
+        return service_pb2.RemainReplayResponse(status=_ok())
+
+    def DispatchTask(self, request_iterator, context):
+        self._called("DispatchTask")
+
+        def read_acks():
+            try:
+                for ack in request_iterator:
+                    with self._lock:
+                        self.finished_tasks.append(ack.task_id)
+            except grpc.RpcError:
+                # The stream ended
+                pass
+
+        threading.Thread(target=read_acks, name="fake-wisp-acks", daemon=True).start()
+        epoch = self._stream_epoch
+        while context.is_active() and epoch == self._stream_epoch:
+            try:
+                task = self._tasks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            yield service_pb2.TaskResponse(task=task)
+
+
+def serve(
+        address: str,
+        servicer: Optional[FakeWisp] = None,
+        options: Optional[list] = None,
+        max_workers: int = 32,
+) -> Tuple[FakeWisp, grpc.Server]:
+    """
+    Start `servicer`, a new FakeWisp by default, on `address`, e.g.
+    unix:/tmp/wisp.sock; stop it with `server.stop(None)`.
+    """
+    servicer = servicer or FakeWisp()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers), options=options)
+    service_pb2_grpc.add_ServiceServicer_to_server(servicer, server)
+    if not server.add_insecure_port(address):
+        raise RuntimeError(f"Failed to bind the fake wisp server to {address}")
+    server.start()
+    return servicer, server
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Union
+
+import grpc
+
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    WISP_RPC_TIMEOUT,
+    WISP_RPC_TIMEOUTS,
+    WISP_RPC_RETRIES,
+    WISP_RPC_RETRY_BACKOFF,
+    WISP_RPC_BREAKER_FAILURES,
+    WISP_RPC_BREAKER_RESET_TIMEOUT,
+    WISP_GRPC_WAIT_FOR_READY,
+)
+
+from .exceptions import WispUnavailableError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(SRC_LOG_LEVELS["WISP"])
+
+# Upper bound of one backoff between retries, in seconds
+MAX_RETRY_BACKOFF = 2.0
+# Codes that say nothing reached wisp, or it did not answer in time
+BREAKER_CODES = frozenset({grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED})
+RETRY_CODES = frozenset({grpc.StatusCode.UNAVAILABLE})
+
+
+class RpcPolicy(NamedTuple):
+    timeout: Optional[float]
+    # Whether a request may be sent again: a bool or a predicate on the request
+    idempotent: Union[bool, Callable[[Any], bool]] = False
+
+    def is_idempotent(self, request: Any) -> bool:
+        return self.idempotent(request) if callable(self.idempotent) else self.idempotent
+
+
+def _is_read(request: Any) -> bool:
+    return getattr(request, "method", "").upper() in ("GET", "HEAD")
+
+
+# Unary methods of the wisp service; others (the DispatchTask stream) are
+# called as is
+DEFAULT_POLICIES: Dict[str, RpcPolicy] = {
+    "CallAPI": RpcPolicy(30.0, _is_read),
+    "CheckUserByCookies": RpcPolicy(WISP_RPC_TIMEOUT, True),
+    "GetAccountChat": RpcPolicy(WISP_RPC_TIMEOUT, True),
+    "CreateSession": RpcPolicy(WISP_RPC_TIMEOUT),
+    "FinishSession": RpcPolicy(WISP_RPC_TIMEOUT),
+    "UploadCommand": RpcPolicy(WISP_RPC_TIMEOUT),
+    "UploadReplayFile": RpcPolicy(600.0),
+    "ScanRemainReplays": RpcPolicy(60.0),
+}
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def get_policy(method: str) -> Optional[RpcPolicy]:
+    policy = DEFAULT_POLICIES.get(method)
+    if policy is not None and method in WISP_RPC_TIMEOUTS:
+        policy = policy._replace(timeout=WISP_RPC_TIMEOUTS[method])
+    return policy
+
+
+def retry_backoff(attempt: int) -> float:
+    """Full jitter: uniform up to the exponential bound, so retries spread out."""
+    return random.uniform(0, min(WISP_RPC_RETRY_BACKOFF * (2 ** attempt), MAX_RETRY_BACKOFF))
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast once `failure_threshold` consecutive calls found wisp
+    unavailable. After `reset_timeout` seconds one probe call goes through:
+    its success closes the breaker, its failure keeps it open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "state": self._state, "failures": self._failures}
+
+    def before_call(self, method: str):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            # A probe that never completed does not hold the breaker forever
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # This call is the probe
+                self._state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return
+            self._stats["rejected"] += 1
+        raise WispUnavailableError(f"Wisp unavailable, {method} not sent ({self.name} circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"{self.name}: wisp reachable again, circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                if self._state == self.CLOSED:
+                    logger.warning(f"{self.name}: {self._failures} failed calls to wisp, circuit open")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._stats["opened"] += 1
+
+    def record(self, error: Optional[grpc.RpcError]):
+        """
+        Count the outcome of a call. Errors wisp answered with, such as
+        NOT_FOUND, show it is up.
+        """
+        if error is not None and error.code() in BREAKER_CODES:
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+wisp_breaker = CircuitBreaker(
+    "wisp",
+    failure_threshold=WISP_RPC_BREAKER_FAILURES,
+    reset_timeout=WISP_RPC_BREAKER_RESET_TIMEOUT,
+)
+
+
+class PolicyStub:
+    """
+    Service stub applying the RPC policies: a deadline on every unary call,
+    retries with jittered backoff of idempotent ones, and the circuit
+    breaker. Wraps either a sync stub or a grpc.aio one (`aio`).
+    """
+
+    def __init__(self, stub, aio: bool = False, breaker: CircuitBreaker = wisp_breaker):
+        self._stub = stub
+        self._aio = aio
+        self._breaker = breaker
+
+    def __getattr__(self, name: str):
+        method = getattr(self._stub, name)
+        policy = get_policy(name)
+        if policy is None:
+            return method
+
+        if self._aio:
+            async def call(request, **kwargs):
+                return await self._acall(name, method, policy, request, **kwargs)
+        else:
+            def call(request, **kwargs):
+                return self._call(name, method, policy, request, **kwargs)
+
+        # Resolved once per stub
+        setattr(self, name, call)
+        return call
+
+    @staticmethod
+    def _call_options(policy: RpcPolicy, kwargs: dict) -> dict:
+        kwargs.setdefault("timeout", policy.timeout)
+        kwargs.setdefault("wait_for_ready", WISP_GRPC_WAIT_FOR_READY)
+        return kwargs
+
+    def _attempts(self, policy: RpcPolicy, request: Any) -> int:
+        return 1 + (max(WISP_RPC_RETRIES, 0) if policy.is_idempotent(request) else 0)
+
+    def _call(self, name: str, method, policy: RpcPolicy, request, **kwargs):
+        kwargs = self._call_options(policy, kwargs)
+        attempts = self._attempts(policy, request)
+        if attempts > 1 and _on_event_loop():
+            # A sync call from a coroutine already stalls the loop for one
+            # call; backing off and retrying there would stall every request
+            logger.debug(f"{name} called on the event loop thread, not retried")
+            attempts = 1
+        for attempt in range(attempts):
+            self._breaker.before_call(name)
+            try:
+                resp = method(request, **kwargs)
+            except grpc.RpcError as e:
+                self._breaker.record(e)
+                if e.code() not in RETRY_CODES or attempt == attempts - 1:
+                    raise
+                delay = retry_backoff(attempt)
+                logger.warning(f"{name} failed with {e.code().name}, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self._breaker.record(None)
+            return resp
+
+    async def _acall(self, name: str, method, policy: RpcPolicy, request, **kwargs):
+        kwargs = self._call_options(policy, kwargs)
+        attempts = self._attempts(policy, request)
+        for attempt in range(attempts):
+            self._breaker.before_call(name)
+            try:
+                resp = await method(request, **kwargs)
+            except grpc.aio.AioRpcError as e:
+                self._breaker.record(e)
+                if e.code() not in RETRY_CODES or attempt == attempts - 1:
+                    raise
+                delay = retry_backoff(attempt)
+                logger.warning(f"{name} failed with {e.code().name}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            self._breaker.record(None)
+            return resp
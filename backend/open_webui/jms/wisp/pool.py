@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import grpc
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+LB_POLICIES = (ROUND_ROBIN, LEAST_OUTSTANDING)
+
+
+class _Balancer:
+    """Picks the channel of each unary call and counts the calls in flight on each."""
+
+    def __init__(self, size: int, policy: str):
+        self.policy = policy
+        self.outstanding = [0] * size
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> int:
+        with self._lock:
+            size = len(self.outstanding)
+            start = next(self._next) % size
+            if self.policy == ROUND_ROBIN:
+                index = start
+            else:
+                # Ties go round-robin, so an idle pool still spreads calls
+                index = min(
+                    ((start + i) % size for i in range(size)),
+                    key=self.outstanding.__getitem__,
+                )
+            self.outstanding[index] += 1
+            return index
+
+    def release(self, index: int):
+        with self._lock:
+            self.outstanding[index] -= 1
+
+
+class _UnaryUnary(grpc.UnaryUnaryMultiCallable):
+    def __init__(self, balancer: _Balancer, callables: List[grpc.UnaryUnaryMultiCallable]):
+        self._balancer = balancer
+        self._callables = callables
+
+    def __call__(self, request, **kwargs):
+        index = self._balancer.acquire()
+        try:
+            return self._callables[index](request, **kwargs)
+        finally:
+            self._balancer.release(index)
+
+    def with_call(self, request, **kwargs):
+        index = self._balancer.acquire()
+        try:
+            return self._callables[index].with_call(request, **kwargs)
+        finally:
+            self._balancer.release(index)
+
+    def future(self, request, **kwargs):
+        index = self._balancer.acquire()
+        try:
+            future = self._callables[index].future(request, **kwargs)
+        except BaseException:
+            self._balancer.release(index)
+            raise
+        future.add_done_callback(lambda _: self._balancer.release(index))
+        return future
+
+
+class _AioUnaryUnary(grpc.aio.UnaryUnaryMultiCallable):
+    def __init__(self, balancer: _Balancer, callables: List[grpc.aio.UnaryUnaryMultiCallable]):
+        self._balancer = balancer
+        self._callables = callables
+
+    def __call__(self, request, **kwargs):
+        index = self._balancer.acquire()
+        try:
+            call = self._callables[index](request, **kwargs)
+        except BaseException:
+            self._balancer.release(index)
+            raise
+        call.add_done_callback(lambda _: self._balancer.release(index))
+        return call
+
+
+class _StreamCallable:
+    """
+    Multi-callable of a streaming method, resolved on the current stream
+    channel at each call, so stubs survive reset_stream_channel().
+    """
+
+    def __init__(self, pool: "_PoolBase", kind: str, method: str, kwargs: Dict[str, Any]):
+        self._pool = pool
+        self._kind = kind
+        self._method = method
+        self._kwargs = kwargs
+
+    def __call__(self, *args, **kwargs):
+        channel = self._pool.stream_channel
+        return getattr(channel, self._kind)(self._method, **self._kwargs)(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        # with_call / future of the sync stream-unary kind
+        channel = self._pool.stream_channel
+        return getattr(getattr(channel, self._kind)(self._method, **self._kwargs), name)
+
+
+class _PoolBase:
+    def __init__(
+            self,
+            targets: Sequence[str],
+            size: int,
+            policy: str,
+            new_channel: Callable[[str], Any],
+    ):
+        if not targets:
+            raise ValueError("No wisp address")
+        self.targets = list(targets)
+        self.policy = policy if policy in LB_POLICIES else LEAST_OUTSTANDING
+        self._new_channel = new_channel
+        size = max(size, 1)
+        # Spread over every address even when there are fewer channels
+        self.channel_targets = [self.targets[i % len(self.targets)] for i in range(max(size, len(self.targets)))]
+        self.channels = [new_channel(target) for target in self.channel_targets]
+        self.balancer = _Balancer(len(self.channels), self.policy)
+        self._stream_target = 0
+        self._stream_channel = None
+        self._stream_lock = threading.Lock()
+
+    @property
+    def stream_channel(self):
+        """
+        The channel of streaming RPCs, opened on first use, so long-lived
+        streams such as DispatchTask do not share a connection with unary calls.
+        """
+        channel = self._stream_channel
+        if channel is None:
+            with self._stream_lock:
+                if self._stream_channel is None:
+                    self._stream_channel = self._new_channel(self.targets[self._stream_target])
+                channel = self._stream_channel
+        return channel
+
+    @property
+    def stream_target(self) -> str:
+        return self.targets[self._stream_target]
+
+    def _swap_stream_channel(self):
+        """Drop the stream channel; the next stream opens one to the next address."""
+        with self._stream_lock:
+            channel, self._stream_channel = self._stream_channel, None
+            self._stream_target = (self._stream_target + 1) % len(self.targets)
+        return channel
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "channels": [
+                {"target": target, "outstanding": outstanding}
+                for target, outstanding in zip(self.channel_targets, self.balancer.outstanding)
+            ],
+            "stream_target": self.stream_target,
+        }
+
+    def _unary_callables(self, method: str, kwargs: Dict[str, Any]) -> list:
+        return [channel.unary_unary(method, **kwargs) for channel in self.channels]
+
+    def unary_stream(self, method, **kwargs):
+        return _StreamCallable(self, "unary_stream", method, kwargs)
+
+    def stream_unary(self, method, **kwargs):
+        return _StreamCallable(self, "stream_unary", method, kwargs)
+
+    def stream_stream(self, method, **kwargs):
+        return _StreamCallable(self, "stream_stream", method, kwargs)
+
+
+class ChannelPool(_PoolBase, grpc.Channel):
+    """
+    Channels to the wisp addresses behind one channel interface. Each unary
+    call goes to the channel picked by the `policy`, round-robin or the one
+    with the fewest calls in flight; streaming RPCs have a channel of their
+    own. Channels to one address get connections of their own.
+    """
+
+    def unary_unary(self, method, **kwargs):
+        return _UnaryUnary(self.balancer, self._unary_callables(method, kwargs))
+
+    def subscribe(self, callback, try_to_connect=False):
+        for channel in self.channels:
+            channel.subscribe(callback, try_to_connect=try_to_connect)
+
+    def unsubscribe(self, callback):
+        for channel in self.channels:
+            channel.unsubscribe(callback)
+
+    def reset_stream_channel(self):
+        channel = self._swap_stream_channel()
+        if channel is not None:
+            channel.close()
+
+    def close(self):
+        self.reset_stream_channel()
+        for channel in self.channels:
+            channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class AioChannelPool(_PoolBase, grpc.aio.Channel):
+    """ChannelPool of grpc.aio channels, bound to one event loop."""
+
+    def unary_unary(self, method, **kwargs):
+        return _AioUnaryUnary(self.balancer, self._unary_callables(method, kwargs))
+
+    def get_state(self, try_to_connect: bool = False) -> grpc.ChannelConnectivity:
+        states = [channel.get_state(try_to_connect) for channel in self.channels]
+        # The pool works while any channel does
+        for state in (grpc.ChannelConnectivity.READY, grpc.ChannelConnectivity.CONNECTING, grpc.ChannelConnectivity.IDLE):
+            if state in states:
+                return state
+        return states[0]
+
+    async def wait_for_state_change(self, last_observed_state):
+        await self.channels[0].wait_for_state_change(last_observed_state)
+
+    async def channel_ready(self):
+        for channel in self.channels:
+            await channel.channel_ready()
+
+    async def stream_channel_ready(self, timeout: Optional[float] = None) -> bool:
+        """Connect the stream channel, False when it is not ready within `timeout`."""
+        channel = self.stream_channel
+        try:
+            await asyncio.wait_for(channel.channel_ready(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def reset_stream_channel(self):
+        channel = self._swap_stream_channel()
+        if channel is not None:
+            await channel.close()
+
+    async def close(self, grace: Optional[float] = None):
+        channel = self._swap_stream_channel()
+        for ch in [*self.channels, *([channel] if channel is not None else [])]:
+            await ch.close(grace)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: chat.proto
+# Protobuf Python Version: 5.29.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    5,
+    29,
+    0,
+    '',
+    'chat.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\x12\x07message\"\x82\x02\n\x0b\x43hatMessage\x12\n\n\x02id\x18\x01 \x01(\t\x12\x16\n\tparent_id\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x14\n\x0c\x63hildren_ids\x18\x03 \x03(\t\x12\x11\n\x04role\x18\x04 \x01(\tH\x01\x88\x01\x01\x12\x14\n\x07\x63ontent\x18\x05 \x01(\tH\x02\x88\x01\x01\x12\x12\n\x05model\x18\x06 \x01(\tH\x03\x88\x01\x01\x12\x16\n\ttimestamp\x18\x07 \x01(\x03H\x04\x88\x01\x01\x12\x11\n\x04\x64one\x18\x08 \x01(\x08H\x05\x88\x01\x01\x12\r\n\x05\x65xtra\x18\x0f \x01(\x0c\x42\x0c\n\n_parent_idB\x07\n\x05_roleB\n\n\x08_contentB\x08\n\x06_modelB\x0c\n\n_timestampB\x07\n\x05_done\"\xcd\x03\n\x0c\x43hatDocument\x12\n\n\x02id\x18\x01 \x01(\t\x12\x14\n\x07user_id\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x12\n\x05title\x18\x03 \x01(\tH\x01\x88\x01\x01\x12\x17\n\ncreated_at\x18\x04 \x01(\x03H\x02\x88\x01\x01\x12\x17\n\nupdated_at\x18\x05 \x01(\x03H\x03\x88\x01\x01\x12\x15\n\x08share_id\x18\x06 \x01(\tH\x04\x88\x01\x01\x12\x15\n\x08\x61rchived\x18\x07 \x01(\x08H\x05\x88\x01\x01\x12\x13\n\x06pinned\x18\x08 \x01(\x08H\x06\x88\x01\x01\x12\x16\n\tfolder_id\x18\t \x01(\tH\x07\x88\x01\x01\x12\x0c\n\x04meta\x18\n \x01(\x0c\x12\x17\n\ncurrent_id\x18\x0b \x01(\tH\x08\x88\x01\x01\x12&\n\x08messages\x18\x0c \x03(\x0b\x32\x14.message.ChatMessage\x12\x12\n\nbranch_ids\x18\r \x03(\t\x12\x12\n\nchat_extra\x18\x0e \x01(\x0c\x12\r\n\x05\x65xtra\x18\x0f \x01(\x0c\x42\n\n\x08_user_idB\x08\n\x06_titleB\r\n\x0b_created_atB\r\n\x0b_updated_atB\x0b\n\t_share_idB\x0b\n\t_archivedB\t\n\x07_pinnedB\x0c\n\n_folder_idB\r\n\x0b_current_idB \n\x13org.jumpserver.wispZ\t/protobufb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chat_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  _globals['DESCRIPTOR']._loaded_options = None
+  _globals['DESCRIPTOR']._serialized_options = b'\n\023org.jumpserver.wispZ\t/protobuf'
+  _globals['_CHATMESSAGE']._serialized_start=24
+  _globals['_CHATMESSAGE']._serialized_end=282
+  _globals['_CHATDOCUMENT']._serialized_start=285
+  _globals['_CHATDOCUMENT']._serialized_end=746
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,62 @@
+from google.protobuf.internal import containers as _containers
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Mapping, Optional as _Optional, Union as _Union
+
+DESCRIPTOR: _descriptor.FileDescriptor
+
+class ChatMessage(_message.Message):
+    __slots__ = ("id", "parent_id", "children_ids", "role", "content", "model", "timestamp", "done", "extra")
+    ID_FIELD_NUMBER: _ClassVar[int]
+    PARENT_ID_FIELD_NUMBER: _ClassVar[int]
+    CHILDREN_IDS_FIELD_NUMBER: _ClassVar[int]
+    ROLE_FIELD_NUMBER: _ClassVar[int]
+    CONTENT_FIELD_NUMBER: _ClassVar[int]
+    MODEL_FIELD_NUMBER: _ClassVar[int]
+    TIMESTAMP_FIELD_NUMBER: _ClassVar[int]
+    DONE_FIELD_NUMBER: _ClassVar[int]
+    EXTRA_FIELD_NUMBER: _ClassVar[int]
+    id: str
+    parent_id: str
+    children_ids: _containers.RepeatedScalarFieldContainer[str]
+    role: str
+    content: str
+    model: str
+    timestamp: int
+    done: bool
+    extra: bytes
+    def __init__(self, id: _Optional[str] = ..., parent_id: _Optional[str] = ..., children_ids: _Optional[_Iterable[str]] = ..., role: _Optional[str] = ..., content: _Optional[str] = ..., model: _Optional[str] = ..., timestamp: _Optional[int] = ..., done: bool = ..., extra: _Optional[bytes] = ...) -> None: ...
+
+class ChatDocument(_message.Message):
+    __slots__ = ("id", "user_id", "title", "created_at", "updated_at", "share_id", "archived", "pinned", "folder_id", "meta", "current_id", "messages", "branch_ids", "chat_extra", "extra")
+    ID_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    TITLE_FIELD_NUMBER: _ClassVar[int]
+    CREATED_AT_FIELD_NUMBER: _ClassVar[int]
+    UPDATED_AT_FIELD_NUMBER: _ClassVar[int]
+    SHARE_ID_FIELD_NUMBER: _ClassVar[int]
+    ARCHIVED_FIELD_NUMBER: _ClassVar[int]
+    PINNED_FIELD_NUMBER: _ClassVar[int]
+    FOLDER_ID_FIELD_NUMBER: _ClassVar[int]
+    META_FIELD_NUMBER: _ClassVar[int]
+    CURRENT_ID_FIELD_NUMBER: _ClassVar[int]
+    MESSAGES_FIELD_NUMBER: _ClassVar[int]
+    BRANCH_IDS_FIELD_NUMBER: _ClassVar[int]
+    CHAT_EXTRA_FIELD_NUMBER: _ClassVar[int]
+    EXTRA_FIELD_NUMBER: _ClassVar[int]
+    id: str
+    user_id: str
+    title: str
+    created_at: int
+    updated_at: int
+    share_id: str
+    archived: bool
+    pinned: bool
+    folder_id: str
+    meta: bytes
+    current_id: str
+    messages: _containers.RepeatedCompositeFieldContainer[ChatMessage]
+    branch_ids: _containers.RepeatedScalarFieldContainer[str]
+    chat_extra: bytes
+    extra: bytes
+    def __init__(self, id: _Optional[str] = ..., user_id: _Optional[str] = ..., title: _Optional[str] = ..., created_at: _Optional[int] = ..., updated_at: _Optional[int] = ..., share_id: _Optional[str] = ..., archived: bool = ..., pinned: bool = ..., folder_id: _Optional[str] = ..., meta: _Optional[bytes] = ..., current_id: _Optional[str] = ..., messages: _Optional[_Iterable[_Union[ChatMessage, _Mapping]]] = ..., branch_ids: _Optional[_Iterable[str]] = ..., chat_extra: _Optional[bytes] = ..., extra: _Optional[bytes] = ...) -> None: ...
@@ -0,0 +1,234 @@
+import asyncio
+import heapq
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import grpc
+from opentelemetry import metrics, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from open_webui.env import WISP_RPC_SLOW_CALLS_WINDOW, WISP_RPC_SLOW_CALLS_PER_MINUTE
+from open_webui.utils.telemetry.constants import SpanAttributes
+
+# CallAPI paths of one chat, e.g. /api/v1/terminal/chats/<id>/
+_CHAT_PATH_RE = re.compile(r"/chats/([^/?]+)/")
+# Request fields holding the terminal session id
+_SESSION_FIELDS = ("session_id", "sid")
+_SESSION_METHODS = ("FinishSession",)
+
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+duration_histogram = meter.create_histogram(
+    name="wisp.rpc.duration",
+    description="Duration of wisp RPCs, per method and status",
+    unit="ms",
+)
+error_counter = meter.create_counter(
+    name="wisp.rpc.errors",
+    description="Wisp RPCs that did not return OK, per method and status",
+    unit="1",
+)
+request_size_histogram = meter.create_histogram(
+    name="wisp.rpc.request.size",
+    description="Serialized size of wisp RPC requests",
+    unit="By",
+)
+response_size_histogram = meter.create_histogram(
+    name="wisp.rpc.response.size",
+    description="Serialized size of wisp RPC responses",
+    unit="By",
+)
+inflight_counter = meter.create_up_down_counter(
+    name="wisp.rpc.inflight",
+    description="Wisp RPCs sent and not answered yet, per method",
+    unit="1",
+)
+
+
+class SlowCalls:
+    """
+    The `per_minute` slowest calls of each of the last `window` minutes, so
+    the slowest calls of any span of minutes are known without keeping
+    every call.
+    """
+
+    def __init__(self, window: int, per_minute: int):
+        self.window = max(window, 1)
+        self.per_minute = max(per_minute, 1)
+        # minute -> min-heap of (duration_ms, seq, call)
+        self._minutes: "OrderedDict[int, list]" = OrderedDict()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def record(self, duration_ms: float, call: Dict[str, Any]):
+        minute = int(call["time"] // 60)
+        with self._lock:
+            heap = self._minutes.get(minute)
+            if heap is None:
+                heap = self._minutes[minute] = []
+                while self._minutes and next(iter(self._minutes)) <= minute - self.window:
+                    self._minutes.popitem(last=False)
+            self._seq += 1
+            item = (duration_ms, self._seq, call)
+            if len(heap) < self.per_minute:
+                heapq.heappush(heap, item)
+            elif duration_ms > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    def slowest(self, minutes: int = 10, limit: int = 20) -> List[Dict[str, Any]]:
+        """The `limit` slowest calls that finished in the last `minutes` minutes."""
+        since = time.time() - minutes * 60
+        with self._lock:
+            items = [
+                item for minute, heap in self._minutes.items()
+                if (minute + 1) * 60 > since
+                for item in heap
+                if item[2]["time"] >= since
+            ]
+        return [dict(call) for _, _, call in heapq.nlargest(limit, items)]
+
+    def clear(self):
+        with self._lock:
+            self._minutes.clear()
+
+
+slow_calls = SlowCalls(WISP_RPC_SLOW_CALLS_WINDOW, WISP_RPC_SLOW_CALLS_PER_MINUTE)
+
+
+def _method_name(method: Any) -> str:
+    # "/message.Service/CallAPI" -> "CallAPI"; grpc.aio passes it as bytes
+    if isinstance(method, bytes):
+        method = method.decode()
+    return method.rsplit("/", 1)[-1]
+
+
+def _request_ids(method: str, request: Any) -> Dict[str, str]:
+    """The chat and session a request is about, when it names them."""
+    ids = {}
+    fields = getattr(getattr(request, "DESCRIPTOR", None), "fields_by_name", {})
+    if "path" in fields:
+        match = _CHAT_PATH_RE.search(request.path)
+        if match and match.group(1) != "batch":
+            ids["chat.id"] = match.group(1)
+    for name in _SESSION_FIELDS:
+        if name in fields and getattr(request, name):
+            ids["session.id"] = getattr(request, name)
+            break
+    else:
+        if method in _SESSION_METHODS and request.id:
+            ids["session.id"] = request.id
+        elif method == "CreateSession" and request.data.id:
+            ids["session.id"] = request.data.id
+    return ids
+
+
+class _RpcRecorder:
+    """Span, metrics and slow call entry of one RPC."""
+
+    __slots__ = ("method", "ids", "span", "attrs", "start", "request_size", "path")
+
+    def __init__(self, method: str, request: Any):
+        self.method = method
+        self.ids = _request_ids(method, request)
+        self.path = getattr(request, "path", None) if method == "CallAPI" else None
+        self.attrs = {SpanAttributes.RPC_METHOD: method}
+        self.request_size = request.ByteSize() if hasattr(request, "ByteSize") else 0
+
+        span_attrs = {
+            SpanAttributes.RPC_SYSTEM: "grpc",
+            SpanAttributes.RPC_SERVICE: "message.Service",
+            SpanAttributes.RPC_METHOD: method,
+            "rpc.request.size": self.request_size,
+            **self.ids,
+        }
+        if self.path:
+            span_attrs["wisp.api.method"] = request.method
+            span_attrs["wisp.api.path"] = self.path
+        self.span = tracer.start_span(f"wisp/{method}", kind=SpanKind.CLIENT, attributes=span_attrs)
+        request_size_histogram.record(self.request_size, self.attrs)
+        inflight_counter.add(1, self.attrs)
+        self.start = time.perf_counter()
+
+    def finish(self, code: grpc.StatusCode, response: Any = None, details: Optional[str] = None):
+        duration_ms = (time.perf_counter() - self.start) * 1000.0
+        inflight_counter.add(-1, self.attrs)
+        attrs = {**self.attrs, SpanAttributes.RPC_GRPC_STATUS_CODE: code.name}
+        duration_histogram.record(duration_ms, attrs)
+
+        response_size = 0
+        if code == grpc.StatusCode.OK:
+            response_size = response.ByteSize() if hasattr(response, "ByteSize") else 0
+            response_size_histogram.record(response_size, self.attrs)
+        else:
+            error_counter.add(1, attrs)
+            self.span.set_status(Status(StatusCode.ERROR, details or code.name))
+        self.span.set_attribute(SpanAttributes.RPC_GRPC_STATUS_CODE, code.value[0])
+        self.span.set_attribute("rpc.response.size", response_size)
+        self.span.end()
+
+        slow_calls.record(duration_ms, {
+            "time": time.time(),
+            "method": self.method,
+            "duration_ms": round(duration_ms, 3),
+            "status": code.name,
+            "request_size": self.request_size,
+            "response_size": response_size,
+            "path": self.path,
+            "chat_id": self.ids.get("chat.id"),
+            "session_id": self.ids.get("session.id"),
+        })
+
+
+class TelemetryInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """
+    Records every unary call on a sync wisp channel: a client span carrying
+    the chat and session ids, the wisp.rpc.* metrics and the slow call log.
+    Each retry of PolicyStub is a call of its own. The DispatchTask stream
+    lives as long as the worker and is left out.
+    """
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        recorder = _RpcRecorder(_method_name(client_call_details.method), request)
+        try:
+            outcome = continuation(client_call_details, request)
+        except Exception:
+            recorder.finish(grpc.StatusCode.UNKNOWN)
+            raise
+
+        def done(future):
+            error = future.exception()
+            if error is None:
+                recorder.finish(grpc.StatusCode.OK, future.result())
+            elif isinstance(error, grpc.Call):
+                recorder.finish(error.code(), details=error.details())
+            else:
+                recorder.finish(grpc.StatusCode.UNKNOWN, details=str(error))
+
+        # Blocking calls get a finished outcome, the callback runs at once
+        outcome.add_done_callback(done)
+        return outcome
+
+
+class AioTelemetryInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """TelemetryInterceptor for grpc.aio channels."""
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        recorder = _RpcRecorder(_method_name(client_call_details.method), request)
+        try:
+            call = await continuation(client_call_details, request)
+            response = await call
+        except grpc.aio.AioRpcError as e:
+            recorder.finish(e.code(), details=e.details())
+            raise
+        except asyncio.CancelledError:
+            recorder.finish(grpc.StatusCode.CANCELLED)
+            raise
+        except Exception as e:
+            recorder.finish(grpc.StatusCode.UNKNOWN, details=str(e))
+            raise
+        recorder.finish(grpc.StatusCode.OK, response)
+        # A finished call hands the same response to the stub
+        return call
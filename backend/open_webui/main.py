@@ -20,11 +20,22 @@ from fastapi.openapi.docs import get_swagger_ui_html
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.datastructures import Headers
 
-from open_webui.jms import setup_poll_jms_event, chat_manager
+from open_webui.jms import (
+    setup_poll_jms_event,
+    AccountChatHandler,
+    chat_manager,
+    chat_write_buffer,
+    command_uploader,
+    replay_uploader,
+    session_closer,
+)
+from open_webui.jms.wisp import shutdown_aio_protobuf
 from open_webui.utils.logger import start_logger
 from open_webui.socket.main import (
     app as socket_app,
     periodic_usage_pool_cleanup,
+    SESSION_POOLS,
+    YDOC_MANAGER,
 )
 
 from open_webui.models.functions import Functions
@@ -47,6 +58,8 @@ from open_webui.env import (
     INSTANCE_ID,
     WEBUI_BUILD_HASH,
     RESET_CONFIG_ON_START, FRONTEND_BUILD_DIR,
+    WISP_SHUTDOWN_TIMEOUT,
+    WEBSOCKET_YDOC_SWEEP_INTERVAL,
 )
 
 from open_webui.utils.models import (
@@ -57,6 +70,7 @@ from open_webui.utils.auth import (
     get_license_data,
 )
 from open_webui.utils.plugin import install_tool_and_function_dependencies
+from open_webui.utils.http_client import client_sessions
 from open_webui.utils.redis import get_redis_connection
 
 from open_webui.tasks import (
@@ -184,6 +198,10 @@ async def lifespan(app: FastAPI):
         limiter.total_tokens = THREAD_POOL_SIZE
 
     asyncio.create_task(periodic_usage_pool_cleanup())
+    session_pools_task = asyncio.create_task(SESSION_POOLS.run())
+    ydoc_sweeper_task = asyncio.create_task(
+        YDOC_MANAGER.run_sweeper(WEBSOCKET_YDOC_SWEEP_INTERVAL)
+    )
 
     if app.state.config.ENABLE_BASE_MODELS_CACHE:
         await get_all_models(
@@ -206,14 +224,26 @@ async def lifespan(app: FastAPI):
             None,
         )
 
-    setup_poll_jms_event()
+    setup_poll_jms_event(app.state.redis)
+    await command_uploader.start()
+    app.state.account_prefetch_task = AccountChatHandler.start_prefetch()
 
-    providers = chat_manager.get_providers()
+    providers = await chat_manager.aget_providers()
     apply_provider_config(providers, app.state.config)
     yield
 
     if hasattr(app.state, "redis_task_command_listener"):
         app.state.redis_task_command_listener.cancel()
+    session_pools_task.cancel()
+    ydoc_sweeper_task.cancel()
+    app.state.account_prefetch_task.cancel()
+
+    await session_closer.wait(WISP_SHUTDOWN_TIMEOUT)
+    await chat_write_buffer.flush_all()
+    await command_uploader.aclose()
+    await replay_uploader.wait(WISP_SHUTDOWN_TIMEOUT)
+    await shutdown_aio_protobuf()
+    await client_sessions.close()
 
 
 app = FastAPI(
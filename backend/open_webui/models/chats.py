@@ -1,16 +1,34 @@
 import logging
 import time
 import uuid
-from typing import Optional
+from typing import AsyncIterator, Optional
 from fastapi import Request
 
-from open_webui.jms import chat_manager
+from open_webui.jms import chat_manager, chat_write_buffer
+from open_webui.jms.chat import (
+    set_op,
+    retrieve_many_op,
+    update_many_op,
+    delete_many_op,
+    CHAT_MINI_FIELDS,
+)
 from open_webui.jms import SessionHandler
+from open_webui.jms.wisp.exceptions import WispError
 from open_webui.jms.wisp.protobuf.common_pb2 import User
 from open_webui.internal.db import Base, get_db
 from open_webui.models.tags import TagModel, Tags
 from open_webui.models.folders import Folders
-from open_webui.env import SRC_LOG_LEVELS
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    WISP_CHAT_LIST_PAGE_SIZE,
+    WISP_CHAT_SEARCH_SYNC_INTERVAL,
+)
+from open_webui.utils.chat_search import (
+    ChatSearchIndex,
+    ChatSearchIndexes,
+    SearchQuery,
+    chat_search_indexes,
+)
 
 from pydantic import BaseModel, ConfigDict
 from sqlalchemy import BigInteger, Boolean, Column, String, Text, JSON, Index
@@ -145,7 +163,23 @@ class ChatTable:
         chat_model = form_data.chat.get("models", [None])[0] or ''
         session = session_handler.create_session(chat_model)
 
-        data = {
+        data = self._new_chat_data(form_data, sid, session)
+        chat = chat_manager.create(data)
+        return chat
+
+    async def ainsert_new_chat(self, form_data: ChatForm, sid: str, request: Request, user: User):
+        ip = self.get_ip(request)
+        session_handler = SessionHandler(sid=sid, ip=ip, user=user)
+        chat_model = form_data.chat.get("models", [None])[0] or ''
+        session = await session_handler.acreate_session(chat_model)
+
+        data = self._new_chat_data(form_data, sid, session)
+        chat = await chat_manager.acreate(data)
+        return chat
+
+    @staticmethod
+    def _new_chat_data(form_data: ChatForm, sid: str, session) -> dict:
+        return {
             'id': session.id,
             'user_id': session.user_id,
             'title': form_data.chat['title'] if 'title' in form_data.chat else 'New Chat',
@@ -160,9 +194,6 @@ class ChatTable:
             }
         }
 
-        chat = chat_manager.create(data)
-        return chat
-
     # TODO
     def import_chat(
             self, user_id: str, form_data: ChatImportForm
@@ -210,10 +241,23 @@ class ChatTable:
                 'title': chat["title"] if "title" in chat else "New Chat",
             }
         )
+        chat_write_buffer.mark_written(_id)
+        return chat_dict
+
+    @staticmethod
+    async def aupdate_chat_by_id(_id: str, chat: dict) -> Optional[ChatModel]:
+        chat_dict = await chat_manager.aupdate(
+            _id,
+            {
+                'chat': chat,
+                'title': chat["title"] if "title" in chat else "New Chat",
+            }
+        )
+        chat_write_buffer.mark_written(_id)
         return chat_dict
 
     def update_chat_title_by_id(self, _id: str, title: str) -> Optional[ChatModel]:
-        chat_dict = self.get_chat_by_id(_id)
+        chat_dict = self.get_chat_by_id(_id, fresh=True)
         if chat_dict is None:
             return None
 
@@ -221,26 +265,47 @@ class ChatTable:
         chat["title"] = title
         return self.update_chat_by_id(_id, chat)
 
-    # TODO
     def update_chat_tags_by_id(
             self, id: str, tags: list[str], user
     ) -> Optional[ChatModel]:
-        chat = self.get_chat_by_id(id)
+        chat = self.get_chat_by_id(id, fresh=True)
         if chat is None:
             return None
 
-        self.delete_all_tags_by_id_and_user_id(id, user.id)
-
-        for tag in chat['meta'].get("tags", []):
-            if self.count_chats_by_tag_name_and_user_id(tag, user.id) == 0:
-                Tags.delete_tag_by_name_and_user_id(tag, user.id)
-
+        old_tags = chat['meta'].get("tags", [])
+        new_tags = []
         for tag_name in tags:
             if tag_name.lower() == "none":
                 continue
+            tag = Tags.get_tag_by_name_and_user_id(tag_name, user.id)
+            if tag is None:
+                tag = Tags.insert_new_tag(tag_name, user.id)
+            new_tags.append(tag.id if tag else tag_name.replace(" ", "_").lower())
+
+        chat = self._set_chat_tags(id, chat, new_tags, user.id)
 
-            self.add_chat_tag_by_id_and_user_id_and_tag_name(id, user.id, tag_name)
-        return self.get_chat_by_id(id)
+        for tag in old_tags:
+            if tag not in new_tags and self.count_chats_by_tag_name_and_user_id(tag, user.id) == 0:
+                Tags.delete_tag_by_name_and_user_id(tag, user.id)
+        return chat
+
+    def _set_chat_tags(
+            self, _id: str, chat_dict: dict, tags: list[str], user_id: Optional[str] = None
+    ) -> Optional[dict]:
+        meta = {
+            **chat_dict['meta'],
+            "tags": list(dict.fromkeys(tags)),
+        }
+        return self._update_chat_by_id_and_user_id(_id, user_id, {'meta': meta})
+
+    async def _aset_chat_tags(
+            self, _id: str, chat_dict: dict, tags: list[str], user_id: Optional[str] = None
+    ) -> Optional[dict]:
+        meta = {
+            **chat_dict['meta'],
+            "tags": list(dict.fromkeys(tags)),
+        }
+        return await self._aupdate_chat_by_id_and_user_id(_id, user_id, {'meta': meta})
 
     def get_chat_title_by_id(self, _id: str) -> Optional[str]:
         chat_dict = self.get_chat_by_id(_id)
@@ -268,7 +333,7 @@ class ChatTable:
     def upsert_message_to_chat_by_id_and_message_id(
             self, _id: str, message_id: str, message: dict
     ):
-        chat_dict = self.get_chat_by_id(_id)
+        chat_dict = self.get_chat_by_id(_id, fresh=True)
         if chat_dict is None:
             return None
 
@@ -290,25 +355,104 @@ class ChatTable:
         history["currentId"] = message_id
 
         chat["history"] = history
-        return self.update_chat_by_id(_id, chat)
+        return self._patch_message(_id, chat, message_id, set_current=True)
 
     def add_message_status_to_chat_by_id_and_message_id(
             self, _id: str, message_id: str, status: dict
     ):
-        chat_dict = self.get_chat_by_id(_id)
+        chat_dict = self.get_chat_by_id(_id, fresh=True)
         if chat_dict is None:
             return None
 
         chat = chat_dict['chat']
         history = chat.get("history", {})
 
-        if message_id in history.get("messages", {}):
-            status_history = history["messages"][message_id].get("statusHistory", [])
-            status_history.append(status)
-            history["messages"][message_id]["statusHistory"] = status_history
+        if message_id not in history.get("messages", {}):
+            return chat_dict
+
+        status_history = history["messages"][message_id].get("statusHistory", [])
+        status_history.append(status)
+        history["messages"][message_id]["statusHistory"] = status_history
 
         chat["history"] = history
-        return self.update_chat_by_id(_id, chat)
+        return self._patch_message(_id, chat, message_id)
+
+    def add_message_append_to_chat_by_id_and_message_id(
+            self, _id: str, message_id: str, key: str, value, prepend: bool = False
+    ):
+        """Join `value`, a string or a list, after (or before) the message's `key`."""
+        chat_dict = self.get_chat_by_id(_id, fresh=True)
+        if chat_dict is None:
+            return None
+        message = chat_dict['chat'].get("history", {}).get("messages", {}).get(message_id)
+        if not message:
+            return None
+
+        stored = message.get(key)
+        if stored is None:
+            stored = value[:0]
+        return self.upsert_message_to_chat_by_id_and_message_id(
+            _id, message_id, {key: value + stored if prepend else stored + value}
+        )
+
+    @staticmethod
+    def _patch_message(_id: str, chat: dict, message_id: str, set_current: bool = False):
+        """Send only the changed message (and currentId) instead of the whole chat."""
+        history = chat["history"]
+        ops = [set_op("chat", "history", "messages", message_id, value=history["messages"][message_id])]
+        if set_current:
+            ops.append(set_op("chat", "history", "currentId", value=message_id))
+
+        result = chat_manager.patch(
+            _id,
+            ops,
+            {
+                'chat': chat,
+                'title': chat["title"] if "title" in chat else "New Chat",
+            }
+        )
+        if result.full_update:
+            # The whole chat was sent, with the buffered patches of every message
+            chat_write_buffer.mark_written(_id)
+        else:
+            # The sent message already contained any buffered patches for it
+            chat_write_buffer.mark_message_written(_id, message_id)
+        return result.chat
+
+    def buffer_message_to_chat_by_id_and_message_id(
+            self, _id: str, message_id: str, message: dict
+    ):
+        """
+        Write-behind variant of upsert_message_to_chat_by_id_and_message_id for
+        hot paths such as streaming; call flush_chat_by_id when the answer is done.
+        """
+        if not chat_write_buffer.enabled:
+            return self.upsert_message_to_chat_by_id_and_message_id(_id, message_id, message)
+        chat_write_buffer.add_message(_id, message_id, message)
+
+    def buffer_message_status_to_chat_by_id_and_message_id(
+            self, _id: str, message_id: str, status: dict
+    ):
+        if not chat_write_buffer.enabled:
+            return self.add_message_status_to_chat_by_id_and_message_id(_id, message_id, status)
+        chat_write_buffer.add_status(_id, message_id, status)
+
+    def buffer_message_append_to_chat_by_id_and_message_id(
+            self, _id: str, message_id: str, key: str, value, prepend: bool = False
+    ):
+        """
+        Write-behind variant of add_message_append_to_chat_by_id_and_message_id,
+        which does not read the chat for every content delta or embed.
+        """
+        if not chat_write_buffer.enabled:
+            return self.add_message_append_to_chat_by_id_and_message_id(
+                _id, message_id, key, value, prepend
+            )
+        chat_write_buffer.add_append(_id, message_id, key, value, prepend)
+
+    @staticmethod
+    async def flush_chat_by_id(_id: str):
+        await chat_write_buffer.flush(_id)
 
     # TODO
     def insert_shared_chat_by_chat_id(self, chat_id: str) -> Optional[ChatModel]:
@@ -398,18 +542,39 @@ class ChatTable:
         chat_dict = chat_manager.update(_id, data)
         return chat_dict
 
+    @staticmethod
+    async def aupdate_chat_share_id_by_id(
+            _id: str, share_id: Optional[str]
+    ):
+        data = {'share_id': share_id}
+        return await chat_manager.aupdate(_id, data)
+
     def toggle_chat_pinned_by_id(self, _id: str):
-        chat_dict = self.get_chat_by_id(_id)
+        chat_dict = self.get_chat_by_id(_id, fresh=True)
         pinned = not chat_dict.get('pinned', False)
         data = {'pinned': pinned}
         return chat_manager.update(_id, data)
 
-    def toggle_chat_archive_by_id(self, _id: str):
-        chat_dict = self.get_chat_by_id(_id)
+    async def atoggle_chat_pinned_by_id(self, _id: str):
+        chat_dict = await self.aget_chat_by_id(_id, fresh=True)
+        pinned = not chat_dict.get('pinned', False)
+        data = {'pinned': pinned}
+        return await chat_manager.aupdate(_id, data)
+
+    def toggle_chat_archive_by_id(
+            self, _id: str, user_id: Optional[str] = None, chat_dict: Optional[dict] = None
+    ) -> Optional[dict]:
+        """Pass `chat_dict` if the caller just read the chat fresh, it is not read again."""
+        chat_dict = chat_dict or self.get_chat_by_id(_id, fresh=True)
         archived = not chat_dict.get('archived', False)
-        data = {'archived': archived}
-        chat_dict = chat_manager.update(_id, data)
-        return chat_dict
+        return self._update_chat_by_id_and_user_id(_id, user_id, {'archived': archived})
+
+    async def atoggle_chat_archive_by_id(
+            self, _id: str, user_id: Optional[str] = None, chat_dict: Optional[dict] = None
+    ) -> Optional[dict]:
+        chat_dict = chat_dict or await self.aget_chat_by_id(_id, fresh=True)
+        archived = not chat_dict.get('archived', False)
+        return await self._aupdate_chat_by_id_and_user_id(_id, user_id, {'archived': archived})
 
     @staticmethod
     def archive_all_chats_by_user_id(user_id: str) -> bool:
@@ -429,8 +594,6 @@ class ChatTable:
         query = {
             'user_id': user_id,
             'archived': True,
-            'offset': skip,
-            'limit': limit,
         }
 
         if filter:
@@ -445,8 +608,8 @@ class ChatTable:
                 if direction.lower() == "asc":
                     query['ordering'] = 'date_updated'
 
-        resp = chat_manager.list(query=query)
-        return resp['results']
+        page = chat_manager.list_page(query, offset=skip, limit=limit, fields=CHAT_MINI_FIELDS)
+        return page.results
 
     @staticmethod
     def get_chat_list_by_user_id(
@@ -458,8 +621,6 @@ class ChatTable:
     ) -> list:
         query = {
             'user_id': user_id,
-            'offset': skip,
-            'limit': limit,
         }
 
         if not include_archived:
@@ -477,8 +638,8 @@ class ChatTable:
                 if direction.lower() == "asc":
                     query['ordering'] = 'date_updated'
 
-        resp = chat_manager.list(query=query)
-        return resp['results']
+        page = chat_manager.list_page(query, offset=skip, limit=limit, fields=CHAT_MINI_FIELDS)
+        return page.results
 
     @staticmethod
     def get_chat_title_id_list_by_user_id(
@@ -491,9 +652,6 @@ class ChatTable:
     ) -> list[ChatTitleIdResponse]:
         query = {
             'user_id': user_id,
-            'offset': skip,
-            'limit': limit,
-            'fields_size': 'mini'
         }
 
         if not include_folders:
@@ -505,8 +663,7 @@ class ChatTable:
         if not include_archived:
             query['archived'] = False
 
-        resp = chat_manager.list(query=query)
-        filtered = resp['results']
+        page = chat_manager.list_page(query, offset=skip or 0, limit=limit, fields=CHAT_MINI_FIELDS)
         return [
             ChatTitleIdResponse.model_validate(
                 {
@@ -516,7 +673,7 @@ class ChatTable:
                     "created_at": chat['created_at'],
                 }
             )
-            for chat in filtered
+            for chat in page.results
         ]
 
     @staticmethod
@@ -526,17 +683,17 @@ class ChatTable:
         query = {
             'archived': False,
             'ids': ','.join(chat_ids),
-            'offset': skip,
-            'limit': limit,
         }
+        return chat_manager.list_page(query, offset=skip, limit=limit).results
 
-        resp = chat_manager.list(query=query)
-        filtered = resp['results']
-        return filtered
+    @staticmethod
+    def get_chat_by_id(_id: str, fresh: bool = False):
+        """Pass `fresh` when the chat is read to be written back whole."""
+        return chat_write_buffer.overlay(_id, chat_manager.retrieve(_id, fresh=fresh))
 
     @staticmethod
-    def get_chat_by_id(_id: str):
-        return chat_manager.retrieve(_id)
+    async def aget_chat_by_id(_id: str, fresh: bool = False):
+        return chat_write_buffer.overlay(_id, await chat_manager.aretrieve(_id, fresh=fresh))
 
     # TODO
     def get_chat_by_share_id(self, id: str) -> Optional[ChatModel]:
@@ -553,8 +710,11 @@ class ChatTable:
         except Exception:
             return None
 
-    def get_chat_by_id_and_user_id(self, _id: str, user_id: str):
-        return self.get_chat_by_id(_id)
+    def get_chat_by_id_and_user_id(self, _id: str, user_id: str, fresh: bool = False):
+        return self.get_chat_by_id(_id, fresh=fresh)
+
+    async def aget_chat_by_id_and_user_id(self, _id: str, user_id: str, fresh: bool = False):
+        return await self.aget_chat_by_id(_id, fresh=fresh)
         # try:
         #     with get_db() as db:
         #         chat = db.query(Chat).filter_by(id=id, user_id=user_id).first()
@@ -564,14 +724,31 @@ class ChatTable:
 
     @staticmethod
     def get_chats(skip: int = 0, limit: int = 50):
-        return chat_manager.list()['results']
+        return list(chat_manager.iter())
+
+    @staticmethod
+    def aiter_chats() -> AsyncIterator[dict]:
+        return chat_manager.aiter()
 
     @staticmethod
     def get_chats_by_user_id(user_id: str):
         query = {
             'user_id': user_id,
         }
-        return chat_manager.list(query=query)['results']
+        return list(chat_manager.iter(query))
+
+    @staticmethod
+    async def aget_chats_by_user_id(user_id: str):
+        return [chat async for chat in Chats.aiter_chats_by_user_id(user_id)]
+
+    @staticmethod
+    def aiter_chats_by_user_id(user_id: str, archived: Optional[bool] = None) -> AsyncIterator[dict]:
+        query = {
+            'user_id': user_id,
+        }
+        if archived is not None:
+            query['archived'] = archived
+        return chat_manager.aiter(query)
 
     @staticmethod
     def get_pinned_chats_by_user_id(user_id: str):
@@ -580,7 +757,16 @@ class ChatTable:
             'pinned': True,
             'archived': False,
         }
-        return chat_manager.list(query=query)['results']
+        return list(chat_manager.iter(query, fields=CHAT_MINI_FIELDS))
+
+    @staticmethod
+    async def aget_pinned_chats_by_user_id(user_id: str):
+        query = {
+            'user_id': user_id,
+            'pinned': True,
+            'archived': False,
+        }
+        return [chat async for chat in chat_manager.aiter(query, fields=CHAT_MINI_FIELDS)]
 
     @staticmethod
     def get_archived_chats_by_user_id(user_id: str):
@@ -588,7 +774,11 @@ class ChatTable:
             'user_id': user_id,
             'archived': True,
         }
-        return chat_manager.list(query=query)['results']
+        return list(chat_manager.iter(query))
+
+    @staticmethod
+    async def aget_archived_chats_by_user_id(user_id: str):
+        return [chat async for chat in Chats.aiter_chats_by_user_id(user_id, archived=True)]
 
     def get_chats_by_user_id_and_search_text(
             self,
@@ -597,63 +787,66 @@ class ChatTable:
             include_archived: bool = False,
             skip: int = 0,
             limit: int = 60,
-    ) -> list[ChatModel]:
+    ) -> list[dict]:
         """
-        Filters chats based on a search query using Python, allowing pagination using skip and limit.
+        Search the user's chats in the local index, see ChatSearchIndex. The
+        text may hold tag:, folder:, pinned:, archived: and shared: filters.
         """
-        search_text = search_text.replace("\u0000", "").lower().strip()
+        search_text = search_text.replace("\u0000", "").strip()
 
         if not search_text:
             return self.get_chat_list_by_user_id(
                 user_id, include_archived, filter={}, skip=skip, limit=limit
             )
 
-        search_text_words = search_text.split(" ")
-
-        is_pinned = None
-        if "pinned:true" in search_text_words:
-            is_pinned = True
-        elif "pinned:false" in search_text_words:
-            is_pinned = False
-
-        is_archived = None
-        if "archived:true" in search_text_words:
-            is_archived = True
-        elif "archived:false" in search_text_words:
-            is_archived = False
-
-        search_text_words = [
-            word
-            for word in search_text_words
-            if (
-                    not word.startswith("tag:")
-                    and not word.startswith("folder:")
-                    and not word.startswith("pinned:")
-                    and not word.startswith("archived:")
-                    and not word.startswith("shared:")
-            )
-        ]
+        query = SearchQuery.parse(search_text)
+        if query.archived is None and not include_archived:
+            query.archived = False
 
-        search_text = " ".join(search_text_words)
-        query = {
-            'user_id': user_id,
-            'skip': skip,
-            'limit': limit,
-        }
+        folder_ids = None
+        if query.folders:
+            folder_ids = {
+                folder.id
+                for folder in Folders.search_folders_by_names(user_id, query.folders)
+            }
 
-        if is_archived is not None:
-            query['archived'] = is_archived
-        elif not include_archived:
-            query['archived'] = False
+        index = chat_search_indexes.get(user_id)
+        if ChatSearchIndexes.is_stale(index, WISP_CHAT_SEARCH_SYNC_INTERVAL):
+            self._sync_search_index(user_id, index)
+        return index.search(query, folder_ids, skip=skip, limit=limit)
 
-        if is_pinned is not None:
-            query['pinned'] = is_pinned
+    @staticmethod
+    def _sync_search_index(user_id: str, index: ChatSearchIndex):
+        """
+        Catch up with chats changed by other workers: compare the user's
+        (id, updated_at) list with the index and load only the chats that
+        differ. The first sync streams every chat instead.
+        """
+        with index.sync_lock:
+            if not ChatSearchIndexes.is_stale(index, WISP_CHAT_SEARCH_SYNC_INTERVAL):
+                return
+            synced_at = time.monotonic()
+            query = {'user_id': user_id}
+
+            if index.synced_at is None:
+                for chat in chat_manager.iter(query):
+                    index.upsert(chat)
+            else:
+                indexed = index.versions()
+                current = {
+                    chat['id']: chat.get('updated_at')
+                    for chat in chat_manager.iter(query, fields=('id', 'updated_at'))
+                }
+                for chat_id in indexed.keys() - current.keys():
+                    index.remove(chat_id)
 
-        query['search'] = search_text
-        resp = chat_manager.list(query=query)
+                changed = [chat_id for chat_id, updated_at in current.items() if indexed.get(chat_id) != updated_at]
+                for start in range(0, len(changed), WISP_CHAT_LIST_PAGE_SIZE):
+                    batch = changed[start:start + WISP_CHAT_LIST_PAGE_SIZE]
+                    for chat in chat_manager.iter({'ids': ','.join(batch)}):
+                        index.upsert(chat)
 
-        # Validate and return chats
-        return resp['results']
+            index.synced_at = synced_at
 
     def get_chats_by_folder_id_and_user_id(
             self, folder_id: str, user_id: str, skip: int = 0, limit: int = 60
@@ -689,15 +882,166 @@ class ChatTable:
             all_chats = query.all()
             return [ChatModel.model_validate(chat) for chat in all_chats]
 
-    @staticmethod
     def update_chat_folder_id_by_id_and_user_id(
-            _id: str, user_id: str, folder_id: str
-    ):
+            self, _id: str, user_id: str, folder_id: str
+    ) -> Optional[dict]:
         data = {
             'folder_id': folder_id,
             'pinned': False
         }
-        return chat_manager.update(_id, data)
+        return self._update_chat_by_id_and_user_id(_id, user_id, data)
+
+    async def aupdate_chat_folder_id_by_id_and_user_id(
+            self, _id: str, user_id: str, folder_id: str
+    ) -> Optional[dict]:
+        data = {
+            'folder_id': folder_id,
+            'pinned': False
+        }
+        return await self._aupdate_chat_by_id_and_user_id(_id, user_id, data)
+
+    # Multi-chat actions: one batch call to wisp whatever the number of chats
+
+    @staticmethod
+    def get_chats_by_ids_and_user_id(ids: list[str], user_id: str) -> list[dict]:
+        try:
+            [result] = chat_manager.batch([retrieve_many_op(ids, user_id)])
+        except WispError as e:
+            log.error(f"Failed to retrieve chats {ids}: {e}")
+            return []
+        if not result.ok:
+            log.error(f"Failed to retrieve chats {ids}: {result.error}")
+            return []
+        return [chat_write_buffer.overlay(chat['id'], chat) for chat in result.result]
+
+    @staticmethod
+    async def aget_chats_by_ids_and_user_id(ids: list[str], user_id: str) -> list[dict]:
+        try:
+            [result] = await chat_manager.abatch([retrieve_many_op(ids, user_id)])
+        except WispError as e:
+            log.error(f"Failed to retrieve chats {ids}: {e}")
+            return []
+        if not result.ok:
+            log.error(f"Failed to retrieve chats {ids}: {result.error}")
+            return []
+        return [chat_write_buffer.overlay(chat['id'], chat) for chat in result.result]
+
+    @staticmethod
+    def _updated_chats(ids: list[str], result) -> list[dict]:
+        # Chats that were updated are returned even if others of `ids` failed
+        if not result.ok:
+            log.error(f"Failed to update chats {ids}: {result.error}")
+        return result.result or []
+
+    @staticmethod
+    def update_chats_by_ids_and_user_id(ids: list[str], user_id: Optional[str], data: dict) -> list[dict]:
+        try:
+            [result] = chat_manager.batch([update_many_op(ids, data, user_id)])
+        except WispError as e:
+            log.error(f"Failed to update chats {ids}: {e}")
+            return []
+        return ChatTable._updated_chats(ids, result)
+
+    @staticmethod
+    async def aupdate_chats_by_ids_and_user_id(ids: list[str], user_id: Optional[str], data: dict) -> list[dict]:
+        try:
+            [result] = await chat_manager.abatch([update_many_op(ids, data, user_id)])
+        except WispError as e:
+            log.error(f"Failed to update chats {ids}: {e}")
+            return []
+        return ChatTable._updated_chats(ids, result)
+
+    def _update_chat_by_id_and_user_id(self, _id: str, user_id: Optional[str], data: dict) -> Optional[dict]:
+        """One chat updated with a batch op, so `user_id` is enforced by wisp; None if it was not."""
+        chats = self.update_chats_by_ids_and_user_id([_id], user_id, data)
+        return chats[0] if chats else None
+
+    async def _aupdate_chat_by_id_and_user_id(self, _id: str, user_id: Optional[str], data: dict) -> Optional[dict]:
+        chats = await self.aupdate_chats_by_ids_and_user_id([_id], user_id, data)
+        return chats[0] if chats else None
+
+    def archive_chats_by_ids_and_user_id(
+            self, ids: list[str], user_id: str, archived: bool = True
+    ) -> list[dict]:
+        return self.update_chats_by_ids_and_user_id(ids, user_id, {'archived': archived})
+
+    async def aarchive_chats_by_ids_and_user_id(
+            self, ids: list[str], user_id: str, archived: bool = True
+    ) -> list[dict]:
+        return await self.aupdate_chats_by_ids_and_user_id(ids, user_id, {'archived': archived})
+
+    def update_chats_folder_id_by_ids_and_user_id(
+            self, ids: list[str], user_id: str, folder_id: Optional[str]
+    ) -> list[dict]:
+        return self.update_chats_by_ids_and_user_id(
+            ids, user_id, {'folder_id': folder_id, 'pinned': False}
+        )
+
+    async def aupdate_chats_folder_id_by_ids_and_user_id(
+            self, ids: list[str], user_id: str, folder_id: Optional[str]
+    ) -> list[dict]:
+        return await self.aupdate_chats_by_ids_and_user_id(
+            ids, user_id, {'folder_id': folder_id, 'pinned': False}
+        )
+
+    @staticmethod
+    def _deleted(ids: list[str], result) -> bool:
+        if not result.ok:
+            log.error(f"Failed to delete chats {ids}: {result.error}")
+        return result.ok
+
+    @staticmethod
+    def delete_chats_by_ids_and_user_id(ids: list[str], user_id: str) -> bool:
+        try:
+            [result] = chat_manager.batch([delete_many_op(ids, user_id)])
+        except WispError as e:
+            log.error(f"Failed to delete chats {ids}: {e}")
+            return False
+        return ChatTable._deleted(ids, result)
+
+    @staticmethod
+    async def adelete_chats_by_ids_and_user_id(ids: list[str], user_id: str) -> bool:
+        try:
+            [result] = await chat_manager.abatch([delete_many_op(ids, user_id)])
+        except WispError as e:
+            log.error(f"Failed to delete chats {ids}: {e}")
+            return False
+        return ChatTable._deleted(ids, result)
+
+    @staticmethod
+    def _popped_chat(_id: str, retrieved, deleted) -> Optional[dict]:
+        if not deleted.ok:
+            log.error(f"Failed to delete chat {_id}: {deleted.error}")
+            return None
+        if not retrieved.ok or not retrieved.result:
+            return None
+        return retrieved.result[0]
+
+    @staticmethod
+    def pop_chat_by_id(_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        """
+        Delete a chat (of `user_id` if given) and return it as it was, read
+        and deleted in one batch; None if there was no such chat.
+        """
+        try:
+            retrieved, deleted = chat_manager.batch(
+                [retrieve_many_op([_id], user_id), delete_many_op([_id], user_id)]
+            )
+        except WispError as e:
+            log.error(f"Failed to delete chat {_id}: {e}")
+            return None
+        return ChatTable._popped_chat(_id, retrieved, deleted)
+
+    @staticmethod
+    async def apop_chat_by_id(_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        try:
+            retrieved, deleted = await chat_manager.abatch(
+                [retrieve_many_op([_id], user_id), delete_many_op([_id], user_id)]
+            )
+        except WispError as e:
+            log.error(f"Failed to delete chat {_id}: {e}")
+            return None
+        return ChatTable._popped_chat(_id, retrieved, deleted)
 
     # TODO
     def get_chat_tags_by_id_and_user_id(self, id: str, user_id: str) -> list[TagModel]:
@@ -738,27 +1082,34 @@ class ChatTable:
             log.debug(f"all_chats: {all_chats}")
             return [ChatModel.model_validate(chat) for chat in all_chats]
 
-    # TODO
     def add_chat_tag_by_id_and_user_id_and_tag_name(
-            self, _id: str, user_id: str, tag_name: str
-    ) -> Optional[ChatModel]:
+            self, _id: str, user_id: str, tag_name: str, chat_dict: Optional[dict] = None
+    ) -> Optional[dict]:
+        """The updated chat; pass `chat_dict` if the caller just read it fresh."""
         tag = Tags.get_tag_by_name_and_user_id(tag_name, user_id)
         if tag is None:
             tag = Tags.insert_new_tag(tag_name, user_id)
         try:
-            with get_db() as db:
-                chat = db.get(Chat, _id)
-
-                tag_id = tag.id
-                if tag_id not in chat['meta'].get("tags", []):
-                    chat.meta = {
-                        **chat['meta'],
-                        "tags": list(set(chat['meta'].get("tags", []) + [tag_id])),
-                    }
+            chat_dict = chat_dict or self.get_chat_by_id(_id, fresh=True)
+            tags = chat_dict['meta'].get("tags", [])
+            if tag.id in tags:
+                return chat_dict
+            return self._set_chat_tags(_id, chat_dict, tags + [tag.id], user_id)
+        except Exception:
+            return None
 
-                db.commit()
-                db.refresh(chat)
-                return ChatModel.model_validate(chat)
+    async def aadd_chat_tag_by_id_and_user_id_and_tag_name(
+            self, _id: str, user_id: str, tag_name: str, chat_dict: Optional[dict] = None
+    ) -> Optional[dict]:
+        tag = Tags.get_tag_by_name_and_user_id(tag_name, user_id)
+        if tag is None:
+            tag = Tags.insert_new_tag(tag_name, user_id)
+        try:
+            chat_dict = chat_dict or await self.aget_chat_by_id(_id, fresh=True)
+            tags = chat_dict['meta'].get("tags", [])
+            if tag.id in tags:
+                return chat_dict
+            return await self._aset_chat_tags(_id, chat_dict, tags + [tag.id], user_id)
         except Exception:
             return None
 
@@ -811,38 +1162,48 @@ class ChatTable:
             return count
 
     def delete_tag_by_id_and_user_id_and_tag_name(
-            self, _id: str, user_id: str, tag_name: str
-    ) -> bool:
+            self, _id: str, user_id: str, tag_name: str, chat_dict: Optional[dict] = None
+    ) -> Optional[dict]:
+        """The updated chat; pass `chat_dict` if the caller just read it fresh."""
         try:
-            chat_dict = self.get_chat_by_id(_id)
+            chat_dict = chat_dict or self.get_chat_by_id(_id, fresh=True)
             tags = chat_dict['meta'].get("tags", [])
             tag_id = tag_name.replace(" ", "_").lower()
-            tags = [tag for tag in tags if tag != tag_id]
-            meta = {
-                **chat_dict['meta'],
-                "tags": list(set(tags)),
-            }
-            chat_manager.update(_id, {'meta': meta})
-            return True
+            return self._set_chat_tags(_id, chat_dict, [tag for tag in tags if tag != tag_id], user_id)
+        except Exception:
+            return None
+
+    async def adelete_tag_by_id_and_user_id_and_tag_name(
+            self, _id: str, user_id: str, tag_name: str, chat_dict: Optional[dict] = None
+    ) -> Optional[dict]:
+        try:
+            chat_dict = chat_dict or await self.aget_chat_by_id(_id, fresh=True)
+            tags = chat_dict['meta'].get("tags", [])
+            tag_id = tag_name.replace(" ", "_").lower()
+            return await self._aset_chat_tags(_id, chat_dict, [tag for tag in tags if tag != tag_id], user_id)
+        except Exception:
+            return None
+
+    def delete_all_tags_by_id_and_user_id(
+            self, _id: str, user_id: str, chat_dict: Optional[dict] = None
+    ) -> bool:
+        try:
+            chat_dict = chat_dict or self.get_chat_by_id(_id, fresh=True)
+            return self._set_chat_tags(_id, chat_dict, [], user_id) is not None
         except Exception:
             return False
 
-    def delete_all_tags_by_id_and_user_id(self, _id: str, user_id: str) -> bool:
+    async def adelete_all_tags_by_id_and_user_id(
+            self, _id: str, user_id: str, chat_dict: Optional[dict] = None
+    ) -> bool:
         try:
-            chat_dict = self.get_chat_by_id(_id)
-            data = {
-                'meta': {
-                    **chat_dict['meta'],
-                    "tags": [],
-                }
-            }
-            chat_manager.update(_id, data)
-            return True
+            chat_dict = chat_dict or await self.aget_chat_by_id(_id, fresh=True)
+            return await self._aset_chat_tags(_id, chat_dict, [], user_id) is not None
         except Exception:
             return False
 
     @staticmethod
-    def delete_chat_by_id(self, _id: str) -> bool:
+    def delete_chat_by_id(_id: str) -> bool:
         try:
             chat_manager.destroy(_id)
             return True
@@ -5,6 +5,7 @@ import datetime
 import logging
 from aiohttp import ClientSession
 
+from open_webui.jms.check_user import CheckUserHandler
 from open_webui.models.auths import (
     AddUserForm,
     ApiKey,
@@ -642,6 +643,7 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
 
 @router.get("/signout")
 async def signout(request: Request, response: Response):
+    await CheckUserHandler.ainvalidate(request.cookies)
     response.delete_cookie("token")
     response.delete_cookie("oui-session")
     response.delete_cookie("oauth_id_token")
@@ -18,17 +18,20 @@ from open_webui.config import ENABLE_ADMIN_CHAT_ACCESS, ENABLE_ADMIN_EXPORT
 from open_webui.constants import ERROR_MESSAGES
 from open_webui.env import SRC_LOG_LEVELS
 from fastapi import APIRouter, Depends, HTTPException, Request, status, Header
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 
 from open_webui.utils.auth import get_admin_user, get_verified_user
 from open_webui.utils.access_control import has_permission
+from open_webui.utils.chat_list import stream_chat_responses
 
 log = logging.getLogger(__name__)
 log.setLevel(SRC_LOG_LEVELS["MODELS"])
 
 router = APIRouter()
 
+
 ############################
 # GetChatList
 ############################
@@ -138,7 +141,7 @@ async def create_new_chat(
 ):
     try:
         log.debug(f"Creating new chat with form_data: {form_data}, sid: {sid}, user: {user.id}")
-        chat = Chats.insert_new_chat(form_data, sid, request, user)
+        chat = await Chats.ainsert_new_chat(form_data, sid, request, user)
         return ChatResponse(**chat)
     except Exception as e:
         log.exception(f"Error creating new chat: {e}")
@@ -259,7 +262,7 @@ async def get_chat_list_by_folder_id(
 async def get_user_pinned_chats(user=Depends(get_verified_user)):
     return [
         ChatTitleIdResponse(**chat)
-        for chat in Chats.get_pinned_chats_by_user_id(user.id)
+        for chat in await Chats.aget_pinned_chats_by_user_id(user.id)
     ]
 
 
@@ -270,10 +273,7 @@ async def get_user_pinned_chats(user=Depends(get_verified_user)):
 
 @router.get("/all", response_model=list[ChatResponse])
 async def get_user_chats(user=Depends(get_verified_user)):
-    return [
-        ChatResponse(**chat)
-        for chat in Chats.get_chats_by_user_id(user.id)
-    ]
+    return await stream_chat_responses(Chats.aiter_chats_by_user_id(user.id))
 
 
 ############################
@@ -283,10 +283,7 @@ async def get_user_chats(user=Depends(get_verified_user)):
 
 @router.get("/all/archived", response_model=list[ChatResponse])
 async def get_user_archived_chats(user=Depends(get_verified_user)):
-    return [
-        ChatResponse(**chat)
-        for chat in Chats.get_archived_chats_by_user_id(user.id)
-    ]
+    return await stream_chat_responses(Chats.aiter_chats_by_user_id(user.id, archived=True))
 
 
 ############################
@@ -318,7 +315,7 @@ async def get_all_user_chats_in_db(user=Depends(get_admin_user)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
         )
-    return [ChatResponse(**chat) for chat in Chats.get_chats()]
+    return await stream_chat_responses(Chats.aiter_chats())
 
 
 ############################
@@ -441,7 +438,7 @@ async def get_user_chat_list_by_tag_name(
 
 @router.get("/{_id}", response_model=Optional[ChatResponse])
 async def get_chat_by_id(_id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(_id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(_id, user.id)
 
     if chat:
         return ChatResponse(**chat)
@@ -461,10 +458,10 @@ async def get_chat_by_id(_id: str, user=Depends(get_verified_user)):
 async def update_chat_by_id(
     id: str, form_data: ChatForm, user=Depends(get_verified_user)
 ):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id, fresh=True)
     if chat:
         updated_chat = {**chat['chat'], **form_data.chat}
-        chat = Chats.update_chat_by_id(id, updated_chat)
+        chat = await Chats.aupdate_chat_by_id(id, updated_chat)
         return ChatResponse(**chat)
     else:
         raise HTTPException(
@@ -581,31 +578,23 @@ async def send_chat_message_event_by_id(
 
 @router.delete("/{id}", response_model=bool)
 async def delete_chat_by_id(request: Request, id: str, user=Depends(get_verified_user)):
-    if user.role == "admin":
-        chat = Chats.get_chat_by_id(id)
-        for tag in chat['meta'].get("tags", []):
-            if Chats.count_chats_by_tag_name_and_user_id(tag, user.id) == 1:
-                Tags.delete_tag_by_name_and_user_id(tag, user.id)
-
-        result = Chats.delete_chat_by_id(id)
-
-        return result
-    else:
-        if not has_permission(
-            user.id, "chat.delete", request.app.state.config.USER_PERMISSIONS
-        ):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
-            )
+    if user.role != "admin" and not has_permission(
+        user.id, "chat.delete", request.app.state.config.USER_PERMISSIONS
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
+        )
 
-        chat = Chats.get_chat_by_id(id)
-        for tag in chat['meta'].get("tags", []):
-            if Chats.count_chats_by_tag_name_and_user_id(tag, user.id) == 1:
-                Tags.delete_tag_by_name_and_user_id(tag, user.id)
+    # Read for its tags and deleted in one call; admins delete any chat
+    chat = await Chats.apop_chat_by_id(id, None if user.role == "admin" else user.id)
+    if chat is None:
+        return False
 
-        result = Chats.delete_chat_by_id_and_user_id(id, user.id)
-        return result
+    for tag in chat['meta'].get("tags", []):
+        if Chats.count_chats_by_tag_name_and_user_id(tag, user.id) == 0:
+            Tags.delete_tag_by_name_and_user_id(tag, user.id)
+    return True
 
 
 ############################
@@ -615,7 +604,7 @@ async def delete_chat_by_id(request: Request, id: str, user=Depends(get_verified
 
 @router.get("/{id}/pinned", response_model=Optional[bool])
 async def get_pinned_status_by_id(id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id)
     if chat:
         return chat['pinned']
     else:
@@ -631,9 +620,9 @@ async def get_pinned_status_by_id(id: str, user=Depends(get_verified_user)):
 
 @router.post("/{id}/pin", response_model=Optional[ChatResponse])
 async def pin_chat_by_id(id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id)
     if chat:
-        chat = Chats.toggle_chat_pinned_by_id(id)
+        chat = await Chats.atoggle_chat_pinned_by_id(id)
         return chat
     else:
         raise HTTPException(
@@ -728,9 +717,13 @@ async def clone_shared_chat_by_id(id: str, user=Depends(get_verified_user)):
 
 @router.post("/{id}/archive", response_model=Optional[ChatResponse])
 async def archive_chat_by_id(id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id, fresh=True)
     if chat:
-        chat = Chats.toggle_chat_archive_by_id(id)
+        chat = await Chats.atoggle_chat_archive_by_id(id, user.id, chat)
+        if chat is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.DEFAULT()
+            )
 
         # Delete tags if chat is archived
         if chat['archived']:
@@ -769,14 +762,14 @@ async def share_chat_by_id(request: Request, id: str, user=Depends(get_verified_
             detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
         )
 
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id)
 
     if chat:
         if chat['share_id']:
-            shared_chat = Chats.update_shared_chat_by_chat_id(chat['id'])
+            shared_chat = await run_in_threadpool(Chats.update_shared_chat_by_chat_id, chat['id'])
             return ChatResponse(**shared_chat)
 
-        shared_chat = Chats.insert_shared_chat_by_chat_id(chat['id'])
+        shared_chat = await run_in_threadpool(Chats.insert_shared_chat_by_chat_id, chat['id'])
         if not shared_chat:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -798,13 +791,13 @@ async def share_chat_by_id(request: Request, id: str, user=Depends(get_verified_
 
 @router.delete("/{id}/share", response_model=Optional[bool])
 async def delete_shared_chat_by_id(id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id)
     if chat:
         if not chat['share_id']:
             return False
 
-        result = Chats.delete_shared_chat_by_chat_id(id)
-        update_result = Chats.update_chat_share_id_by_id(id, None)
+        result = await run_in_threadpool(Chats.delete_shared_chat_by_chat_id, id)
+        update_result = await Chats.aupdate_chat_share_id_by_id(id, None)
 
         return result and update_result != None
     else:
@@ -827,11 +820,10 @@ class ChatFolderIdForm(BaseModel):
 async def update_chat_folder_id_by_id(
     id: str, form_data: ChatFolderIdForm, user=Depends(get_verified_user)
 ):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aupdate_chat_folder_id_by_id_and_user_id(
+        id, user.id, form_data.folder_id
+    )
     if chat:
-        chat = Chats.update_chat_folder_id_by_id_and_user_id(
-            id, user.id, form_data.folder_id
-        )
         return ChatResponse(**chat)
     else:
         raise HTTPException(
@@ -846,7 +838,7 @@ async def update_chat_folder_id_by_id(
 
 @router.get("/{_id}/tags", response_model=list[TagModel])
 async def get_chat_tags_by_id(_id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(_id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(_id, user.id)
     if chat:
         tags = chat['meta'].get("tags", [])
         return Tags.get_tags_by_ids_and_user_id(tags, user.id)
@@ -865,7 +857,7 @@ async def get_chat_tags_by_id(_id: str, user=Depends(get_verified_user)):
 async def add_tag_by_id_and_tag_name(
     id: str, form_data: TagForm, user=Depends(get_verified_user)
 ):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id, fresh=True)
     if chat:
         tags = chat['meta'].get("tags", [])
         tag_id = form_data.name.replace(" ", "_").lower()
@@ -877,11 +869,10 @@ async def add_tag_by_id_and_tag_name(
             )
 
         if tag_id not in tags:
-            Chats.add_chat_tag_by_id_and_user_id_and_tag_name(
-                id, user.id, form_data.name
-            )
+            chat = await Chats.aadd_chat_tag_by_id_and_user_id_and_tag_name(
+                id, user.id, form_data.name, chat
+            ) or chat
 
-        chat = Chats.get_chat_by_id_and_user_id(id, user.id)
         tags = chat['meta'].get("tags", [])
         return Tags.get_tags_by_ids_and_user_id(tags, user.id)
     else:
@@ -899,14 +890,15 @@ async def add_tag_by_id_and_tag_name(
 async def delete_tag_by_id_and_tag_name(
     id: str, form_data: TagForm, user=Depends(get_verified_user)
 ):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id, fresh=True)
     if chat:
-        Chats.delete_tag_by_id_and_user_id_and_tag_name(id, user.id, form_data.name)
+        chat = await Chats.adelete_tag_by_id_and_user_id_and_tag_name(
+            id, user.id, form_data.name, chat
+        ) or chat
 
         if Chats.count_chats_by_tag_name_and_user_id(form_data.name, user.id) == 0:
             Tags.delete_tag_by_name_and_user_id(form_data.name, user.id)
 
-        chat = Chats.get_chat_by_id_and_user_id(id, user.id)
         tags = chat['meta'].get("tags", [])
         return Tags.get_tags_by_ids_and_user_id(tags, user.id)
     else:
@@ -922,9 +914,9 @@ async def delete_tag_by_id_and_tag_name(
 
 @router.delete("/{id}/tags/all", response_model=Optional[bool])
 async def delete_all_tags_by_id(id: str, user=Depends(get_verified_user)):
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
+    chat = await Chats.aget_chat_by_id_and_user_id(id, user.id, fresh=True)
     if chat:
-        Chats.delete_all_tags_by_id_and_user_id(id, user.id)
+        await Chats.adelete_all_tags_by_id_and_user_id(id, user.id, chat)
 
         for tag in chat['meta'].get("tags", []):
             if Chats.count_chats_by_tag_name_and_user_id(tag, user.id) == 0:
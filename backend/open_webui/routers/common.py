@@ -645,7 +645,10 @@ def setup_lazy_routes(app):
         This is an experimental endpoint and subject to change.
         """
         try:
-            return {"model_ids": get_models_in_use(), "user_ids": get_active_user_ids()}
+            return {
+                "model_ids": await get_models_in_use(),
+                "user_ids": await get_active_user_ids(),
+            }
         except Exception as e:
             log.error(f"Error getting usage statistics: {e}")
             raise HTTPException(status_code=500, detail="Internal Server Error")
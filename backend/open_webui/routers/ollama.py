@@ -49,6 +49,7 @@ from open_webui.utils.payload import (
     apply_system_prompt_to_body,
 )
 from open_webui.utils.auth import get_admin_user, get_verified_user
+from open_webui.utils.http_client import cleanup_response, client_sessions, get_proxy
 from open_webui.utils.access_control import has_access
 
 from open_webui.config import (
@@ -76,45 +77,36 @@ log.setLevel(SRC_LOG_LEVELS["OLLAMA"])
 ##########################################
 
 
-async def send_get_request(url, key=None, user: UserModel = None):
+async def send_get_request(url, key=None, user: UserModel = None, proxy=None):
     timeout = aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT_MODEL_LIST)
     try:
-        async with aiohttp.ClientSession(timeout=timeout, trust_env=True) as session:
-            async with session.get(
-                    url,
-                    headers={
-                        "Content-Type": "application/json",
-                        **({"Authorization": f"Bearer {key}"} if key else {}),
-                        **(
-                                {
-                                    "X-OpenWebUI-User-Name": quote(user.name, safe=" "),
-                                    "X-OpenWebUI-User-Id": user.id,
-                                    "X-OpenWebUI-User-Username": user.username,
-                                    "X-OpenWebUI-User-Role": user.role,
-                                }
-                                if ENABLE_FORWARD_USER_INFO_HEADERS and user
-                                else {}
-                        ),
-                    },
-                    ssl=AIOHTTP_CLIENT_SESSION_SSL,
-            ) as response:
-                return await response.json()
+        session = client_sessions.get(url, proxy)
+        async with session.get(
+                url,
+                timeout=timeout,
+                headers={
+                    "Content-Type": "application/json",
+                    **({"Authorization": f"Bearer {key}"} if key else {}),
+                    **(
+                            {
+                                "X-OpenWebUI-User-Name": quote(user.name, safe=" "),
+                                "X-OpenWebUI-User-Id": user.id,
+                                "X-OpenWebUI-User-Username": user.username,
+                                "X-OpenWebUI-User-Role": user.role,
+                            }
+                            if ENABLE_FORWARD_USER_INFO_HEADERS and user
+                            else {}
+                    ),
+                },
+                ssl=AIOHTTP_CLIENT_SESSION_SSL,
+        ) as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
         return None
 
 
-async def cleanup_response(
-        response: Optional[aiohttp.ClientResponse],
-        session: Optional[aiohttp.ClientSession],
-):
-    if response:
-        response.close()
-    if session:
-        await session.close()
-
-
 async def send_post_request(
         url: str,
         payload: Union[str, bytes],
@@ -123,15 +115,15 @@ async def send_post_request(
         content_type: Optional[str] = None,
         user: UserModel = None,
         metadata: Optional[dict] = None,
+        proxy: Optional[str] = None,
 ):
     r = None
     try:
-        session = aiohttp.ClientSession(
-            trust_env=True, timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT)
-        )
+        session = client_sessions.get(url, proxy)
 
         r = await session.post(
             url,
+            timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT),
             data=payload,
             headers={
                 "Content-Type": "application/json",
@@ -158,7 +150,7 @@ async def send_post_request(
         if r.ok is False:
             try:
                 res = await r.json()
-                await cleanup_response(r, session)
+                await cleanup_response(r)
                 if "error" in res:
                     raise HTTPException(status_code=r.status, detail=res["error"])
             except HTTPException as e:
@@ -181,9 +173,7 @@ async def send_post_request(
                 r.content,
                 status_code=r.status,
                 headers=response_headers,
-                background=BackgroundTask(
-                    cleanup_response, response=r, session=session
-                ),
+                background=BackgroundTask(cleanup_response, response=r),
             )
         else:
             res = await r.json()
@@ -200,7 +190,7 @@ async def send_post_request(
         )
     finally:
         if not stream:
-            await cleanup_response(r, session)
+            await cleanup_response(r)
 
 
 def get_api_key(idx, url, configs):
@@ -349,7 +339,11 @@ async def get_all_models(request: Request, user: UserModel = None):
             if (str(idx) not in request.app.state.config.OLLAMA_API_CONFIGS) and (
                     url not in request.app.state.config.OLLAMA_API_CONFIGS  # Legacy support
             ):
-                request_tasks.append(send_get_request(f"{url}/api/tags", user=user))
+                request_tasks.append(send_get_request(
+                    f"{url}/api/tags",
+                    user=user,
+                    proxy=get_proxy(idx, request.app.state.config.OLLAMA_API_PROXYS),
+                ))
             else:
                 api_config = request.app.state.config.OLLAMA_API_CONFIGS.get(
                     str(idx),
@@ -363,7 +357,12 @@ async def get_all_models(request: Request, user: UserModel = None):
 
                 if enable:
                     request_tasks.append(
-                        send_get_request(f"{url}/api/tags", key, user=user)
+                        send_get_request(
+                            f"{url}/api/tags",
+                            key,
+                            user=user,
+                            proxy=get_proxy(idx, request.app.state.config.OLLAMA_API_PROXYS),
+                        )
                     )
                 else:
                     request_tasks.append(asyncio.ensure_future(asyncio.sleep(0, None)))
@@ -520,7 +519,11 @@ async def get_ollama_loaded_models(request: Request, user=Depends(get_admin_user
             if (str(idx) not in request.app.state.config.OLLAMA_API_CONFIGS) and (
                     url not in request.app.state.config.OLLAMA_API_CONFIGS  # Legacy support
             ):
-                request_tasks.append(send_get_request(f"{url}/api/ps", user=user))
+                request_tasks.append(send_get_request(
+                    f"{url}/api/ps",
+                    user=user,
+                    proxy=get_proxy(idx, request.app.state.config.OLLAMA_API_PROXYS),
+                ))
             else:
                 api_config = request.app.state.config.OLLAMA_API_CONFIGS.get(
                     str(idx),
@@ -534,7 +537,12 @@ async def get_ollama_loaded_models(request: Request, user=Depends(get_admin_user
 
                 if enable:
                     request_tasks.append(
-                        send_get_request(f"{url}/api/ps", key, user=user)
+                        send_get_request(
+                            f"{url}/api/ps",
+                            key,
+                            user=user,
+                            proxy=get_proxy(idx, request.app.state.config.OLLAMA_API_PROXYS),
+                        )
                     )
                 else:
                     request_tasks.append(asyncio.ensure_future(asyncio.sleep(0, None)))
@@ -595,6 +603,7 @@ async def get_ollama_versions(request: Request, url_idx: Optional[int] = None):
                         send_get_request(
                             f"{url}/api/version",
                             key,
+                            proxy=get_proxy(idx, request.app.state.config.OLLAMA_API_PROXYS),
                         )
                     )
 
@@ -702,6 +711,7 @@ async def unload_model(
                 stream=False,
                 key=key,
                 user=user,
+                proxy=get_proxy(idx, request.app.state.config.OLLAMA_API_PROXYS),
             )
             results.append({"url_idx": idx, "success": True, "response": res})
         except Exception as e:
@@ -738,6 +748,7 @@ async def pull_model(
         url=f"{url}/api/pull",
         payload=json.dumps(payload),
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         user=user,
     )
 
@@ -775,6 +786,7 @@ async def push_model(
         url=f"{url}/api/push",
         payload=form_data.model_dump_json(exclude_none=True).encode(),
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         user=user,
     )
 
@@ -802,6 +814,7 @@ async def create_model(
         url=f"{url}/api/create",
         payload=form_data.model_dump_json(exclude_none=True).encode(),
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         user=user,
     )
 
@@ -1243,6 +1256,7 @@ async def generate_completion(
         url=f"{url}/api/generate",
         payload=form_data.model_dump_json(exclude_none=True).encode(),
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         user=user,
     )
 
@@ -1370,6 +1384,7 @@ async def generate_chat_completion(
         payload=json.dumps(payload),
         stream=form_data.stream,
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         content_type="application/x-ndjson",
         user=user,
         metadata=metadata,
@@ -1477,6 +1492,7 @@ async def generate_openai_completion(
         payload=json.dumps(payload),
         stream=payload.get("stream", False),
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         user=user,
         metadata=metadata,
     )
@@ -1559,6 +1575,7 @@ async def generate_openai_chat_completion(
         payload=json.dumps(payload),
         stream=payload.get("stream", False),
         key=get_api_key(url_idx, url, request.app.state.config.OLLAMA_API_CONFIGS),
+        proxy=get_proxy(url_idx, request.app.state.config.OLLAMA_API_PROXYS),
         user=user,
         metadata=metadata,
     )
@@ -15,6 +15,9 @@ from open_webui.utils.pdf_generator import PDFGenerator
 from open_webui.utils.auth import get_admin_user, get_verified_user
 from open_webui.utils.code_interpreter import execute_code_jupyter
 from open_webui.env import SRC_LOG_LEVELS
+from open_webui.jms.wisp import get_aio_channel
+from open_webui.jms.wisp.policy import wisp_breaker
+from open_webui.jms.wisp.telemetry import slow_calls
 
 
 log = logging.getLogger(__name__)
@@ -133,3 +136,19 @@ async def download_litellm_config_yaml(user=Depends(get_admin_user)):
         media_type="application/octet-stream",
         filename="config.yaml",
     )
+
+
+@router.get("/wisp/slow-calls")
+async def get_wisp_slow_calls(minutes: int = 10, limit: int = 20, user=Depends(get_admin_user)):
+    """
+    The slowest wisp RPCs of this worker that finished in the last `minutes`
+    minutes, to tell a slow sidecar from slow code of our own.
+    """
+    minutes = min(max(minutes, 1), slow_calls.window)
+    limit = min(max(limit, 1), 200)
+    return {
+        "minutes": minutes,
+        "calls": slow_calls.slowest(minutes, limit),
+        "breaker": wisp_breaker.stats(),
+        "channels": get_aio_channel().stats(),
+    }
@@ -0,0 +1,215 @@
+"""
+Coalescing of the chat events emitted to a user's sockets, so a streamed
+answer is not one Socket.IO packet per token.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["SOCKET"])
+
+# Seconds an event that can't be merged waits for a backlogged socket to drain
+DRAIN_TIMEOUT = 5
+
+# Fields of a streamed chat completion chunk that only carries content
+_CHUNK_KEYS = {"id", "object", "created", "model", "system_fingerprint", "choices"}
+_CHOICE_KEYS = {"index", "delta", "finish_reason", "logprobs"}
+_DELTA_KEYS = {"role", "content"}
+
+
+def _content_snapshot(data) -> bool:
+    """Data of a chat:completion event holding the whole content so far."""
+    return isinstance(data, dict) and data.keys() == {"content"} and isinstance(data["content"], str)
+
+
+def _content_delta(data) -> Optional[str]:
+    """Content of a chat:completion chunk that carries nothing else."""
+    if not isinstance(data, dict) or not data.keys() <= _CHUNK_KEYS:
+        return None
+    choices = data.get("choices")
+    if not isinstance(choices, list) or len(choices) != 1:
+        return None
+    choice = choices[0]
+    if (
+            not isinstance(choice, dict)
+            or not choice.keys() <= _CHOICE_KEYS
+            or choice.get("finish_reason")
+            or choice.get("logprobs")
+    ):
+        return None
+    delta = choice.get("delta")
+    if not isinstance(delta, dict) or not delta.keys() <= _DELTA_KEYS:
+        return None
+    content = delta.get("content") or ""
+    return content if isinstance(content, str) else None
+
+
+def coalescable(event: dict) -> bool:
+    if event.get("type") != "chat:completion":
+        return False
+    data = event.get("data")
+    return _content_snapshot(data) or _content_delta(data) is not None
+
+
+def merge_events(older: dict, newer: dict) -> Optional[dict]:
+    """One event with the effect of `older` then `newer`, None if there's none."""
+    if older.get("type") != "chat:completion" or newer.get("type") != "chat:completion":
+        return None
+    older_data, newer_data = older.get("data"), newer.get("data")
+
+    # The frontend replaces the content with a snapshot
+    if _content_snapshot(older_data) and _content_snapshot(newer_data):
+        return newer
+
+    # and appends deltas
+    older_delta, newer_delta = _content_delta(older_data), _content_delta(newer_data)
+    if older_delta is None or newer_delta is None:
+        return None
+    choice = newer_data["choices"][0]
+    delta = {**choice.get("delta", {}), "content": older_delta + newer_delta}
+    return {**newer, "data": {**newer_data, "choices": [{**choice, "delta": delta}]}}
+
+
+class _Frame:
+    __slots__ = ("event", "events", "started_at")
+
+    def __init__(self, event: dict, started_at: float):
+        self.event = event
+        self.events = 1
+        self.started_at = started_at
+
+
+class EventCoalescer:
+    """
+    Merges the chat:completion deltas and content snapshots of one message
+    into a frame per session, sent `interval` seconds after its first event
+    or once it holds `max_events`; any other event sends the frame first, so
+    sessions see events in order. An interval of 0 sends every event as is.
+
+    Frames are held back from a session whose socket has more than
+    `max_backlog` packets queued, `backlog(session_id)`, and keep merging
+    until it drains, DRAIN_TIMEOUT at most. Events that can't be merged wait
+    for the drain, which holds back the emitting stream instead of queueing
+    without bound.
+    """
+
+    def __init__(
+            self,
+            send: Callable[[str, dict], Awaitable],
+            backlog: Callable[[str], int],
+            interval: float,
+            max_events: int,
+            max_backlog: int,
+    ):
+        self._send = send
+        self._backlog = backlog
+        self.interval = interval
+        self.max_events = max_events
+        self.max_backlog = max_backlog
+        self.last_used = time.monotonic()
+        self._frames: Dict[str, _Frame] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    @property
+    def idle(self) -> bool:
+        return not self._frames and not self._lock.locked()
+
+    async def emit(self, session_ids: Iterable[str], event: dict):
+        self.last_used = time.monotonic()
+        if self.interval <= 0:
+            await asyncio.gather(*(self._send(session_id, event) for session_id in session_ids))
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            # Sessions whose frame must be sent before the event, or the event itself
+            waiting = []
+            for session_id in session_ids:
+                frame = self._frames.get(session_id)
+                if frame is not None:
+                    merged = merge_events(frame.event, event)
+                    if merged is not None:
+                        frame.event = merged
+                        frame.events += 1
+                        if frame.events >= self.max_events or now - frame.started_at >= self.interval:
+                            await self._send_frame(session_id)
+                        continue
+                if frame is None and coalescable(event):
+                    self._frames[session_id] = _Frame(event, now)
+                else:
+                    waiting.append(session_id)
+
+            if waiting:
+                await self._drain(waiting)
+                now = time.monotonic()
+                for session_id in waiting:
+                    frame = self._frames.pop(session_id, None)
+                    if frame is not None:
+                        await self._send(session_id, frame.event)
+                    if coalescable(event):
+                        self._frames[session_id] = _Frame(event, now)
+                    else:
+                        await self._send(session_id, event)
+            self._schedule()
+
+    async def flush(self):
+        """Send every frame, waiting for backlogged sessions."""
+        async with self._lock:
+            session_ids = list(self._frames)
+            await self._drain(session_ids)
+            for session_id in session_ids:
+                await self._send(session_id, self._frames.pop(session_id).event)
+
+    def _backlogged(self, session_id: str) -> bool:
+        return self._backlog(session_id) > self.max_backlog
+
+    async def _drain(self, session_ids: List[str]):
+        """Wait for the sockets of the sessions to drain, DRAIN_TIMEOUT at most for all of them."""
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while True:
+            backlogged = [session_id for session_id in session_ids if self._backlogged(session_id)]
+            if not backlogged:
+                return
+            if time.monotonic() >= deadline:
+                log.debug(f"Sockets of sessions {backlogged} did not drain, sending anyway")
+                return
+            await asyncio.sleep(self.interval)
+
+    async def _send_frame(self, session_id: str, force: bool = False):
+        if not force and self._backlogged(session_id):
+            return
+        frame = self._frames.pop(session_id)
+        await self._send(session_id, frame.event)
+
+    def _schedule(self):
+        if self._frames and self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            while self._frames:
+                started_at = min(frame.started_at for frame in self._frames.values())
+                await asyncio.sleep(max(started_at + self.interval - time.monotonic(), 0.001))
+                async with self._lock:
+                    now = time.monotonic()
+                    stuck = []
+                    for session_id, frame in list(self._frames.items()):
+                        if now - frame.started_at >= self.interval + DRAIN_TIMEOUT:
+                            stuck.append(session_id)
+                            await self._send_frame(session_id, force=True)
+                        elif now - frame.started_at >= self.interval:
+                            # Frames of backlogged sessions stay, their age keeps them due
+                            await self._send_frame(session_id)
+                    if stuck:
+                        log.warning(f"Sockets of sessions {stuck} did not drain, sent their frames anyway")
+                if self._frames and all(self._backlogged(session_id) for session_id in self._frames):
+                    await asyncio.sleep(self.interval)
+        except Exception as e:
+            log.error(f"Failed to send coalesced events: {e}")
+        finally:
+            self._timer = None
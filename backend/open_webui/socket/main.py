@@ -5,9 +5,9 @@ import socketio
 import logging
 import sys
 import time
-import pycrdt as Y
+from typing import Dict, Optional
 
-from open_webui.jms import chat_manager, JMSSession
+from open_webui.jms import session_closer
 from open_webui.jms import check_user
 from open_webui.models.users import Users, UserNameResponse
 from open_webui.models.channels import Channels
@@ -31,10 +31,18 @@ from open_webui.env import (
     WEBSOCKET_REDIS_LOCK_TIMEOUT,
     WEBSOCKET_SENTINEL_PORT,
     WEBSOCKET_SENTINEL_HOSTS,
+    WEBSOCKET_EVENT_COALESCE_INTERVAL,
+    WEBSOCKET_EVENT_COALESCE_MAX_EVENTS,
+    WEBSOCKET_EVENT_MAX_BACKLOG,
+    WEBSOCKET_SESSION_CACHE_TTL,
+    WEBSOCKET_SESSION_POOL_TTL,
+    WEBSOCKET_YDOC_COMPACT_UPDATES,
     REDIS_KEY_PREFIX,
 )
 from open_webui.utils.auth import decode_token
-from open_webui.socket.utils import RedisDict, RedisLock, YdocManager
+from open_webui.socket.emitter import EventCoalescer
+from open_webui.socket.pools import RedisSessionPools, SessionPools
+from open_webui.socket.utils import RedisLock, YdocManager
 from open_webui.tasks import create_task, stop_item_tasks
 from open_webui.utils.redis import get_redis_connection
 from open_webui.utils.access_control import has_access, get_users_with_access
@@ -104,23 +112,12 @@ if WEBSOCKET_MANAGER == "redis":
     redis_sentinels = get_sentinels_from_env(
         WEBSOCKET_SENTINEL_HOSTS, WEBSOCKET_SENTINEL_PORT
     )
-    SESSION_POOL = RedisDict(
-        f"{REDIS_KEY_PREFIX}:session_pool",
-        redis_url=WEBSOCKET_REDIS_URL,
-        redis_sentinels=redis_sentinels,
-        redis_cluster=WEBSOCKET_REDIS_CLUSTER,
-    )
-    USER_POOL = RedisDict(
-        f"{REDIS_KEY_PREFIX}:user_pool",
-        redis_url=WEBSOCKET_REDIS_URL,
-        redis_sentinels=redis_sentinels,
-        redis_cluster=WEBSOCKET_REDIS_CLUSTER,
-    )
-    USAGE_POOL = RedisDict(
-        f"{REDIS_KEY_PREFIX}:usage_pool",
-        redis_url=WEBSOCKET_REDIS_URL,
-        redis_sentinels=redis_sentinels,
-        redis_cluster=WEBSOCKET_REDIS_CLUSTER,
+    SESSION_POOLS = RedisSessionPools(
+        REDIS,
+        f"{REDIS_KEY_PREFIX}:{{session_pool}}",
+        ttl=WEBSOCKET_SESSION_POOL_TTL,
+        cache_ttl=WEBSOCKET_SESSION_CACHE_TTL,
+        usage_timeout=TIMEOUT_DURATION,
     )
 
     clean_up_lock = RedisLock(
@@ -134,15 +131,14 @@ if WEBSOCKET_MANAGER == "redis":
     renew_func = clean_up_lock.renew_lock
     release_func = clean_up_lock.release_lock
 else:
-    SESSION_POOL = {}
-    USER_POOL = {}
-    USAGE_POOL = {}
+    SESSION_POOLS = SessionPools(usage_timeout=TIMEOUT_DURATION)
 
     aquire_func = release_func = renew_func = lambda: True
 
 YDOC_MANAGER = YdocManager(
     redis=REDIS,
     redis_key_prefix=f"{REDIS_KEY_PREFIX}:ydoc:documents",
+    compact_updates=WEBSOCKET_YDOC_COMPACT_UPDATES,
 )
 
 
@@ -173,26 +169,7 @@ async def periodic_usage_pool_cleanup():
                 log.error(f"Unable to renew cleanup lock. Exiting usage pool cleanup.")
                 raise Exception("Unable to renew usage pool cleanup lock.")
 
-            now = int(time.time())
-            send_usage = False
-            for model_id, connections in list(USAGE_POOL.items()):
-                # Creating a list of sids to remove if they have timed out
-                expired_sids = [
-                    sid
-                    for sid, details in connections.items()
-                    if now - details["updated_at"] > TIMEOUT_DURATION
-                ]
-
-                for sid in expired_sids:
-                    del connections[sid]
-
-                if not connections:
-                    log.debug(f"Cleaning up model {model_id} from usage pool")
-                    del USAGE_POOL[model_id]
-                else:
-                    USAGE_POOL[model_id] = connections
-
-                send_usage = True
+            await SESSION_POOLS.cleanup()
             await asyncio.sleep(TIMEOUT_DURATION)
     finally:
         release_func()
@@ -204,24 +181,28 @@ app = socketio.ASGIApp(
 )
 
 
-def get_models_in_use():
+async def get_models_in_use():
     # List models that are currently in use
-    models_in_use = list(USAGE_POOL.keys())
-    return models_in_use
+    return await SESSION_POOLS.get_models_in_use()
 
 
-def get_active_user_ids():
+async def get_active_user_ids():
     """Get the list of active user IDs."""
-    return list(USER_POOL.keys())
+    return await SESSION_POOLS.get_active_user_ids()
+
 
+def get_active_user_count():
+    """Last known number of active users, for callers outside the event loop."""
+    return SESSION_POOLS.active_user_count
 
-def get_user_active_status(user_id):
+
+async def get_user_active_status(user_id):
     """Check if a user is currently active."""
-    return user_id in USER_POOL
+    return await SESSION_POOLS.is_user_active(user_id)
 
 
-def get_user_id_from_session_pool(sid):
-    user = SESSION_POOL.get(sid)
+async def get_user_id_from_session_pool(sid):
+    user = await SESSION_POOLS.get_session(sid)
     if user:
         return user["id"]
     return None
@@ -236,33 +217,30 @@ def get_session_ids_from_room(room):
     return [session_id[0] for session_id in active_session_ids]
 
 
-def get_user_ids_from_room(room):
+async def get_user_ids_from_room(room):
     active_session_ids = get_session_ids_from_room(room)
 
     active_user_ids = list(
-        set([SESSION_POOL.get(session_id)["id"] for session_id in active_session_ids])
+        set(
+            [
+                user["id"]
+                for user in await SESSION_POOLS.get_sessions(active_session_ids)
+                if user
+            ]
+        )
     )
     return active_user_ids
 
 
-def get_active_status_by_user_id(user_id):
-    if user_id in USER_POOL:
-        return True
-    return False
+async def get_active_status_by_user_id(user_id):
+    return await SESSION_POOLS.is_user_active(user_id)
 
 
 @sio.on("usage")
 async def usage(sid, data):
-    if sid in SESSION_POOL:
-        model_id = data["model"]
+    if await SESSION_POOLS.get_session(sid):
         # Record the timestamp for the last update
-        current_time = int(time.time())
-
-        # Store the new usage data and task
-        USAGE_POOL[model_id] = {
-            **(USAGE_POOL[model_id] if model_id in USAGE_POOL else {}),
-            sid: {"updated_at": current_time},
-        }
+        await SESSION_POOLS.record_usage(data["model"])
 
 
 @sio.event
@@ -280,19 +258,18 @@ async def connect(sid, environ, auth):
     if not cookie_header and "HTTP_COOKIE" in environ:
         cookie_header = environ["HTTP_COOKIE"]
 
-    user = handler.check_user_by_cookie_header(cookie_header)
+    user = await handler.acheck_user_by_cookie_header(cookie_header)
 
     if user:
-        SESSION_POOL[sid] = {
-            "id": user.id,
-            "name": user.name,
-            "username": user.username,
-            "role": 'admin',
-        }
-        if user.id in USER_POOL:
-            USER_POOL[user.id] = USER_POOL[user.id] + [sid]
-        else:
-            USER_POOL[user.id] = [sid]
+        await SESSION_POOLS.add_session(
+            sid,
+            {
+                "id": user.id,
+                "name": user.name,
+                "username": user.username,
+                "role": 'admin',
+            },
+        )
 
     # user = None
     # if auth and "token" in auth:
@@ -325,11 +302,9 @@ async def user_join(sid, data):
     if not user:
         return
 
-    SESSION_POOL[sid] = user.model_dump(exclude=["date_of_birth", "bio", "gender"])
-    if user.id in USER_POOL:
-        USER_POOL[user.id] = USER_POOL[user.id] + [sid]
-    else:
-        USER_POOL[user.id] = [sid]
+    await SESSION_POOLS.add_session(
+        sid, user.model_dump(exclude=["date_of_birth", "bio", "gender"])
+    )
 
     # Join all the channels
     channels = Channels.get_channels_by_user_id(user.id)
@@ -413,7 +388,9 @@ async def channel_events(sid, data):
                 "channel_id": data["channel_id"],
                 "message_id": data.get("message_id", None),
                 "data": event_data,
-                "user": UserNameResponse(**SESSION_POOL[sid]).model_dump(),
+                "user": UserNameResponse(
+                    **(await SESSION_POOLS.get_session(sid))
+                ).model_dump(),
             },
             room=room,
         )
@@ -422,7 +399,7 @@ async def channel_events(sid, data):
 @sio.on("ydoc:document:join")
 async def ydoc_document_join(sid, data):
     """Handle user joining a document"""
-    user = SESSION_POOL.get(sid)
+    user = await SESSION_POOLS.get_session(sid)
 
     try:
         document_id = data["document_id"]
@@ -459,13 +436,8 @@ async def ydoc_document_join(sid, data):
         active_session_ids = get_session_ids_from_room(f"doc_{document_id}")
 
         # Get the Yjs document state
-        ydoc = Y.Doc()
-        updates = await YDOC_MANAGER.get_updates(document_id)
-        for update in updates:
-            ydoc.apply_update(bytes(update))
-
-        # Encode the entire document state as an update
-        state_update = ydoc.get_update()
+        # The entire document state, encoded as an update
+        state_update = await YDOC_MANAGER.get_state(document_id)
         await sio.emit(
             "ydoc:document:state",
             {
@@ -535,13 +507,8 @@ async def yjs_document_state(sid, data):
             return
 
         # Get the Yjs document state
-        ydoc = Y.Doc()
-        updates = await YDOC_MANAGER.get_updates(document_id)
-        for update in updates:
-            ydoc.apply_update(bytes(update))
-
-        # Encode the entire document state as an update
-        state_update = ydoc.get_update()
+        # The entire document state, encoded as an update
+        state_update = await YDOC_MANAGER.get_state(document_id)
 
         await sio.emit(
             "ydoc:document:state",
@@ -592,7 +559,7 @@ async def yjs_document_update(sid, data):
         async def debounced_save():
             await asyncio.sleep(0.5)
             await document_save_handler(
-                document_id, data.get("data", {}), SESSION_POOL.get(sid)
+                document_id, data.get("data", {}), await SESSION_POOLS.get_session(sid)
             )
 
         if data.get("data"):
@@ -624,13 +591,6 @@ async def yjs_document_leave(sid, data):
             room=f"doc_{document_id}",
         )
 
-        if (
-                await YDOC_MANAGER.document_exists(document_id)
-                and len(await YDOC_MANAGER.get_users(document_id)) == 0
-        ):
-            log.info(f"Cleaning up document {document_id} as no users are left")
-            await YDOC_MANAGER.clear_document(document_id)
-
     except Exception as e:
         log.error(f"Error in yjs_document_leave: {e}")
 
@@ -657,48 +617,50 @@ async def yjs_awareness_update(sid, data):
 
 @sio.event
 async def disconnect(sid):
-    if sid in SESSION_POOL:
-        user = SESSION_POOL[sid]
-        del SESSION_POOL[sid]
-
-        user_id = user["id"]
-        USER_POOL[user_id] = [_sid for _sid in USER_POOL[user_id] if _sid != sid]
-
-        if len(USER_POOL[user_id]) == 0:
-            del USER_POOL[user_id]
-
+    user = await SESSION_POOLS.remove_session(sid)
+    if user:
         await YDOC_MANAGER.remove_user_from_all_documents(sid)
 
-        chats = chat_manager.list(query={'socket_id': sid})
-
-        for chat in chats:
-            jms_session = JMSSession(chat)
-            await jms_session.close()
+        session_closer.close_socket_sessions(sid)
     else:
         pass
         # print(f"Unknown session ID {sid} disconnected")
 
 
-def get_event_emitter(request_info, update_db=True):
-    async def __event_emitter__(event_data):
-        user_id = request_info["user_id"]
+def get_session_backlog(sid) -> int:
+    """Packets queued on the socket of a session connected to this worker."""
+    try:
+        eio_sid = sio.manager.eio_sid_from_sid(sid, "/")
+        socket = sio.eio.sockets.get(eio_sid) if eio_sid else None
+        return socket.queue.qsize() if socket is not None else 0
+    except Exception:
+        return 0
 
-        session_ids = list(
-            set(
-                USER_POOL.get(user_id, [])
-                + (
-                    [request_info.get("session_id")]
-                    if request_info.get("session_id")
-                    else []
-                )
-            )
-        )
 
-        chat_id = request_info.get("chat_id", None)
-        message_id = request_info.get("message_id", None)
+# EventCoalescer per (user, chat, message), shared by the emitters of a request
+EVENT_COALESCERS: Dict[tuple, EventCoalescer] = {}
+EVENT_COALESCERS_PRUNED_AT = 0.0
+
+
+def prune_event_coalescers():
+    """Drop the coalescers idle for a minute, at most once a minute."""
+    global EVENT_COALESCERS_PRUNED_AT
+    now = time.monotonic()
+    if now - EVENT_COALESCERS_PRUNED_AT < 60:
+        return
+    EVENT_COALESCERS_PRUNED_AT = now
+    for key, coalescer in list(EVENT_COALESCERS.items()):
+        if coalescer.idle and now - coalescer.last_used > 60:
+            del EVENT_COALESCERS[key]
+
 
-        emit_tasks = [
-            sio.emit(
+def get_event_coalescer(key: tuple, chat_id: Optional[str], message_id: Optional[str]) -> EventCoalescer:
+    prune_event_coalescers()
+    coalescer = EVENT_COALESCERS.get(key)
+    if coalescer is None:
+
+        async def send(session_id, event_data):
+            await sio.emit(
                 "events",
                 {
                     "chat_id": chat_id,
@@ -707,44 +669,65 @@ def get_event_emitter(request_info, update_db=True):
                 },
                 to=session_id,
             )
-            for session_id in session_ids
-        ]
 
-        await asyncio.gather(*emit_tasks)
+        coalescer = EventCoalescer(
+            send,
+            get_session_backlog,
+            interval=WEBSOCKET_EVENT_COALESCE_INTERVAL,
+            max_events=WEBSOCKET_EVENT_COALESCE_MAX_EVENTS,
+            max_backlog=WEBSOCKET_EVENT_MAX_BACKLOG,
+        )
+        EVENT_COALESCERS[key] = coalescer
+    return coalescer
+
+
+def get_event_emitter(request_info, update_db=True):
+    user_id = request_info["user_id"]
+    chat_id = request_info.get("chat_id", None)
+    message_id = request_info.get("message_id", None)
+    coalescer = get_event_coalescer((user_id, chat_id, message_id), chat_id, message_id)
+
+    async def get_session_ids():
+        return list(
+            set(
+                await SESSION_POOLS.get_user_session_ids(user_id)
+                + (
+                    [request_info.get("session_id")]
+                    if request_info.get("session_id")
+                    else []
+                )
+            )
+        )
+
+    async def __event_emitter__(event_data):
+        await coalescer.emit(await get_session_ids(), event_data)
+        prune_event_coalescers()
+
         if (
                 update_db
                 and message_id
                 and not request_info.get("chat_id", "").startswith("local:")
         ):
+            # Written behind, appends don't read the chat
             if "type" in event_data and event_data["type"] == "status":
-                Chats.add_message_status_to_chat_by_id_and_message_id(
+                Chats.buffer_message_status_to_chat_by_id_and_message_id(
                     request_info["chat_id"],
                     request_info["message_id"],
                     event_data.get("data", {}),
                 )
 
             if "type" in event_data and event_data["type"] == "message":
-                message = Chats.get_message_by_id_and_message_id(
+                Chats.buffer_message_append_to_chat_by_id_and_message_id(
                     request_info["chat_id"],
                     request_info["message_id"],
+                    "content",
+                    event_data.get("data", {}).get("content", ""),
                 )
 
-                if message:
-                    content = message.get("content", "")
-                    content += event_data.get("data", {}).get("content", "")
-
-                    Chats.upsert_message_to_chat_by_id_and_message_id(
-                        request_info["chat_id"],
-                        request_info["message_id"],
-                        {
-                            "content": content,
-                        },
-                    )
-
             if "type" in event_data and event_data["type"] == "replace":
                 content = event_data.get("data", {}).get("content", "")
 
-                Chats.upsert_message_to_chat_by_id_and_message_id(
+                Chats.buffer_message_to_chat_by_id_and_message_id(
                     request_info["chat_id"],
                     request_info["message_id"],
                     {
@@ -752,57 +735,25 @@ def get_event_emitter(request_info, update_db=True):
                     },
                 )
 
-            if "type" in event_data and event_data["type"] == "embeds":
-                message = Chats.get_message_by_id_and_message_id(
+            if "type" in event_data and event_data["type"] in ["embeds", "files"]:
+                key = event_data["type"]
+                # Newest first
+                Chats.buffer_message_append_to_chat_by_id_and_message_id(
                     request_info["chat_id"],
                     request_info["message_id"],
-                )
-
-                embeds = event_data.get("data", {}).get("embeds", [])
-                embeds.extend(message.get("embeds", []))
-
-                Chats.upsert_message_to_chat_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                    {
-                        "embeds": embeds,
-                    },
-                )
-
-            if "type" in event_data and event_data["type"] == "files":
-                message = Chats.get_message_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                )
-
-                files = event_data.get("data", {}).get("files", [])
-                files.extend(message.get("files", []))
-
-                Chats.upsert_message_to_chat_by_id_and_message_id(
-                    request_info["chat_id"],
-                    request_info["message_id"],
-                    {
-                        "files": files,
-                    },
+                    key,
+                    list(event_data.get("data", {}).get(key, [])),
+                    prepend=True,
                 )
 
             if event_data.get("type") in ["source", "citation"]:
                 data = event_data.get("data", {})
                 if data.get("type") == None:
-                    message = Chats.get_message_by_id_and_message_id(
-                        request_info["chat_id"],
-                        request_info["message_id"],
-                    )
-
-                    sources = message.get("sources", [])
-                    sources.append(data)
-
-                    Chats.upsert_message_to_chat_by_id_and_message_id(
+                    Chats.buffer_message_append_to_chat_by_id_and_message_id(
                         request_info["chat_id"],
                         request_info["message_id"],
-                        {
-                            "sources": sources,
-                        },
+                        "sources",
+                        [data],
                     )
 
     return __event_emitter__
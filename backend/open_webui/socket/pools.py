@@ -0,0 +1,290 @@
+"""
+Session pools of the Socket.IO server: the user of each connected session,
+the sessions of each user and the models in use.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError, WatchError
+
+from open_webui.env import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["SOCKET"])
+
+
+class SessionPools:
+    """In-process pools, for a single worker."""
+
+    def __init__(self, usage_timeout: float):
+        self.usage_timeout = usage_timeout
+        self._sessions: Dict[str, dict] = {}
+        self._user_sessions: Dict[str, Set[str]] = {}
+        self._models: Dict[str, float] = {}
+
+    @property
+    def active_user_count(self) -> int:
+        """Last known number of active users, readable outside the event loop."""
+        return len(self._user_sessions)
+
+    async def add_session(self, sid: str, user: dict):
+        self._sessions[sid] = user
+        self._user_sessions.setdefault(user["id"], set()).add(sid)
+
+    async def remove_session(self, sid: str) -> Optional[dict]:
+        user = self._sessions.pop(sid, None)
+        if user is not None:
+            sids = self._user_sessions.get(user["id"], set())
+            sids.discard(sid)
+            if not sids:
+                self._user_sessions.pop(user["id"], None)
+        return user
+
+    async def get_session(self, sid: str) -> Optional[dict]:
+        return self._sessions.get(sid)
+
+    async def get_sessions(self, sids: List[str]) -> List[Optional[dict]]:
+        return [self._sessions.get(sid) for sid in sids]
+
+    async def get_user_session_ids(self, user_id: str) -> List[str]:
+        return list(self._user_sessions.get(user_id, ()))
+
+    async def get_active_user_ids(self) -> List[str]:
+        return list(self._user_sessions)
+
+    async def is_user_active(self, user_id: str) -> bool:
+        return user_id in self._user_sessions
+
+    async def record_usage(self, model_id: str):
+        self._models[model_id] = time.time()
+
+    async def get_models_in_use(self) -> List[str]:
+        since = time.time() - self.usage_timeout
+        return [model_id for model_id, used_at in self._models.items() if used_at >= since]
+
+    async def cleanup(self):
+        """Forget models unused for `usage_timeout` seconds."""
+        since = time.time() - self.usage_timeout
+        for model_id, used_at in list(self._models.items()):
+            if used_at < since:
+                log.debug(f"Cleaning up model {model_id} from usage pool")
+                del self._models[model_id]
+
+    async def run(self):
+        """Background upkeep of the pools, until cancelled."""
+
+
+class RedisSessionPools(SessionPools):
+    """
+    Pools shared by the workers through Redis:
+
+    - {prefix}:session:{sid}   the session's user as JSON, expiring after `ttl`
+    - {prefix}:user:{user_id}  sorted set of the user's session ids by expiry
+    - {prefix}:users           sorted set of the active user ids by expiry
+    - {prefix}:models          sorted set of model ids by last use
+
+    Each worker pushes the expiry of its own sessions forward every ttl / 3
+    in run(), so the sessions of a worker that went away drop out on their
+    own. Updates are pipelined, and reads go through a per-worker cache of
+    `cache_ttl` seconds that run() invalidates as other workers publish
+    their changes.
+
+    `prefix` should carry a hash tag, e.g. "kael:{session_pool}", so the keys
+    share a slot on Redis Cluster.
+    """
+
+    def __init__(self, redis, prefix: str, ttl: float, cache_ttl: float, usage_timeout: float):
+        super().__init__(usage_timeout)
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.channel = f"{prefix}:invalidate"
+        # Sessions connected to this worker, sid -> user id
+        self._local: Dict[str, str] = {}
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+        # Bumped by invalidations, so a read racing one doesn't cache what it got
+        self._generation = 0
+        self._active_user_count = 0
+
+    @property
+    def active_user_count(self) -> int:
+        return self._active_user_count
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    async def _cached(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        generation = self._generation
+        value = await load()
+        if generation == self._generation:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, value)
+        return value
+
+    def _invalidate(self, pipe, *keys: str):
+        """Drop `keys` from the caches of every worker, as part of `pipe`."""
+        self._generation += 1
+        for key in keys:
+            self._cache.pop(key, None)
+        pipe.publish(self.channel, "\n".join(keys))
+
+    def _refresh_session(self, pipe, sid: str, user_id: str, expires_at: float):
+        pipe.zadd(self._key("user", user_id), {sid: expires_at})
+        pipe.expire(self._key("user", user_id), int(self.ttl))
+        pipe.zadd(self._key("users"), {user_id: expires_at})
+
+    async def add_session(self, sid: str, user: dict):
+        self._local[sid] = user["id"]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._key("session", sid), json.dumps(user), ex=int(self.ttl))
+            self._refresh_session(pipe, sid, user["id"], time.time() + self.ttl)
+            self._invalidate(pipe, f"session:{sid}", f"user:{user['id']}", "users")
+            await pipe.execute()
+
+    async def remove_session(self, sid: str) -> Optional[dict]:
+        self._local.pop(sid, None)
+        user = await self._load_session(sid)
+        if user is None:
+            return None
+
+        user_id = user["id"]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self._key("session", sid))
+            pipe.zrem(self._key("user", user_id), sid)
+            self._invalidate(pipe, f"session:{sid}", f"user:{user_id}", "users")
+            await pipe.execute()
+        await self._remove_user_if_idle(user_id)
+        return user
+
+    async def _remove_user_if_idle(self, user_id: str):
+        key = self._key("user", user_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                if await pipe.zcount(key, time.time(), "+inf") > 0:
+                    return
+                pipe.multi()
+                pipe.zrem(self._key("users"), user_id)
+                self._invalidate(pipe, "users")
+                await pipe.execute()
+        except WatchError:
+            # A session of the user connected meanwhile
+            pass
+        except RedisError as e:
+            # The entry expires with the user's last session anyway
+            log.debug(f"Failed to remove idle user {user_id} from the pool: {e}")
+
+    async def _load_session(self, sid: str) -> Optional[dict]:
+        value = await self.redis.get(self._key("session", sid))
+        return json.loads(value) if value else None
+
+    async def get_session(self, sid: str) -> Optional[dict]:
+        return await self._cached(f"session:{sid}", lambda: self._load_session(sid))
+
+    async def get_sessions(self, sids: List[str]) -> List[Optional[dict]]:
+        now = time.monotonic()
+        users = {}
+        for sid in sids:
+            entry = self._cache.get(f"session:{sid}")
+            if entry is not None and entry[0] > now:
+                users[sid] = entry[1]
+
+        missing = [sid for sid in sids if sid not in users]
+        if missing:
+            generation = self._generation
+            values = await self.redis.mget([self._key("session", sid) for sid in missing])
+            expires_at = time.monotonic() + self.cache_ttl
+            for sid, value in zip(missing, values):
+                users[sid] = json.loads(value) if value else None
+                if generation == self._generation:
+                    self._cache[f"session:{sid}"] = (expires_at, users[sid])
+        return [users[sid] for sid in sids]
+
+    async def get_user_session_ids(self, user_id: str) -> List[str]:
+        async def load():
+            return await self.redis.zrangebyscore(self._key("user", user_id), time.time(), "+inf")
+
+        return await self._cached(f"user:{user_id}", load)
+
+    async def get_active_user_ids(self) -> List[str]:
+        async def load():
+            user_ids = await self.redis.zrangebyscore(self._key("users"), time.time(), "+inf")
+            self._active_user_count = len(user_ids)
+            return user_ids
+
+        return await self._cached("users", load)
+
+    async def is_user_active(self, user_id: str) -> bool:
+        return bool(await self.get_user_session_ids(user_id))
+
+    async def record_usage(self, model_id: str):
+        await self.redis.zadd(self._key("models"), {model_id: time.time()})
+
+    async def get_models_in_use(self) -> List[str]:
+        return await self.redis.zrangebyscore(
+            self._key("models"), time.time() - self.usage_timeout, "+inf"
+        )
+
+    async def cleanup(self):
+        """Drop models unused for `usage_timeout` seconds and expired users."""
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self._key("models"), "-inf", now - self.usage_timeout)
+            pipe.zremrangebyscore(self._key("users"), "-inf", now)
+            await pipe.execute()
+
+    async def refresh(self):
+        """Push the expiry of this worker's sessions forward."""
+        if self._local:
+            expires_at = time.time() + self.ttl
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for sid, user_id in list(self._local.items()):
+                    pipe.expire(self._key("session", sid), int(self.ttl))
+                    self._refresh_session(pipe, sid, user_id, expires_at)
+                await pipe.execute()
+        # Keeps active_user_count current for the metrics
+        await self.get_active_user_ids()
+
+    async def run(self):
+        """Refresh this worker's sessions and apply the invalidations of the others."""
+        await asyncio.gather(self._refresh_loop(), self._listen())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except RedisError as e:
+                log.warning(f"Failed to refresh the session pools: {e}")
+            await asyncio.sleep(self.ttl / 3)
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Changes may have been missed while not subscribed
+                self._cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    self._generation += 1
+                    for key in data.split("\n"):
+                        self._cache.pop(key, None)
+            except RedisError as e:
+                log.warning(f"Session pool invalidations stopped ({e}), resubscribing")
+                self._cache.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
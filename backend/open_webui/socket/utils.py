@@ -1,10 +1,18 @@
-import json
+import asyncio
+import logging
+import time
 import uuid
+from base64 import b64decode, b64encode
+from collections import OrderedDict
 from open_webui.utils.redis import get_redis_connection
-from open_webui.env import REDIS_KEY_PREFIX
+from open_webui.env import REDIS_KEY_PREFIX, SRC_LOG_LEVELS
 from typing import Optional, List, Tuple
+from redis.exceptions import WatchError
 import pycrdt as Y
 
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["SOCKET"])
+
 
 class RedisLock:
     def __init__(
@@ -46,113 +54,180 @@ class RedisLock:
             self.redis.delete(self.lock_name)
 
 
-class RedisDict:
-    def __init__(self, name, redis_url, redis_sentinels=[], redis_cluster=False):
-        self.name = name
-        self.redis = get_redis_connection(
-            redis_url,
-            redis_sentinels,
-            redis_cluster=redis_cluster,
-            decode_responses=True,
-        )
-
-    def __setitem__(self, key, value):
-        serialized_value = json.dumps(value)
-        self.redis.hset(self.name, key, serialized_value)
-
-    def __getitem__(self, key):
-        value = self.redis.hget(self.name, key)
-        if value is None:
-            raise KeyError(key)
-        return json.loads(value)
-
-    def __delitem__(self, key):
-        result = self.redis.hdel(self.name, key)
-        if result == 0:
-            raise KeyError(key)
-
-    def __contains__(self, key):
-        return self.redis.hexists(self.name, key)
-
-    def __len__(self):
-        return self.redis.hlen(self.name)
-
-    def keys(self):
-        return self.redis.hkeys(self.name)
-
-    def values(self):
-        return [json.loads(v) for v in self.redis.hvals(self.name)]
-
-    def items(self):
-        return [(k, json.loads(v)) for k, v in self.redis.hgetall(self.name).items()]
-
-    def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
-            return default
-
-    def clear(self):
-        self.redis.delete(self.name)
-
-    def update(self, other=None, **kwargs):
-        if other is not None:
-            for k, v in other.items() if hasattr(other, "items") else other:
-                self[k] = v
-        for k, v in kwargs.items():
-            self[k] = v
-
-    def setdefault(self, key, default=None):
-        if key not in self:
-            self[key] = default
-        return self[key]
-
-
 class YdocManager:
+    """
+    Users and state of the collaborative documents.
+
+    With Redis, each update is appended to a log of base64 entries and every
+    `compact_updates` entries the log is folded into a snapshot of the whole
+    state; `offset` counts the entries folded so far. Workers cache the Y.Doc
+    of the documents they serve and only apply the log entries they haven't
+    seen, so a join costs the size of the state, not of its history. The
+    first append sets a random `generation`, which tells a cached doc of a
+    document that was cleared and started again apart from the new one.
+
+    Each session's documents are indexed so a disconnect only touches those.
+    Documents a user left are candidates for sweep(), which clears the ones
+    still without users after `grace` seconds. The user sets expire
+    `users_ttl` seconds after the last join or update, so the entries of
+    workers that died with their sessions don't stay forever.
+    """
+
     def __init__(
         self,
         redis=None,
         redis_key_prefix: str = f"{REDIS_KEY_PREFIX}:ydoc:documents",
+        compact_updates: int = 100,
+        max_cached_docs: int = 128,
+        users_ttl: int = 24 * 60 * 60,
     ):
-        self._updates = {}
+        # document id -> (Y.Doc, log entries applied, generation)
+        self._docs: "OrderedDict[str, Tuple[Y.Doc, int, Optional[str]]]" = OrderedDict()
         self._users = {}
         self._redis = redis
         self._redis_key_prefix = redis_key_prefix
+        self._compact_updates = compact_updates
+        self._max_cached_docs = max_cached_docs
+        self._users_ttl = users_ttl
+
+    def _key(self, document_id: str, name: str) -> str:
+        # Hash tagged, the keys of a document share a slot on Redis Cluster
+        return f"{self._redis_key_prefix}:{{{document_id}}}:{name}"
+
+    def _session_key(self, user_id: str) -> str:
+        return f"{self._redis_key_prefix}:session:{user_id}:documents"
+
+    @property
+    def _sweep_key(self) -> str:
+        return f"{self._redis_key_prefix}:sweep"
+
+    def _cache_doc(self, document_id: str, ydoc: Y.Doc, applied: int, generation: Optional[str]):
+        self._docs[document_id] = (ydoc, applied, generation)
+        self._docs.move_to_end(document_id)
+        while len(self._docs) > self._max_cached_docs:
+            self._docs.popitem(last=False)
 
     async def append_to_updates(self, document_id: str, update: bytes):
         document_id = document_id.replace(":", "_")
-        if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
-            await self._redis.rpush(redis_key, json.dumps(list(update)))
-        else:
-            if document_id not in self._updates:
-                self._updates[document_id] = []
-            self._updates[document_id].append(update)
-
-    async def get_updates(self, document_id: str) -> List[bytes]:
+        update = bytes(update)
+
+        if not self._redis:
+            ydoc, _, _ = self._docs.get(document_id) or (Y.Doc(), 0, None)
+            ydoc.apply_update(update)
+            # Local documents live until cleared, outside of the cache bound
+            self._docs[document_id] = (ydoc, 0, None)
+            return
+
+        generation_key = self._key(document_id, "generation")
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self._key(document_id, "updates"), b64encode(update).decode())
+            pipe.set(generation_key, uuid.uuid4().hex, nx=True)
+            pipe.get(self._key(document_id, "offset"))
+            pipe.get(generation_key)
+            pipe.expire(self._key(document_id, "users"), self._users_ttl)
+            length, _, offset, generation, _ = await pipe.execute()
+        position = int(offset or 0) + length
+
+        cached = self._docs.get(document_id)
+        if cached is not None and cached[1] == position - 1 and cached[2] == generation:
+            cached[0].apply_update(update)
+            self._cache_doc(document_id, cached[0], position, generation)
+
+        if length >= self._compact_updates:
+            await self._compact(document_id)
+
+    async def _load(self, document_id: str) -> Tuple[Y.Doc, int]:
+        """The document's Y.Doc with the number of log entries it has applied."""
+        if not self._redis:
+            ydoc, applied, _ = self._docs.get(document_id) or (Y.Doc(), 0, None)
+            return ydoc, applied
+
+        updates_key = self._key(document_id, "updates")
+        offset_key = self._key(document_id, "offset")
+        generation_key = self._key(document_id, "generation")
+        while True:
+            ydoc, applied, cached_generation = self._docs.get(document_id) or (None, 0, None)
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.get(offset_key)
+                pipe.llen(updates_key)
+                pipe.get(generation_key)
+                offset, length, generation = await pipe.execute()
+            offset = int(offset or 0)
+            current = ydoc is not None and cached_generation == generation
+            if current and applied == offset + length:
+                self._docs.move_to_end(document_id)
+                return ydoc, applied
+
+            # Entries the cached doc misses may have been folded into the
+            # snapshot, or the document cleared and started again since
+            rebuild = not current or not offset <= applied <= offset + length
+            start = 0 if rebuild else applied - offset
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.get(offset_key)
+                pipe.get(generation_key)
+                pipe.lrange(updates_key, start, -1)
+                if rebuild:
+                    pipe.get(self._key(document_id, "snapshot"))
+                results = await pipe.execute()
+            if int(results[0] or 0) != offset or results[1] != generation:
+                # Compacted or cleared in between, the positions moved
+                continue
+
+            if rebuild:
+                ydoc = Y.Doc()
+                if results[3]:
+                    ydoc.apply_update(b64decode(results[3]))
+            for update in results[2]:
+                ydoc.apply_update(b64decode(update))
+            applied = offset + start + len(results[2])
+            self._cache_doc(document_id, ydoc, applied, generation)
+            return ydoc, applied
+
+    async def _compact(self, document_id: str):
+        """Fold the log entries into the snapshot, unless another worker is at it."""
+        snapshot_key = self._key(document_id, "snapshot")
+        offset_key = self._key(document_id, "offset")
+        generation_key = self._key(document_id, "generation")
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(snapshot_key, offset_key, generation_key)
+                ydoc, applied = await self._load(document_id)
+                folded = applied - int(await pipe.get(offset_key) or 0)
+                if folded <= 0:
+                    return
+                pipe.multi()
+                pipe.set(snapshot_key, b64encode(ydoc.get_update()).decode())
+                pipe.ltrim(self._key(document_id, "updates"), folded, -1)
+                pipe.incrby(offset_key, folded)
+                await pipe.execute()
+        except WatchError:
+            pass
+
+    async def get_state(self, document_id: str) -> bytes:
+        """The whole state of the document, encoded as a single update."""
         document_id = document_id.replace(":", "_")
-
-        if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
-            updates = await self._redis.lrange(redis_key, 0, -1)
-            return [bytes(json.loads(update)) for update in updates]
-        else:
-            return self._updates.get(document_id, [])
+        ydoc, _ = await self._load(document_id)
+        return ydoc.get_update()
 
     async def document_exists(self, document_id: str) -> bool:
         document_id = document_id.replace(":", "_")
 
         if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
-            return await self._redis.exists(redis_key) > 0
+            return (
+                await self._redis.exists(
+                    self._key(document_id, "updates"),
+                    self._key(document_id, "snapshot"),
+                )
+                > 0
+            )
         else:
-            return document_id in self._updates
+            return document_id in self._docs
 
     async def get_users(self, document_id: str) -> List[str]:
         document_id = document_id.replace(":", "_")
 
         if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:users"
+            redis_key = self._key(document_id, "users")
             users = await self._redis.smembers(redis_key)
             return list(users)
         else:
@@ -162,53 +237,103 @@ class YdocManager:
         document_id = document_id.replace(":", "_")
 
         if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:users"
-            await self._redis.sadd(redis_key, user_id)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.sadd(self._key(document_id, "users"), user_id)
+                pipe.expire(self._key(document_id, "users"), self._users_ttl)
+                pipe.sadd(self._session_key(user_id), document_id)
+                pipe.expire(self._session_key(user_id), self._users_ttl)
+                await pipe.execute()
         else:
             if document_id not in self._users:
                 self._users[document_id] = set()
             self._users[document_id].add(user_id)
 
     async def remove_user(self, document_id: str, user_id: str):
-        document_id = document_id.replace(":", "_")
+        await self._remove_user_from_documents(
+            [document_id.replace(":", "_")], user_id
+        )
 
+    async def remove_user_from_all_documents(self, user_id: str):
         if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:users"
-            await self._redis.srem(redis_key, user_id)
+            document_ids = await self._redis.smembers(self._session_key(user_id))
         else:
-            if document_id in self._users and user_id in self._users[document_id]:
-                self._users[document_id].remove(user_id)
-
-    async def remove_user_from_all_documents(self, user_id: str):
+            document_ids = [
+                document_id
+                for document_id, users in self._users.items()
+                if user_id in users
+            ]
+        if document_ids:
+            await self._remove_user_from_documents(list(document_ids), user_id)
+
+    async def _remove_user_from_documents(self, document_ids: List[str], user_id: str):
         if self._redis:
-            keys = await self._redis.keys(f"{self._redis_key_prefix}:*")
-            for key in keys:
-                if key.endswith(":users"):
-                    await self._redis.srem(key, user_id)
-
-                    document_id = key.split(":")[-2]
-                    if len(await self.get_users(document_id)) == 0:
-                        await self.clear_document(document_id)
-
+            # Whether the documents are left empty is up to sweep()
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for document_id in document_ids:
+                    pipe.srem(self._key(document_id, "users"), user_id)
+                    pipe.srem(self._session_key(user_id), document_id)
+                pipe.zadd(
+                    self._sweep_key,
+                    {document_id: time.time() for document_id in document_ids},
+                )
+                await pipe.execute()
         else:
-            for document_id in list(self._users.keys()):
-                if user_id in self._users[document_id]:
-                    self._users[document_id].remove(user_id)
-                    if not self._users[document_id]:
-                        del self._users[document_id]
-
+            for document_id in document_ids:
+                users = self._users.get(document_id)
+                if users is not None and user_id in users:
+                    users.remove(user_id)
+                    if not users:
                         await self.clear_document(document_id)
 
+    async def sweep(self, grace: float):
+        """Clear the documents left without users for `grace` seconds."""
+        if not self._redis:
+            return
+
+        cutoff = time.time() - grace
+        document_ids = await self._redis.zrangebyscore(self._sweep_key, "-inf", cutoff)
+        for document_id in document_ids:
+            users_key = self._key(document_id, "users")
+            try:
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    await pipe.watch(users_key)
+                    if await pipe.scard(users_key) == 0:
+                        pipe.multi()
+                        pipe.delete(
+                            self._key(document_id, "updates"),
+                            self._key(document_id, "snapshot"),
+                            self._key(document_id, "offset"),
+                            self._key(document_id, "generation"),
+                        )
+                        await pipe.execute()
+                        self._docs.pop(document_id, None)
+            except WatchError:
+                # Joined meanwhile
+                pass
+        if document_ids:
+            await self._redis.zremrangebyscore(self._sweep_key, "-inf", cutoff)
+
+    async def run_sweeper(self, interval: float):
+        """Sweep every `interval` seconds, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep(grace=interval)
+            except Exception as e:
+                log.warning(f"Failed to sweep collaborative documents: {e}")
+
     async def clear_document(self, document_id: str):
         document_id = document_id.replace(":", "_")
 
+        self._docs.pop(document_id, None)
         if self._redis:
-            redis_key = f"{self._redis_key_prefix}:{document_id}:updates"
-            await self._redis.delete(redis_key)
-            redis_users_key = f"{self._redis_key_prefix}:{document_id}:users"
-            await self._redis.delete(redis_users_key)
+            await self._redis.delete(
+                self._key(document_id, "updates"),
+                self._key(document_id, "snapshot"),
+                self._key(document_id, "offset"),
+                self._key(document_id, "generation"),
+                self._key(document_id, "users"),
+            )
         else:
-            if document_id in self._updates:
-                del self._updates[document_id]
             if document_id in self._users:
                 del self._users[document_id]
@@ -0,0 +1,121 @@
+"""
+Serialization cost of a chat document per codec, for 10/100/1000-message
+chats: stdlib json, orjson and the ChatDocument protobuf schema.
+
+    python -m open_webui.test.benchmark.chat_codec [--repeat N]
+"""
+import argparse
+import json
+import time
+import uuid
+
+from open_webui.jms import chat_codec
+from open_webui.jms.chat_codec import decode_chat, encode_chat
+
+PARAGRAPH = (
+    "To rotate the credentials, open the account list, select the accounts and "
+    "run the change secret automation; 密钥会在执行后同步到资产。 "
+)
+
+
+def make_chat(n_messages: int) -> dict:
+    messages, branch, parent_id = {}, [], None
+    for i in range(n_messages):
+        message_id = str(uuid.uuid4())
+        user = i % 2 == 0
+        message = {
+            "id": message_id,
+            "parentId": parent_id,
+            "childrenIds": [],
+            "role": "user" if user else "assistant",
+            "content": PARAGRAPH * (1 if user else 6),
+            "timestamp": 1760000000 + i,
+        }
+        if not user:
+            message.update(
+                model="gpt-4o",
+                modelName="gpt-4o",
+                done=True,
+                usage={"prompt_tokens": 120 + i, "completion_tokens": 480, "total_tokens": 600 + i},
+            )
+        else:
+            message["models"] = ["gpt-4o"]
+        if parent_id:
+            messages[parent_id]["childrenIds"].append(message_id)
+        messages[message_id] = message
+        branch.append(message)
+        parent_id = message_id
+
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "title": "Rotate credentials",
+        "chat": {
+            "id": "",
+            "title": "Rotate credentials",
+            "models": ["gpt-4o"],
+            "params": {},
+            "history": {"messages": messages, "currentId": parent_id},
+            "messages": branch,
+            "tags": [],
+            "timestamp": 1760000000000,
+            "files": [],
+        },
+        "updated_at": 1760000100,
+        "created_at": 1760000000,
+        "share_id": None,
+        "archived": False,
+        "pinned": False,
+        "meta": {"tags": ["ops"]},
+        "folder_id": None,
+        "session_info": {"asset": "db-01", "account": "root"},
+    }
+
+
+def stdlib_dumps(doc):
+    return json.dumps(doc, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def stdlib_loads(body):
+    return json.loads(body)
+
+
+CODECS = {
+    "json": (stdlib_dumps, stdlib_loads),
+    "orjson": (chat_codec.json_dumps, chat_codec.json_loads),
+    "protobuf": (encode_chat, decode_chat),
+}
+
+
+def measure(func, arg, repeat: int) -> float:
+    """Best of `repeat` runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if chat_codec.orjson is None:
+        print("orjson is not installed, the orjson row uses stdlib json")
+
+    print(f"{'messages':>8}  {'codec':<8}  {'size KiB':>9}  {'encode ms':>9}  {'decode ms':>9}")
+    for n in (10, 100, 1000):
+        doc = make_chat(n)
+        for name, (dumps, loads) in CODECS.items():
+            body = dumps(doc)
+            assert loads(body) == doc, name
+            print(
+                f"{n:>8}  {name:<8}  {len(body) / 1024:>9.1f}  "
+                f"{measure(dumps, doc, args.repeat):>9.3f}  {measure(loads, body, args.repeat):>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
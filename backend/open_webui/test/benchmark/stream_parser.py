@@ -0,0 +1,110 @@
+"""
+Cost per token of a streamed chat completion as the answer grows, for 1k/5k/20k
+token answers with a reasoning block: the incremental SSE framer, tag parser
+and cached rendering against scanning and serializing the whole answer on
+every delta, as process_chat_response used to.
+
+    python -m open_webui.test.benchmark.stream_parser [--flush N]
+"""
+import argparse
+import json
+import re
+import time
+
+from open_webui.jms.chat_codec import json_loads
+from open_webui.utils.stream_parser import ContentBlockParser, ContentBlockRenderer, SSEFramer
+
+TAG_SETS = [
+    ("reasoning", [("<think>", "</think>"), ("<thinking>", "</thinking>"), ("<reason>", "</reason>")]),
+    ("solution", [("<|begin_of_solution|>", "<|end_of_solution|>")]),
+    ("code_interpreter", [("<code_interpreter>", "</code_interpreter>")]),
+]
+TOKENS = ["The", " account", " list", " shows", " 密钥", " rotation", ",", " then", " run", " it", ".\n"]
+
+
+def serialize(content_blocks, content="", strip=True):
+    """The text and reasoning cases of serialize_content_blocks."""
+    for block in content_blocks:
+        if block["type"] == "reasoning":
+            lines = "\n".join(f"> {line}" for line in block["content"].splitlines())
+            content = f'{content}<details type="reasoning" done="false">\n<summary>Thinking…</summary>\n{lines}\n</details>\n'
+        elif block["content"].strip():
+            content = f"{content}{block['content'].strip()}\n"
+    return content.strip() if strip else content
+
+
+def make_body(n_tokens: int) -> list:
+    """SSE chunks of an answer thinking for its first tenth."""
+    tokens = [TOKENS[i % len(TOKENS)] for i in range(n_tokens)]
+    tokens[0], tokens[n_tokens // 10] = "<think>", "</think>"
+    return [
+        f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n".encode()
+        for token in tokens
+    ]
+
+
+def incremental(body: list, flush: int) -> list:
+    """Seconds spent on each token."""
+    content_blocks = [{"type": "text", "content": ""}]
+    framer = SSEFramer()
+    parser = ContentBlockParser(content_blocks, TAG_SETS)
+    renderer = ContentBlockRenderer(serialize)
+    costs = []
+    for i, chunk in enumerate(body):
+        start = time.perf_counter()
+        for payload in framer.feed(chunk):
+            parser.feed(json_loads(payload)["choices"][0]["delta"]["content"])
+        if i % flush == 0:
+            parser.sync()
+            renderer.render(content_blocks)
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def full_scan(body: list, flush: int) -> list:
+    """Seconds spent on each token when every delta scans the whole answer."""
+    patterns = [
+        (content_type, re.compile(rf"<{re.escape(start[1:-1])}(\s.*?)?>"), end)
+        for content_type, tags in TAG_SETS
+        for start, end in tags
+    ]
+    content = ""
+    costs = []
+    for i, line in enumerate(body):
+        start = time.perf_counter()
+        value = json.loads(line.decode("utf-8", "replace")[len("data:"):].strip())
+        content += value["choices"][0]["delta"]["content"]
+        content_blocks = [{"type": "text", "content": content}]
+        for content_type, pattern, end in patterns:
+            match = pattern.search(content)
+            if match:
+                inner, _, after = content[match.end():].partition(end)
+                content_blocks = [
+                    {"type": "text", "content": content[:match.start()]},
+                    {"type": content_type, "content": inner},
+                    {"type": "text", "content": after},
+                ]
+        if i % flush == 0:
+            serialize(content_blocks)
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--flush", type=int, default=1, help="Render every N tokens, as stream_delta_chunk_size")
+    args = parser.parse_args()
+
+    print(f"{'tokens':>6}  {'method':<11}  {'first 1k us/token':>17}  {'last 1k us/token':>16}  {'total ms':>9}")
+    for n in (1000, 5000, 20000):
+        body = make_body(n)
+        for name, run in (("incremental", incremental), ("full scan", full_scan)):
+            costs = run(body, args.flush)
+            print(
+                f"{n:>6}  {name:<11}  {sum(costs[:1000]) * 1000:>17.2f}  "
+                f"{sum(costs[-1000:]) * 1000:>16.2f}  {sum(costs) * 1000:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
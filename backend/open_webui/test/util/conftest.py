@@ -0,0 +1,14 @@
+import pytest
+
+from open_webui.jms import wisp
+from open_webui.jms.wisp.fake import serve
+
+
+@pytest.fixture
+def fake_wisp(tmp_path):
+    address = f"unix:{tmp_path / 'wisp.sock'}"
+    servicer, server = serve(address, options=wisp.message_size_options())
+    wisp.setup_protobuf([address])
+    yield servicer
+    wisp.setup_protobuf()
+    server.stop(None)
@@ -0,0 +1,157 @@
+import asyncio
+import copy
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from open_webui.jms.chat_buffer import ChatWriteBuffer
+from open_webui.jms.wisp.exceptions import WispError
+
+
+class FakeChats:
+    """
+    Stand-in for chat_manager, writes wait for `gates` in turn and `fail` of
+    them fail, `fail_applied` of them after the change was stored.
+    """
+
+    def __init__(self):
+        self.chats = {"c1": {"id": "c1", "chat": {"history": {"messages": {}}}}}
+        self.gates = []
+        self.fail = 0
+        self.fail_applied = 0
+        self.writing = 0
+        self.max_writing = 0
+
+    async def aretrieve(self, chat_id, fresh=False):
+        return copy.deepcopy(self.chats[chat_id])
+
+    async def apatch(self, chat_id, ops, data):
+        self.writing += 1
+        self.max_writing = max(self.max_writing, self.writing)
+        try:
+            if self.gates:
+                await self.gates.pop(0).wait()
+            if self.fail:
+                self.fail -= 1
+                raise WispError("wisp down")
+            self.chats[chat_id] = {**self.chats[chat_id], **copy.deepcopy(data)}
+            if self.fail_applied:
+                self.fail_applied -= 1
+                raise WispError("connection reset")
+        finally:
+            self.writing -= 1
+
+    def messages(self, chat_id="c1"):
+        return self.chats[chat_id]["chat"]["history"]["messages"]
+
+
+def run(main):
+    chats = FakeChats()
+    with patch("open_webui.jms.chat_buffer.chat_manager", chats):
+        asyncio.run(main(chats))
+    return chats
+
+
+class TestChatWriteBuffer:
+    """Test the write-behind buffer of chat message patches"""
+
+    def test_flushes_of_a_chat_never_overlap(self):
+        """Test a flush started while others wait for the chat's lock waits too"""
+
+        async def main(chats):
+            buffer = ChatWriteBuffer(interval=10, retries=0)
+            first, second = asyncio.Event(), asyncio.Event()
+            chats.gates = [first, second]
+
+            buffer.add_message("c1", "m1", {"content": "a"})
+            flush_a = asyncio.create_task(buffer.flush("c1"))
+            await asyncio.sleep(0)
+            flush_b = asyncio.create_task(buffer.flush("c1"))
+            await asyncio.sleep(0)
+
+            woken = asyncio.Event()
+
+            async def write_between():
+                # Runs after flush A let go of the lock, before B takes it
+                await woken.wait()
+                buffer.add_message("c1", "m2", {"content": "b"})
+
+            writer = asyncio.create_task(write_between())
+            await asyncio.sleep(0)
+            first.set()
+            woken.set()
+            await flush_a
+            await writer
+            await asyncio.sleep(0)
+
+            buffer.add_message("c1", "m3", {"content": "c"})
+            flush_c = asyncio.create_task(buffer.flush("c1"))
+            await asyncio.sleep(0.01)
+            second.set()
+            await asyncio.gather(flush_b, flush_c)
+            assert not buffer._locks
+
+        chats = run(main)
+        assert chats.max_writing == 1
+        assert sorted(chats.messages()) == ["m1", "m2", "m3"]
+
+    def test_failed_flush_is_retried_later(self):
+        """Test patches a flush gave up on are written without another write to the chat"""
+
+        async def main(chats):
+            buffer = ChatWriteBuffer(interval=0.05, retries=0)
+            chats.fail = 1
+            buffer.add_message("c1", "m1", {"content": "a"})
+            with pytest.raises(WispError):
+                await buffer.flush("c1")
+            assert buffer.has_pending("c1")
+
+            await asyncio.sleep(0.2)
+            assert not buffer.has_pending("c1")
+
+        chats = run(main)
+        assert chats.messages()["m1"]["content"] == "a"
+
+    def test_retry_of_an_applied_write_keeps_appends_once(self):
+        """Test a write that failed after it was stored doesn't join the appends again"""
+
+        async def main(chats):
+            buffer = ChatWriteBuffer(interval=10, retries=1)
+            chats.messages()["m1"] = {"id": "m1", "content": "Hello"}
+            chats.fail_applied = 1
+            buffer.add_append("c1", "m1", "content", ", world")
+
+            flush = asyncio.create_task(buffer.flush("c1"))
+            await asyncio.sleep(0.1)
+            # Read between the stored write and its retry
+            chat_dict = buffer.overlay("c1", await chats.aretrieve("c1"))
+            assert chat_dict["chat"]["history"]["messages"]["m1"]["content"] == "Hello, world"
+            await flush
+            assert not buffer.has_pending("c1")
+
+        chats = run(main)
+        assert chats.messages()["m1"]["content"] == "Hello, world"
+
+    def test_mark_written_from_a_thread(self):
+        """Test a direct write in a worker thread updates the buffer on its loop"""
+
+        async def main(chats):
+            buffer = ChatWriteBuffer(interval=10, retries=0)
+            buffer.add_message("c1", "m1", {"content": "a"})
+            timer = buffer._timers["c1"]
+            threads = []
+            mark_written = buffer._mark_written
+
+            def record(chat_id):
+                threads.append(threading.current_thread())
+                mark_written(chat_id)
+
+            buffer._mark_written = record
+            await asyncio.to_thread(buffer.mark_message_written, "c1", "m1")
+            assert threads == [threading.main_thread()]
+            assert not buffer.has_pending("c1")
+            await asyncio.sleep(0)
+            assert timer.cancelled()
+
+        run(main)
@@ -0,0 +1,74 @@
+from open_webui.jms.chat_codec import decode_chat, encode_chat, is_protobuf_response, json_dumps, json_loads
+
+
+def make_doc():
+    messages = {
+        "m1": {"id": "m1", "parentId": None, "childrenIds": ["m2"], "role": "user",
+               "content": "你好", "timestamp": 1, "models": ["gpt-4o"]},
+        "m2": {"id": "m2", "parentId": "m1", "childrenIds": [], "role": "assistant",
+               "content": "hi", "model": "gpt-4o", "done": True, "timestamp": 2},
+    }
+    return {
+        "id": "c1",
+        "user_id": "u1",
+        "title": "t",
+        "chat": {
+            "title": "t",
+            "models": ["gpt-4o"],
+            "history": {"messages": messages, "currentId": "m2"},
+            "messages": [dict(messages["m1"]), dict(messages["m2"])],
+        },
+        "updated_at": 2,
+        "created_at": 1,
+        "share_id": None,
+        "archived": False,
+        "meta": {"tags": []},
+        "folder_id": "",
+        "session_info": {"asset": "a"},
+    }
+
+
+class TestChatCodec:
+    """Test the ChatDocument protobuf codec"""
+
+    def test_round_trip(self):
+        """Test a chat document decodes to what was encoded"""
+        doc = make_doc()
+        body = encode_chat(doc)
+
+        assert is_protobuf_response(body, accepted=True)
+        assert not is_protobuf_response(body, accepted=False)
+        assert decode_chat(body) == doc
+        assert len(body) < len(json_dumps(doc))
+
+    def test_round_trip_untyped_values(self):
+        """Test values that do not fit the schema are kept as JSON"""
+        doc = make_doc()
+        doc["pinned"] = None
+        doc["chat"]["history"]["currentId"] = None
+        doc["chat"]["messages"] = []
+
+        assert decode_chat(encode_chat(doc)) == doc
+
+    def test_partial_update(self):
+        """Test an update payload keeps only the keys it had"""
+        doc = {"id": "c1", "archived": True}
+
+        assert decode_chat(encode_chat(doc)) == doc
+        assert encode_chat({"archived": True}) is None
+
+    def test_json_bodies_are_not_protobuf(self):
+        """Test JSON bodies are told apart from protobuf ones"""
+        body = json_dumps(make_doc())
+
+        assert not is_protobuf_response(body, accepted=True)
+        assert json_loads(body) == make_doc()
+        # pretty-printed JSON may start with the byte a ChatDocument starts with
+        for body in (b"\n{}", b"\r\n  [1]", b" \t{}"):
+            assert not is_protobuf_response(body, accepted=True)
+
+    def test_id_length_that_reads_as_whitespace(self):
+        """Test a ChatDocument whose id length byte is a JSON whitespace is protobuf"""
+        for length in (9, 10, 13, 32):
+            body = encode_chat({"id": "a" * length})
+            assert is_protobuf_response(body, accepted=True)
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from open_webui.jms.chat import ChatHandler
+from open_webui.jms.wisp import shutdown_aio_protobuf
+from open_webui.utils.chat_list import stream_chat_responses
+
+
+def create_chats(fake_wisp, count: int) -> list:
+    """Chats c0..c<count - 1>, each updated a second after the previous one"""
+    chats = ChatHandler()
+    ids = [chats.create({"id": f"c{i}", "title": f"chat {i}"})["id"] for i in range(count)]
+    for i, chat_id in enumerate(ids):
+        fake_wisp.chats[chat_id]["updated_at"] = 1000 + i
+    return ids
+
+
+def read_all(chats: ChatHandler, limit: int, between_pages=None) -> list:
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = chats.list_page(cursor=cursor, limit=limit)
+        ids += [row["id"] for row in page.results]
+        pages += 1
+        if page.cursor is None:
+            return ids
+        if between_pages is not None:
+            between_pages(pages)
+        cursor = page.cursor
+
+
+class TestStreamChatResponses:
+    """Test the chat list written as a JSON array while wisp's pages arrive"""
+
+    @staticmethod
+    def stream(fake_wisp, page_size: int, body: list, fail_after: int = None) -> str:
+        async def main():
+            chats = ChatHandler().aiter(page_size=page_size)
+            response = await stream_chat_responses(chats)
+            try:
+                async for chunk in response.body_iterator:
+                    body.append(chunk)
+                    if fail_after is not None and len(body) == fail_after:
+                        fake_wisp.failures = [400]
+            finally:
+                await shutdown_aio_protobuf()
+
+        asyncio.run(main())
+        return "".join(body)
+
+    def test_empty_list(self, fake_wisp):
+        """Test no chats are written as an empty array"""
+        assert self.stream(fake_wisp, page_size=2, body=[]) == "[]"
+
+    def test_one_page(self, fake_wisp):
+        """Test a list that fits one page is a complete array, newest first"""
+        create_chats(fake_wisp, 2)
+        chats = json.loads(self.stream(fake_wisp, page_size=5, body=[]))
+        assert [chat["id"] for chat in chats] == ["c1", "c0"]
+        assert chats[0]["title"] == "chat 1"
+        assert fake_wisp.calls["CallAPI"] == 2 + 1
+
+    def test_many_pages(self, fake_wisp):
+        """Test the pages of a long list are joined into one array"""
+        create_chats(fake_wisp, 5)
+        before = fake_wisp.calls["CallAPI"]
+        chats = json.loads(self.stream(fake_wisp, page_size=2, body=[]))
+        assert [chat["id"] for chat in chats] == ["c4", "c3", "c2", "c1", "c0"]
+        assert fake_wisp.calls["CallAPI"] - before == 3
+
+    def test_first_page_failure(self, fake_wisp):
+        """Test a failing first page answers with an error status"""
+
+        async def main():
+            try:
+                await stream_chat_responses(ChatHandler().aiter(page_size=2))
+            finally:
+                await shutdown_aio_protobuf()
+
+        fake_wisp.failures = [400]
+        with pytest.raises(HTTPException) as info:
+            asyncio.run(main())
+        assert info.value.status_code == 400
+
+    def test_later_page_failure(self, fake_wisp):
+        """Test a failing later page aborts the array before its closing bracket"""
+        create_chats(fake_wisp, 5)
+        body = []
+        with pytest.raises(Exception):
+            self.stream(fake_wisp, page_size=2, body=body, fail_after=3)
+        written = "".join(body)
+        assert not written.endswith("]")
+        assert [chat["id"] for chat in json.loads(written + "]")] == ["c4", "c3"]
+
+
+class TestChatPages:
+    """Test the keyset cursor kept over wisp's offset paging"""
+
+    def test_pages_in_order(self, fake_wisp):
+        """Test the pages list every chat once and end with no cursor"""
+        ids = create_chats(fake_wisp, 5)
+        assert read_all(ChatHandler(), limit=2) == ids[::-1]
+
+    def test_chat_bumped_between_pages(self, fake_wisp):
+        """Test a chat updated between pages does not repeat the rows it shifted"""
+        chats = ChatHandler()
+        create_chats(fake_wisp, 5)
+
+        def bump(pages):
+            if pages == 1:
+                chats.update("c0", {"title": "bumped"})
+
+        listed = read_all(chats, limit=2, between_pages=bump)
+        assert listed == ["c4", "c3", "c2", "c1"]
+
+    def test_chat_created_between_pages(self, fake_wisp):
+        """Test a chat created between pages does not repeat the rows it shifted"""
+        chats = ChatHandler()
+        create_chats(fake_wisp, 5)
+
+        def create(pages):
+            chats.create({"id": f"new{pages}"})
+
+        listed = read_all(chats, limit=2, between_pages=create)
+        assert listed == ["c4", "c3", "c2", "c1", "c0"]
+
+    def test_tied_updates(self, fake_wisp):
+        """Test chats updated in the same second are split across pages by id"""
+        chats = ChatHandler()
+        ids = create_chats(fake_wisp, 5)
+        for chat_id in ids:
+            fake_wisp.chats[chat_id]["updated_at"] = 1000
+
+        def create(pages):
+            chats.create({"id": f"new{pages}"})
+
+        assert read_all(chats, limit=2, between_pages=create) == ids[::-1]
+
+    def test_invalid_cursor(self, fake_wisp):
+        """Test a cursor that was not returned by a page is refused"""
+        with pytest.raises(ValueError):
+            ChatHandler().list_page(cursor="not a cursor")
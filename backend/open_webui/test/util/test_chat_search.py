@@ -0,0 +1,67 @@
+from open_webui.utils.chat_search import ChatSearchIndex, SearchQuery, tokenize
+
+
+def make_chat(chat_id, title, content="", updated_at=1, **kwargs):
+    return {
+        "id": chat_id,
+        "title": title,
+        "updated_at": updated_at,
+        "created_at": 0,
+        "chat": {"history": {"messages": {"m1": {"content": content}}}},
+        **kwargs,
+    }
+
+
+class TestChatSearch:
+    """Test the local chat search index"""
+
+    def test_tokenize_cjk_bigrams(self):
+        """Test CJK runs are split into bigrams and words are lowercased"""
+        assert tokenize("Hello 并发编程") == ["hello", "并发", "发编", "编程"]
+        assert tokenize("字") == ["字"]
+
+    def test_parse_filters(self):
+        """Test filter operators are separated from the search terms"""
+        query = SearchQuery.parse("deploy tag:Work_Item folder:Ops pinned:true")
+
+        assert query.terms == ["deploy"]
+        assert query.tags == ["work_item"]
+        assert query.folders == ["Ops"]
+        assert query.pinned is True
+        assert query.archived is None
+
+    def test_search_ranks_title_matches_first(self):
+        """Test a title match outranks a body match and prefixes match"""
+        index = ChatSearchIndex()
+        index.upsert(make_chat("a", "Notes", "kubernetes upgrade"))
+        index.upsert(make_chat("b", "Kubernetes upgrade", "notes"))
+
+        results = index.search(SearchQuery.parse("kube"))
+
+        assert [chat["id"] for chat in results] == ["b", "a"]
+
+    def test_search_requires_all_terms_and_filters(self):
+        """Test every term and filter has to match"""
+        index = ChatSearchIndex()
+        index.upsert(make_chat("a", "python tips", meta={"tags": ["dev"]}))
+        index.upsert(make_chat("b", "python recipes", archived=True))
+
+        assert index.search(SearchQuery.parse("python recipes")) == [
+            {"id": "b", "title": "python recipes", "updated_at": 1, "created_at": 0}
+        ]
+        assert [c["id"] for c in index.search(SearchQuery.parse("python tag:dev"))] == ["a"]
+        assert [c["id"] for c in index.search(SearchQuery.parse("python archived:false"))] == ["a"]
+
+    def test_update_and_remove(self):
+        """Test upserts replace the indexed document and removes drop it"""
+        index = ChatSearchIndex()
+        index.upsert(make_chat("a", "old title"))
+        index.search(SearchQuery.parse("old"))
+        index.upsert(make_chat("a", "new title", updated_at=2))
+
+        assert index.search(SearchQuery.parse("old")) == []
+        assert index.versions() == {"a": 2}
+
+        index.remove("a")
+        assert index.search(SearchQuery.parse("new")) == []
+        assert len(index) == 0
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import aiohttp
+from aiohttp import web
+
+from open_webui.utils.http_client import ClientSessionPool, cleanup_response
+
+
+def new_pool() -> ClientSessionPool:
+    return ClientSessionPool(limit=10, limit_per_host=10, keepalive_timeout=30, dns_ttl=300)
+
+
+async def serve() -> web.AppRunner:
+    async def hello(request):
+        return web.Response(text="hello")
+
+    app = web.Application()
+    app.router.add_get("/", hello)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+def url_of(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}/"
+
+
+class TestClientSessionPool:
+    """Test the pooled upstream sessions and the release of their responses"""
+
+    def test_released_connections_are_reused(self):
+        """Test a response cleaned up after its body was read gives its connection back"""
+
+        async def main():
+            runner = await serve()
+            pool = new_pool()
+            try:
+                url = url_of(runner)
+                for _ in range(3):
+                    r = await pool.get(url).get(url)
+                    assert await r.text() == "hello"
+                    await cleanup_response(r)
+                return pool.stats()[pool._origin(url)], pool.get(url).closed
+            finally:
+                await pool.close()
+                await runner.cleanup()
+
+        stats, closed = asyncio.run(main())
+        assert stats == {"requests": 0, "waiting": 0, "created": 1, "reused": 2}
+        assert not closed
+
+    def test_cleanup_closes_only_one_off_sessions(self):
+        """Test cleanup_response closes the session it is given and no other"""
+
+        async def main():
+            runner = await serve()
+            pool = new_pool()
+            try:
+                url = url_of(runner)
+                pooled = pool.get(url)
+                await cleanup_response(await pooled.get(url))
+                one_off = aiohttp.ClientSession()
+                await cleanup_response(await one_off.get(url), one_off)
+                return pooled.closed, one_off.closed
+            finally:
+                await pool.close()
+                await runner.cleanup()
+
+        assert asyncio.run(main()) == (False, True)
+
+    def test_sessions_of_other_loops_are_closed(self):
+        """Test a session replaced because it belongs to another loop is closed"""
+        pool = new_pool()
+        url = "http://upstream.test/"
+
+        async def main():
+            session = pool.get(url)
+            await asyncio.sleep(0.1)
+            return session
+
+        other = asyncio.new_event_loop()
+        thread = threading.Thread(target=other.run_forever, daemon=True)
+        thread.start()
+        running = asyncio.run_coroutine_threadsafe(main(), other).result()
+        replacing = asyncio.run(main())
+        other.call_soon_threadsafe(other.stop)
+        thread.join()
+        other.close()
+        assert running.closed
+        # and so is one left by a loop that is gone
+        assert not replacing.closed
+
+        async def replace():
+            try:
+                return pool.get(url)
+            finally:
+                await pool.close()
+
+        assert asyncio.run(replace()) is not replacing
+        assert replacing.closed
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from open_webui.socket.pools import RedisSessionPools, SessionPools
+
+
+async def exercise(pools):
+    await pools.add_session("s1", {"id": "u1", "name": "a"})
+    await pools.add_session("s2", {"id": "u1", "name": "a"})
+    await pools.add_session("s3", {"id": "u2", "name": "b"})
+    assert sorted(await pools.get_user_session_ids("u1")) == ["s1", "s2"]
+    assert sorted(await pools.get_active_user_ids()) == ["u1", "u2"]
+    assert [user and user["id"] for user in await pools.get_sessions(["s3", "s9", "s1"])] == ["u2", None, "u1"]
+
+    assert (await pools.remove_session("s1"))["id"] == "u1"
+    assert await pools.is_user_active("u1")
+    await pools.remove_session("s2")
+    assert not await pools.is_user_active("u1")
+    assert await pools.get_active_user_ids() == ["u2"]
+    assert await pools.remove_session("s2") is None
+
+    await pools.record_usage("m1")
+    assert await pools.get_models_in_use() == ["m1"]
+
+
+class TestSessionPools:
+    """Test the session pools of the Socket.IO server"""
+
+    def test_local(self):
+        """Test the in-process pools track sessions, users and models"""
+        asyncio.run(exercise(SessionPools(usage_timeout=3)))
+
+    def test_redis(self):
+        """Test the Redis pools, including invalidation of another worker's cache"""
+        fakeredis = pytest.importorskip("fakeredis")
+
+        async def main():
+            server = fakeredis.FakeServer()
+            pools = RedisSessionPools(
+                fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                "test:{session_pool}", ttl=60, cache_ttl=60, usage_timeout=3,
+            )
+            other = RedisSessionPools(
+                fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                "test:{session_pool}", ttl=60, cache_ttl=60, usage_timeout=3,
+            )
+            task = asyncio.create_task(other.run())
+            await asyncio.sleep(0.1)
+
+            await exercise(pools)
+            await asyncio.sleep(0.1)
+            # `other` cached the users while refreshing, `pools` changed them since
+            assert await other.get_active_user_ids() == ["u2"]
+            assert other.active_user_count == 1
+
+            task.cancel()
+
+        asyncio.run(main())
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from open_webui.jms.chat_buffer import _PendingChat
+from open_webui.socket import emitter
+from open_webui.socket.emitter import EventCoalescer
+
+
+def delta(content: str) -> dict:
+    return {"type": "chat:completion", "data": {"choices": [{"index": 0, "delta": {"content": content}}]}}
+
+
+def snapshot(content: str) -> dict:
+    return {"type": "chat:completion", "data": {"content": content}}
+
+
+def run(coalescer_events, backlog=lambda session_id: 0, interval=0.05, max_events=64):
+    sent = []
+
+    async def send(session_id, event):
+        sent.append((session_id, event))
+
+    async def main():
+        coalescer = EventCoalescer(send, backlog, interval, max_events, max_backlog=4)
+        await coalescer_events(coalescer, sent)
+        return coalescer
+
+    return asyncio.run(main()), sent
+
+
+class TestEventCoalescer:
+    """Test coalescing of streamed chat events per session"""
+
+    def test_merge_in_order(self):
+        """Test deltas and snapshots merge and other events keep their place"""
+
+        async def events(coalescer, sent):
+            for event in (delta("a"), delta("b"), delta("c"), {"type": "status", "data": {}},
+                          snapshot("x"), snapshot("xy")):
+                await coalescer.emit(["s1", "s2"], event)
+            await asyncio.sleep(0.1)
+
+        _, sent = run(events)
+        s1 = [event for session_id, event in sent if session_id == "s1"]
+        assert s1 == [delta("abc"), {"type": "status", "data": {}}, snapshot("xy")]
+        assert len(sent) == 6
+
+    def test_max_events(self):
+        """Test a frame is sent once it holds max_events"""
+
+        async def events(coalescer, sent):
+            for content in "abcde":
+                await coalescer.emit(["s1"], delta(content))
+            await coalescer.flush()
+
+        _, sent = run(events, interval=10, max_events=2)
+        assert [event for _, event in sent] == [delta("ab"), delta("cd"), delta("e")]
+
+    def test_backpressure(self):
+        """Test frames are held back while the socket is backlogged"""
+        queued = {"s1": 10}
+
+        async def events(coalescer, sent):
+            await coalescer.emit(["s1"], snapshot("a"))
+            await asyncio.sleep(0.1)
+            assert sent == []
+            await coalescer.emit(["s1"], snapshot("ab"))
+            queued["s1"] = 0
+            await asyncio.sleep(0.2)
+
+        coalescer, sent = run(events, backlog=queued.get)
+        assert [event for _, event in sent] == [snapshot("ab")]
+        assert coalescer.idle
+
+    def test_backlogged_sessions_drain_together(self, monkeypatch):
+        """Test an event waits for backlogged sessions once, not once per session"""
+        monkeypatch.setattr(emitter, "DRAIN_TIMEOUT", 0.2)
+
+        async def events(coalescer, sent):
+            started = time.monotonic()
+            await coalescer.emit(["s1", "s2", "s3"], {"type": "status", "data": {}})
+            assert time.monotonic() - started < 0.4
+
+        _, sent = run(events, backlog=lambda session_id: 10)
+        assert [session_id for session_id, _ in sent] == ["s1", "s2", "s3"]
+
+
+    def test_stuck_sessions_are_sent_after_drain_timeout(self, monkeypatch):
+        """Test frames of sockets that never drain are sent once DRAIN_TIMEOUT passed"""
+        monkeypatch.setattr(emitter, "DRAIN_TIMEOUT", 0.2)
+
+        async def events(coalescer, sent):
+            await coalescer.emit(["s1", "s2"], snapshot("a"))
+            await asyncio.sleep(0.1)
+            assert sent == []
+            await coalescer.emit(["s1", "s2"], snapshot("ab"))
+            await asyncio.sleep(0.4)
+
+        coalescer, sent = run(events, backlog=lambda session_id: 10)
+        assert sent == [("s1", snapshot("ab")), ("s2", snapshot("ab"))]
+        assert coalescer.idle
+        assert coalescer._timer is None
+
+class TestPendingChatAppends:
+    """Test appends buffered for the chat write-behind"""
+
+    def test_appends(self):
+        """Test appends join the stored values and yield to later sets"""
+        pending = _PendingChat()
+        pending.add_append("m1", "content", "b")
+        pending.add_append("m1", "content", "c")
+        pending.add_append("m1", "files", [{"id": "f2"}], prepend=True)
+        pending.add_append("m1", "files", [{"id": "f3"}], prepend=True)
+        chat = pending.apply({"history": {"messages": {"m1": {"content": "a", "files": [{"id": "f1"}]}}}})
+        message = chat["history"]["messages"]["m1"]
+        assert message["content"] == "abc"
+        assert [file["id"] for file in message["files"]] == ["f3", "f2", "f1"]
+
+        pending.add_message("m1", {"content": "new"})
+        pending.add_append("m1", "content", "!")
+        chat = pending.apply({"history": {"messages": {"m1": {"content": "a"}}}})
+        assert chat["history"]["messages"]["m1"]["content"] == "new!"
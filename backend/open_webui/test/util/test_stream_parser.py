@@ -0,0 +1,78 @@
+import json
+
+from open_webui.utils.stream_parser import ContentBlockParser, ContentBlockRenderer, SSEFramer
+
+TAG_SETS = [
+    ("reasoning", [("<think>", "</think>"), ("◁think▷", "◁/think▷")]),
+    ("solution", [("<|begin_of_solution|>", "<|end_of_solution|>")]),
+    ("code_interpreter", [("<code_interpreter>", "</code_interpreter>")]),
+]
+
+
+def serialize(content_blocks, content="", strip=True):
+    for block in content_blocks:
+        content = f"{content}{block['type']}: {block['content']}\n"
+    return content.strip() if strip else content
+
+
+def parse(text: str, size: int) -> list:
+    content_blocks = [{"type": "text", "content": ""}]
+    parser = ContentBlockParser(content_blocks, TAG_SETS)
+    for i in range(0, len(text), size):
+        if "code_interpreter" in parser.feed(text[i:i + size]):
+            break
+    parser.sync()
+    # Whitespace after an end tag is kept or not depending on the deltas, text blocks are stripped when serialized
+    return [(block["type"], block["content"].strip(), block.get("attributes")) for block in content_blocks]
+
+
+class TestStreamParser:
+    """Test the incremental SSE framer and content block parser"""
+
+    def test_framer(self):
+        """Test payloads are cut at newlines whatever the chunking"""
+        body = 'data: {"a": "你好"}\n\n: ping\ndata: {"b": 1}\r\ndata: [DONE]\n'.encode()
+        for size in (1, 3, len(body)):
+            framer = SSEFramer()
+            payloads = []
+            for i in range(0, len(body), size):
+                payloads += framer.feed(body[i:i + size])
+            payloads += framer.flush()
+            assert [json.loads(payload) for payload in payloads] == [{"a": "你好"}, {"b": 1}]
+
+    def test_tags_split_across_deltas(self):
+        """Test tags are found when deltas cut through them"""
+        text = 'Hi <think mode="fast">a < b\n</think> So ◁think▷x◁/think▷ it is <code_interpreter>print(1)</code_interpreter>'
+        for size in (1, 2, 5, len(text)):
+            assert parse(text, size) == [
+                ("text", "Hi", None),
+                ("reasoning", "a < b", {"mode": "fast"}),
+                ("text", "So", None),
+                ("reasoning", "x", {}),
+                ("text", "it is", None),
+                ("code_interpreter", "print(1)", {}),
+            ]
+
+    def test_reasoning_content(self):
+        """Test reasoning_content deltas end at the first content delta"""
+        content_blocks = []
+        parser = ContentBlockParser(content_blocks, TAG_SETS)
+        parser.feed_reasoning("thinking")
+        parser.feed_reasoning(" hard")
+        parser.feed("done")
+        parser.sync()
+        assert [(block["type"], block["content"]) for block in content_blocks] == [
+            ("reasoning", "thinking hard"),
+            ("text", "done"),
+        ]
+        assert "duration" in content_blocks[0]
+
+    def test_renderer(self):
+        """Test cached rendering matches serializing every block"""
+        content_blocks = [{"type": "text", "content": ""}]
+        parser = ContentBlockParser(content_blocks, TAG_SETS)
+        renderer = ContentBlockRenderer(serialize)
+        for value in ("a", "<think>", "b", "</think>", "c", "<|begin_of_solution|>d"):
+            parser.feed(value)
+            parser.sync()
+            assert renderer.render(content_blocks) == serialize(content_blocks)
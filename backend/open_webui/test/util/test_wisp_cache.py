@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from open_webui.jms import account
+from open_webui.jms.account import AccountChatHandler
+from open_webui.jms.cache import TTLCache
+from open_webui.jms.session.handler import SessionHandler
+from open_webui.jms.wisp.exceptions import WispError
+from open_webui.jms.wisp.protobuf import service_pb2
+
+
+class RejectedError(Exception):
+    pass
+
+
+class TestTTLCache:
+    """Test the two-tier cache of wisp lookups"""
+
+    def test_negative_hit_raises_new_exception(self):
+        """Test a cached failure is raised as a new exception on every hit"""
+
+        async def main():
+            cache = TTLCache("test", negative_ttl=60, negative_exceptions=(RejectedError,))
+
+            async def loader():
+                raise RejectedError("denied", 401)
+
+            raised = []
+            for _ in range(3):
+                with pytest.raises(RejectedError) as info:
+                    await cache.aget_or_load("k", loader)
+                raised.append(info.value)
+            assert raised[1] is not raised[2]
+            assert raised[2].args == ("denied", 401)
+            assert raised[2].__context__ is None
+            assert cache.stats()["loads"] == 1
+
+        asyncio.run(main())
+
+    def test_invalidation_reaches_other_workers(self):
+        """Test invalidating a key drops the local copies of other workers"""
+        fakeredis = pytest.importorskip("fakeredis")
+
+        async def main():
+            server = fakeredis.FakeServer()
+
+            def worker():
+                return TTLCache(
+                    "test",
+                    redis=fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                    dumps=str,
+                    loads=str,
+                )
+
+            first, second = worker(), worker()
+
+            async def load():
+                return "v1"
+
+            assert await first.aget_or_load("k", load) == "v1"
+            assert await second.aget_or_load("k", load) == "v1"
+            await asyncio.sleep(0.1)
+
+            await first.ainvalidate("k")
+            await asyncio.sleep(0.1)
+            assert second.get("k") is None
+
+            second.set("k", "v2")
+            first.clear()
+            await asyncio.sleep(0.1)
+            assert second.get("k") is None
+
+        asyncio.run(main())
+
+    def test_refresh_ahead(self):
+        """Test an entry past its refresh point is served while it reloads in the background"""
+
+        async def main():
+            cache = TTLCache("test", ttl=1, refresh_ahead=0.5)
+            values = iter(["v1", "v2"])
+
+            async def load():
+                await asyncio.sleep(0.05)
+                value = next(values, None)
+                if value is None:
+                    raise RuntimeError("upstream down")
+                return value
+
+            assert await cache.aget_or_load("k", load) == "v1"
+            assert await cache.aget_or_load("k", load) == "v1"
+            assert cache.stats()["refreshes"] == 0
+
+            await asyncio.sleep(0.6)
+            assert await cache.aget_or_load("k", load) == "v1"
+            assert await cache.aget_or_load("k", load) == "v1"
+            await asyncio.sleep(0.1)
+            assert await cache.aget_or_load("k", load) == "v2"
+            assert cache.stats()["refreshes"] == 1
+
+            # A failed refresh leaves the entry serving until it expires
+            await asyncio.sleep(0.6)
+            assert await cache.aget_or_load("k", load) == "v2"
+            await asyncio.sleep(0.1)
+            assert cache.peek("k") == "v2"
+            assert cache.stats()["refreshes"] == 2
+
+        asyncio.run(main())
+
+
+class TestAccountCache:
+    """Test the cache of the account new chats run as"""
+
+    @pytest.fixture(autouse=True)
+    def account_cache(self, monkeypatch):
+        cache = TTLCache("test.account", maxsize=1, ttl=60)
+        monkeypatch.setattr(account, "account_cache", cache)
+        return cache
+
+    def test_prefetch_warms_the_cache(self, fake_wisp):
+        """Test the startup prefetch saves the first new chat its GetAccountChat call"""
+
+        async def main():
+            await AccountChatHandler.start_prefetch()
+            assert fake_wisp.calls["GetAccountChat"] == 1
+            assert (await AccountChatHandler().aget_account())["id"] == fake_wisp.account["id"]
+
+        asyncio.run(main())
+        assert AccountChatHandler().get_account()["id"] == fake_wisp.account["id"]
+        assert fake_wisp.calls["GetAccountChat"] == 1
+
+    def test_failed_prefetch_is_not_raised(self, account_cache, monkeypatch):
+        """Test a prefetch that can't reach wisp leaves the cache empty without raising"""
+
+        async def fail(self):
+            raise WispError("wisp down")
+
+        monkeypatch.setattr(AccountChatHandler, "_aget_account", fail)
+        asyncio.run(AccountChatHandler().aprefetch())
+        assert account_cache.peek(AccountChatHandler.CACHE_KEY) is None
+
+    def test_prefetch_is_cancelled_on_shutdown(self, account_cache, monkeypatch, caplog):
+        """Test a prefetch still waiting on wisp at shutdown is cancelled without an error"""
+
+        async def hang(self):
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(AccountChatHandler, "_aget_account", hang)
+
+        async def main():
+            task = AccountChatHandler.start_prefetch()
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return task
+
+        assert asyncio.run(main()).cancelled()
+        assert account_cache.peek(AccountChatHandler.CACHE_KEY) is None
+        assert "prefetch failed" not in caplog.text
+
+    def test_rejected_session_drops_the_account(self, account_cache):
+        """Test a session wisp refuses to create reloads the account next time"""
+        account_cache.set(AccountChatHandler.CACHE_KEY, {"id": "stale"})
+        resp = service_pb2.SessionCreateResponse(status=service_pb2.Status(ok=False, err="account not found"))
+        with pytest.raises(WispError):
+            SessionHandler._check_response(resp)
+        assert account_cache.peek(AccountChatHandler.CACHE_KEY) is None
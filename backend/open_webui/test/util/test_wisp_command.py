@@ -0,0 +1,68 @@
+import asyncio
+import base64
+import os
+import subprocess
+import sys
+
+from open_webui.jms import command
+from open_webui.jms.command import CommandUploader
+from open_webui.jms.wisp.protobuf import service_pb2
+
+
+def journal(directory, name: str, *sids: str):
+    with open(os.path.join(directory, name), "w", encoding="ascii") as f:
+        for sid in sids:
+            req = service_pb2.CommandRequest(sid=sid)
+            f.write(base64.b64encode(req.SerializeToString()).decode("ascii") + "\n")
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+class TestCommandUploader:
+    """Test the command upload pipeline and its journal"""
+
+    def test_claims_only_journals_of_dead_workers(self, tmp_path, monkeypatch):
+        """Test a journal is replayed only once the worker writing it is gone"""
+        monkeypatch.setattr(CommandUploader, "JOURNAL_DIR", str(tmp_path))
+        live, dead = os.getppid(), dead_pid()
+        journal(tmp_path, f"commands-{live}.journal", "live")
+        journal(tmp_path, f"commands-{dead}.journal", "dead")
+        journal(tmp_path, f"commands-{live}.journal.{dead}.replaying", "abandoned")
+        journal(tmp_path, f"commands-{dead}.journal.{live}.replaying", "replaying")
+
+        uploader = CommandUploader(queue_size=10, batch_size=10, retries=0)
+        reqs = uploader._claim_journal()
+
+        assert sorted(req.sid for req in reqs) == ["abandoned", "dead"]
+        assert sorted(os.listdir(tmp_path)) == sorted([
+            f"commands-{live}.journal",
+            f"commands-{dead}.journal.{live}.replaying",
+        ])
+
+    def test_close_journals_only_unsent_commands(self, tmp_path, monkeypatch):
+        """Test commands sent before shutdown interrupted their batch are not journaled"""
+        monkeypatch.setattr(CommandUploader, "JOURNAL_DIR", str(tmp_path))
+        monkeypatch.setattr(command, "WISP_SHUTDOWN_TIMEOUT", 0.1)
+        uploader = CommandUploader(queue_size=10, batch_size=10, retries=0)
+        sent = []
+
+        async def upload(req):
+            if req.sid == "stuck":
+                await asyncio.Event().wait()
+            sent.append(req.sid)
+
+        uploader._upload = upload
+
+        async def main():
+            uploader.submit(service_pb2.CommandRequest(sid="sent"))
+            uploader.submit(service_pb2.CommandRequest(sid="stuck"))
+            await asyncio.sleep(0.01)
+            await uploader.aclose()
+
+        asyncio.run(main())
+        assert sent == ["sent"]
+        assert [req.sid for req in uploader._claim_journal()] == ["stuck"]
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from open_webui.jms.chat import ChatHandler, delete_many_op, retrieve_many_op, set_op, update_many_op
+from open_webui.jms.check_user import CheckUserHandler
+from open_webui.jms.wisp import shutdown_aio_protobuf
+from open_webui.jms.wisp.exceptions import WispAPIError
+
+
+def new_chat(title: str = "New Chat") -> dict:
+    message_id = str(uuid.uuid4())
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "chat": {
+            "history": {
+                "messages": {message_id: {"id": message_id, "role": "user", "content": "hi"}},
+                "currentId": message_id,
+            },
+        },
+    }
+
+
+class TestFakeWisp:
+    """Test the chat client against the in-process wisp server"""
+
+    def test_chat_round_trip(self, fake_wisp):
+        """Test chats are created, patched, listed and batched over a unix socket"""
+        chats = ChatHandler()
+        chat = chats.create(new_chat("first"))
+        assert chats.retrieve(chat["id"])["title"] == "first"
+
+        message = {"id": "m2", "role": "assistant", "content": "hello"}
+        chats.patch(chat["id"], [set_op("chat", "history", "messages", "m2", value=message)], {})
+        assert chats.retrieve(chat["id"])["chat"]["history"]["messages"]["m2"] == message
+
+        other = chats.create(new_chat("second"))
+        query = {"user_id": chat["user_id"]}
+        page = chats.list_page(query, limit=1)
+        next_page = chats.list_page(query, cursor=page.cursor, limit=1)
+        # The patched chat was updated last
+        assert [row["id"] for row in page.results + next_page.results] == [chat["id"], other["id"]]
+
+        [updated, retrieved] = chats.batch([
+            update_many_op([chat["id"], other["id"]], {"pinned": True}),
+            retrieve_many_op([chat["id"]]),
+        ])
+        assert updated.ok and len(updated.result) == 2
+        assert retrieved.result[0]["pinned"] is True
+
+        chats.destroy(chat["id"])
+        assert chat["id"] not in fake_wisp.chats
+
+    def test_patch_fallback(self, fake_wisp, monkeypatch):
+        """Test only an unsupported patch endpoint switches to full updates"""
+        monkeypatch.setattr(ChatHandler, "_patch_disabled_until", 0.0)
+        chats = ChatHandler()
+        chat = chats.create(new_chat())
+        message = {"id": "m2", "role": "assistant", "content": "hello"}
+        ops = [set_op("chat", "history", "messages", "m2", value=message)]
+        data = {"chat": {"history": {"messages": {"m2": message}}}}
+
+        for status in (500, 400):
+            fake_wisp.failures = [status]
+            with pytest.raises(WispAPIError) as info:
+                chats.patch(chat["id"], ops, data)
+            assert info.value.status_code == status
+            assert ChatHandler._patch_enabled()
+        assert "m2" not in fake_wisp.chats[chat["id"]]["chat"]["history"]["messages"]
+
+        fake_wisp.unsupported = {"patch"}
+        chats.patch(chat["id"], ops, data)
+        assert fake_wisp.chats[chat["id"]]["chat"]["history"]["messages"]["m2"] == message
+        assert not ChatHandler._patch_enabled()
+
+    def test_status_only_from_wisp_status_text(self, fake_wisp, monkeypatch):
+        """Test numbers elsewhere in an error text are not taken for its status"""
+        monkeypatch.setattr(ChatHandler, "_patch_disabled_until", 0.0)
+        chats = ChatHandler()
+        chat = chats.create(new_chat())
+        ops = [set_op("chat", "title", value="renamed")]
+
+        fake_wisp.failures = ["dial tcp 10.1.2.3:405: read 404 bytes: connection reset"]
+        with pytest.raises(WispAPIError) as info:
+            chats.patch(chat["id"], ops, {"title": "renamed"})
+        assert info.value.status_code is None
+        assert ChatHandler._patch_enabled()
+
+        fake_wisp.failures = ["status code: 405 Method Not Allowed"]
+        chats.patch(chat["id"], ops, {"title": "renamed"})
+        assert fake_wisp.chats[chat["id"]]["title"] == "renamed"
+        assert not ChatHandler._patch_enabled()
+
+    def test_patch_fallback_writes_buffered_patches_once(self, fake_wisp, monkeypatch):
+        """Test a message write sent as a full update takes the chat's buffered patches with it"""
+        from open_webui.jms.chat_buffer import ChatWriteBuffer
+        from open_webui.models import chats as chats_module
+
+        buffer = ChatWriteBuffer(interval=10, retries=0)
+        monkeypatch.setattr(chats_module, "chat_write_buffer", buffer)
+        monkeypatch.setattr(ChatHandler, "_patch_disabled_until", 0.0)
+        fake_wisp.unsupported = {"patch"}
+        chat = ChatHandler().create(new_chat())
+        [first_id] = chat["chat"]["history"]["messages"]
+
+        async def main():
+            buffer.add_append(chat["id"], first_id, "content", " there")
+            buffer.add_status(chat["id"], first_id, {"done": True})
+            chats_module.Chats.upsert_message_to_chat_by_id_and_message_id(
+                chat["id"], "m2", {"id": "m2", "role": "assistant", "content": "hello"}
+            )
+            await buffer.flush(chat["id"])
+
+        asyncio.run(main())
+        messages = fake_wisp.chats[chat["id"]]["chat"]["history"]["messages"]
+        assert messages[first_id]["content"] == "hi there"
+        assert messages[first_id]["statusHistory"] == [{"done": True}]
+        assert messages["m2"]["content"] == "hello"
+
+    def test_single_chat_actions_take_one_call(self, fake_wisp, monkeypatch):
+        """Test the archive, folder, tag and delete actions write with one batch call"""
+        from open_webui.models.chats import Chats
+
+        monkeypatch.setattr(ChatHandler, "_batch_disabled_until", 0.0)
+        chat = ChatHandler().create({**new_chat(), "meta": {"tags": ["a", "b"]}})
+        user_id = chat["user_id"]
+
+        def calls(action):
+            before = fake_wisp.calls["CallAPI"]
+            result = action()
+            return result, fake_wisp.calls["CallAPI"] - before
+
+        archived, count = calls(lambda: Chats.toggle_chat_archive_by_id(chat["id"], user_id, chat))
+        assert (archived["archived"], count) == (True, 1)
+        moved, count = calls(lambda: Chats.update_chat_folder_id_by_id_and_user_id(chat["id"], user_id, "f1"))
+        assert (moved["folder_id"], count) == ("f1", 1)
+        tagged, count = calls(lambda: Chats.delete_tag_by_id_and_user_id_and_tag_name(chat["id"], user_id, "a", moved))
+        assert (tagged["meta"]["tags"], count) == (["b"], 1)
+
+        assert Chats.pop_chat_by_id(chat["id"], "someone-else") is None
+        assert Chats.update_chat_folder_id_by_id_and_user_id(chat["id"], "someone-else", "f2") is None
+        assert chat["id"] in fake_wisp.chats
+
+        popped, count = calls(lambda: Chats.pop_chat_by_id(chat["id"], user_id))
+        assert (popped["meta"]["tags"], count) == (["b"], 1)
+        assert chat["id"] not in fake_wisp.chats
+
+    def test_batch_fallback(self, fake_wisp, monkeypatch):
+        """Test only an unsupported batch endpoint runs the ops one by one"""
+        from open_webui.models.chats import Chats
+
+        monkeypatch.setattr(ChatHandler, "_batch_disabled_until", 0.0)
+        chat = ChatHandler().create(new_chat())
+
+        fake_wisp.failures = [500]
+        before = fake_wisp.calls["CallAPI"]
+        assert Chats.pop_chat_by_id(chat["id"]) is None
+        assert fake_wisp.calls["CallAPI"] - before == 1
+        assert chat["id"] in fake_wisp.chats
+        assert ChatHandler._batch_enabled()
+
+        fake_wisp.unsupported = {"batch"}
+        assert Chats.pop_chat_by_id(chat["id"])["id"] == chat["id"]
+        assert chat["id"] not in fake_wisp.chats
+        assert not ChatHandler._batch_enabled()
+
+    def test_async_single_chat_actions_take_one_call(self, fake_wisp, monkeypatch):
+        """Test the async archive, folder and delete actions write with one batch call"""
+        from open_webui.models.chats import Chats
+
+        monkeypatch.setattr(ChatHandler, "_batch_disabled_until", 0.0)
+        chat = ChatHandler().create({**new_chat(), "meta": {"tags": ["a"]}})
+        user_id = chat["user_id"]
+
+        async def calls(action):
+            before = fake_wisp.calls["CallAPI"]
+            result = await action
+            return result, fake_wisp.calls["CallAPI"] - before
+
+        async def main():
+            try:
+                archived, count = await calls(Chats.atoggle_chat_archive_by_id(chat["id"], user_id, chat))
+                assert (archived["archived"], count) == (True, 1)
+                moved, count = await calls(Chats.aupdate_chat_folder_id_by_id_and_user_id(chat["id"], user_id, "f1"))
+                assert (moved["folder_id"], count) == ("f1", 1)
+
+                assert await Chats.apop_chat_by_id(chat["id"], "someone-else") is None
+                assert chat["id"] in fake_wisp.chats
+                return await calls(Chats.apop_chat_by_id(chat["id"], user_id))
+            finally:
+                await shutdown_aio_protobuf()
+
+        popped, count = asyncio.run(main())
+        assert (popped["meta"]["tags"], count) == (["a"], 1)
+        assert chat["id"] not in fake_wisp.chats
+
+    def test_async_chat_actions(self, fake_wisp):
+        """Test the update, pin, share and tag actions of the async routes"""
+        from open_webui.models.chats import Chats
+
+        chat = ChatHandler().create({**new_chat(), "meta": {"tags": ["a", "b"]}, "share_id": "s1"})
+        user_id = chat["user_id"]
+
+        async def main():
+            try:
+                updated = await Chats.aupdate_chat_by_id(chat["id"], {**chat["chat"], "title": "renamed"})
+                assert updated["title"] == "renamed"
+                assert (await Chats.atoggle_chat_pinned_by_id(chat["id"]))["pinned"] is True
+                assert (await Chats.aupdate_chat_share_id_by_id(chat["id"], None))["share_id"] is None
+                untagged = await Chats.adelete_tag_by_id_and_user_id_and_tag_name(chat["id"], user_id, "a")
+                assert untagged["meta"]["tags"] == ["b"]
+                assert await Chats.adelete_all_tags_by_id_and_user_id(chat["id"], user_id, untagged)
+            finally:
+                await shutdown_aio_protobuf()
+
+        asyncio.run(main())
+        stored = fake_wisp.chats[chat["id"]]
+        assert (stored["title"], stored["pinned"], stored["share_id"]) == ("renamed", True, None)
+        assert stored["meta"]["tags"] == []
+
+    def test_batch_fallback_reports_each_failed_chat(self, fake_wisp, monkeypatch):
+        """Test ops run chat by chat try every chat and name the ones that failed"""
+        from open_webui.models.chats import Chats
+
+        monkeypatch.setattr(ChatHandler, "_batch_disabled_until", 0.0)
+        fake_wisp.unsupported = {"batch"}
+        chats = ChatHandler()
+        first, last = chats.create(new_chat()), chats.create(new_chat())
+        ids = [first["id"], "missing", last["id"]]
+
+        [result] = chats.batch([update_many_op(ids, {"pinned": True})])
+        assert not result.ok
+        assert [chat["id"] for chat in result.result] == [first["id"], last["id"]]
+        assert result.error.startswith("missing: ")
+
+        async def main():
+            try:
+                [updated] = await chats.abatch([update_many_op(ids, {"archived": True})])
+                archived = await Chats.aarchive_chats_by_ids_and_user_id(ids, first["user_id"], archived=False)
+                [deleted] = await chats.abatch([delete_many_op(ids)])
+                return updated, archived, deleted
+            finally:
+                await shutdown_aio_protobuf()
+
+        updated, archived, deleted = asyncio.run(main())
+        assert not updated.ok and "missing: " in updated.error
+        assert [chat["archived"] for chat in updated.result] == [True, True]
+        # the chats that were updated are returned
+        assert [chat["archived"] for chat in archived] == [False, False]
+        assert (deleted.ok, deleted.result) == (False, [first["id"], last["id"]])
+        assert "missing: " in deleted.error
+        assert fake_wisp.chats == {}
+
+    def test_batch_indexes_only_whole_chats(self, monkeypatch):
+        """Test chats a batch updated in part are dropped from the search index"""
+        from open_webui.jms import chat as chat_module
+
+        upserted, removed = [], []
+
+        class Indexes:
+            def upsert(self, chat):
+                upserted.append(chat["id"])
+
+            def remove(self, chat_id):
+                removed.append(chat_id)
+
+        monkeypatch.setattr(chat_module, "chat_search_indexes", Indexes())
+        whole = {"id": "c1", "user_id": "u", "chat": {}, "updated_at": 2}
+        body = json.dumps({"results": [
+            {"ok": True, "result": [whole, {"id": "c2", "updated_at": 2}]},
+            {"ok": False, "error": "boom"},
+        ]}).encode()
+        ops = [update_many_op(["c1", "c2", "c3"], {"pinned": True}), update_many_op(["c4"], {"pinned": True})]
+
+        results = ChatHandler._batch_results(ops, body)
+        assert [result.ok for result in results] == [True, False]
+        assert upserted == ["c1"]
+        assert removed == ["c2", "c3", "c4"]
+
+    def test_protobuf_negotiation(self, fake_wisp, monkeypatch):
+        """Test chats travel as protobuf once wisp answered with it, and are cached as such"""
+        from open_webui.jms import chat as chat_module
+
+        monkeypatch.setattr(chat_module, "WISP_CHAT_CODEC", "protobuf")
+        monkeypatch.setattr(ChatHandler, "_protobuf_accepted", False)
+        chats = ChatHandler()
+        chat = chats.create(new_chat("first"))
+        assert ChatHandler._protobuf_accepted
+
+        updated = chats.update(chat["id"], {**chat, "title": "second"})
+        assert updated["title"] == fake_wisp.chats[chat["id"]]["title"] == "second"
+        assert isinstance(chat_module.chat_cache.get(chat["id"])[1], bytes)
+        assert chats.retrieve(chat["id"])["title"] == "second"
+
+    def test_json_answer_to_protobuf_request(self, monkeypatch):
+        """Test a JSON chat answered to a request accepting protobuf is read as JSON"""
+        from open_webui.jms import chat as chat_module
+
+        monkeypatch.setattr(chat_module, "WISP_CHAT_CODEC", "protobuf")
+        monkeypatch.setattr(ChatHandler, "_protobuf_accepted", False)
+        body = b'\n{"id": "c1", "chat": {}, "updated_at": 1}'
+
+        assert ChatHandler._loads_chat(chat_module.CHAT_URL, body) == (json.loads(body), False)
+        assert ChatHandler()._cache_entry(chat_module.CHAT_URL, body) == (1, body.decode())
+        assert not ChatHandler._protobuf_accepted
+
+    def test_fresh_retrieve(self, fake_wisp):
+        """Test a fresh read skips the cached copy another worker outdated"""
+        chats = ChatHandler()
+        chat = chats.create(new_chat())
+        assert chats.retrieve(chat["id"])["title"] == "New Chat"
+        fake_wisp.chats[chat["id"]]["title"] = "Renamed elsewhere"
+
+        assert chats.retrieve(chat["id"])["title"] == "New Chat"
+        assert chats.retrieve(chat["id"], fresh=True)["title"] == "Renamed elsewhere"
+        assert chats.retrieve(chat["id"])["title"] == "Renamed elsewhere"
+
+    def test_big_chat_and_user(self, fake_wisp):
+        """Test documents above the default 4 MB gRPC limit and the async path"""
+        chats = ChatHandler()
+        data = new_chat()
+        message_id = data["chat"]["history"]["currentId"]
+        data["chat"]["history"]["messages"][message_id]["content"] = "x" * (6 * 1024 * 1024)
+
+        async def run():
+            chat = await chats.acreate(data)
+            user = await CheckUserHandler().acheck_user_by_cookie_map({})
+            return chat, user
+
+        chat, user = asyncio.run(run())
+        assert len(chat["chat"]["history"]["messages"][message_id]["content"]) == 6 * 1024 * 1024
+        assert user.id == fake_wisp.user["id"]
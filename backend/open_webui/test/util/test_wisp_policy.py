@@ -0,0 +1,89 @@
+import asyncio
+
+import grpc
+import pytest
+from unittest.mock import patch
+
+from open_webui.jms.wisp.exceptions import WispUnavailableError
+from open_webui.jms.wisp.policy import CircuitBreaker, PolicyStub
+from open_webui.jms.wisp.protobuf import service_pb2
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+class FakeStub:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def CallAPI(self, request, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestWispPolicy:
+    """Test deadlines, retries and the circuit breaker of wisp RPCs"""
+
+    @patch("open_webui.jms.wisp.policy.time.sleep")
+    def test_read_is_retried_with_deadline(self, sleep):
+        """Test an idempotent call is retried while wisp is unavailable"""
+        stub = FakeStub(FakeRpcError(grpc.StatusCode.UNAVAILABLE), "ok")
+        breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=10)
+        request = service_pb2.HTTPRequest(method="GET", path="/")
+
+        assert PolicyStub(stub, breaker=breaker).CallAPI(request) == "ok"
+        assert len(stub.calls) == 2
+        assert stub.calls[0]["timeout"] > 0
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @patch("open_webui.jms.wisp.policy.time.sleep")
+    def test_read_on_event_loop_is_not_retried(self, sleep):
+        """Test a sync call made from a coroutine fails at once instead of sleeping on the loop"""
+        stub = FakeStub(FakeRpcError(grpc.StatusCode.UNAVAILABLE), "ok")
+        breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=10)
+        request = service_pb2.HTTPRequest(method="GET", path="/")
+
+        async def main():
+            PolicyStub(stub, breaker=breaker).CallAPI(request)
+
+        with pytest.raises(grpc.RpcError):
+            asyncio.run(main())
+        assert len(stub.calls) == 1
+        sleep.assert_not_called()
+
+    def test_write_is_not_retried(self):
+        """Test a non-idempotent call fails on the first error"""
+        stub = FakeStub(FakeRpcError(grpc.StatusCode.UNAVAILABLE), "ok")
+        breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=10)
+        request = service_pb2.HTTPRequest(method="POST", path="/")
+
+        with pytest.raises(grpc.RpcError):
+            PolicyStub(stub, breaker=breaker).CallAPI(request)
+        assert len(stub.calls) == 1
+
+    def test_breaker_opens_and_probes(self):
+        """Test the breaker fails fast when open and closes after a probe"""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+        breaker.record(FakeRpcError(grpc.StatusCode.UNAVAILABLE))
+        breaker.record(FakeRpcError(grpc.StatusCode.DEADLINE_EXCEEDED))
+
+        with pytest.raises(WispUnavailableError):
+            breaker.before_call("CallAPI")
+
+        with patch("open_webui.jms.wisp.policy.time.monotonic", return_value=breaker._opened_at + 1):
+            breaker.before_call("CallAPI")
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            with pytest.raises(WispUnavailableError):
+                breaker.before_call("CallAPI")
+
+        breaker.record(FakeRpcError(grpc.StatusCode.NOT_FOUND))
+        assert breaker.state == CircuitBreaker.CLOSED
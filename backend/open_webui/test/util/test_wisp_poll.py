@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+from open_webui.jms import poll
+from open_webui.jms.chat import ChatHandler
+from open_webui.jms.poll import PollJMSEvent
+from open_webui.jms.session.handler import JMSSession, SessionCloser
+from open_webui.jms.wisp import shutdown_aio_protobuf
+from open_webui.jms.wisp.protobuf.common_pb2 import KillSession, TerminalTask
+
+
+def kill(session_id: str) -> TerminalTask:
+    return TerminalTask(id=f"task-{session_id}", action=KillSession, session_id=session_id)
+
+
+async def until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+class TestPollJMSEvent:
+    """Test the dispatcher of wisp's tasks against the fake wisp"""
+
+    def test_kill_burst_takes_one_lookup(self, fake_wisp, monkeypatch):
+        """Test a burst of kill tasks is looked up once and each task is acknowledged"""
+        monkeypatch.setattr(poll, "WISP_DISPATCH_BATCH_WINDOW", 0.3)
+        monkeypatch.setattr(poll, "session_closer", SessionCloser(concurrency=4))
+        closed, stopped = [], []
+
+        async def close(self):
+            closed.append(self.chat_id)
+
+        async def stop_item_tasks(redis, item_id):
+            stopped.append((threading.current_thread(), item_id))
+
+        monkeypatch.setattr(JMSSession, "close", close)
+        monkeypatch.setattr("open_webui.tasks.stop_item_tasks", stop_item_tasks)
+
+        chats = ChatHandler()
+        session_ids = [chats.create({"id": f"s{i}", "chat": {}, "session_info": {}})["id"] for i in range(3)]
+
+        app_loop = asyncio.new_event_loop()
+        app_thread = threading.Thread(target=app_loop.run_forever, daemon=True)
+        app_thread.start()
+        dispatcher = PollJMSEvent()
+        dispatcher.app_loop = app_loop
+
+        async def main():
+            stream = asyncio.create_task(dispatcher.dispatch_tasks())
+            await until(lambda: fake_wisp.calls["DispatchTask"])
+            lookups = fake_wisp.calls["CallAPI"]
+            for session_id in session_ids:
+                fake_wisp.dispatch(kill(session_id))
+            await until(lambda: len(fake_wisp.finished_tasks) == len(session_ids))
+            lookups = fake_wisp.calls["CallAPI"] - lookups
+            stream.cancel()
+            await shutdown_aio_protobuf()
+            return lookups
+
+        try:
+            lookups = asyncio.run(main())
+        finally:
+            app_loop.call_soon_threadsafe(app_loop.stop)
+            app_thread.join()
+            app_loop.close()
+
+        assert lookups == 1
+        assert sorted(fake_wisp.finished_tasks) == [f"task-{session_id}" for session_id in session_ids]
+        assert sorted(closed) == session_ids
+        assert sorted(item_id for _, item_id in stopped) == session_ids
+        assert {thread for thread, _ in stopped} == {app_thread}
+        assert dispatcher.stats()["completed"] == 3
+
+    def test_reconnects_after_stream_break(self, fake_wisp, monkeypatch):
+        """Test the dispatcher opens a new task stream once wisp ends the current one"""
+        monkeypatch.setattr(poll, "session_closer", SessionCloser(concurrency=4))
+        dispatcher = PollJMSEvent()
+
+        async def main():
+            run = asyncio.create_task(dispatcher.run())
+            fake_wisp.dispatch(kill("before"))
+            await until(lambda: fake_wisp.finished_tasks == ["task-before"])
+
+            fake_wisp.end_streams()
+            await until(lambda: fake_wisp.calls["DispatchTask"] == 2)
+            fake_wisp.dispatch(kill("after"))
+            await until(lambda: fake_wisp.finished_tasks == ["task-before", "task-after"])
+            run.cancel()
+            await shutdown_aio_protobuf()
+
+        asyncio.run(main())
+        stats = dispatcher.stats()
+        assert stats["reconnects"] == 1
+        assert stats["completed"] == 2
+        assert stats["backlog"] == 0
@@ -0,0 +1,50 @@
+from open_webui.jms.wisp.pool import ChannelPool, ROUND_ROBIN, LEAST_OUTSTANDING, _Balancer
+
+
+class FakeChannel:
+    def __init__(self, target):
+        self.target = target
+        self.calls = []
+        self.closed = False
+
+    def unary_unary(self, method, **kwargs):
+        return lambda request, **kw: self.calls.append((method, request)) or self.target
+
+    def stream_stream(self, method, **kwargs):
+        return lambda requests, **kw: (self, method)
+
+    def close(self):
+        self.closed = True
+
+
+class TestWispPool:
+    """Test channel selection of the wisp channel pool"""
+
+    def test_round_robin(self):
+        """Test round-robin takes the channels in turn"""
+        balancer = _Balancer(3, ROUND_ROBIN)
+        assert [balancer.acquire() for _ in range(4)] == [0, 1, 2, 0]
+
+    def test_least_outstanding(self):
+        """Test the channel with the fewest calls in flight is picked"""
+        balancer = _Balancer(3, LEAST_OUTSTANDING)
+        first, second = balancer.acquire(), balancer.acquire()
+        assert {first, second} == {0, 1}
+        balancer.release(first)
+        assert balancer.acquire() in (first, 2)
+        assert balancer.outstanding.count(0) == 1
+
+    def test_addresses_and_streams(self):
+        """Test calls spread over the addresses and streams use their own channel"""
+        pool = ChannelPool(["a:1", "unix:/run/b.sock"], 1, ROUND_ROBIN, FakeChannel)
+        call_api = pool.unary_unary("/message.Service/CallAPI")
+        assert [call_api(i) for i in range(4)] == ["a:1", "unix:/run/b.sock"] * 2
+        assert pool.balancer.outstanding == [0, 0]
+
+        dispatch = pool.stream_stream("/message.Service/DispatchTask")
+        channel, _ = dispatch(iter(()))
+        assert channel not in pool.channels and channel.target == "a:1"
+
+        pool.reset_stream_channel()
+        assert channel.closed
+        assert dispatch(iter(()))[0].target == "unix:/run/b.sock"
@@ -0,0 +1,117 @@
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+
+from open_webui.jms import replay
+from open_webui.jms.replay import ReplayHandler, ReplayUploader, ReplayWriter, ReplayWriterRegistry
+from open_webui.jms.session.handler import JMSSession
+
+
+def rows(path) -> list:
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestReplay:
+    """Test the replay writer and uploader"""
+
+    def test_row_after_upload_keeps_session_timing(self, tmp_path):
+        """Test a writer reopening an uploaded replay times rows from its header"""
+        path = tmp_path / "s1.cast"
+        started = int(time.time()) - 60
+        with path.open("w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": 2, "timestamp": started}) + "\n")
+            f.write(json.dumps([1.0, "o", "before"]) + "\n")
+
+        writer = ReplayWriter(path)
+        writer.write_input("after")
+        writer.finish()
+
+        header, before, after = rows(path)
+        assert header["timestamp"] == started
+        assert 59 <= after[0] <= 62
+
+    def test_gzip_upload_replaces_the_cast(self, tmp_path, monkeypatch):
+        """Test only the .gz is left to upload, and a later row extends it"""
+        monkeypatch.setattr(replay, "ENABLE_WISP_REPLAY_GZIP", True)
+        uploader = ReplayUploader(workers=1, retries=0)
+        sent = []
+        monkeypatch.setattr(uploader, "_send", lambda session_id, path: sent.append(path.name))
+
+        writer = ReplayWriter(tmp_path / "s1.cast")
+        replay.replay_executor.submit(writer.write_input, "first").result()
+        uploader.submit("s1", writer).result()
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["s1.cast.gz"]
+
+        writer = ReplayWriter(tmp_path / "s1.cast")
+        replay.replay_executor.submit(writer.write_input, "second").result()
+        uploader.submit("s1", writer).result()
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["s1.cast.gz"]
+        assert sent == ["s1.cast.gz", "s1.cast.gz"]
+
+        with gzip.open(tmp_path / "s1.cast.gz", "rt", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 3
+        assert "first" in lines[1][2] and "second" in lines[2][2]
+
+    def test_row_during_compression_is_kept(self, tmp_path, monkeypatch):
+        """Test a row written while the replay is compressed extends the next upload"""
+        monkeypatch.setattr(replay, "ENABLE_WISP_REPLAY_GZIP", True)
+        monkeypatch.setattr(replay, "replay_writers", ReplayWriterRegistry(str(tmp_path), 4))
+        uploader = ReplayUploader(workers=1, retries=0)
+        monkeypatch.setattr(uploader, "_send", lambda session_id, path: None)
+        compressing = threading.Event()
+        replace = os.replace
+
+        def slow_replace(src, dst):
+            compressing.set()
+            time.sleep(0.2)
+            replace(src, dst)
+
+        monkeypatch.setattr(replay.os, "replace", slow_replace)
+
+        ReplayHandler("s1").write_input("first")
+        upload = uploader.submit("s1", replay.replay_writers.pop("s1"))
+        assert compressing.wait(5)
+        ReplayHandler("s1").write_input("late").result()
+        upload.result()
+        uploader.submit("s1", replay.replay_writers.pop("s1")).result()
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["s1.cast.gz"]
+        with gzip.open(tmp_path / "s1.cast.gz", "rt", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert "first" in lines[1][2] and "late" in lines[2][2]
+
+    def test_uploaded_checksums_are_bounded(self, tmp_path, monkeypatch):
+        """Test the uploader remembers the checksums of recent sessions only"""
+        monkeypatch.setattr(ReplayUploader, "UPLOADED_MAX", 2)
+        uploader = ReplayUploader(workers=1, retries=0)
+        monkeypatch.setattr(uploader, "_send", lambda session_id, path: None)
+        for session_id in ("s1", "s2", "s3"):
+            uploader.submit(session_id, ReplayWriter(tmp_path / f"{session_id}.cast")).result()
+        assert list(uploader._uploaded) == ["s2", "s3"]
+
+    def test_session_finished_after_replay_upload(self, tmp_path, monkeypatch):
+        """Test FinishSession is sent only once the replay was uploaded"""
+        monkeypatch.setattr(replay, "replay_writers", ReplayWriterRegistry(str(tmp_path), 4))
+        events = []
+
+        def send(session_id, path):
+            time.sleep(0.1)
+            events.append("upload")
+
+        async def close_session(self):
+            events.append("finish")
+
+        monkeypatch.setattr(replay.replay_uploader, "_send", send)
+        monkeypatch.setattr(JMSSession, "close_session", close_session)
+
+        async def main():
+            ReplayHandler("s1").write_input("hi")
+            await JMSSession({"id": "s1", "session_info": {}}).close()
+
+        asyncio.run(main())
+        assert events == ["upload", "finish"]
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from collections import Counter
+
+from open_webui.jms.session.handler import JMSSession, SessionCloser
+
+
+class TestSessionCloser:
+    """Test background session closes requested from several loops"""
+
+    def test_closes_from_another_loop_run_once_on_the_bound_loop(self, monkeypatch):
+        """Test a chat closed from two loops at once is closed once, on the bound loop"""
+        closed = Counter()
+        loops = set()
+
+        async def close(self):
+            loops.add(asyncio.get_running_loop())
+            await asyncio.sleep(0.05)
+            closed[self.chat_id] += 1
+
+        monkeypatch.setattr(JMSSession, "close", close)
+        closer = SessionCloser(concurrency=2)
+        chats = [{"id": "c1", "session_info": {}}, {"id": "c2", "session_info": {}}]
+
+        home = asyncio.new_event_loop()
+        thread = threading.Thread(target=home.run_forever, daemon=True)
+        thread.start()
+        closer.bind(home)
+
+        async def other():
+            futures = closer.close(chats) + closer.close(chats[:1])
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+            closer.close(chats[1:])
+            await closer.wait(1)
+
+        try:
+            asyncio.run(other())
+        finally:
+            home.call_soon_threadsafe(home.stop)
+            thread.join()
+            home.close()
+
+        assert loops == {home}
+        assert closed == {"c1": 1, "c2": 2}
+        assert not closer._closing
@@ -0,0 +1,46 @@
+import time
+
+from open_webui.jms.wisp.protobuf import common_pb2, service_pb2
+from open_webui.jms.wisp.telemetry import SlowCalls, _request_ids
+
+
+def call(method, seconds_ago=0.0):
+    return {"time": time.time() - seconds_ago, "method": method}
+
+
+class TestWispTelemetry:
+    """Test the slow wisp call log and the ids put on wisp spans"""
+
+    def test_slowest_calls_in_window(self):
+        """Test the slowest calls are kept per minute and filtered by age"""
+        log = SlowCalls(window=60, per_minute=2)
+        log.record(5.0, call("fast"))
+        log.record(50.0, call("slow"))
+        log.record(30.0, call("medium"))
+        log.record(500.0, call("old", seconds_ago=600))
+
+        assert [c["method"] for c in log.slowest(minutes=5, limit=10)] == ["slow", "medium"]
+        assert [c["method"] for c in log.slowest(minutes=20, limit=1)] == ["old"]
+
+    def test_old_minutes_are_dropped(self):
+        """Test minutes past the window are forgotten"""
+        log = SlowCalls(window=2, per_minute=5)
+        log.record(500.0, call("old", seconds_ago=600))
+        log.record(1.0, call("new"))
+
+        assert [c["method"] for c in log.slowest(minutes=60, limit=10)] == ["new"]
+
+    def test_request_ids(self):
+        """Test chat and session ids are read from wisp requests"""
+        chat = service_pb2.HTTPRequest(method="GET", path="/api/v1/terminal/chats/c1/")
+        batch = service_pb2.HTTPRequest(method="POST", path="/api/v1/terminal/chats/batch/")
+        command = service_pb2.CommandRequest(sid="s1")
+        create = service_pb2.SessionCreateRequest(data=common_pb2.Session(id="s2"))
+
+        assert _request_ids("CallAPI", chat) == {"chat.id": "c1"}
+        assert _request_ids("CallAPI", batch) == {}
+        assert _request_ids("UploadCommand", command) == {"session.id": "s1"}
+        assert _request_ids("CreateSession", create) == {"session.id": "s2"}
+        assert _request_ids("FinishSession", service_pb2.SessionFinishRequest(id="s3")) == {
+            "session.id": "s3"
+        }
@@ -0,0 +1,137 @@
+import asyncio
+
+import pycrdt as Y
+import pytest
+
+from open_webui.socket.utils import YdocManager
+
+
+def edits(count: int):
+    """Updates of a document typing `count` characters."""
+    return typing("".join(str(i % 10) for i in range(count)))
+
+
+def typing(chars: str):
+    """Updates of a document typing `chars` one by one."""
+    ydoc = Y.Doc()
+    text = ydoc.get("text", type=Y.Text)
+    updates = []
+    ydoc.observe(lambda event: updates.append(event.update))
+    for char in chars:
+        text += char
+    return updates
+
+
+def text_of(state: bytes) -> str:
+    ydoc = Y.Doc()
+    ydoc.apply_update(state)
+    return str(ydoc.get("text", type=Y.Text))
+
+
+class TestYdocManager:
+    """Test the state and update log of collaborative documents"""
+
+    def test_local(self):
+        """Test the in-process manager keeps one Y.Doc per document"""
+
+        async def main():
+            manager = YdocManager()
+            for update in edits(12):
+                await manager.append_to_updates("note:1", list(update))
+            assert text_of(await manager.get_state("note:1")) == "012345678901"
+            assert await manager.document_exists("note:1")
+            await manager.clear_document("note:1")
+            assert not await manager.document_exists("note:1")
+
+        asyncio.run(main())
+
+    def test_redis_compaction(self):
+        """Test the log is folded into a snapshot and other workers catch up"""
+        fakeredis = pytest.importorskip("fakeredis")
+
+        async def main():
+            server = fakeredis.FakeServer()
+            redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+            manager = YdocManager(redis, "test:ydoc", compact_updates=10)
+            other = YdocManager(
+                fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                "test:ydoc",
+                compact_updates=10,
+            )
+
+            updates = edits(25)
+            for update in updates[:5]:
+                await manager.append_to_updates("note:1", list(update))
+            # Cached by both workers before the compactions
+            assert text_of(await other.get_state("note:1")) == "01234"
+            assert text_of(await manager.get_state("note:1")) == "01234"
+
+            for update in updates[5:]:
+                await manager.append_to_updates("note:1", list(update))
+            assert await redis.llen("test:ydoc:{note_1}:updates") < 10
+            assert int(await redis.get("test:ydoc:{note_1}:offset")) >= 10
+
+            expected = "0123456789" * 2 + "01234"
+            assert text_of(await manager.get_state("note:1")) == expected
+            assert text_of(await other.get_state("note:1")) == expected
+            assert text_of(await YdocManager(redis, "test:ydoc").get_state("note:1")) == expected
+
+            await manager.add_user("note:1", "s1")
+            await manager.add_user("note:1", "s2")
+            await manager.append_to_updates("note:2", list(updates[0]))
+            await manager.add_user("note:2", "s3")
+            await manager.remove_user_from_all_documents("s1")
+            await manager.sweep(grace=0)
+            assert await other.document_exists("note:1")
+
+            await manager.remove_user_from_all_documents("s2")
+            await manager.sweep(grace=60)
+            assert await other.document_exists("note:1")
+            await manager.sweep(grace=0)
+            assert not await other.document_exists("note:1")
+            assert await other.document_exists("note:2")
+            assert await other.get_users("note:2") == ["s3"]
+
+            # A stale cache doesn't outlive the document
+            await manager.append_to_updates("note:1", list(updates[0]))
+            assert text_of(await other.get_state("note:1")) == "0"
+
+        asyncio.run(main())
+
+    def test_redis_restarted_document(self):
+        """Test a worker doesn't serve its cache of a document swept and started again"""
+        fakeredis = pytest.importorskip("fakeredis")
+
+        async def main():
+            server = fakeredis.FakeServer()
+            a = YdocManager(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), "test:ydoc")
+            b = YdocManager(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), "test:ydoc")
+
+            for update in typing("abc"):
+                await a.append_to_updates("note:1", list(update))
+            await b.add_user("note:1", "s1")
+            assert text_of(await b.get_state("note:1")) == "abc"
+
+            await b.remove_user("note:1", "s1")
+            await a.sweep(grace=0)
+            assert not await a.document_exists("note:1")
+
+            # As many log entries as b has applied
+            for update in typing("XYZ"):
+                await a.append_to_updates("note:1", list(update))
+            assert text_of(await b.get_state("note:1")) == "XYZ"
+
+        asyncio.run(main())
+
+    def test_redis_user_sets_expire(self):
+        """Test the user sets of a document and of a session get an expiry"""
+        fakeredis = pytest.importorskip("fakeredis")
+
+        async def main():
+            redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+            manager = YdocManager(redis, "test:ydoc", users_ttl=60)
+            await manager.add_user("note:1", "s1")
+            assert 0 < await redis.ttl("test:ydoc:{note_1}:users") <= 60
+            assert 0 < await redis.ttl("test:ydoc:session:s1:documents") <= 60
+
+        asyncio.run(main())
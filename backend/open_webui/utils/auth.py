@@ -210,7 +210,7 @@ def get_http_authorization_cred(auth_header: Optional[str]):
         return None
 
 
-def get_current_user(
+async def get_current_user(
     request: Request,
     response: Response,
     background_tasks: BackgroundTasks,
@@ -252,7 +252,7 @@ def get_current_user(
     #             )
     check_user_handler = check_user.CheckUserHandler()
     try:
-        user = check_user_handler.check_user_by_cookies(request)
+        user = await check_user_handler.acheck_user_by_cookies(request)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
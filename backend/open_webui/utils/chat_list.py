@@ -0,0 +1,43 @@
+import logging
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from open_webui.constants import ERROR_MESSAGES
+from open_webui.env import SRC_LOG_LEVELS
+from open_webui.models.chats import ChatResponse
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
+
+async def stream_chat_responses(chats: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    JSON array of ChatResponse, written as the pages arrive from wisp.
+
+    The first page is fetched before answering, so a failing wisp shows as
+    an error status. A later failure aborts the response before the closing
+    bracket, so a partial list never reads as a complete one.
+    """
+    try:
+        first = await anext(chats, None)
+    except Exception as e:
+        log.exception(e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.DEFAULT()
+        )
+
+    async def body():
+        yield "["
+        if first is not None:
+            yield ChatResponse(**first).model_dump_json()
+            try:
+                async for chat in chats:
+                    yield "," + ChatResponse(**chat).model_dump_json()
+            except Exception as e:
+                log.error(f"Aborting chat list response: {e}")
+                raise
+        yield "]"
+
+    return StreamingResponse(body(), media_type="application/json")
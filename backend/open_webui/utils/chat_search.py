@@ -0,0 +1,326 @@
+import math
+import re
+import time
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from open_webui.env import WISP_CHAT_SEARCH_MAX_USERS
+
+# Hiragana/Katakana, CJK ideographs and extensions, Hangul, compatibility ideographs
+_CJK = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+TITLE_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms matched only as a prefix of the query term count a little less
+PREFIX_DISCOUNT = 0.8
+
+FILTER_PREFIXES = ("tag:", "folder:", "pinned:", "archived:", "shared:")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens; runs of CJK characters, which are not separated
+    by spaces, become overlapping bigrams (a single character stays as is).
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.replace(" ", "_").lower()
+
+
+def _parse_bool(value: str) -> Optional[bool]:
+    return {"true": True, "false": False}.get(value.lower())
+
+
+@dataclass
+class SearchQuery:
+    terms: List[str] = field(default_factory=list)
+    tags: List[str] = field(default_factory=list)
+    folders: List[str] = field(default_factory=list)
+    pinned: Optional[bool] = None
+    archived: Optional[bool] = None
+    shared: Optional[bool] = None
+
+    @classmethod
+    def parse(cls, text: str) -> "SearchQuery":
+        """
+        Split sidebar search text into free-text terms and the filter
+        operators tag:, folder:, pinned:, archived: and shared:.
+        """
+        query = cls()
+        words = []
+        for word in text.replace("\u0000", "").strip().split():
+            name, sep, value = word.partition(":")
+            name = name.lower()
+            if not sep or f"{name}:" not in FILTER_PREFIXES:
+                words.append(word)
+            elif not value:
+                continue
+            elif name == "tag":
+                query.tags.append(normalize_tag(value))
+            elif name == "folder":
+                query.folders.append(value)
+            else:
+                setattr(query, name, _parse_bool(value))
+        query.terms = tokenize(" ".join(words))
+        return query
+
+
+@dataclass
+class _Doc:
+    title: str
+    created_at: int
+    updated_at: int
+    length: int
+    terms: Counter
+    tags: Set[str]
+    folder_id: Optional[str]
+    pinned: bool
+    archived: bool
+    shared: bool
+
+
+def _message_texts(chat: dict) -> Iterable[str]:
+    messages = ((chat.get("chat") or {}).get("history") or {}).get("messages") or {}
+    for message in messages.values():
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            yield content
+        elif isinstance(content, list):
+            # Multimodal content: [{"type": "text", "text": ...}, ...]
+            for part in content:
+                if isinstance(part, dict) and isinstance(part.get("text"), str):
+                    yield part["text"]
+
+
+class ChatSearchIndex:
+    """
+    Inverted index over the titles and message text of one user's chats,
+    ranked with BM25. Writes only queue the new document; it is tokenized
+    on the next search, so chats updated while streaming are indexed once.
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, _Doc] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._sorted_terms: Optional[List[str]] = None
+        self._pending: Dict[str, Optional[dict]] = {}
+        self._lock = threading.Lock()
+        # Monotonic time of the last full comparison with wisp, see ChatTable
+        self.synced_at: Optional[float] = None
+        self.sync_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def versions(self) -> Dict[str, int]:
+        """chat id -> updated_at of what is indexed or queued."""
+        with self._lock:
+            versions = {chat_id: doc.updated_at for chat_id, doc in self._docs.items()}
+            for chat_id, chat in self._pending.items():
+                if chat is None:
+                    versions.pop(chat_id, None)
+                else:
+                    versions[chat_id] = chat.get("updated_at")
+            return versions
+
+    def upsert(self, chat: dict):
+        with self._lock:
+            self._pending[chat["id"]] = chat
+
+    def remove(self, chat_id: str):
+        with self._lock:
+            if chat_id in self._docs or chat_id in self._pending:
+                self._pending[chat_id] = None
+
+    def _apply_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        for chat_id, chat in pending.items():
+            self._remove(chat_id)
+            if chat is not None:
+                self._add(chat)
+        self._sorted_terms = None
+
+    def _remove(self, chat_id: str):
+        doc = self._docs.pop(chat_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc.length
+        for term in doc.terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(chat_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def _add(self, chat: dict):
+        title = chat.get("title") or ""
+        terms = Counter()
+        for token in tokenize(title):
+            terms[token] += TITLE_WEIGHT
+        for text in _message_texts(chat):
+            terms.update(tokenize(text))
+
+        meta = chat.get("meta") or {}
+        doc = _Doc(
+            title=title,
+            created_at=chat.get("created_at") or 0,
+            updated_at=chat.get("updated_at") or 0,
+            length=sum(terms.values()),
+            terms=terms,
+            tags={normalize_tag(tag) for tag in meta.get("tags") or []},
+            folder_id=chat.get("folder_id") or None,
+            pinned=bool(chat.get("pinned")),
+            archived=bool(chat.get("archived")),
+            shared=bool(chat.get("share_id")),
+        )
+        self._docs[chat["id"]] = doc
+        self._total_length += doc.length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[chat["id"]] = tf
+
+    def _expand(self, term: str) -> Dict[str, float]:
+        """Index terms matching `term` exactly or as a prefix, with their weight."""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        expansions = {}
+        i = bisect_left(self._sorted_terms, term)
+        while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(term):
+            candidate = self._sorted_terms[i]
+            expansions[candidate] = 1.0 if candidate == term else PREFIX_DISCOUNT
+            i += 1
+        return expansions
+
+    def _matches(self, doc: _Doc, query: SearchQuery, folder_ids: Optional[Set[str]]) -> bool:
+        if query.pinned is not None and doc.pinned != query.pinned:
+            return False
+        if query.archived is not None and doc.archived != query.archived:
+            return False
+        if query.shared is not None and doc.shared != query.shared:
+            return False
+        if query.tags and not set(query.tags) <= doc.tags:
+            return False
+        if folder_ids is not None and doc.folder_id not in folder_ids:
+            return False
+        return True
+
+    def search(
+            self,
+            query: SearchQuery,
+            folder_ids: Optional[Set[str]] = None,
+            skip: int = 0,
+            limit: int = 60,
+    ) -> List[dict]:
+        """
+        Chats matching every term (each also as a prefix) and every filter,
+        best BM25 score first, then most recently updated. `folder_ids`
+        restricts results to those folders when not None.
+        """
+        with self._lock:
+            self._apply_pending()
+            candidates = {
+                chat_id for chat_id, doc in self._docs.items()
+                if self._matches(doc, query, folder_ids)
+            }
+
+            scores: Dict[str, float] = {}
+            if query.terms:
+                n = len(self._docs)
+                avg_length = self._total_length / n if n else 0
+                for i, term in enumerate(dict.fromkeys(query.terms)):
+                    term_scores: Dict[str, float] = {}
+                    for candidate, weight in self._expand(term).items():
+                        postings = self._postings[candidate]
+                        idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                        for chat_id, tf in postings.items():
+                            if chat_id not in candidates:
+                                continue
+                            norm = 1 - BM25_B + BM25_B * self._docs[chat_id].length / (avg_length or 1)
+                            score = weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+                            term_scores[chat_id] = max(term_scores.get(chat_id, 0.0), score)
+                    # Every term has to match
+                    candidates &= term_scores.keys()
+                    for chat_id in candidates:
+                        scores[chat_id] = scores.get(chat_id, 0.0) + term_scores[chat_id]
+
+            ranked = sorted(
+                candidates,
+                key=lambda chat_id: (-scores.get(chat_id, 0.0), -self._docs[chat_id].updated_at),
+            )
+            return [
+                {
+                    "id": chat_id,
+                    "title": self._docs[chat_id].title,
+                    "updated_at": self._docs[chat_id].updated_at,
+                    "created_at": self._docs[chat_id].created_at,
+                }
+                for chat_id in ranked[skip:skip + limit]
+            ]
+
+
+class ChatSearchIndexes:
+    """The search indexes of the `max_users` users who searched most recently."""
+
+    def __init__(self, max_users: int):
+        self.max_users = max(max_users, 1)
+        self._indexes: "OrderedDict[str, ChatSearchIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> ChatSearchIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = self._indexes[user_id] = ChatSearchIndex()
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            return index
+
+    def upsert(self, chat: dict):
+        """Feed a written chat document to its owner's index, if it has one."""
+        with self._lock:
+            index = self._indexes.get(chat.get("user_id"))
+        if index is not None and chat.get("id"):
+            index.upsert(chat)
+
+    def remove(self, chat_id: str):
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            index.remove(chat_id)
+
+    def drop(self, user_id: Optional[str] = None):
+        """Forget a user's index, or every index; it is rebuilt on the next search."""
+        with self._lock:
+            if user_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(user_id, None)
+
+    @staticmethod
+    def is_stale(index: ChatSearchIndex, max_age: float) -> bool:
+        return index.synced_at is None or time.monotonic() - index.synced_at >= max_age
+
+
+chat_search_indexes = ChatSearchIndexes(WISP_CHAT_SEARCH_MAX_USERS)
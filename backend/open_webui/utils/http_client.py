@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from open_webui.env import (
+    SRC_LOG_LEVELS,
+    AIOHTTP_CLIENT_POOL_LIMIT,
+    AIOHTTP_CLIENT_POOL_LIMIT_PER_HOST,
+    AIOHTTP_CLIENT_POOL_KEEPALIVE_TIMEOUT,
+    AIOHTTP_CLIENT_POOL_DNS_TTL,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+def get_proxy(idx: int, proxys) -> Optional[str]:
+    """The proxy configured for the idx-th base URL, proxys may be shorter."""
+    if proxys and 0 <= idx < len(proxys):
+        return proxys[idx] or None
+    return None
+
+
+async def cleanup_response(
+        response: Optional[aiohttp.ClientResponse],
+        session: Optional[aiohttp.ClientSession] = None,
+):
+    """
+    Hand the response's connection back to its pool, which closes it if the
+    body was not read to the end; a one-off `session` is closed too.
+    """
+    if response:
+        await response.release()
+    if session:
+        await session.close()
+
+
+class _PoolStats:
+    """Counts of one session, kept by the signals of its TraceConfig."""
+
+    def __init__(self):
+        self.requests = 0
+        self.waiting = 0
+        self.created = 0
+        self.reused = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        def count(name: str, delta: int):
+            async def on_signal(session, context, params):
+                setattr(self, name, getattr(self, name) + delta)
+
+            return on_signal
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(count("requests", 1))
+        trace_config.on_request_end.append(count("requests", -1))
+        trace_config.on_request_exception.append(count("requests", -1))
+        trace_config.on_connection_queued_start.append(count("waiting", 1))
+        trace_config.on_connection_queued_end.append(count("waiting", -1))
+        trace_config.on_connection_create_end.append(count("created", 1))
+        trace_config.on_connection_reuseconn.append(count("reused", 1))
+        return trace_config
+
+
+class ClientSessionPool:
+    """
+    App-lifetime aiohttp sessions, one per upstream origin and proxy, so
+    requests to the same provider reuse keep-alive connections instead of a
+    new DNS lookup and TCP+TLS handshake each.
+
+    The sessions are shared between users: they have no cookie jar and no
+    timeout, pass both per request. Don't close a session from the pool,
+    release the response with `cleanup_response`.
+    """
+
+    def __init__(
+            self,
+            limit: int,
+            limit_per_host: int,
+            keepalive_timeout: float,
+            dns_ttl: int,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        # (origin, proxy) -> the session, the loop it is bound to and its counts
+        self._sessions: Dict[
+            Tuple[str, Optional[str]],
+            Tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop, _PoolStats],
+        ] = {}
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+    def get(self, url: str, proxy: Optional[str] = None) -> aiohttp.ClientSession:
+        key = (self._origin(url), proxy or None)
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(key)
+        if entry is not None:
+            session, session_loop, _ = entry
+            if not session.closed and session_loop is loop:
+                return session
+            self._discard(session, session_loop)
+
+        stats = _PoolStats()
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            # Requests set their own timeout
+            timeout=aiohttp.ClientTimeout(total=None),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            proxy=proxy or None,
+            trust_env=True,
+            trace_configs=[stats.trace_config()],
+        )
+        self._sessions[key] = (session, loop, stats)
+        log.debug(f"Created connection pool for {key[0]}{' via proxy' if proxy else ''}")
+        return session
+
+    @staticmethod
+    def _discard(session: aiohttp.ClientSession, loop: asyncio.AbstractEventLoop):
+        """Close a session replaced in the pool, on the loop its connections belong to."""
+        if session.closed:
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # Its loop is gone and so are the connections, nothing to await
+            session.detach()
+        log.debug("Replaced a connection pool bound to another event loop")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Requests awaiting a response and requests waiting for a free
+        connection, with the connections opened and reused so far, per
+        upstream origin.
+        """
+        stats = {}
+        for (origin, _), (session, _, counts) in list(self._sessions.items()):
+            if session.closed:
+                continue
+            entry = stats.setdefault(origin, {"requests": 0, "waiting": 0, "created": 0, "reused": 0})
+            entry["requests"] += counts.requests
+            entry["waiting"] += counts.waiting
+            entry["created"] += counts.created
+            entry["reused"] += counts.reused
+        return stats
+
+    async def close(self):
+        sessions = [session for session, _, _ in self._sessions.values()]
+        self._sessions.clear()
+        results = await asyncio.gather(
+            *(session.close() for session in sessions if not session.closed),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                log.warning(f"Failed to close connection pool: {result}")
+
+
+client_sessions = ClientSessionPool(
+    limit=AIOHTTP_CLIENT_POOL_LIMIT,
+    limit_per_host=AIOHTTP_CLIENT_POOL_LIMIT_PER_HOST,
+    keepalive_timeout=AIOHTTP_CLIENT_POOL_KEEPALIVE_TIMEOUT,
+    dns_ttl=AIOHTTP_CLIENT_POOL_DNS_TTL,
+)
@@ -18,6 +18,7 @@ from fastapi.responses import HTMLResponse
 from starlette.responses import StreamingResponse, JSONResponse
 
 from open_webui.jms import chat_manager, CommandHandler, CommandRecord, ReplayHandler
+from open_webui.jms.chat_codec import json_loads
 from open_webui.models.chats import Chats
 from open_webui.models.folders import Folders
 from open_webui.models.users import Users
@@ -85,6 +86,11 @@ from open_webui.utils.misc import (
 )
 from open_webui.utils.tools import get_tools, get_updated_tool_function
 from open_webui.utils.plugin import load_function_module_by_id
+from open_webui.utils.stream_parser import (
+    ContentBlockParser,
+    ContentBlockRenderer,
+    aiter_sse_data,
+)
 from open_webui.utils.filter import (
     get_sorted_filter_ids,
     process_filter_functions,
@@ -124,6 +130,8 @@ DEFAULT_REASONING_TAGS = [
 ]
 DEFAULT_SOLUTION_TAGS = [("<|begin_of_solution|>", "<|end_of_solution|>")]
 DEFAULT_CODE_INTERPRETER_TAGS = [("<code_interpreter>", "</code_interpreter>")]
+# Delta data standing for the serialized content blocks, rendered when flushed
+RENDER_CONTENT = object()
 
 
 def process_tool_result(
@@ -1527,7 +1535,7 @@ async def process_chat_payload(request, form_data, user, metadata, model):
         )
 
     chat_id = metadata.get("chat_id", '')
-    asyncio.create_task(ReplayHandler(chat_id).write_input(user_message))
+    ReplayHandler(chat_id).write_input(user_message)
     return form_data, metadata, events
 
 
@@ -1859,7 +1867,7 @@ async def process_chat_response(
                             )
 
                             # Send a webhook notification if the user is not active
-                            if not get_active_status_by_user_id(user.id):
+                            if not await get_active_status_by_user_id(user.id):
                                 webhook_url = Users.get_user_webhook_url_by_id(user.id)
                                 if webhook_url:
                                     await post_webhook(
@@ -1973,9 +1981,9 @@ async def process_chat_response(
 
         # Handle as a background task
         async def response_handler(response, events):
-            def serialize_content_blocks(content_blocks, raw=False):
-                content = ""
-
+            def serialize_content_blocks(content_blocks, raw=False, content="", strip=True):
+                # `content` is what the blocks before content_blocks serialized to
+                # unstripped (strip=False), see ContentBlockRenderer
                 for block in content_blocks:
                     if block["type"] == "text":
                         block_content = block["content"].strip()
@@ -2106,7 +2114,7 @@ async def process_chat_response(
                         if block_content:
                             content = f"{content}{block['type']}: {block_content}\n"
 
-                return content.strip()
+                return content.strip() if strip else content
 
             def convert_content_blocks_to_messages(content_blocks, raw=False):
                 messages = []
@@ -2148,182 +2156,6 @@ async def process_chat_response(
 
                 return messages
 
-            def tag_content_handler(content_type, tags, content, content_blocks):
-                end_flag = False
-
-                def extract_attributes(tag_content):
-                    """Extract attributes from a tag if they exist."""
-                    attributes = {}
-                    if not tag_content:  # Ensure tag_content is not None
-                        return attributes
-                    # Match attributes in the format: key="value" (ignores single quotes for simplicity)
-                    matches = re.findall(r'(\w+)\s*=\s*"([^"]+)"', tag_content)
-                    for key, value in matches:
-                        attributes[key] = value
-                    return attributes
-
-                if content_blocks[-1]["type"] == "text":
-                    for start_tag, end_tag in tags:
-
-                        start_tag_pattern = rf"{re.escape(start_tag)}"
-                        if start_tag.startswith("<") and start_tag.endswith(">"):
-                            # Match start tag e.g., <tag> or <tag attr="value">
-                            # remove both '<' and '>' from start_tag
-                            # Match start tag with attributes
-                            start_tag_pattern = (
-                                rf"<{re.escape(start_tag[1:-1])}(\s.*?)?>"
-                            )
-
-                        match = re.search(start_tag_pattern, content)
-                        if match:
-                            try:
-                                attr_content = (
-                                    match.group(1) if match.group(1) else ""
-                                )  # Ensure it's not None
-                            except:
-                                attr_content = ""
-
-                            attributes = extract_attributes(
-                                attr_content
-                            )  # Extract attributes safely
-
-                            # Capture everything before and after the matched tag
-                            before_tag = content[
-                                : match.start()
-                            ]  # Content before opening tag
-                            after_tag = content[
-                                match.end():
-                            ]  # Content after opening tag
-
-                            # Remove the start tag and after from the currently handling text block
-                            content_blocks[-1]["content"] = content_blocks[-1][
-                                "content"
-                            ].replace(match.group(0) + after_tag, "")
-
-                            if before_tag:
-                                content_blocks[-1]["content"] = before_tag
-
-                            if not content_blocks[-1]["content"]:
-                                content_blocks.pop()
-
-                            # Append the new block
-                            content_blocks.append(
-                                {
-                                    "type": content_type,
-                                    "start_tag": start_tag,
-                                    "end_tag": end_tag,
-                                    "attributes": attributes,
-                                    "content": "",
-                                    "started_at": time.time(),
-                                }
-                            )
-
-                            if after_tag:
-                                content_blocks[-1]["content"] = after_tag
-                                tag_content_handler(
-                                    content_type, tags, after_tag, content_blocks
-                                )
-
-                            break
-                elif content_blocks[-1]["type"] == content_type:
-                    start_tag = content_blocks[-1]["start_tag"]
-                    end_tag = content_blocks[-1]["end_tag"]
-
-                    if end_tag.startswith("<") and end_tag.endswith(">"):
-                        # Match end tag e.g., </tag>
-                        end_tag_pattern = rf"{re.escape(end_tag)}"
-                    else:
-                        # Handle cases where end_tag is just a tag name
-                        end_tag_pattern = rf"{re.escape(end_tag)}"
-
-                    # Check if the content has the end tag
-                    if re.search(end_tag_pattern, content):
-                        end_flag = True
-
-                        block_content = content_blocks[-1]["content"]
-                        # Strip start and end tags from the content
-                        start_tag_pattern = rf"<{re.escape(start_tag)}(.*?)>"
-                        block_content = re.sub(
-                            start_tag_pattern, "", block_content
-                        ).strip()
-
-                        end_tag_regex = re.compile(end_tag_pattern, re.DOTALL)
-                        split_content = end_tag_regex.split(block_content, maxsplit=1)
-
-                        # Content inside the tag
-                        block_content = (
-                            split_content[0].strip() if split_content else ""
-                        )
-
-                        # Leftover content (everything after `</tag>`)
-                        leftover_content = (
-                            split_content[1].strip() if len(split_content) > 1 else ""
-                        )
-
-                        if block_content:
-                            content_blocks[-1]["content"] = block_content
-                            content_blocks[-1]["ended_at"] = time.time()
-                            content_blocks[-1]["duration"] = int(
-                                content_blocks[-1]["ended_at"]
-                                - content_blocks[-1]["started_at"]
-                            )
-
-                            # Reset the content_blocks by appending a new text block
-                            if content_type != "code_interpreter":
-                                if leftover_content:
-
-                                    content_blocks.append(
-                                        {
-                                            "type": "text",
-                                            "content": leftover_content,
-                                        }
-                                    )
-                                else:
-                                    content_blocks.append(
-                                        {
-                                            "type": "text",
-                                            "content": "",
-                                        }
-                                    )
-
-                        else:
-                            # Remove the block if content is empty
-                            content_blocks.pop()
-
-                            if leftover_content:
-                                content_blocks.append(
-                                    {
-                                        "type": "text",
-                                        "content": leftover_content,
-                                    }
-                                )
-                            else:
-                                content_blocks.append(
-                                    {
-                                        "type": "text",
-                                        "content": "",
-                                    }
-                                )
-
-                        # Clean processed content
-                        start_tag_pattern = rf"{re.escape(start_tag)}"
-                        if start_tag.startswith("<") and start_tag.endswith(">"):
-                            # Match start tag e.g., <tag> or <tag attr="value">
-                            # remove both '<' and '>' from start_tag
-                            # Match start tag with attributes
-                            start_tag_pattern = (
-                                rf"<{re.escape(start_tag[1:-1])}(\s.*?)?>"
-                            )
-
-                        content = re.sub(
-                            rf"{start_tag_pattern}(.|\n)*?{re.escape(end_tag)}",
-                            "",
-                            content,
-                            flags=re.DOTALL,
-                        )
-
-                return content, content_blocks, end_flag
-
             message = Chats.get_message_by_id_and_message_id(
                 metadata["chat_id"], metadata["message_id"]
             )
@@ -2389,11 +2221,25 @@ async def process_chat_response(
                     )
 
                 async def stream_body_handler(response, form_data):
-                    nonlocal content
-                    nonlocal content_blocks
-
                     response_tool_calls = []
 
+                    tag_sets = []
+                    if DETECT_REASONING_TAGS:
+                        tag_sets += [
+                            ("reasoning", reasoning_tags),
+                            ("solution", DEFAULT_SOLUTION_TAGS),
+                        ]
+                    if DETECT_CODE_INTERPRETER:
+                        tag_sets.append(
+                            ("code_interpreter", DEFAULT_CODE_INTERPRETER_TAGS)
+                        )
+                    parser = ContentBlockParser(content_blocks, tag_sets)
+                    renderer = ContentBlockRenderer(serialize_content_blocks)
+
+                    def render_content():
+                        parser.sync()
+                        return renderer.render(content_blocks)
+
                     delta_count = 0
                     delta_chunk_size = max(
                         CHAT_RESPONSE_STREAM_DELTA_CHUNK_SIZE,
@@ -2403,42 +2249,42 @@ async def process_chat_response(
                         ),
                     )
                     last_delta_data = None
+                    # The content is only serialized when a flush sends or saves it
+                    content_changed = False
 
                     async def flush_pending_delta_data(threshold: int = 0):
                         nonlocal delta_count
                         nonlocal last_delta_data
+                        nonlocal content_changed
 
                         if delta_count >= threshold and last_delta_data:
+                            if ENABLE_REALTIME_CHAT_SAVE and content_changed:
+                                # Save message in the database (written behind, see flush below)
+                                Chats.buffer_message_to_chat_by_id_and_message_id(
+                                    metadata["chat_id"],
+                                    metadata["message_id"],
+                                    {
+                                        "content": render_content(),
+                                    },
+                                )
+                                content_changed = False
+
                             await event_emitter(
                                 {
                                     "type": "chat:completion",
-                                    "data": last_delta_data,
+                                    "data": (
+                                        {"content": render_content()}
+                                        if last_delta_data is RENDER_CONTENT
+                                        else last_delta_data
+                                    ),
                                 }
                             )
                             delta_count = 0
                             last_delta_data = None
 
-                    async for line in response.body_iterator:
-                        line = (
-                            line.decode("utf-8", "replace")
-                            if isinstance(line, bytes)
-                            else line
-                        )
-                        data = line
-
-                        # Skip empty lines
-                        if not data.strip():
-                            continue
-
-                        # "data:" is the prefix for each event
-                        if not data.startswith("data:"):
-                            continue
-
-                        # Remove the prefix
-                        data = data[len("data:"):].strip()
-
+                    async for data in aiter_sse_data(response.body_iterator):
                         try:
-                            data = json.loads(data)
+                            data = json_loads(data)
 
                             data, _ = await process_filter_functions(
                                 request=request,
@@ -2567,118 +2413,18 @@ async def process_chat_response(
                                             or delta.get("thinking")
                                     )
                                     if reasoning_content:
-                                        if (
-                                                not content_blocks
-                                                or content_blocks[-1]["type"] != "reasoning"
-                                        ):
-                                            reasoning_block = {
-                                                "type": "reasoning",
-                                                "start_tag": "<think>",
-                                                "end_tag": "</think>",
-                                                "attributes": {
-                                                    "type": "reasoning_content"
-                                                },
-                                                "content": "",
-                                                "started_at": time.time(),
-                                            }
-                                            content_blocks.append(reasoning_block)
-                                        else:
-                                            reasoning_block = content_blocks[-1]
-
-                                        reasoning_block["content"] += reasoning_content
-
-                                        data = {
-                                            "content": serialize_content_blocks(
-                                                content_blocks
-                                            )
-                                        }
+                                        parser.feed_reasoning(reasoning_content)
+                                        content_changed = True
+                                        data = RENDER_CONTENT
 
                                     if value:
-                                        if (
-                                                content_blocks
-                                                and content_blocks[-1]["type"]
-                                                == "reasoning"
-                                                and content_blocks[-1]
-                                                .get("attributes", {})
-                                                .get("type")
-                                                == "reasoning_content"
-                                        ):
-                                            reasoning_block = content_blocks[-1]
-                                            reasoning_block["ended_at"] = time.time()
-                                            reasoning_block["duration"] = int(
-                                                reasoning_block["ended_at"]
-                                                - reasoning_block["started_at"]
-                                            )
-
-                                            content_blocks.append(
-                                                {
-                                                    "type": "text",
-                                                    "content": "",
-                                                }
-                                            )
-
-                                        content = f"{content}{value}"
-                                        if not content_blocks:
-                                            content_blocks.append(
-                                                {
-                                                    "type": "text",
-                                                    "content": "",
-                                                }
-                                            )
-
-                                        content_blocks[-1]["content"] = (
-                                                content_blocks[-1]["content"] + value
-                                        )
-
-                                        if DETECT_REASONING_TAGS:
-                                            content, content_blocks, _ = (
-                                                tag_content_handler(
-                                                    "reasoning",
-                                                    reasoning_tags,
-                                                    content,
-                                                    content_blocks,
-                                                )
-                                            )
-
-                                            content, content_blocks, _ = (
-                                                tag_content_handler(
-                                                    "solution",
-                                                    DEFAULT_SOLUTION_TAGS,
-                                                    content,
-                                                    content_blocks,
-                                                )
-                                            )
+                                        closed = parser.feed(value)
+                                        if "code_interpreter" in closed:
+                                            break
 
-                                        if DETECT_CODE_INTERPRETER:
-                                            content, content_blocks, end = (
-                                                tag_content_handler(
-                                                    "code_interpreter",
-                                                    DEFAULT_CODE_INTERPRETER_TAGS,
-                                                    content,
-                                                    content_blocks,
-                                                )
-                                            )
-
-                                            if end:
-                                                break
-
-                                        if ENABLE_REALTIME_CHAT_SAVE:
-                                            # Save message in the database
-                                            Chats.upsert_message_to_chat_by_id_and_message_id(
-                                                metadata["chat_id"],
-                                                metadata["message_id"],
-                                                {
-                                                    "content": serialize_content_blocks(
-                                                        content_blocks
-                                                    ),
-                                                },
-                                            )
-                                        else:
-                                            data = {
-                                                "content": serialize_content_blocks(
-                                                    content_blocks
-                                                ),
-                                            }
+                                        content_changed = True
+                                        if not ENABLE_REALTIME_CHAT_SAVE:
+                                            data = RENDER_CONTENT
 
                                 if delta:
                                     delta_count += 1
@@ -2693,13 +2439,10 @@ async def process_chat_response(
                                         }
                                     )
                         except Exception as e:
-                            done = "data: [DONE]" in line
-                            if done:
-                                pass
-                            else:
-                                log.debug(f"Error: {e}")
-                                continue
+                            log.debug(f"Error: {e}")
+                            continue
                     await flush_pending_delta_data()
+                    parser.sync()
 
                     if content_blocks:
                         # Clean up the last text block
@@ -3111,6 +2854,8 @@ async def process_chat_response(
                             log.debug(e)
                             break
 
+                await Chats.flush_chat_by_id(metadata["chat_id"])
+
                 title = Chats.get_chat_title_by_id(metadata["chat_id"])
                 data = {
                     "done": True,
@@ -3120,15 +2865,15 @@ async def process_chat_response(
 
                 chat_id = metadata.get("chat_id", '')
 
-                chat_data = chat_manager.retrieve(chat_id)
+                chat_data = await chat_manager.aretrieve(chat_id)
                 user_message = get_last_user_message(form_data["messages"])
 
                 command_handler = CommandHandler(chat_id, chat_data['session_info'])
                 command_handler.command_record = CommandRecord(
                     input=user_message, output=data['content']
                 )
-                asyncio.create_task(command_handler.record_command())
-                asyncio.create_task(ReplayHandler(chat_id).write_input(data['content']))
+                command_handler.record_command()
+                ReplayHandler(chat_id).write_input(data['content'])
 
                 if not ENABLE_REALTIME_CHAT_SAVE:
                     # Save message in the database
@@ -3141,9 +2886,14 @@ async def process_chat_response(
                     )
 
                 # Send a webhook notification if the user is not active
-                if not get_active_status_by_user_id(user.id):
+                if not await get_active_status_by_user_id(user.id):
                     webhook_url = Users.get_user_webhook_url_by_id(user.id)
                     if webhook_url:
+                        content = "\n".join(
+                            block["content"]
+                            for block in content_blocks
+                            if block["type"] == "text" and block["content"]
+                        )
                         await post_webhook(
                             request.app.state.WEBUI_NAME,
                             webhook_url,
@@ -3167,6 +2917,7 @@ async def process_chat_response(
             except asyncio.CancelledError:
                 log.warning("Task was cancelled!")
                 await event_emitter({"type": "chat:tasks:cancel"})
+                await Chats.flush_chat_by_id(metadata["chat_id"])
 
                 if not ENABLE_REALTIME_CHAT_SAVE:
                     # Save message in the database
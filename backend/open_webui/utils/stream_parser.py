@@ -0,0 +1,297 @@
+"""
+Incremental parsing of streamed chat completions, so the work per token stays
+flat however long the answer gets:
+
+- SSEFramer cuts the response body into the payloads of its `data:` lines,
+- ContentBlockParser appends deltas to the content blocks and runs the
+  reasoning/solution/code interpreter tag state machine over the new text only,
+- ContentBlockRenderer serializes the blocks on demand, rendering again only
+  the block that is still streaming.
+"""
+import re
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple, Union
+
+# Longest start tag, attributes included, looked for across deltas
+MAX_TAG_LENGTH = 1024
+
+
+class SSEFramer:
+    """
+    Splits a streamed body into the payloads of its `data:` lines whatever the
+    chunking, a chunk may hold part of a line or several lines. Works on bytes,
+    so payloads go to the JSON parser without being decoded first.
+    """
+
+    def __init__(self):
+        self._partial = bytearray()
+
+    @staticmethod
+    def _payload(line: bytes) -> Optional[bytes]:
+        # "data:" is the prefix for each event, other fields and comments are skipped
+        if not line.startswith(b"data:"):
+            return None
+        payload = line[len(b"data:"):].strip()
+        if not payload or payload == b"[DONE]":
+            return None
+        return payload
+
+    def feed(self, chunk: Union[bytes, str]) -> List[bytes]:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if b"\n" not in chunk:
+            self._partial += chunk
+            return []
+
+        lines = chunk.split(b"\n")
+        if self._partial:
+            self._partial += lines[0]
+            lines[0] = bytes(self._partial)
+        self._partial = bytearray(lines.pop())
+        return [payload for payload in map(self._payload, lines) if payload is not None]
+
+    def flush(self) -> List[bytes]:
+        """Payload of a last line the body did not end with a newline."""
+        line, self._partial = bytes(self._partial), bytearray()
+        payload = self._payload(line.strip())
+        return [payload] if payload is not None else []
+
+
+async def aiter_sse_data(body_iterator: AsyncIterable[Union[bytes, str]]) -> AsyncIterator[bytes]:
+    framer = SSEFramer()
+    async for chunk in body_iterator:
+        for payload in framer.feed(chunk):
+            yield payload
+    for payload in framer.flush():
+        yield payload
+
+
+def _start_tag_pattern(start_tag: str) -> "re.Pattern":
+    if start_tag.startswith("<") and start_tag.endswith(">"):
+        # Match start tag e.g., <tag> or <tag attr="value">
+        return re.compile(rf"<{re.escape(start_tag[1:-1])}(\s.*?)?>")
+    return re.compile(re.escape(start_tag))
+
+
+def _extract_attributes(tag_content: Optional[str]) -> dict:
+    """Extract key="value" attributes of a tag, single quotes are ignored for simplicity."""
+    if not tag_content:
+        return {}
+    return dict(re.findall(r'(\w+)\s*=\s*"([^"]+)"', tag_content))
+
+
+class ContentBlockParser:
+    """
+    Streams deltas into `content_blocks`, the list of block dicts built by
+    process_chat_response, splitting reasoning, solution and code interpreter
+    blocks out of the text at their tags.
+
+    The content of the last block is kept as a list of parts and only joined
+    into block["content"] by sync(), and tags are only looked for in a window
+    of the text that is new or may still hold a partial tag, instead of the
+    whole answer on every delta.
+
+    `tag_sets` are (content type, [(start tag, end tag), ...]) pairs; when
+    several start tags are in the text the first one opens a block.
+    """
+
+    def __init__(self, content_blocks: List[dict], tag_sets: List[Tuple[str, List[Tuple[str, str]]]]):
+        self.content_blocks = content_blocks
+        self.tag_sets = [
+            (content_type, [(start, end, _start_tag_pattern(start)) for start, end in tags])
+            for content_type, tags in tag_sets
+        ]
+        self._content_types = {content_type for content_type, _ in tag_sets}
+        self._block: Optional[dict] = None
+        self._parts: List[str] = []
+        # Suffix of the content that is still scanned for tags
+        self._window = ""
+        self._dirty = False
+
+    def _adopt(self, block: Optional[dict]):
+        self.sync()
+        self._block = block
+        content = block.get("content") if block is not None else None
+        self._parts = [content] if isinstance(content, str) and content else []
+        self._window = content if isinstance(content, str) else ""
+
+    def _content(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _append_block(self, block: dict) -> dict:
+        self.sync()
+        self.content_blocks.append(block)
+        self._adopt(block)
+        return block
+
+    def _current(self) -> Optional[dict]:
+        block = self.content_blocks[-1] if self.content_blocks else None
+        if block is not self._block:
+            self._adopt(block)
+        return block
+
+    def sync(self):
+        """Write the buffered content back into its block dict."""
+        if self._block is not None and self._dirty:
+            self._block["content"] = self._content()
+        self._dirty = False
+
+    def feed_reasoning(self, value: str):
+        """Append a reasoning_content delta, which comes without tags."""
+        block = self._current()
+        if block is None or block["type"] != "reasoning":
+            self._append_block(
+                {
+                    "type": "reasoning",
+                    "start_tag": "<think>",
+                    "end_tag": "</think>",
+                    "attributes": {"type": "reasoning_content"},
+                    "content": "",
+                    "started_at": time.time(),
+                }
+            )
+        self._parts.append(value)
+        self._dirty = True
+
+    def feed(self, value: str) -> List[str]:
+        """
+        Append a content delta. Returns the types of the blocks whose end tag
+        it completed.
+        """
+        block = self._current()
+        if (
+                block is not None
+                and block["type"] == "reasoning"
+                and block.get("attributes", {}).get("type") == "reasoning_content"
+        ):
+            self.sync()
+            block["ended_at"] = time.time()
+            block["duration"] = int(block["ended_at"] - block["started_at"])
+            block = None
+        if block is None or not isinstance(block.get("content"), str):
+            self._append_block({"type": "text", "content": ""})
+
+        self._parts.append(value)
+        self._window += value
+        self._dirty = True
+
+        closed = []
+        # Again after each end tag, a delta may hold several tags
+        while "code_interpreter" not in closed:
+            if self.content_blocks[-1]["type"] == "text" and not self._open():
+                break
+            content_type = self.content_blocks[-1]["type"]
+            if content_type not in self._content_types or not self._close(content_type):
+                break
+            closed.append(content_type)
+        self._trim()
+        return closed
+
+    def _open(self) -> bool:
+        """Start a block at the first start tag in the window."""
+        found = None
+        for content_type, tags in self.tag_sets:
+            for start_tag, end_tag, pattern in tags:
+                match = pattern.search(self._window)
+                if match and (found is None or match.start() < found[0].start()):
+                    found = (match, content_type, start_tag, end_tag)
+        if found is None:
+            return False
+
+        match, content_type, start_tag, end_tag = found
+        content = self._content()
+        offset = len(content) - len(self._window)
+        before_tag = content[:offset + match.start()]
+        after_tag = content[offset + match.end():]
+
+        self._parts, self._dirty = [before_tag], True
+        self.sync()
+        if not before_tag:
+            self.content_blocks.pop()
+
+        self._append_block(
+            {
+                "type": content_type,
+                "start_tag": start_tag,
+                "end_tag": end_tag,
+                "attributes": _extract_attributes(match.group(1) if match.re.groups else None),
+                "content": after_tag,
+                "started_at": time.time(),
+            }
+        )
+        return True
+
+    def _close(self, content_type: str) -> bool:
+        block = self._block
+        end_tag = block["end_tag"]
+        if end_tag not in self._window:
+            return False
+
+        block_content, _, leftover_content = self._content().partition(end_tag)
+        # Content inside the tag, and everything after `</tag>`
+        block_content, leftover_content = block_content.strip(), leftover_content.lstrip()
+        self._dirty = False
+
+        if block_content:
+            block["content"] = block_content
+            block["ended_at"] = time.time()
+            block["duration"] = int(block["ended_at"] - block["started_at"])
+            if content_type == "code_interpreter":
+                self._adopt(block)
+                return True
+        else:
+            # Remove the block if content is empty
+            self.content_blocks.pop()
+
+        self._append_block({"type": "text", "content": leftover_content})
+        return True
+
+    def _trim(self):
+        """Drop the part of the window no later delta can complete a tag in."""
+        block = self._block
+        window = self._window
+        if block is None or not window:
+            return
+
+        if block["type"] == "text":
+            keep = len(window)
+            for _, tags in self.tag_sets:
+                for start_tag, _, _ in tags:
+                    if start_tag.startswith("<") and start_tag.endswith(">"):
+                        # Any "<" after the last ">" may still become a tag
+                        lt = window.find("<", window.rfind(">") + 1)
+                        if lt != -1:
+                            keep = min(keep, lt)
+                    else:
+                        keep = min(keep, len(window) - len(start_tag) + 1)
+            keep = max(keep, len(window) - MAX_TAG_LENGTH)
+        elif "end_tag" in block:
+            keep = len(window) - len(block["end_tag"]) + 1
+        else:
+            keep = len(window)
+        self._window = window[max(keep, 0):]
+
+
+class ContentBlockRenderer:
+    """
+    Serializes content blocks through `serialize`, process_chat_response's
+    serialize_content_blocks, caching the output for the blocks before the
+    last one: while a response streams only the last block changes.
+    """
+
+    def __init__(self, serialize: Callable[..., str]):
+        self._serialize = serialize
+        self._closed: List[dict] = []
+        self._prefix = ""
+
+    def render(self, content_blocks: List[dict]) -> str:
+        closed = max(len(content_blocks) - 1, 0)
+        cached = len(self._closed)
+        if cached > closed or any(a is not b for a, b in zip(self._closed, content_blocks)):
+            self._closed, self._prefix, cached = [], "", 0
+        if closed > cached:
+            self._prefix = self._serialize(content_blocks[cached:closed], content=self._prefix, strip=False)
+            self._closed = content_blocks[:closed]
+        return self._serialize(content_blocks[closed:], content=self._prefix)
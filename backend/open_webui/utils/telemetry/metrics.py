@@ -8,6 +8,15 @@ Metrics collected:
 
 * http.server.requests (counter)
 * http.server.duration (histogram, milliseconds)
+* wisp.cache.events (observable counter, per cache and event)
+* wisp.dispatch.tasks (observable counter, per event)
+* wisp.dispatch.backlog (observable gauge)
+* wisp.dispatch.task.duration (histogram, milliseconds, per task action)
+* http.client.pool.connections (observable gauge, per upstream and state)
+* wisp.rpc.duration (histogram, milliseconds, per method and status)
+* wisp.rpc.errors (counter, per method and status)
+* wisp.rpc.request.size / wisp.rpc.response.size (histograms, bytes, per method)
+* wisp.rpc.inflight (up-down counter, per method)
 
 Attributes used: http.method, http.route, http.status_code
 
@@ -45,8 +54,13 @@ from open_webui.env import (
     OTEL_METRICS_OTLP_SPAN_EXPORTER,
     OTEL_METRICS_EXPORTER_OTLP_INSECURE,
 )
-from open_webui.socket.main import get_active_user_ids
+from open_webui.socket.main import get_active_user_count
+from open_webui.jms.check_user import user_cache
+from open_webui.jms.chat import chat_cache
+from open_webui.jms.account import account_cache
+from open_webui.jms.poll import jms_event
 from open_webui.models.users import Users
+from open_webui.utils.http_client import client_sessions
 
 _EXPORT_INTERVAL_MILLIS = 10_000  # 10 seconds
 
@@ -99,6 +113,45 @@ def _build_meter_provider(resource: Resource) -> MeterProvider:
         View(
             instrument_name="webui.users.active",
         ),
+        View(
+            instrument_name="wisp.cache.events",
+            attribute_keys=["wisp.cache.name", "wisp.cache.event"],
+        ),
+        View(
+            instrument_name="wisp.dispatch.tasks",
+            attribute_keys=["wisp.dispatch.event"],
+        ),
+        View(
+            instrument_name="wisp.dispatch.backlog",
+        ),
+        View(
+            instrument_name="wisp.dispatch.task.duration",
+            attribute_keys=["wisp.task.action"],
+        ),
+        View(
+            instrument_name="http.client.pool.connections",
+            attribute_keys=["http.client.upstream", "http.client.pool.state"],
+        ),
+        View(
+            instrument_name="wisp.rpc.duration",
+            attribute_keys=["rpc.method", "rpc.grpc.status_code"],
+        ),
+        View(
+            instrument_name="wisp.rpc.errors",
+            attribute_keys=["rpc.method", "rpc.grpc.status_code"],
+        ),
+        View(
+            instrument_name="wisp.rpc.request.size",
+            attribute_keys=["rpc.method"],
+        ),
+        View(
+            instrument_name="wisp.rpc.response.size",
+            attribute_keys=["rpc.method"],
+        ),
+        View(
+            instrument_name="wisp.rpc.inflight",
+            attribute_keys=["rpc.method"],
+        ),
     ]
 
     provider = MeterProvider(
@@ -132,7 +185,7 @@ def setup_metrics(app: FastAPI, resource: Resource) -> None:
     ) -> Sequence[metrics.Observation]:
         return [
             metrics.Observation(
-                value=len(get_active_user_ids()),
+                value=get_active_user_count(),
             )
         ]
 
@@ -159,6 +212,94 @@ def setup_metrics(app: FastAPI, resource: Resource) -> None:
         callbacks=[observe_active_users],
     )
 
+    wisp_caches = [user_cache, chat_cache, account_cache]
+
+    def observe_wisp_cache_events(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(
+                value=value,
+                attributes={"wisp.cache.name": cache.name, "wisp.cache.event": event},
+            )
+            for cache in wisp_caches
+            for event, value in cache.stats().items()
+            if event != "size"
+        ]
+
+    meter.create_observable_counter(
+        name="wisp.cache.events",
+        description="Hits, misses, loads and refreshes of the wisp caches",
+        unit="1",
+        callbacks=[observe_wisp_cache_events],
+    )
+
+    def observe_wisp_dispatch_tasks(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(value=value, attributes={"wisp.dispatch.event": event})
+            for event, value in jms_event.stats().items()
+            if event != "backlog"
+        ]
+
+    def observe_wisp_dispatch_backlog(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [metrics.Observation(value=jms_event.stats()["backlog"])]
+
+    meter.create_observable_counter(
+        name="wisp.dispatch.tasks",
+        description="Wisp tasks received, completed and failed, and stream reconnects",
+        unit="1",
+        callbacks=[observe_wisp_dispatch_tasks],
+    )
+
+    meter.create_observable_gauge(
+        name="wisp.dispatch.backlog",
+        description="Wisp tasks received but not yet acknowledged",
+        unit="1",
+        callbacks=[observe_wisp_dispatch_backlog],
+    )
+
+    def observe_http_client_pools(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(
+                value=pool[state],
+                attributes={"http.client.upstream": upstream, "http.client.pool.state": state},
+            )
+            for upstream, pool in client_sessions.stats().items()
+            for state in ("requests", "waiting")
+        ]
+
+    meter.create_observable_gauge(
+        name="http.client.pool.requests",
+        description="Upstream requests awaiting a response and waiting for a connection, per provider",
+        unit="1",
+        callbacks=[observe_http_client_pools],
+    )
+
+    def observe_http_client_connections(
+        options: metrics.CallbackOptions,
+    ) -> Sequence[metrics.Observation]:
+        return [
+            metrics.Observation(
+                value=pool[state],
+                attributes={"http.client.upstream": upstream, "http.client.connection.state": state},
+            )
+            for upstream, pool in client_sessions.stats().items()
+            for state in ("created", "reused")
+        ]
+
+    meter.create_observable_counter(
+        name="http.client.pool.connections",
+        description="Upstream connections opened and reused from the pool, per provider",
+        unit="1",
+        callbacks=[observe_http_client_connections],
+    )
+
     # FastAPI middleware
     @app.middleware("http")
     async def _metrics_middleware(request: Request, call_next):